@@ -0,0 +1,71 @@
+"""
+Age of the ticks read by a slow consumer (1 ms per tick) of a shared
+stream during a burst of 5000 tickPrices messages per second over five
+symbols, for the delivery policies of StreamSubscriber: every tick
+queued, the latest tick of every symbol (conflated) and the latest at
+most every 20 ms (throttled).
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_delivery.py
+"""
+
+import threading
+from queue import Empty
+from time import perf_counter, sleep
+from api.streamtools import DeliveryPolicy, StreamSubscriber
+from utils.metrics import LatencyHistogram
+
+RATE = 5000
+SECONDS = 2.0
+WORK = 0.001
+SYMBOLS = ("EURUSD", "USDJPY", "GBPUSD", "US500", "DE40")
+
+
+def feed(subscriber: StreamSubscriber, done: threading.Event) -> None:
+    interval = 1 / RATE
+    due = perf_counter()
+    for i in range(int(RATE * SECONDS)):
+        due += interval
+        delay = due - perf_counter()
+        if delay > 0:
+            sleep(delay)
+        data = {"symbol": SYMBOLS[i % len(SYMBOLS)], "level": 0}
+        subscriber.put(
+            {"command": "tickPrices", "data": data, "sent": perf_counter()}
+        )
+    done.set()
+
+
+def consume(policy: DeliveryPolicy) -> tuple[LatencyHistogram, int, int]:
+    subscriber = StreamSubscriber([("tickPrices", None)], policy=policy)
+    done = threading.Event()
+    age = LatencyHistogram()
+    read = 0
+    feeder = threading.Thread(target=feed, args=(subscriber, done))
+    feeder.start()
+    while True:
+        try:
+            message = subscriber.stream_read(timeout=0.1)
+        except Empty:
+            if done.is_set():
+                break
+            continue
+        age.record(perf_counter() - message["sent"])
+        read += 1
+        sleep(WORK)
+    feeder.join()
+    return age, read, subscriber.conflated
+
+
+if __name__ == "__main__":
+    for policy in (
+        DeliveryPolicy("all"),
+        DeliveryPolicy("conflated"),
+        DeliveryPolicy("throttled", interval=20),
+    ):
+        age, read, conflated = consume(policy)
+        print(
+            f"{policy.mode:>9}: read {read:5d}, conflated {conflated:5d}, "
+            f"age p50 {age.percentile(50) * 1e3:8.2f} ms, "
+            f"p99 {age.percentile(99) * 1e3:8.2f} ms"
+        )
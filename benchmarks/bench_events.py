@@ -0,0 +1,91 @@
+"""
+Tick-to-consumer latency of every tick and the consumer CPU time of
+a DataStream fed with 500 tickPrices messages per second: consumers
+polling the tick buffer with a sleep between polls (as read_prices and
+MovingAVG.market_observe did) against a consumer blocked in
+DataStream.wait_tick.
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_events.py
+"""
+
+import threading
+from time import perf_counter, sleep, thread_time
+from api.streamtools import DataStream
+from data.buffers import TICK_FIELDS
+from utils.metrics import LatencyHistogram
+
+RATE = 500
+SECONDS = 2.0
+
+
+def tick(i: int) -> dict:
+    data = {field: 1.0 for field in TICK_FIELDS}
+    data.update({"symbol": "EURUSD", "timestamp": 1272529161605 + i})
+    return {"command": "tickPrices", "data": data}
+
+
+def feed(data_stream: DataStream, sent: list, done: threading.Event):
+    interval = 1 / RATE
+    due = perf_counter()
+    for i in range(int(RATE * SECONDS)):
+        due += interval
+        sleep(max(due - perf_counter(), 0))
+        sent.append(perf_counter())
+        data_stream.on_message(tick(i))
+    done.set()
+    data_stream.events.close()
+
+
+def polling(data_stream, sent, done, latency, interval):
+    seen = 0
+    while not done.is_set():
+        count = data_stream.ticks.count
+        now = perf_counter()
+        for i in range(seen, count):
+            latency.record(now - sent[i])
+        seen = count
+        sleep(interval)
+
+
+def waiting(data_stream, sent, done, latency, interval):
+    seen = 0
+    while True:
+        sequence, event = data_stream.wait_tick(seen)
+        if event is None:
+            break
+        now = perf_counter()
+        for i in range(seen, sequence):
+            latency.record(now - sent[i])
+        seen = sequence
+
+
+def bench(name: str, consumer, interval: float = 0.0) -> None:
+    data_stream = DataStream("EURUSD", bar_specs=())
+    sent: list = []
+    done = threading.Event()
+    latency = LatencyHistogram()
+    cpu = []
+
+    def consume():
+        start = thread_time()
+        consumer(data_stream, sent, done, latency, interval)
+        cpu.append(thread_time() - start)
+
+    thread = threading.Thread(target=consume)
+    thread.start()
+    feed(data_stream, sent, done)
+    thread.join()
+    stats = latency.summary()
+    print(
+        f"{name:>14}: {stats['count']} ticks, latency "
+        f"p50 {stats['p50'] * 1e3:.3f} ms, p99 {stats['p99'] * 1e3:.3f} ms, "
+        f"max {stats['max'] * 1e3:.3f} ms, consumer CPU {cpu[0] * 1e3:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    bench("poll 1 s", polling, 1.0)
+    bench("poll 10 ms", polling, 0.01)
+    bench("poll 1 ms", polling, 0.001)
+    bench("wait_tick", waiting)
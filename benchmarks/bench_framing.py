@@ -0,0 +1,101 @@
+"""
+Throughput of the stream frame decoding: the previous string concatenating
+reader of XTBClient against MessageFramer.
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_framing.py
+"""
+
+import json
+from time import perf_counter
+from api.client import MessageFramer
+
+
+def tick_payload(messages: int) -> bytes:
+    """
+    Builds a stream of tickPrices messages terminated as by the API.
+    """
+    frames = []
+    for i in range(messages):
+        msg = {
+            "command": "tickPrices",
+            "data": {
+                "ask": 1.0 + i * 1e-5,
+                "askVolume": 15000,
+                "bid": 1.0,
+                "bidVolume": 16000,
+                "high": 1.1,
+                "level": 0,
+                "low": 0.9,
+                "quoteId": 0,
+                "spreadRaw": 0.000003,
+                "spreadTable": 0.00042,
+                "symbol": "EURUSD",
+                "timestamp": 1272529161605 + i,
+            },
+        }
+        frames.append(json.dumps(msg).encode("utf-8") + b"\n\n")
+    return b"".join(frames)
+
+
+def chunks(payload: bytes, size: int = 4096) -> list[bytes]:
+    return [payload[i:][:size] for i in range(0, len(payload), size)]
+
+
+def legacy_reader(segments: list[bytes]) -> int:
+    """
+    The algorithm used by stream_read before MessageFramer: a new string
+    per recv, a new decoder per attempt and no leftovers between calls.
+    """
+    segments_iter = iter(segments)
+    decoded = 0
+    try:
+        while True:
+            received_data = ""
+            while True:
+                received_data += next(segments_iter).decode()
+                try:
+                    json.JSONDecoder().raw_decode(received_data)
+                    decoded += 1
+                    break
+                except Exception:
+                    continue
+    except StopIteration:
+        return decoded
+
+
+def framer_reader(segments: list[bytes]) -> int:
+    framer = MessageFramer()
+    decoded = 0
+    for segment in segments:
+        framer.feed(segment)
+        for _ in framer.messages():
+            decoded += 1
+    return decoded
+
+
+def run(name, reader, segments, expected) -> None:
+    start = perf_counter()
+    decoded = reader(segments)
+    elapsed = perf_counter() - start
+    print(
+        f"{name:>8}: {decoded:>6}/{expected} messages, "
+        f"{decoded / elapsed:>10.0f} msg/s, "
+        f"{len(b''.join(segments)) / elapsed / 1e6:>7.1f} MB/s"
+    )
+
+
+if __name__ == "__main__":
+    for messages in (1_000, 20_000):
+        payload = tick_payload(messages)
+        # best case for the legacy reader: one message per recv
+        segments = [frame + b"\n\n" for frame in payload.split(b"\n\n")]
+        segments = segments[:-1]
+        print(f"{messages} tickPrices messages, one message per recv")
+        run("legacy", legacy_reader, segments, messages)
+        run("framer", framer_reader, segments, messages)
+        # busy stream: messages packed into 4096 byte reads
+        segments = chunks(payload)
+        print(f"{messages} tickPrices messages in {len(segments)} chunks")
+        run("legacy", legacy_reader, segments, messages)
+        run("framer", framer_reader, segments, messages)
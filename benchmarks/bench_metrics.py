@@ -0,0 +1,41 @@
+"""
+Overhead of the client instrumentation: the cost of one recorded command
+and the round trip of send_n_return against the local stand-in server
+with and without metrics.
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_metrics.py
+"""
+
+from time import perf_counter
+from api.client import XTBClient
+from api.standin import XTBStandInServer
+from utils.metrics import ClientMetrics
+
+
+def bench_record(calls: int) -> float:
+    metrics = ClientMetrics()
+    start = perf_counter()
+    for i in range(calls):
+        metrics.record_command("getTrades", i * 1e-6, 1e-6, 60, 400)
+    return (perf_counter() - start) / calls
+
+
+def bench_round_trip(client: XTBClient, commands: int) -> float:
+    start = perf_counter()
+    for _ in range(commands):
+        client.send_n_return({"command": "getServerTime"})
+    return (perf_counter() - start) / commands
+
+
+if __name__ == "__main__":
+    print(f"record_command: {bench_record(200_000) * 1e6:.2f} us per call")
+    with XTBStandInServer(tls=False) as server, server.patch_environ("DEMO"):
+        client = XTBClient("DEMO")
+        client.open_session()
+        for label, metrics in (("off", None), ("on", ClientMetrics())):
+            client.metrics = metrics
+            bench_round_trip(client, 200)
+            rate = bench_round_trip(client, 5000)
+            print(f"send_n_return, metrics {label:>3}: {rate * 1e6:.1f} us")
+        client.close_session()
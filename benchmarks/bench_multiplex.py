@@ -0,0 +1,116 @@
+"""
+Commands per second on one main connection: the serial send_n_return path
+of XTBClient against MultiplexedChannel with several callers in flight.
+The local server answers every command after a fixed delay that stands
+for the network round trip.
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_multiplex.py
+"""
+
+import json
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+from threading import Thread
+from time import perf_counter, sleep, monotonic
+from api.client import XTBClient, MultiplexedChannel
+
+ROUND_TRIP = 0.005
+
+
+def serve(conn: socket.socket) -> None:
+    """
+    Answers the commands in order, each one ROUND_TRIP after it arrived.
+    """
+    outbox: Queue = Queue()
+
+    def sender() -> None:
+        while True:
+            due, response = outbox.get()
+            if response is None:
+                return
+            delay = due - monotonic()
+            if delay > 0:
+                sleep(delay)
+            conn.sendall(response)
+
+    Thread(target=sender, daemon=True).start()
+    decoder = json.JSONDecoder()
+    received = ""
+    while True:
+        chunk = conn.recv(65536)
+        if not chunk:
+            outbox.put((0, None))
+            return
+        received += chunk.decode()
+        while received:
+            try:
+                request, size = decoder.raw_decode(received)
+            except ValueError:
+                break
+            received = received[size:]
+            response = {"status": True, "returnData": {"time": 0}}
+            if "customTag" in request:
+                response["customTag"] = request["customTag"]
+            outbox.put(
+                (
+                    monotonic() + ROUND_TRIP,
+                    json.dumps(response).encode("utf-8") + b"\n\n",
+                )
+            )
+
+
+def start_server() -> int:
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+
+    def accept() -> None:
+        while True:
+            conn, _ = listener.accept()
+            Thread(target=serve, args=(conn,), daemon=True).start()
+
+    Thread(target=accept, daemon=True).start()
+    return listener.getsockname()[1]
+
+
+def connected_client(port: int) -> XTBClient:
+    client = XTBClient("DEMO")
+    client.socket_connection = socket.create_connection(("127.0.0.1", port))
+    client.connection = True
+    return client
+
+
+def bench_serial(port: int, commands: int) -> float:
+    client = connected_client(port)
+    start = perf_counter()
+    for _ in range(commands):
+        client.send_n_return({"command": "getServerTime"})
+    return commands / (perf_counter() - start)
+
+
+def bench_multiplexed(port: int, commands: int, callers: int) -> float:
+    client = connected_client(port)
+    with MultiplexedChannel(client) as channel:
+        start = perf_counter()
+        with ThreadPoolExecutor(max_workers=callers) as executor:
+            list(
+                executor.map(
+                    lambda _: channel.send_n_return(
+                        {"command": "getServerTime"}
+                    ),
+                    range(commands),
+                )
+            )
+        return commands / (perf_counter() - start)
+
+
+if __name__ == "__main__":
+    port = start_server()
+    commands = 400
+    print(f"round trip {ROUND_TRIP * 1000:.0f} ms, {commands} commands")
+    print(f"  serial send_n_return: {bench_serial(port, commands):8.0f} cmd/s")
+    for callers in (4, 16, 64):
+        rate = bench_multiplexed(port, commands, callers)
+        print(f"  multiplexed, {callers:>2} callers: {rate:8.0f} cmd/s")
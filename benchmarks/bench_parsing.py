@@ -0,0 +1,125 @@
+"""
+Per-message cost of turning the data of tickPrices, candle and balance
+messages and the rateInfos of a chart command into arrays: the previous
+copy/pop/fromiter/reshape path, which depends on the key order of the
+server, against the key-addressed RecordParser.
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_parsing.py
+"""
+
+from copy import copy
+from timeit import repeat
+import numpy as np
+from api.commands import candles_to_array
+from data.buffers import TICK_DTYPE, TICK_FIELDS, RingBuffer
+from data.candles import CANDLE_DTYPE
+from data.records import BALANCE_DTYPE, BALANCE_FIELDS, RecordParser
+
+NUMBER = 20000
+RATE_INFOS = 1000
+
+TICK = {field: 1.0 for field in TICK_FIELDS} | {"symbol": "EURUSD"}
+CANDLE = {
+    "close": 4.1849,
+    "ctm": 1378369375000,
+    "ctmString": "Sep 05, 2013 10:22:55 AM",
+    "high": 4.1854,
+    "low": 4.1848,
+    "open": 4.1848,
+    "quoteId": 2,
+    "symbol": "EURUSD",
+    "vol": 0.0,
+}
+BALANCE = {field: 1.0 for field in BALANCE_FIELDS}
+RATE_INFO = {
+    "ctm": 1389362640000,
+    "ctmString": "Jan 10, 2014 3:04:00 PM",
+    "open": 4000.0,
+    "close": 1.0,
+    "high": 6.0,
+    "low": 0.0,
+    "vol": 0.0,
+}
+
+
+def previous_tick(data):
+    data = copy(data)
+    data.pop("symbol")
+    return np.fromiter(data.values(), dtype=float).reshape(1, 11)
+
+
+def previous_candle(data):
+    data = copy(data)
+    for key in ("ctmString", "quoteId", "symbol"):
+        data.pop(key)
+    return np.fromiter(data.values(), dtype=float).reshape(1, 6)
+
+
+def previous_balance(data):
+    return np.fromiter(data.values(), dtype=float)
+
+
+def previous_rate_infos(records):
+    historical_data = np.empty(shape=[0, 6])
+    for candle in records:
+        candle = copy(candle)
+        candle.pop("ctmString")
+        candle_data = np.fromiter(candle.values(), dtype=float).reshape(1, 6)
+        candle_data[0, 2] = candle_data[0, 1] + candle_data[0, 2]
+        candle_data[0, 3] = candle_data[0, 1] + candle_data[0, 3]
+        candle_data[0, 4] = candle_data[0, 1] + candle_data[0, 4]
+        historical_data = np.vstack([historical_data, candle_data])
+    return historical_data
+
+
+def per_call(function, *args, number=NUMBER) -> float:
+    return min(repeat(lambda: function(*args), number=number, repeat=5)) / (
+        number
+    )
+
+
+def compare(name: str, previous: float, parsed: float, per: str) -> None:
+    print(
+        f"{name:>10}: previous {previous * 1e6:8.2f} us, "
+        f"RecordParser {parsed * 1e6:8.2f} us per {per} "
+        f"({previous / parsed:.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    ticks = RingBuffer(TICK_DTYPE, 4096)
+    tick_parser = RecordParser(TICK_DTYPE, "tickPrices")
+    candle_parser = RecordParser(CANDLE_DTYPE, "candle")
+    balance_parser = RecordParser(BALANCE_DTYPE, "balance")
+    records = [dict(RATE_INFO) for _ in range(RATE_INFOS)]
+    compare(
+        "tick",
+        per_call(previous_tick, TICK),
+        per_call(tick_parser.array, TICK),
+        "message",
+    )
+    compare(
+        "tick",
+        per_call(previous_tick, TICK),
+        per_call(ticks.append_fields, TICK),
+        "message appended to a RingBuffer",
+    )
+    compare(
+        "candle",
+        per_call(previous_candle, CANDLE),
+        per_call(candle_parser.array, CANDLE),
+        "message",
+    )
+    compare(
+        "balance",
+        per_call(previous_balance, BALANCE),
+        per_call(balance_parser.array, BALANCE),
+        "message",
+    )
+    compare(
+        "rateInfos",
+        per_call(previous_rate_infos, records, number=5) / RATE_INFOS,
+        per_call(candles_to_array, records, number=5) / RATE_INFOS,
+        f"record of {RATE_INFOS}",
+    )
@@ -0,0 +1,113 @@
+"""
+Threads and tick-to-consumer latency of a shared stream consumed per
+symbol by a thread reading a StreamSubscriber queue, against callbacks
+dispatched by the Reactor. A local feeder sends tickPrices messages
+stamped with perf_counter, so the latency covers the socket, the framing,
+the decoding and the hand-over to the consumer.
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_reactor.py
+"""
+
+import json
+import socket
+import threading
+from time import perf_counter, sleep
+from api.client import XTBClient, Reactor
+from api.standin import XTBStandInServer
+from api.streamtools import StreamDemultiplexer
+from utils.metrics import LatencyHistogram
+
+SYMBOLS = [f"SYM{i}" for i in range(50)]
+RATE = 5000
+SECONDS = 2.0
+
+
+def feed(connection: socket.socket) -> None:
+    interval = 1 / RATE
+    due = perf_counter()
+    for i in range(int(RATE * SECONDS)):
+        message = {
+            "command": "tickPrices",
+            "data": {"symbol": SYMBOLS[i % len(SYMBOLS)], "sent": 0.0},
+        }
+        due += interval
+        while perf_counter() < due:
+            pass
+        message["data"]["sent"] = perf_counter()
+        connection.sendall(json.dumps(message).encode("utf-8") + b"\n\n")
+    connection.close()
+
+
+def stream_client() -> tuple[XTBClient, socket.socket]:
+    client = XTBClient("DEMO")
+    client.metrics = None
+    ours, theirs = socket.socketpair()
+    client.socket_stream_connection = ours
+    client.connection_stream = True
+    return client, theirs
+
+
+def bench_threads() -> tuple[int, LatencyHistogram]:
+    client, feeder = stream_client()
+    histogram = LatencyHistogram()
+    demux = StreamDemultiplexer(client).start()
+
+    def consume(symbol: str) -> None:
+        subscriber = demux.subscribe([("tickPrices", symbol)])
+        while True:
+            try:
+                message = subscriber.stream_read()
+            except ConnectionError:
+                return
+            histogram.record(perf_counter() - message["data"]["sent"])
+
+    consumers = [
+        threading.Thread(target=consume, args=(symbol,), daemon=True)
+        for symbol in SYMBOLS
+    ]
+    for consumer in consumers:
+        consumer.start()
+    sleep(0.2)
+    threads = threading.active_count()
+    feed(feeder)
+    for consumer in consumers:
+        consumer.join()
+    return threads, histogram
+
+
+def bench_reactor() -> tuple[int, LatencyHistogram]:
+    client, feeder = stream_client()
+    histogram = LatencyHistogram()
+    with Reactor() as reactor:
+        demux = StreamDemultiplexer(client).attach(reactor)
+
+        def consume(message: dict) -> None:
+            histogram.record(perf_counter() - message["data"]["sent"])
+
+        listeners = [
+            demux.subscribe_callback([("tickPrices", symbol)], consume)
+            for symbol in SYMBOLS
+        ]
+        threads = threading.active_count()
+        feed(feeder)
+        listeners[0].wait(5)
+    return threads, histogram
+
+
+if __name__ == "__main__":
+    with XTBStandInServer(tls=False) as server, server.patch_environ("DEMO"):
+        base = threading.active_count()
+        for name, bench in (
+            ("threads", bench_threads),
+            ("reactor", bench_reactor),
+        ):
+            threads, histogram = bench()
+            summary = histogram.summary()
+            print(
+                f"{name:>8}: {threads - base:3d} threads, "
+                f"{summary['count']} ticks, "
+                f"p50 {summary['p50'] * 1e6:.0f} us, "
+                f"p99 {summary['p99'] * 1e6:.0f} us, "
+                f"max {summary['max'] * 1e6:.0f} us"
+            )
@@ -0,0 +1,128 @@
+"""
+Allocations and CPU time of the stream receive path under a synthetic
+stream of 5000 tickPrices messages per second: the previous framer fed
+with a new bytes object per recv against MessageFramer.recv_into, which
+receives into its reused buffer and only allocates complete frames.
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_receive.py
+"""
+
+import json
+import socket
+import threading
+from time import perf_counter, thread_time
+from typing import Optional
+from api.client import MessageFramer
+
+RATE = 5000
+SECONDS = 2.0
+
+
+class PreviousFramer:
+    """
+    The framer before recv_into, counting the buffers of payload bytes it
+    allocates: the chunk of every recv and two copies per frame.
+    """
+
+    TERMINATOR = b"\n\n"
+
+    def __init__(self, chunk_size: int = 4096) -> None:
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+        self._start = 0
+        self._scan_from = 0
+        self.metrics = {"reads": 0, "frames": 0, "allocations": 0}
+
+    def stats(self) -> dict[str, float]:
+        return {
+            **self.metrics,
+            "allocations_per_frame": (
+                self.metrics["allocations"] / self.metrics["frames"]
+            ),
+        }
+
+    def recv_into(self, connection: socket.socket) -> int:
+        chunk = connection.recv(self.chunk_size)
+        if self._start:
+            del self.buffer[: self._start]
+            self._scan_from -= self._start
+            self._start = 0
+        self.buffer += chunk
+        self.metrics["reads"] += 1
+        self.metrics["allocations"] += 1
+        return len(chunk)
+
+    def next_frame(self) -> Optional[bytes]:
+        end = self.buffer.find(
+            self.TERMINATOR, max(self._start, self._scan_from)
+        )
+        if end == -1:
+            self._scan_from = max(self._start, len(self.buffer) - 1)
+            return None
+        start = self._start
+        frame = bytes(self.buffer[start:end])
+        self._start = end + 2
+        self._scan_from = self._start
+        self.metrics["frames"] += 1
+        self.metrics["allocations"] += 2
+        return frame
+
+
+def tick(i: int) -> bytes:
+    message = {
+        "command": "tickPrices",
+        "data": {
+            "ask": 1.0 + i * 1e-5,
+            "askVolume": 15000,
+            "bid": 1.0,
+            "bidVolume": 16000,
+            "high": 1.1,
+            "level": 0,
+            "low": 0.9,
+            "quoteId": 0,
+            "spreadRaw": 0.000003,
+            "spreadTable": 0.00042,
+            "symbol": "EURUSD",
+            "timestamp": 1272529161605 + i,
+        },
+    }
+    return json.dumps(message).encode("utf-8") + b"\n\n"
+
+
+def feed(connection: socket.socket) -> None:
+    frames = [tick(i) for i in range(int(RATE * SECONDS))]
+    interval = 1 / RATE
+    due = perf_counter()
+    for frame in frames:
+        due += interval
+        while perf_counter() < due:
+            pass
+        connection.sendall(frame)
+    connection.close()
+
+
+def bench(framer) -> None:
+    ours, theirs = socket.socketpair()
+    feeder = threading.Thread(target=feed, args=(theirs,))
+    feeder.start()
+    frames = 0
+    start = thread_time()
+    while framer.recv_into(ours):
+        while framer.next_frame() is not None:
+            frames += 1
+    cpu = thread_time() - start
+    feeder.join()
+    ours.close()
+    stats = framer.stats()
+    print(
+        f"{type(framer).__name__:>14}: {frames} messages, "
+        f"{stats['reads']} reads, "
+        f"{stats['allocations_per_frame']:.2f} payload buffers/message, "
+        f"{cpu / frames * 1e6:.2f} us CPU/message"
+    )
+
+
+if __name__ == "__main__":
+    bench(PreviousFramer())
+    bench(MessageFramer())
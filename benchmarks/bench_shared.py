@@ -0,0 +1,61 @@
+"""
+Cost of handing the latest quote of a symbol to a model process: the
+MarketDataPublisher writing into shared memory and a MarketDataReader
+copying a consistent snapshot, against pickling the tickPrices message
+through a multiprocessing.Queue.
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_shared.py
+"""
+
+import multiprocessing
+from time import perf_counter
+from uuid import uuid4
+from data.buffers import TICK_FIELDS
+from data.shared import MarketDataPublisher, MarketDataReader
+
+NUMBER = 50000
+MESSAGE = {
+    "command": "tickPrices",
+    "data": {field: 1.0 for field in TICK_FIELDS} | {"symbol": "EURUSD"},
+}
+
+
+def per_call(function, number: int = NUMBER) -> float:
+    start = perf_counter()
+    for _ in range(number):
+        function()
+    return (perf_counter() - start) / number
+
+
+def drain(queue, number: int) -> None:
+    for _ in range(number):
+        queue.get()
+
+
+def bench_queue() -> float:
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    consumer = context.Process(target=drain, args=(queue, NUMBER))
+    consumer.start()
+    start = perf_counter()
+    for _ in range(NUMBER):
+        queue.put(MESSAGE)
+    consumer.join()
+    return (perf_counter() - start) / NUMBER
+
+
+if __name__ == "__main__":
+    prefix = f"bench_{uuid4().hex[:8]}"
+    publisher = MarketDataPublisher(["EURUSD"], prefix=prefix)
+    reader = MarketDataReader("EURUSD", prefix)
+    write = per_call(lambda: publisher.on_message(MESSAGE))
+    read = per_call(reader.quote)
+    reader.close()
+    publisher.close()
+    print(
+        f"shared memory: publish {write * 1e6:.2f} us, read {read * 1e6:.2f} us"
+    )
+    print(
+        f"        queue: put and get {bench_queue() * 1e6:.2f} us per message"
+    )
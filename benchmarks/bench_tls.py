@@ -0,0 +1,85 @@
+"""
+Time to a ready main connection of a fresh client against the local
+stand-in server with TLS: a socket of the previous ssl.wrap_socket kind
+with a full handshake per connection, the shared context of
+ConnectionFactory resuming the cached TLS session, and a socket taken
+from the warm-up pool. Against the remote server the full and resumed
+handshakes both add the TCP and TLS round trips, which a warm socket
+does not pay.
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_tls.py
+"""
+
+import socket
+import ssl
+from time import perf_counter, sleep
+from typing import Callable
+from api.client import ConnectionFactory
+from api.standin import XTBStandInServer
+from utils.metrics import LatencyHistogram
+
+CONNECTIONS = 200
+
+
+def previous_socket() -> ssl.SSLSocket:
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context.wrap_socket(socket.socket(socket.AF_INET))
+
+
+def ping(sock: ssl.SSLSocket) -> None:
+    # reads the session ticket, as the login response does
+    sock.sendall(b'{"command": "ping"}\n\n')
+    sock.recv(1024)
+
+
+def bench(
+    connect: Callable[[], ssl.SSLSocket],
+    connections: int = CONNECTIONS,
+    pause: float = 0.0,
+) -> LatencyHistogram:
+    histogram = LatencyHistogram()
+    for _ in range(connections):
+        sleep(pause)
+        start = perf_counter()
+        sock = connect()
+        histogram.record(perf_counter() - start)
+        ping(sock)
+        factory.save_session(sock, address)
+        sock.close()
+    return histogram
+
+
+if __name__ == "__main__":
+    with XTBStandInServer(tls=True) as server:
+        address = (server.host, server.main_port)
+        factory = ConnectionFactory()
+
+        def full() -> ssl.SSLSocket:
+            sock = previous_socket()
+            sock.connect(address)
+            return sock
+
+        def resumed() -> ssl.SSLSocket:
+            return factory.connect(factory.new_socket(), address)
+
+        results = [("full", bench(full)), ("resumed", bench(resumed))]
+        factory.warm_up(address, count=1)
+        # a new position every 50 ms leaves time for the refill
+        results.append(("warm", bench(resumed, CONNECTIONS // 10, 0.05)))
+        for name, histogram in results:
+            summary = histogram.summary()
+            print(
+                f"{name:>8}: p50 {summary['p50'] * 1e3:.2f} ms, "
+                f"p99 {summary['p99'] * 1e3:.2f} ms"
+            )
+        stats = factory.stats()
+        print(
+            f"{stats['resumed_handshakes']} resumed and "
+            f"{stats['full_handshakes']} full handshakes, "
+            f"{stats['warm_hits']} warm hits, "
+            f"{stats['warm_misses']} misses"
+        )
+        factory.clear()
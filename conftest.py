@@ -0,0 +1,20 @@
+"""
+Shared fixtures of the test suite. Unless XTB_LIVE_TESTS is set, the DEMO
+settings point at a local stand-in of the XTB API, so the tests needing
+a server run offline.
+"""
+
+import os
+import pytest
+
+
+@pytest.fixture(scope="session", autouse=True)
+def xtb_standin():
+    if os.getenv("XTB_LIVE_TESTS"):
+        yield None
+        return
+    from api.standin import XTBStandInServer
+
+    with XTBStandInServer(tick_rate=50.0) as server:
+        with server.patch_environ("DEMO"):
+            yield server
@@ -21,6 +21,8 @@ class XTBUserDEMO:
             the XTB API in demo trading mode.
         streaming_port (int): The streaming port number for real-time data from
             the XTB API in demo trading mode.
+        tls (bool): Whether the connections use TLS, false only for a local
+            stand-in server.
         websocket (str): The WebSocket URL for connecting to the XTB API in demo
             trading mode.
         websocket_streaming_port (str): The WebSocket streaming port number for
@@ -39,6 +41,7 @@ class XTBUserDEMO:
         self.host = getenv("XTB_HOST_DEMO")
         self.main_port = int(getenv("XTB_MAIN_PORT_DEMO", "O"))
         self.streaming_port = int(getenv("XTB_STREAMING_PORT_DEMO", "O"))
+        self.tls = getenv("XTB_TLS_DEMO", "true").lower() != "false"
         self.websocket = getenv("XTB_WEBSOCKET_DEMO")
         self.websocket_streaming_port = getenv(
             "XTB_WEBSOCKET_STREAMING_PORT_DEMO"
@@ -60,6 +63,8 @@ class XTBUserREAL:
             the XTB API in real trading mode.
         streaming_port (int): The streaming port number for real-time data from
             the XTB API in real trading mode.
+        tls (bool): Whether the connections use TLS, false only for a local
+            stand-in server.
         websocket (str): The WebSocket URL for connecting to the XTB API in real
             trading mode.
         websocket_streaming_port (str): The WebSocket streaming port number for
@@ -73,6 +78,7 @@ class XTBUserREAL:
         self.host = getenv("XTB_HOST_REAL")
         self.main_port = int(getenv("XTB_MAIN_PORT_REAL", "O"))
         self.streaming_port = int(getenv("XTB_STREAMING_PORT_REAL", "O"))
+        self.tls = getenv("XTB_TLS_REAL", "true").lower() != "false"
         self.websocket = getenv("XTB_WEBSKOCET_REAL")
         self.websocket_streaming_port = getenv(
             "XTB_WEBSOCKET_STRAMING_PORT_REAL"
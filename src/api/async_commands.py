@@ -0,0 +1,256 @@
+"""
+Module containing asynchronous commands to APIs used outside the data
+stream. The functions mirror api.commands for AsyncXTBClient.
+"""
+
+import asyncio
+from typing import Optional, Any
+import numpy as np
+from api.client import AsyncCommandSender
+from api.commands import (
+    trade_transaction_info,
+    opened_trade_data,
+    closed_trade_data,
+    candles_to_array,
+)
+from utils.metrics import client_metrics
+from utils.technical import setup_logger
+
+
+async def get_trades(
+    client: AsyncCommandSender, order_no: int, interval: float = 1.0
+) -> dict[str, Any]:
+    """
+    Retrieves trading data for a specific order number, polling until the
+    server reports the opened position.
+
+    Args:
+        client (AsyncCommandSender): The client object used for API
+            communication.
+        order_no (int): The order number of the position.
+        interval (float, optional): The pause between queries in seconds.
+            Defaults to 1.
+
+    Returns:
+        A dictionary containing the trading data for the specified order.
+    """
+    message = {"command": "getTrades", "arguments": {"openedOnly": True}}
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            response = await client.send_n_return(message)
+            if isinstance(response["returnData"], list):
+                for trade in response["returnData"]:
+                    if int(trade.get("order2", 0)) == order_no:
+                        return opened_trade_data(trade, order_no)
+        except Exception:
+            pass
+        client_metrics.record_retry("getTrades")
+
+
+async def get_margin(
+    client: AsyncCommandSender, symbol: str, volume: float
+) -> Optional[float]:
+    """
+    Calculate the margin required for a given trading position.
+
+    Args:
+        client (AsyncCommandSender): The client object used for API
+            communication.
+        symbol (str): The symbol of the trading position.
+        volume (float): The volume of the trading position.
+
+    Returns:
+        float: The margin required for the trading position.
+    """
+    message = {
+        "command": "getMarginTrade",
+        "arguments": {"symbol": symbol, "volume": volume},
+    }
+    response = (await client.send_n_return(message)).get("returnData", 0)
+    if isinstance(response, dict):
+        return float(response.get("margin", 0))
+    else:
+        return None
+
+
+async def open_transaction(
+    client: AsyncCommandSender, symbol: str, volume: float, cmd: int
+) -> dict[str, Any]:
+    """
+    Opens a transaction and returns the position information.
+
+    Args:
+        client (AsyncCommandSender): The client object used for API
+            communication.
+        symbol (str): The symbol of the asset.
+        volume (float): The volume of the position.
+        cmd (int): The command type of the position (0 - buy, 1 - sell).
+
+    Returns:
+        A dictionary containing the order number, margin and transaction
+            data for the position opened or an empty dictionary if the
+            transaction failed.
+    """
+    side = "buy" if cmd == 0 else "sell"
+    logging = setup_logger(side, f"{side}.log")
+    response = await client.send_n_return(
+        {
+            "command": "tradeTransaction",
+            "arguments": trade_transaction_info(
+                symbol=symbol, volume=volume, cmd=cmd
+            ),
+        }
+    )
+    returned_data = response.get("returnData", 0)
+    margin = await get_margin(client=client, symbol=symbol, volume=volume)
+    logging.info(f"{response}")
+    logging.info(f"margin: {margin}")
+    if response["status"] is not True or not isinstance(returned_data, dict):
+        logging.info(f"{symbol} {side} transaction failed")
+        return {}
+    order_no = int(returned_data.get("order", 0))
+    transactions_data = await get_trades(client=client, order_no=order_no)
+    if margin is None:
+        logging.info(f"{symbol} {side} transaction failed")
+        return {}
+    logging.info(f"{symbol} {side} transaction opened (order no: {order_no})")
+    return {
+        "order_no": order_no,
+        "margin": margin,
+        "transactions_data": transactions_data,
+    }
+
+
+async def buy_transaction(
+    client: AsyncCommandSender, symbol: str, volume: float
+) -> dict[str, Any]:
+    """
+    Opens a buy transaction and returns the position information.
+    """
+    return await open_transaction(client, symbol, volume, cmd=0)
+
+
+async def sell_transaction(
+    client: AsyncCommandSender, symbol: str, volume: float
+) -> dict[str, Any]:
+    """
+    Opens a sell transaction and returns the position information.
+    """
+    return await open_transaction(client, symbol, volume, cmd=1)
+
+
+async def close_position(
+    client: AsyncCommandSender,
+    symbol: str,
+    position: int,
+    volume: float,
+    cmd: int,
+    interval: float = 1.0,
+) -> dict[str, Any]:
+    """
+    Close a trading position.
+
+    Args:
+        client (AsyncCommandSender): The client object used for API
+            communication.
+        symbol (str): The symbol of the trading position to be closed.
+        position (int): The position number to be closed.
+        volume (float): The volume of the trading position to be closed.
+        cmd (int): The command type of the trading position (buy/sell).
+        interval (float, optional): The pause between the retries of the
+            close and between the history queries in seconds. Defaults
+            to 1.
+
+    Returns:
+        dict: Information about the closed position, including order
+            details and profit.
+    """
+    close_arguments = trade_transaction_info(
+        symbol=symbol, volume=volume, cmd=cmd, trade_type=2, order=position
+    )
+    while True:
+        close_response = await client.send_n_return(
+            {"command": "tradeTransaction", "arguments": close_arguments}
+        )
+        if close_response["status"] is True:
+            break
+        client_metrics.record_retry("tradeTransaction")
+        await asyncio.sleep(interval)
+    server_time = await get_server_time(client) or 0
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            trades_stats = (
+                await client.send_n_return(
+                    {
+                        "command": "getTradesHistory",
+                        "arguments": {"end": 0, "start": server_time - 10000},
+                    }
+                )
+            ).get("returnData", 0)
+            if isinstance(trades_stats, list):
+                for trade in trades_stats:
+                    if int(trade.get("position", 0)) == position:
+                        return closed_trade_data(trade)
+        except Exception:
+            pass
+        client_metrics.record_retry("getTradesHistory")
+
+
+async def get_historical_candles(
+    client: AsyncCommandSender, symbol: str, shift: int, period: int = 1
+) -> np.ndarray[Any, np.dtype[Any]]:
+    """
+    Retrieve historical candle data for a specific symbol.
+
+    Args:
+        client (AsyncCommandSender): The client object used for API
+            communication.
+        symbol (str): The symbol for which to retrieve historical candle data.
+        shift (int): The number of historical candles to retrieve.
+        period (int, optional): The period of each candle in minutes.
+            Defaults to 1.
+
+    Returns:
+        np.ndarray: An array containing the historical candle data.
+    """
+    server_time = await get_server_time(client) or 0
+    start_times = server_time - (shift * 6e4)
+    while True:
+        try:
+            data = await client.send_n_return(
+                {
+                    "command": "getChartLastRequest",
+                    "arguments": {
+                        "info": {
+                            "period": period,
+                            "start": start_times,
+                            "symbol": symbol,
+                        }
+                    },
+                }
+            )
+            return candles_to_array(
+                data["returnData"]["rateInfos"], data["returnData"]["digits"]
+            )
+        except Exception:
+            client_metrics.record_retry("getChartLastRequest")
+            await asyncio.sleep(1)
+
+
+async def get_server_time(client: AsyncCommandSender) -> Optional[int]:
+    """
+    Retrieves the server time from the specified client.
+
+    Args:
+        client (AsyncCommandSender): The client object used to communicate with
+            the server.
+    """
+    data = (await client.send_n_return({"command": "getServerTime"})).get(
+        "returnData", 0
+    )
+    if isinstance(data, dict):
+        return int(data.get("time", 0))
+    else:
+        return None
@@ -2,16 +2,749 @@
 Module containing clients objects for api and wrappers for testing clients.
 """
 
+import asyncio
+import heapq
+import itertools
 import json
+import random
+import select
+import selectors
 import socket
 import ssl
-import sys
-from threading import Thread
-from typing import Union, Callable, Any
-from time import sleep
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from threading import Thread, Condition, Lock, current_thread
+from typing import (
+    Union,
+    Callable,
+    Any,
+    AsyncIterator,
+    Iterator,
+    Optional,
+    Protocol,
+    TypeVar,
+)
+from time import sleep, monotonic, perf_counter
 from settings import XTBUserDEMO, XTBUserREAL
+from api.replay import (
+    CaptureWriter,
+    COMMAND_SENT,
+    COMMAND_RECEIVED,
+    STREAM_SENT,
+    STREAM_RECEIVED,
+)
+from utils.metrics import ClientMetrics, LatencyHistogram, client_metrics
 from utils.technical import setup_logger
 
+T = TypeVar("T")
+# stream command and symbol of a stream subscription
+Subscription = tuple[str, Optional[str]]
+
+
+class CommandSender(Protocol):
+    """
+    Anything that sends a command and returns its response, e.g.
+    XTBClient, MultiplexedChannel or CommandScheduler, as taken by the
+    functions of api.commands.
+    """
+
+    def send_n_return(self, packet: dict[str, Any]) -> Any: ...
+
+
+class AsyncCommandSender(Protocol):
+    """
+    Anything that sends a command and awaits its response, e.g.
+    AsyncXTBClient, as taken by the functions of api.async_commands.
+    """
+
+    async def send_n_return(self, packet: dict[str, Any]) -> Any: ...
+
+
+def select_user(mode: str) -> Union[XTBUserREAL, XTBUserDEMO]:
+    """
+    Returns the user credentials for the given mode.
+
+    Args:
+        mode (str): The mode to connect to the server in. Must be either
+        "REAL" or "DEMO".
+
+    Raises:
+        ValueError: If the mode argument is not "REAL" or "DEMO".
+    """
+    if mode == "REAL":
+        return XTBUserREAL()
+    elif mode == "DEMO":
+        return XTBUserDEMO()
+    else:
+        raise ValueError(
+            "Invalid mode argument. Must be either 'REAL' or 'DEMO'."
+        )
+
+
+class MessageFramer:
+    """
+    Incremental decoder of the frames sent by the API. Every JSON message
+    from the server is terminated with a blank line. The framer receives
+    with recv_into straight into one preallocated buffer, scans only the
+    new bytes for the terminator and copies out only the bytes of complete
+    frames. When the free tail of the buffer gets shorter than a chunk, the
+    unread bytes are moved to its front, so the buffer is reused for the
+    lifetime of the connection and grows only for frames larger than it.
+    Several messages delivered in one TCP segment are returned one after
+    another instead of being dropped.
+
+    Args:
+        chunk_size (int, optional): The smallest free space requested from
+            the socket per read. Defaults to 4096.
+        capacity (int, optional): The initial size of the buffer.
+            Defaults to 65536.
+
+    Attributes:
+        chunk_size (int): The smallest free space requested per read.
+        buffer (bytearray): The receive buffer, holding the bytes not yet
+            returned as frames between its read and write positions.
+        metrics (dict): Counters of the reads, the chunks passed to feed,
+            the frames copied out of the buffer and the compactions and
+            growths of the buffer.
+    """
+
+    TERMINATOR = b"\n\n"
+    DECODER = json.JSONDecoder()
+
+    def __init__(self, chunk_size: int = 4096, capacity: int = 65536) -> None:
+        self.chunk_size = chunk_size
+        self.buffer = bytearray(max(capacity, chunk_size))
+        self._view = memoryview(self.buffer)
+        self._start: int = 0
+        self._end: int = 0
+        self._scan_from: int = 0
+        self.metrics: dict[str, int] = {
+            "reads": 0,
+            "fed": 0,
+            "frames": 0,
+            "compactions": 0,
+            "grows": 0,
+        }
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    def _reserve(self, size: int) -> None:
+        """
+        Makes room for size bytes after the received ones.
+        """
+        if len(self.buffer) - self._end >= size:
+            return
+        start, end = self._start, self._end
+        unread = end - start
+        if unread + size > len(self.buffer):
+            buffer = bytearray(max(2 * len(self.buffer), unread + size))
+            buffer[:unread] = self._view[start:end]
+            self._view.release()
+            self.buffer = buffer
+            self._view = memoryview(buffer)
+            self.metrics["grows"] += 1
+        else:
+            # memoryview assignment moves overlapping bytes safely
+            self._view[:unread] = self._view[start:end]
+            self.metrics["compactions"] += 1
+        self._scan_from -= self._start
+        self._start = 0
+        self._end = unread
+
+    def recv_into(self, connection: socket.socket) -> int:
+        """
+        Receives from a socket directly into the free tail of the buffer.
+
+        Args:
+            connection (socket): The socket to read from.
+
+        Returns:
+            int: The number of received bytes, 0 if the peer closed the
+                connection.
+        """
+        self._reserve(self.chunk_size)
+        end = self._end
+        received = connection.recv_into(
+            self._view[end:] if end else self._view
+        )
+        self._end += received
+        self.metrics["reads"] += 1
+        return received
+
+    def feed(self, data: bytes) -> None:
+        """
+        Appends bytes received elsewhere, e.g. from an asyncio stream,
+        to the buffer.
+
+        Args:
+            data (bytes): The received bytes.
+        """
+        self._reserve(len(data))
+        start, end = self._end, self._end + len(data)
+        self.buffer[start:end] = data
+        self._end = end
+        self.metrics["fed"] += 1
+
+    def next_frame(self) -> Optional[bytes]:
+        """
+        Returns the next complete frame from the buffer.
+
+        Returns:
+            bytes: The frame without its terminator or None if the buffer
+                does not hold a complete frame yet.
+        """
+        while True:
+            end = self.buffer.find(
+                self.TERMINATOR, max(self._start, self._scan_from), self._end
+            )
+            if end == -1:
+                # the terminator may be split between two chunks
+                self._scan_from = max(
+                    self._start, self._end - len(self.TERMINATOR) + 1
+                )
+                return None
+            start = self._start
+            frame = self._view[start:end].tobytes()
+            self._start = end + len(self.TERMINATOR)
+            self._scan_from = self._start
+            if self._start == self._end:
+                # nothing left to move by the next compaction
+                self._start = self._end = self._scan_from = 0
+            self.metrics["frames"] += 1
+            if frame.strip():
+                return frame
+
+    def frames(self) -> Iterator[bytes]:
+        """
+        Yields all complete frames currently held in the buffer.
+        """
+        while True:
+            frame = self.next_frame()
+            if frame is None:
+                return
+            yield frame
+
+    def messages(self) -> Iterator[Any]:
+        """
+        Yields all complete frames currently held in the buffer decoded
+        from JSON.
+        """
+        for frame in self.frames():
+            yield self.decode(frame)
+
+    def decode(self, frame: bytes) -> Any:
+        """
+        Decodes a single frame from JSON with the decoder shared by all
+        framers.
+        """
+        return self.DECODER.decode(frame.decode("utf-8"))
+
+    def stats(self) -> dict[str, float]:
+        """
+        Returns the counters with the number of buffers holding payload
+        bytes allocated by the receive path (the copied frames, the buffer
+        growths and the chunks passed to feed) in total and per frame.
+        The small memoryview headers of the slices are not counted.
+        """
+        allocations = (
+            self.metrics["frames"]
+            + self.metrics["grows"]
+            + self.metrics["fed"]
+        )
+        return {
+            **self.metrics,
+            "allocations": allocations,
+            "allocations_per_frame": (
+                allocations / self.metrics["frames"]
+                if self.metrics["frames"]
+                else 0.0
+            ),
+        }
+
+    def clear(self) -> None:
+        """
+        Drops all buffered bytes, e.g. after the socket was reconnected.
+        The buffer itself is kept.
+        """
+        self._start = 0
+        self._end = 0
+        self._scan_from = 0
+
+
+def is_success(response: Any) -> bool:
+    """
+    Checks whether a response of the API reports success.
+    """
+    return isinstance(response, dict) and response.get("status") is True
+
+
+class ReconnectEngine:
+    """
+    Retries the recovery of a connection with exponential backoff and
+    jitter and measures the time to recover. The jitter spreads the
+    attempts of many clients dropped by the same network blip, so they
+    do not hit the server at the same moment.
+
+    Args:
+        base_delay (float, optional): The delay after the first failed
+            attempt in seconds. Defaults to 0.5.
+        max_delay (float, optional): The maximum delay between attempts
+            in seconds. Defaults to 30.
+        factor (float, optional): The growth of the delay per attempt.
+            Defaults to 2.
+        jitter (float, optional): The fraction of the delay drawn at
+            random, between 0 and 1. Defaults to 0.5.
+        max_attempts (int, optional): The number of attempts before the
+            recovery is given up. Defaults to 10.
+
+    Attributes:
+        base_delay (float): The delay after the first failed attempt.
+        max_delay (float): The maximum delay between attempts.
+        factor (float): The growth of the delay per attempt.
+        jitter (float): The fraction of the delay drawn at random.
+        max_attempts (int): The number of attempts of one recovery.
+        metrics (dict): The numbers of recoveries, attempts and failures
+            and the last, maximum and total time to recover in seconds.
+    """
+
+    def __init__(
+        self,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+        factor: float = 2.0,
+        jitter: float = 0.5,
+        max_attempts: int = 10,
+    ) -> None:
+        if not 0 <= jitter <= 1:
+            raise ValueError("jitter must be between 0 and 1")
+        self.logging = setup_logger(
+            "client_logger", "client.log", print_logs=False
+        )
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.jitter = jitter
+        self.max_attempts = max_attempts
+        self.metrics: dict[str, float] = {
+            "recoveries": 0,
+            "attempts": 0,
+            "failed_attempts": 0,
+            "given_up": 0,
+            "time_to_recover": 0.0,
+            "max_time_to_recover": 0.0,
+            "total_time_to_recover": 0.0,
+        }
+        self._random = random.Random()
+
+    def delay(self, attempt: int) -> float:
+        """
+        Returns the delay after a failed attempt, counted from 0.
+        """
+        delay = min(self.max_delay, self.base_delay * self.factor**attempt)
+        return delay * (1 - self.jitter * self._random.random())
+
+    def run(
+        self,
+        recover: Callable[[], T],
+        name: str = "connection",
+        since: Optional[float] = None,
+    ) -> T:
+        """
+        Calls recover until it succeeds.
+
+        Args:
+            recover (callable): Restores the connection, raising
+                ConnectionError or OSError on failure.
+            name (str, optional): The name of the connection in the logs.
+            since (float, optional): The monotonic time the connection was
+                lost. Defaults to now.
+
+        Returns:
+            The result of recover.
+
+        Raises:
+            ConnectionError: If all attempts failed.
+        """
+        since = monotonic() if since is None else since
+        for attempt in range(self.max_attempts):
+            self.metrics["attempts"] += 1
+            try:
+                result = recover()
+            except (ConnectionError, OSError) as e:
+                self.metrics["failed_attempts"] += 1
+                delay = self.delay(attempt)
+                self.logging.info(
+                    f"Recovery of {name} failed ({e}), "
+                    f"next attempt in {delay:.2f} s"
+                )
+                if attempt + 1 < self.max_attempts:
+                    sleep(delay)
+                continue
+            elapsed = monotonic() - since
+            self.metrics["recoveries"] += 1
+            self.metrics["time_to_recover"] = elapsed
+            self.metrics["total_time_to_recover"] += elapsed
+            self.metrics["max_time_to_recover"] = max(
+                self.metrics["max_time_to_recover"], elapsed
+            )
+            self.logging.info(f"{name} recovered in {elapsed:.3f} s")
+            return result
+        self.metrics["given_up"] += 1
+        self.logging.warning(
+            f"Unable to recover {name} in {self.max_attempts} attempts"
+        )
+        raise ConnectionError(f"Unable to recover {name}")
+
+    def stats(self) -> dict[str, float]:
+        """
+        Returns the metrics with the mean time to recover.
+        """
+        recoveries = self.metrics["recoveries"]
+        return {
+            **self.metrics,
+            "mean_time_to_recover": (
+                self.metrics["total_time_to_recover"] / recoveries
+                if recoveries
+                else 0.0
+            ),
+        }
+
+
+class ConnectionFactory:
+    """
+    Creates the sockets of the clients from one SSLContext per process.
+    The TLS sessions of the servers are cached, so a connection to a
+    server seen before resumes the session with an abbreviated
+    handshake, the sockets are set up with TCP_NODELAY and sized buffers,
+    and an optional warm-up pool keeps connected sockets ready for the
+    next clients.
+
+    Args:
+        context (ssl.SSLContext, optional): The context of the TLS
+            connections. Defaults to a client context without certificate
+            verification, as the sockets of the client always had.
+        receive_buffer (int, optional): The SO_RCVBUF size in bytes, None
+            keeps the system default. Defaults to 262144.
+        send_buffer (int, optional): The SO_SNDBUF size in bytes, None
+            keeps the system default. Defaults to 65536.
+        max_idle (float, optional): The seconds a warm socket is kept
+            before it is closed instead of handed out. Defaults to 30.
+
+    Attributes:
+        context (ssl.SSLContext): The context shared by the TLS sockets.
+        receive_buffer (int): The SO_RCVBUF size in bytes.
+        send_buffer (int): The SO_SNDBUF size in bytes.
+        max_idle (float): The lifetime of a warm socket in seconds.
+        sessions (dict): The last resumable TLS session by host and port.
+        metrics (dict): The numbers of full and resumed handshakes, their
+            total time in seconds and the counters of the warm-up pool.
+    """
+
+    def __init__(
+        self,
+        context: Optional[ssl.SSLContext] = None,
+        receive_buffer: Optional[int] = 262144,
+        send_buffer: Optional[int] = 65536,
+        max_idle: float = 30.0,
+    ) -> None:
+        self.logging = setup_logger(
+            "client_logger", "client.log", print_logs=False
+        )
+        if context is None:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        self.context = context
+        self.receive_buffer = receive_buffer
+        self.send_buffer = send_buffer
+        self.max_idle = max_idle
+        self.sessions: dict[tuple[str, int], ssl.SSLSession] = {}
+        self.metrics: dict[str, float] = {
+            "sockets": 0,
+            "full_handshakes": 0,
+            "resumed_handshakes": 0,
+            "full_handshake_time": 0.0,
+            "resumed_handshake_time": 0.0,
+            "warm_opened": 0,
+            "warm_hits": 0,
+            "warm_misses": 0,
+            "warm_discarded": 0,
+        }
+        self._warm: dict[tuple[str, int, bool], list[tuple[Any, float]]] = {}
+        self._targets: dict[tuple[str, int, bool], int] = {}
+        self._filling: set[tuple[str, int, bool]] = set()
+        self._lock = Lock()
+
+    def new_socket(
+        self, tls: bool = True
+    ) -> Union[ssl.SSLSocket, socket.socket]:
+        """
+        Creates an unconnected socket with the options of the factory,
+        wrapped in TLS unless tls is False.
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # the buffers are sized before connecting, so the TCP window
+        # scale negotiated by the handshake matches them
+        if self.receive_buffer is not None:
+            sock.setsockopt(
+                socket.SOL_SOCKET, socket.SO_RCVBUF, self.receive_buffer
+            )
+        if self.send_buffer is not None:
+            sock.setsockopt(
+                socket.SOL_SOCKET, socket.SO_SNDBUF, self.send_buffer
+            )
+        self.metrics["sockets"] += 1
+        if not tls:
+            return sock
+        return self.context.wrap_socket(sock)
+
+    @staticmethod
+    def checked(address: tuple[Optional[str], int]) -> tuple[str, int]:
+        """
+        Returns the address of a server whose host may be unset, e.g. read
+        from a missing environment variable.
+
+        Raises:
+            ValueError: If the host is None.
+        """
+        host, port = address
+        if host is None:
+            raise ValueError(f"The host of the server on port {port} is unset")
+        return host, port
+
+    def connect(
+        self,
+        sock: Union[ssl.SSLSocket, socket.socket],
+        address: tuple[Optional[str], int],
+    ) -> Union[ssl.SSLSocket, socket.socket]:
+        """
+        Connects a socket of the factory. A warm socket to the address
+        is handed out instead if the pool has one, otherwise the socket
+        connects and resumes the cached TLS session of the server.
+
+        Args:
+            sock: An unconnected socket created by new_socket.
+            address (tuple): The host and the port of the server.
+
+        Returns:
+            The connected socket, the given one or a warm one.
+
+        Raises:
+            ValueError: If the host is None.
+            OSError: If the connection could not be established.
+        """
+        server = self.checked(address)
+        tls = isinstance(sock, ssl.SSLSocket)
+        warm = self.take(server, tls)
+        if warm is not None:
+            sock.close()
+            return warm
+        self._handshake(sock, server)
+        return sock
+
+    def _handshake(
+        self,
+        sock: Union[ssl.SSLSocket, socket.socket],
+        address: tuple[str, int],
+    ) -> None:
+        if not isinstance(sock, ssl.SSLSocket):
+            sock.connect(address)
+            return
+        session = self.sessions.get(address)
+        if session is not None:
+            sock.session = session
+        start = perf_counter()
+        sock.connect(address)
+        elapsed = perf_counter() - start
+        kind = "resumed" if sock.session_reused else "full"
+        with self._lock:
+            self.metrics[f"{kind}_handshakes"] += 1
+            self.metrics[f"{kind}_handshake_time"] += elapsed
+        self.save_session(sock, address)
+
+    def save_session(
+        self,
+        sock: Union[ssl.SSLSocket, socket.socket],
+        address: tuple[Optional[str], int],
+    ) -> None:
+        """
+        Caches the TLS session of a connected socket for the next
+        connections to the host and port. With TLS 1.3 the session can be
+        resumed only once the server's ticket has been read, after the
+        first response, so the clients save it again after logging in and
+        before disconnecting. Sockets of other contexts are ignored, as
+        are unset hosts, whose sockets never connected.
+        """
+        host, port = address
+        if host is None:
+            return
+        if not isinstance(sock, ssl.SSLSocket) or sock.fileno() == -1:
+            return
+        if sock.context is not self.context:
+            return
+        try:
+            session = sock.session
+        except (OSError, ValueError):
+            return
+        if session is not None and session.has_ticket:
+            self.sessions[(host, port)] = session
+
+    def warm_up(
+        self,
+        address: tuple[Optional[str], int],
+        count: int = 1,
+        tls: bool = True,
+        refill: bool = True,
+    ) -> int:
+        """
+        Opens connections to the address ahead of the clients, which take
+        them in connect instead of paying the TCP and TLS handshakes.
+
+        Args:
+            address (tuple): The host and the port of the server.
+            count (int, optional): The number of warm sockets to keep.
+                Defaults to 1.
+            tls (bool, optional): Whether the sockets use TLS. Defaults to
+                True.
+            refill (bool, optional): Whether a taken socket is replaced
+                in the background. Defaults to True.
+
+        Returns:
+            int: The number of warm sockets in the pool.
+
+        Raises:
+            ValueError: If the host is None.
+        """
+        key = (*self.checked(address), tls)
+        with self._lock:
+            self._targets[key] = count if refill else 0
+            missing = count - len(self._warm.get(key, []))
+        for _ in range(missing):
+            if not self._open_warm(key):
+                break
+        with self._lock:
+            return len(self._warm.get(key, []))
+
+    def _open_warm(self, key: tuple[str, int, bool]) -> bool:
+        sock = self.new_socket(key[2])
+        try:
+            self._handshake(sock, key[:2])
+        except OSError as e:
+            self.logging.warning(f"Warm-up of {key[0]}:{key[1]} failed, {e}")
+            sock.close()
+            return False
+        with self._lock:
+            self._warm.setdefault(key, []).append((sock, monotonic()))
+            self.metrics["warm_opened"] += 1
+        return True
+
+    def _refill(self, key: tuple[str, int, bool]) -> None:
+        with self._lock:
+            missing = self._targets.get(key, 0) - len(self._warm.get(key, []))
+        try:
+            for _ in range(missing):
+                if not self._open_warm(key):
+                    return
+        finally:
+            with self._lock:
+                self._filling.discard(key)
+
+    @staticmethod
+    def is_alive(sock: Union[ssl.SSLSocket, socket.socket]) -> bool:
+        """
+        Checks without blocking that an idle socket was not closed by the
+        server. Readable bytes, e.g. a TLS session ticket, are peeked at
+        the TCP level and left for the TLS layer.
+        """
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+            if not readable:
+                return True
+            return bool(socket.socket.recv(sock, 1, socket.MSG_PEEK))
+        except (OSError, ValueError):
+            return False
+
+    def take(
+        self, address: tuple[Optional[str], int], tls: bool = True
+    ) -> Optional[Union[ssl.SSLSocket, socket.socket]]:
+        """
+        Returns a warm socket connected to the address, or None if the
+        pool has none. Expired and closed sockets are discarded, and the
+        pool is refilled in the background.
+
+        Raises:
+            ValueError: If the host is None.
+        """
+        key = (*self.checked(address), tls)
+        found = None
+        with self._lock:
+            pool = self._warm.get(key)
+            if not pool and key not in self._targets:
+                return None
+            while pool:
+                sock, opened = pool.pop(0)
+                if monotonic() - opened < self.max_idle and self.is_alive(
+                    sock
+                ):
+                    found = sock
+                    break
+                self.metrics["warm_discarded"] += 1
+                sock.close()
+            self.metrics["warm_hits" if found else "warm_misses"] += 1
+            refill = self._targets.get(key, 0) > 0 and key not in self._filling
+            if refill:
+                self._filling.add(key)
+        if refill:
+            Thread(
+                target=self._refill, args=(key,), name="warm-up", daemon=True
+            ).start()
+        return found
+
+    def clear(self) -> None:
+        """
+        Closes the warm sockets, stops the refills and forgets the cached
+        TLS sessions.
+        """
+        with self._lock:
+            pools, self._warm, self._targets = self._warm, {}, {}
+            self.sessions = {}
+        for pool in pools.values():
+            for sock, _ in pool:
+                sock.close()
+
+    def stats(self) -> dict[str, float]:
+        """
+        Returns the metrics with the mean handshake times and the number
+        of warm sockets.
+        """
+        with self._lock:
+            metrics = dict(self.metrics)
+            warm = sum(len(pool) for pool in self._warm.values())
+        for kind in ("full", "resumed"):
+            count = metrics[f"{kind}_handshakes"]
+            metrics[f"mean_{kind}_handshake_time"] = (
+                metrics[f"{kind}_handshake_time"] / count if count else 0.0
+            )
+        metrics["warm"] = warm
+        return metrics
+
+
+_connection_factory: Optional[ConnectionFactory] = None
+_connection_factory_lock = Lock()
+
+
+def get_connection_factory() -> ConnectionFactory:
+    """
+    Returns the process-wide connection factory.
+    """
+    global _connection_factory
+    with _connection_factory_lock:
+        if _connection_factory is None:
+            _connection_factory = ConnectionFactory()
+        return _connection_factory
+
 
 class XTBClient:
     """
@@ -35,6 +768,24 @@ class XTBClient:
             server. None if not connected.
         connection_stream (bool): The status of the client's streaming data
             connection to the server. None if not connected.
+        framer (MessageFramer): The frame decoder of the main connection.
+        stream_framer (MessageFramer): The frame decoder of the streaming
+            data connection.
+        recorder (CaptureWriter): The capture of the sent and received
+            frames. None if not capturing.
+        last_stream_message (float): The monotonic time of the last
+            message read from the streaming connection.
+        subscriptions (dict): The active stream subscriptions by command
+            and symbol, replayed after a reconnection.
+        reconnect_engine (ReconnectEngine): The backoff and the time to
+            recover metrics of the reconnections.
+        metrics (ClientMetrics): The latency histograms and traffic
+            counters of the commands and stream messages. Shared by all
+            clients by default, None disables the instrumentation.
+        reactor (Reactor): The reactor owning the connections handed over
+            with attach_reactor. None if the client reads them itself.
+        connector (ConnectionFactory): Creates and connects the sockets,
+            shared by all clients of the process.
 
     Raises:
         ValueError: If the mode argument is not "REAL" or "DEMO".
@@ -45,69 +796,95 @@ class XTBClient:
             "client_logger", "client.log", print_logs=False
         )
         self.logging.info(f"{mode} SESSION OPENED")
-
-        if mode == "REAL":
-            self.user: Union[XTBUserREAL, XTBUserDEMO] = XTBUserREAL()
-        elif mode == "DEMO":
-            self.user = XTBUserDEMO()
-        else:
-            raise ValueError(
-                "Invalid mode argument. Must be either 'REAL' or 'DEMO'."
-            )
-
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket_connection = ssl.wrap_socket(
-            sock, ssl_version=ssl.PROTOCOL_TLS
-        )
-
-        sock_stream = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket_stream_connection = ssl.wrap_socket(
-            sock_stream, ssl_version=ssl.PROTOCOL_TLS
-        )
+        self.user = select_user(mode)
+        self.connector = get_connection_factory()
+        self.socket_connection = self.new_socket(self.user.tls)
+        self.socket_stream_connection = self.new_socket(self.user.tls)
 
         self.login_status: bool = False
         self.stream_sesion_id: str = str()
         self.connection: bool = False
         self.connection_stream: bool = False
+        self.framer = MessageFramer()
+        self.stream_framer = MessageFramer()
+        self.recorder: Optional[CaptureWriter] = None
+        self.last_stream_message: float = 0.0
+        self.subscriptions: dict[Subscription, dict[str, Any]] = {}
+        self.reconnect_engine = ReconnectEngine()
+        self.metrics: Optional[ClientMetrics] = client_metrics
+        self.reactor: Optional[Reactor] = None
+        self._request_lock = Lock()
+
+    def new_socket(
+        self, tls: bool = True
+    ) -> Union[ssl.SSLSocket, socket.socket]:
+        """
+        Creates a new socket for a connection with the server, wrapped
+        in TLS unless tls is False.
+        """
+        return self.connector.new_socket(tls)
 
     def connect(self):
         """
-        Attempt to connect to the server.
+        Attempt to connect to the server. A closed socket is replaced with
+        a new one, so the client can connect again after disconnecting.
+
+        Raises:
+            ConnectionError: If the connection could not be established.
         """
+        if self.socket_connection.fileno() == -1:
+            self.socket_connection = self.new_socket(self.user.tls)
         try:
-            self.socket_connection.connect(
-                (self.user.host, self.user.main_port)
+            self.socket_connection = self.connector.connect(
+                self.socket_connection, (self.user.host, self.user.main_port)
             )
             self.logging.info(f"Connected successfully to {self.user.host}")
+            self.framer.clear()
             self.connection = True
         except Exception as e:
             self.logging.error(f"Not connected to {self.user.host}, {e}")
             self.connection = False
-            sys.exit(0)
+            self.socket_connection.close()
+            raise ConnectionError(f"Not connected to {self.user.host}") from e
 
     def connect_stream(self):
         """
-        Attempt to connect to the server's streaming port.
+        Attempt to connect to the server's streaming port. A closed socket
+        is replaced with a new one.
+
+        Raises:
+            ConnectionError: If the connection could not be established.
         """
+        if self.socket_stream_connection.fileno() == -1:
+            self.socket_stream_connection = self.new_socket(self.user.tls)
         try:
-            self.socket_stream_connection.connect(
-                (self.user.host, self.user.streaming_port)
+            self.socket_stream_connection = self.connector.connect(
+                self.socket_stream_connection,
+                (self.user.host, self.user.streaming_port),
             )
             self.logging.info(
                 f"Connected successfully to streaming port on {self.user.host}"
             )
+            self.stream_framer.clear()
             self.connection_stream = True
         except Exception as e:
             self.logging.error(
                 f"Not connected to streaming port on {self.user.host}, {e}"
             )
             self.connection_stream = False
-            sys.exit(0)
+            self.socket_stream_connection.close()
+            raise ConnectionError(
+                f"Not connected to streaming port on {self.user.host}"
+            ) from e
 
     def disconnect(self):
         """
         Attempt to disconnect from the server.
         """
+        self.detach_reactor(stream=False)
+        self.connector.save_session(
+            self.socket_connection, (self.user.host, self.user.main_port)
+        )
         try:
             self.socket_connection.close()
             self.logging.info(
@@ -124,6 +901,11 @@ class XTBClient:
         """
         Disconnects the stream socket connection.
         """
+        self.detach_reactor(stream=True)
+        self.connector.save_session(
+            self.socket_stream_connection,
+            (self.user.host, self.user.streaming_port),
+        )
         try:
             self.socket_stream_connection.close()
             self.logging.info(
@@ -136,12 +918,37 @@ class XTBClient:
             )
             self.connection_stream = True
 
+    def start_capture(self, path: str) -> CaptureWriter:
+        """
+        Starts writing every frame sent and received on both connections
+        with its monotonic timestamp to a capture file, which
+        api.replay.ReplayClient plays back.
+
+        Args:
+            path (str): The capture file, appended to if it exists.
+
+        Returns:
+            CaptureWriter: The writer of the capture.
+        """
+        self.stop_capture()
+        self.recorder = CaptureWriter(path)
+        return self.recorder
+
+    def stop_capture(self) -> None:
+        """
+        Stops capturing and closes the capture file.
+        """
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            recorder.close()
+
     def send_n_return(
         self, packet: dict[str, Any]
     ) -> dict[Union[str, int], Union[int, float, str, bool, list[Any]]]:
         """
         Sends a JSON-encoded packet through the connection socket and returns
-        the response.
+        the response. Concurrent calls, e.g. of the keep-alive pings, wait
+        for each other.
 
         Args:
             packet (dict): The packet to be sent.
@@ -150,75 +957,324 @@ class XTBClient:
             dict: The response received from the server.
         """
         command_type: str = packet["command"]
-        message: bytes = json.dumps(packet).encode("utf-8")
-        received_data: str = ""
-        sent: int = 0
         response: dict[
             Union[str, int], Union[int, float, str, bool, list[Any]]
         ]
-        while sent < len(message):
-            sent += self.socket_connection.send(message[sent:])
-        while True:
-            char: str = self.socket_connection.recv(4096).decode()
-            received_data += char
+        with self._request_lock:
+            start = perf_counter()
             try:
-                (response, size) = json.JSONDecoder().raw_decode(received_data)
-                if size == len(received_data):
-                    received_data = ""
-                    break
-                elif size < len(received_data):
-                    received_data = received_data[size:].strip()
-                    break
-            except Exception as e:
-                self.logging.warning(f"Error sending {command_type}: {e}")
-                continue
+                sent = self.send_packet(packet)
+                response, size, decode = self.receive(
+                    self.socket_connection,
+                    self.framer,
+                    f"Error sending {command_type}",
+                )
+            except Exception:
+                if self.metrics is not None:
+                    self.metrics.record_command(
+                        command_type, perf_counter() - start, 0.0, 0, 0, True
+                    )
+                raise
+        if self.metrics is not None:
+            self.metrics.record_command(
+                command_type,
+                perf_counter() - start,
+                decode,
+                sent,
+                size,
+                not is_success(response),
+            )
         return response
 
-    def stream_send(self, message: dict[str, Any]) -> int:
+    def send_packet(self, packet: dict[str, Any]) -> int:
         """
-        Sends a JSON-encoded message through the stream connection socket.
+        Sends a JSON-encoded packet through the connection socket without
+        waiting for the response.
 
         Args:
-            message (dict): A dictionary representing the message to be sent.
+            packet (dict): The packet to be sent.
 
         Returns:
-            int: message from server.
+            int: The number of bytes sent.
         """
-        return self.socket_stream_connection.send(
-            json.dumps(message).encode("utf-8")
-        )
+        return self.send_data(json.dumps(packet).encode("utf-8"))
 
-    def stream_read(self):
+    def send_data(self, message: bytes) -> int:
         """
-        Method that reads data streamed by api.
+        Sends an encoded command through the connection socket.
+
+        Args:
+            message (bytes): The JSON-encoded command.
 
         Returns:
-            int: message from server.
+            int: The number of bytes sent.
         """
-        received_data = ""
-        while True:
-            char = self.socket_stream_connection.recv(4096).decode()
-            received_data += char
-            try:
-                (response, size) = json.JSONDecoder().raw_decode(received_data)
-                if size == len(received_data):
-                    received_data = ""
-                    break
-                elif size < len(received_data):
-                    received_data = received_data[size:].strip()
-                    break
-            except Exception as e:
-                self.logging.warning(f"Reciving error: {e}")
-                continue
-        return response
+        if self.recorder is not None:
+            self.recorder.write(COMMAND_SENT, message)
+        return self._send(self.socket_connection, message)
 
-    def login(self):
+    def _send(
+        self, connection: Union[ssl.SSLSocket, socket.socket], data: bytes
+    ) -> int:
+        if self.reactor is not None and self.reactor.owns(connection):
+            return self.reactor.send(connection, data)
+        sent: int = 0
+        while sent < len(data):
+            sent += connection.send(data[sent:])
+        return sent
+
+    def read_message(
+        self,
+        connection: socket.socket,
+        framer: MessageFramer,
+        warning: str = "Reciving error",
+    ) -> Any:
         """
-        Attempts to log in with the user's credentials and sets
-        the login status, stream session ID, and logs relevant messages.
+        Reads the next message from the socket. Bytes received after the
+        end of the message stay in the framer for the next call.
+
+        Args:
+            connection (socket): The socket to read from.
+            framer (MessageFramer): The frame decoder bound to the socket.
+            warning (str, optional): The prefix of the logged warning
+                about a frame that could not be decoded.
+
+        Returns:
+            The decoded message.
+
+        Raises:
+            ConnectionError: If the server closed the connection.
         """
-        packet = {
-            "command": "login",
+        return self.receive(connection, framer, warning)[0]
+
+    def receive(
+        self,
+        connection: socket.socket,
+        framer: MessageFramer,
+        warning: str = "Reciving error",
+    ) -> tuple[Any, int, float]:
+        """
+        Reads the next message from the socket like read_message and
+        returns it with the size of its frame and the decode time.
+
+        Returns:
+            tuple: The decoded message, the frame size in bytes and the
+                decode time in seconds.
+
+        Raises:
+            ConnectionError: If the server closed the connection.
+        """
+        while True:
+            frame = framer.next_frame()
+            if frame is None:
+                if not framer.recv_into(connection):
+                    raise ConnectionError("Connection closed by the server")
+                continue
+            decoded = self.decode_frame(frame, framer, warning)
+            if decoded is not None:
+                return decoded
+
+    def decode_frame(
+        self,
+        frame: bytes,
+        framer: MessageFramer,
+        warning: str = "Reciving error",
+    ) -> Optional[tuple[Any, int, float]]:
+        """
+        Captures and decodes a frame received on the connection of the
+        framer.
+
+        Returns:
+            tuple: The decoded message, the frame size in bytes and the
+                decode time in seconds or None if the frame is not valid
+                JSON.
+        """
+        if self.recorder is not None:
+            self.recorder.write(
+                (
+                    STREAM_RECEIVED
+                    if framer is self.stream_framer
+                    else COMMAND_RECEIVED
+                ),
+                frame,
+            )
+        start = perf_counter()
+        try:
+            message = framer.decode(frame)
+        except ValueError as e:
+            self.logging.warning(f"{warning}: {e}")
+            return None
+        return message, len(frame), perf_counter() - start
+
+    def stream_send(self, message: dict[str, Any]) -> int:
+        """
+        Sends a JSON-encoded message through the stream connection socket.
+        Subscriptions (get* commands) are remembered until the matching
+        stop* command, so they can be replayed after a reconnection.
+
+        Args:
+            message (dict): A dictionary representing the message to be sent.
+
+        Returns:
+            int: message from server.
+        """
+        command: str = message.get("command", "")
+        if command.startswith("get"):
+            self.subscriptions[(command, message.get("symbol"))] = message
+        elif command.startswith("stop"):
+            self.subscriptions.pop(
+                ("get" + command[4:], message.get("symbol")), None
+            )
+        data: bytes = json.dumps(message).encode("utf-8")
+        if self.recorder is not None:
+            self.recorder.write(STREAM_SENT, data)
+        connection = self.socket_stream_connection
+        if self.reactor is not None and self.reactor.owns(connection):
+            return self.reactor.send(connection, data)
+        return connection.send(data)
+
+    def stream_read(self):
+        """
+        Method that reads data streamed by api.
+
+        Returns:
+            int: message from server.
+        """
+        message, size, decode = self.receive(
+            self.socket_stream_connection, self.stream_framer
+        )
+        self._stream_received(message, size, decode)
+        return message
+
+    def _stream_received(
+        self,
+        message: Any,
+        size: int,
+        decode: float,
+        dispatch: Optional[float] = None,
+    ) -> None:
+        self.last_stream_message = monotonic()
+        if self.metrics is not None:
+            self.metrics.record_stream(
+                (
+                    message.get("command", "")
+                    if isinstance(message, dict)
+                    else ""
+                ),
+                decode,
+                size,
+                dispatch,
+            )
+
+    def stream_messages(self) -> Iterator[Any]:
+        """
+        Generator of the messages streamed by api. All messages delivered
+        in one read are yielded before the socket is read again.
+
+        Yields:
+            dict: message from server.
+        """
+        while self.connection_stream is True:
+            yield self.stream_read()
+
+    def attach_reactor(
+        self,
+        reactor: "Reactor",
+        on_frame: Callable[[bytes, float], Any],
+        on_close: Optional[Callable[[Exception], Any]] = None,
+        stream: bool = True,
+    ) -> None:
+        """
+        Hands a connection over to a reactor, which reads it without
+        blocking and passes every complete frame to on_frame on the
+        reactor thread. Commands and subscriptions are still sent with
+        send_data and stream_send, but the connection must not be read
+        with receive or stream_read until detach_reactor.
+
+        Args:
+            reactor (Reactor): The running reactor.
+            on_frame (callable): Called with every frame and the
+                perf_counter time its bytes arrived.
+            on_close (callable, optional): Called with the error when the
+                connection is lost.
+            stream (bool, optional): Whether the stream or the main
+                connection is handed over. Defaults to True.
+        """
+        connection = (
+            self.socket_stream_connection if stream else self.socket_connection
+        )
+        self.reactor = reactor
+
+        def closed(error: Exception) -> None:
+            if stream:
+                self.connection_stream = False
+            else:
+                self.connection = False
+            if on_close is not None:
+                on_close(error)
+
+        reactor.add(
+            connection,
+            self.stream_framer if stream else self.framer,
+            on_frame,
+            closed,
+            f"{self.user.host}:{'stream' if stream else 'main'}",
+        )
+
+    def detach_reactor(self, stream: bool = True) -> None:
+        """
+        Takes a connection back from the reactor in blocking mode.
+        Bytes already received stay in the framer of the connection.
+        """
+        if self.reactor is not None:
+            self.reactor.remove(
+                self.socket_stream_connection
+                if stream
+                else self.socket_connection
+            )
+
+    def stream_to(
+        self,
+        reactor: "Reactor",
+        on_message: Callable[[Any], Any],
+        on_close: Optional[Callable[[Exception], Any]] = None,
+    ) -> None:
+        """
+        Hands the stream connection over to a reactor, which calls
+        on_message with every decoded message on the reactor thread. The
+        time from the arrival of the bytes to the call of on_message is
+        recorded in metrics as the dispatch latency of the stream command.
+
+        Args:
+            reactor (Reactor): The running reactor.
+            on_message (callable): Called with every stream message.
+            on_close (callable, optional): Called with the error when the
+                stream connection is lost.
+        """
+
+        def on_frame(frame: bytes, arrival: float) -> None:
+            decoded = self.decode_frame(frame, self.stream_framer)
+            if decoded is None:
+                return
+            message, size, decode = decoded
+            self._stream_received(
+                message, size, decode, perf_counter() - arrival
+            )
+            on_message(message)
+
+        self.attach_reactor(reactor, on_frame, on_close, stream=True)
+
+    def login(self):
+        """
+        Attempts to log in with the user's credentials and sets
+        the login status, stream session ID, and logs relevant messages.
+
+        Raises:
+            ConnectionError: If the request failed, e.g. the connection
+                dropped during the login. The login status is False.
+        """
+        packet = {
+            "command": "login",
             "arguments": {
                 "userId": self.user.login,
                 "password": self.user.password,
@@ -228,11 +1284,16 @@ class XTBClient:
             result = self.send_n_return(packet)
         except Exception as e:
             self.logging.warning(f"Cant log in, {e}")
+            self.login_status = False
+            raise ConnectionError(f"Cant log in, {e}") from e
         if result["status"] is True and isinstance(
             result["streamSessionId"], str
         ):
             self.login_status = result["status"]
             self.stream_sesion_id = result["streamSessionId"]
+            self.connector.save_session(
+                self.socket_connection, (self.user.host, self.user.main_port)
+            )
             self.logging.info(
                 f"Logged as {self.user.login}"
                 f"(stream session id: {result['streamSessionId']})"
@@ -260,26 +1321,27 @@ class XTBClient:
         """
         Establishes a session with the server by connecting to the main
         and streaming ports and logging in with the user credentials.
+        The connection is retried with the backoff of reconnect_engine.
 
         Raises:
-            SystemExit: If the connection cannot be established after
-                six attempts or if the login is unsuccessful.
+            ConnectionError: If the connection cannot be established after
+                six attempts.
         """
-        try:
-            for i in range(6):
-                try:
-                    self.connect()
-                    self.connect_stream()
-                    break
-                except ConnectionError as e:
-                    self.logging.info(f"Wait... {e}")
-                    sleep(10)
-            self.login()
-        except ConnectionError as e:
-            self.logging.warning(
-                f"Session interrupted, unable to connect. Details: {e}"
-            )
-            sys.exit(0)
+        for attempt in range(6):
+            try:
+                self.connect()
+                self.connect_stream()
+                break
+            except ConnectionError as e:
+                if attempt == 5:
+                    self.logging.warning(
+                        f"Session interrupted, unable to connect. Details: {e}"
+                    )
+                    raise
+                delay = self.reconnect_engine.delay(attempt)
+                self.logging.info(f"Wait {delay:.2f} s... {e}")
+                sleep(delay)
+        self.login()
 
     def close_session(self):
         """
@@ -290,33 +1352,2054 @@ class XTBClient:
         self.disconnect_stream()
         self.disconnect()
 
-    def reconnect(self):
+    def resubscribe(self) -> int:
         """
-        Try to reconnect the client to the server. If the connection is not
-        successful, the function will try again for up to 10 times, waiting
-        5 seconds between attempts. If the  connection is restored, the client
-        will log in again. If the connection cannot be restored, the function
-        will print a warning message and exit the program.
+        Sends the active stream subscriptions again with the current
+        stream session ID.
+
+        Returns:
+            int: The number of replayed subscriptions.
         """
-        if self.connection is not True:
-            for i in range(1, 10):
-                try:
-                    self.logging.info("Trying to reconnect")
-                    self.connect()
-                    self.connect_stream()
-                    self.login()
-                    self.logging.info("Reconnected")
-                    break
-                except ConnectionError:
-                    self.logging.info(
-                        "No way to restore the connection. Trying again"
-                    )
-                    sleep(5)
-            if self.connection is False:
-                self.logging.warning("Session interrupted, unable to connect.")
-                sys.exit(0)
+        subscriptions = list(self.subscriptions.values())
+        for message in subscriptions:
+            if "streamSessionId" in message:
+                message = {**message, "streamSessionId": self.stream_sesion_id}
+            self.stream_send(message)
+        return len(subscriptions)
+
+    def reconnect(self, since: Optional[float] = None) -> float:
+        """
+        Reopens both connections, logs in again and replays the active
+        stream subscriptions. The attempts are spaced by the exponential
+        backoff with jitter of reconnect_engine. The connections are
+        reopened even if they still look open, since a dropped socket is
+        usually only noticed by the next read.
+
+        Args:
+            since (float, optional): The monotonic time the connection was
+                lost. Defaults to now.
+
+        Returns:
+            float: The time to recover in seconds.
+
+        Raises:
+            ConnectionError: If the session could not be restored.
+        """
+        self.reconnect_engine.run(self._reopen_session, "session", since)
+        return self.reconnect_engine.metrics["time_to_recover"]
+
+    def _reopen_session(self) -> None:
+        self.logging.info("Trying to reconnect")
+        self.disconnect()
+        self.disconnect_stream()
+        self.login_status = False
+        self.connect()
+        self.connect_stream()
+        self.login()
+        if self.login_status is not True:
+            raise ConnectionError("Login after reconnection failed")
+        self.resubscribe()
+        self.logging.info("Reconnected")
+
+    def reconnect_stream(
+        self,
+        session_id: Optional[Callable[[], str]] = None,
+        since: Optional[float] = None,
+    ) -> float:
+        """
+        Reopens only the streaming connection and replays the active
+        subscriptions, e.g. for a stream bound to the session of a pool.
+
+        Args:
+            session_id (callable, optional): Returns the stream session ID
+                to be used. Defaults to the current one.
+            since (float, optional): The monotonic time the connection was
+                lost. Defaults to now.
+
+        Returns:
+            float: The time to recover in seconds.
+
+        Raises:
+            ConnectionError: If the stream could not be restored.
+        """
+
+        def reopen_stream() -> None:
+            self.disconnect_stream()
+            self.connect_stream()
+            if session_id is not None:
+                self.stream_sesion_id = session_id()
+            self.resubscribe()
+
+        self.reconnect_engine.run(reopen_stream, "stream", since)
+        return self.reconnect_engine.metrics["time_to_recover"]
+
+
+class AsyncXTBClient:
+    """
+    Asyncio counterpart of XTBClient. Both connections are asyncio streams
+    with TLS, so any number of clients can share one event loop instead of
+    blocking a thread per socket.
+
+    Args:
+        mode (str): The mode to connect to the server in. Must be either
+            "REAL" or "DEMO".
+        ssl_context (SSLContext, optional): The TLS context of both
+            connections. Defaults to the default client context.
+
+    Attributes:
+        user: A user object representing the user associated with the client.
+        ssl_context: The TLS context of both connections.
+        login_status (bool): The status of the client's login.
+        stream_sesion_id (str): The session ID for the client's streaming
+            data session.
+        connection (bool): The status of the client's connection to the
+            server.
+        connection_stream (bool): The status of the client's streaming data
+            connection to the server.
+        framer (MessageFramer): The frame decoder of the main connection.
+        stream_framer (MessageFramer): The frame decoder of the streaming
+            data connection.
+
+    Raises:
+        ValueError: If the mode argument is not "REAL" or "DEMO".
+    """
+
+    def __init__(
+        self, mode: str, ssl_context: Optional[ssl.SSLContext] = None
+    ) -> None:
+        self.logging = setup_logger(
+            "async_client_logger", "client.log", print_logs=False
+        )
+        self.logging.info(f"{mode} ASYNC SESSION OPENED")
+        self.user = select_user(mode)
+        self.ssl_context = (
+            ssl_context
+            if ssl_context is not None
+            else ssl.create_default_context()
+        )
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.stream_reader: Optional[asyncio.StreamReader] = None
+        self.stream_writer: Optional[asyncio.StreamWriter] = None
+        self.login_status: bool = False
+        self.stream_sesion_id: str = str()
+        self.connection: bool = False
+        self.connection_stream: bool = False
+        self.framer = MessageFramer()
+        self.stream_framer = MessageFramer()
+        self._request_lock: Optional[asyncio.Lock] = None
+
+    async def connect(self) -> None:
+        """
+        Opens the connection to the main port of the server.
+
+        Raises:
+            OSError: If the connection could not be established.
+        """
+        try:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.user.host,
+                self.user.main_port,
+                ssl=self.ssl_context if self.user.tls else None,
+            )
+        except OSError as e:
+            self.logging.error(f"Not connected to {self.user.host}, {e}")
+            self.connection = False
+            raise
+        self.logging.info(f"Connected successfully to {self.user.host}")
+        self.framer.clear()
+        self.connection = True
+
+    async def connect_stream(self) -> None:
+        """
+        Opens the connection to the streaming port of the server.
+
+        Raises:
+            OSError: If the connection could not be established.
+        """
+        try:
+            (
+                self.stream_reader,
+                self.stream_writer,
+            ) = await asyncio.open_connection(
+                self.user.host,
+                self.user.streaming_port,
+                ssl=self.ssl_context if self.user.tls else None,
+            )
+        except OSError as e:
+            self.logging.error(
+                f"Not connected to streaming port on {self.user.host}, {e}"
+            )
+            self.connection_stream = False
+            raise
+        self.logging.info(
+            f"Connected successfully to streaming port on {self.user.host}"
+        )
+        self.stream_framer.clear()
+        self.connection_stream = True
+
+    async def disconnect(self) -> None:
+        """
+        Closes the connection to the main port of the server.
+        """
+        if self.writer is not None:
+            await self._close_writer(self.writer)
+            self.logging.info(
+                f"Disconnected successfully from {self.user.host}"
+            )
+        self.writer = None
+        self.reader = None
+        self.connection = False
+
+    async def disconnect_stream(self) -> None:
+        """
+        Closes the connection to the streaming port of the server.
+        """
+        if self.stream_writer is not None:
+            await self._close_writer(self.stream_writer)
+            self.logging.info(
+                f"Disconnected successfully stream from {self.user.host}"
+            )
+        self.stream_writer = None
+        self.stream_reader = None
+        self.connection_stream = False
+
+    async def _close_writer(self, writer: asyncio.StreamWriter) -> None:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (OSError, ssl.SSLError) as e:
+            self.logging.warning(f"Error while closing connection: {e}")
+
+    async def _read_message(
+        self,
+        reader: Optional[asyncio.StreamReader],
+        framer: MessageFramer,
+        warning: str = "Reciving error",
+    ) -> Any:
+        if reader is None:
+            raise ConnectionError("Not connected")
+        while True:
+            frame = framer.next_frame()
+            if frame is None:
+                chunk = await reader.read(framer.chunk_size)
+                if not chunk:
+                    raise ConnectionError("Connection closed by the server")
+                framer.feed(chunk)
+                continue
+            try:
+                return framer.decode(frame)
+            except ValueError as e:
+                self.logging.warning(f"{warning}: {e}")
+
+    async def send_n_return(
+        self, packet: dict[str, Any]
+    ) -> dict[Union[str, int], Union[int, float, str, bool, list[Any]]]:
+        """
+        Sends a JSON-encoded packet through the main connection and returns
+        the response. Concurrent callers are served one after another, so
+        responses can not be swapped between them.
+
+        Args:
+            packet (dict): The packet to be sent.
+
+        Returns:
+            dict: The response received from the server.
+        """
+        if self.writer is None:
+            raise ConnectionError("Not connected")
+        if self._request_lock is None:
+            self._request_lock = asyncio.Lock()
+        async with self._request_lock:
+            self.writer.write(json.dumps(packet).encode("utf-8"))
+            await self.writer.drain()
+            response: dict[
+                Union[str, int], Union[int, float, str, bool, list[Any]]
+            ] = await self._read_message(
+                self.reader, self.framer, f"Error sending {packet['command']}"
+            )
+            return response
+
+    async def stream_send(self, message: dict[str, Any]) -> None:
+        """
+        Sends a JSON-encoded message through the stream connection.
+
+        Args:
+            message (dict): A dictionary representing the message to be sent.
+        """
+        if self.stream_writer is None:
+            raise ConnectionError("Not connected to streaming port")
+        self.stream_writer.write(json.dumps(message).encode("utf-8"))
+        await self.stream_writer.drain()
+
+    async def stream_read(self) -> Any:
+        """
+        Reads the next message streamed by api.
+
+        Returns:
+            dict: message from server.
+        """
+        return await self._read_message(self.stream_reader, self.stream_framer)
+
+    async def stream_messages(self) -> AsyncIterator[Any]:
+        """
+        Asynchronous generator of the messages streamed by api.
+
+        Yields:
+            dict: message from server.
+        """
+        while self.connection_stream is True:
+            yield await self.stream_read()
+
+    def __aiter__(self) -> AsyncIterator[Any]:
+        return self.stream_messages()
+
+    async def login(self) -> None:
+        """
+        Logs in with the user's credentials and sets the login status
+        and the stream session ID.
+        """
+        result = await self.send_n_return(
+            {
+                "command": "login",
+                "arguments": {
+                    "userId": self.user.login,
+                    "password": self.user.password,
+                },
+            }
+        )
+        if result["status"] is True and isinstance(
+            result.get("streamSessionId"), str
+        ):
+            self.login_status = True
+            self.stream_sesion_id = str(result["streamSessionId"])
+            self.logging.info(
+                f"Logged as {self.user.login}"
+                f"(stream session id: {result['streamSessionId']})"
+            )
         else:
-            pass
+            self.login_status = False
+            self.logging.error(
+                f"Not logged, status is: {result['status']}" f"msg:{result}"
+            )
+
+    async def logout(self) -> None:
+        """
+        Logs out the user from the server.
+        """
+        result = await self.send_n_return({"command": "logout"})
+        if str(result["status"]) == "True":
+            self.logging.info(f"Logged out of {self.user.login}")
+            self.login_status = False
+        else:
+            self.logging.error("Not logged out")
+            self.login_status = True
+
+    async def open_session(self) -> None:
+        """
+        Connects to the main and streaming ports and logs in.
+        """
+        await asyncio.gather(self.connect(), self.connect_stream())
+        await self.login()
+
+    async def close_session(self) -> None:
+        """
+        Logs out and closes both connections.
+        """
+        try:
+            await self.logout()
+        finally:
+            await self.disconnect_stream()
+            await self.disconnect()
+
+    async def __aenter__(self) -> "AsyncXTBClient":
+        await self.open_session()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close_session()
+
+
+class Reactor:
+    """
+    Single-threaded event loop owning the sockets of many connections.
+    The sockets handed over with add are switched to non-blocking mode and
+    watched by one selector. Received bytes are fed to the framer of their
+    connection as they arrive and every complete frame is passed to the
+    callback of the connection on the reactor thread, so one thread serves
+    the main and stream connections of the process whatever the number of
+    symbols, and the callbacks must not block. Sends from other threads are
+    queued and written by the reactor thread, which keeps a TLS connection
+    from being used by two threads at once.
+
+    Args:
+        select_timeout (float, optional): The longest wait of one select
+            call in seconds. Defaults to 1.
+
+    Attributes:
+        select_timeout (float): The longest wait of one select call.
+        running (bool): Whether the reactor thread is running.
+        metrics (dict): Counters of the wake-ups of the loop, the dispatched
+            frames, the failed callbacks and the lost connections.
+    """
+
+    def __init__(self, select_timeout: float = 1.0) -> None:
+        self.logging = setup_logger(
+            "reactor_logger", "client.log", print_logs=False
+        )
+        self.select_timeout = select_timeout
+        self.running: bool = False
+        self.metrics: dict[str, int] = {
+            "wakeups": 0,
+            "frames": 0,
+            "callback_errors": 0,
+            "lost": 0,
+        }
+        self._channels: dict[Any, dict[str, Any]] = {}
+        self._changes: list[tuple[Callable[[], Any], Future[Any]]] = []
+        self._lock = Lock()
+        self._thread: Optional[Thread] = None
+        self._selector: Optional[selectors.BaseSelector] = None
+        self._wake_reader: Optional[socket.socket] = None
+        self._wake_writer: Optional[socket.socket] = None
+
+    def start(self) -> "Reactor":
+        """
+        Starts the reactor thread.
+        """
+        with self._lock:
+            if not self.running:
+                self._selector = selectors.DefaultSelector()
+                self._wake_reader, self._wake_writer = socket.socketpair()
+                self._wake_reader.setblocking(False)
+                self._wake_writer.setblocking(False)
+                self._selector.register(
+                    self._wake_reader, selectors.EVENT_READ, None
+                )
+                self.running = True
+                self._thread = Thread(
+                    target=self._run, name="reactor", daemon=True
+                )
+                self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Stops the reactor thread. The owned connections are handed back
+        in blocking mode and their on_close callbacks are called.
+        """
+        with self._lock:
+            self.running = False
+        self._wake()
+        thread = self._thread
+        if thread is not None and thread is not current_thread():
+            thread.join(timeout=5)
+
+    def __enter__(self) -> "Reactor":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    def add(
+        self,
+        connection: Union[ssl.SSLSocket, socket.socket],
+        framer: MessageFramer,
+        on_frame: Callable[[bytes, float], Any],
+        on_close: Optional[Callable[[Exception], Any]] = None,
+        name: Optional[str] = None,
+    ) -> None:
+        """
+        Takes over a connected socket. Frames already held by the framer
+        are dispatched right away.
+
+        Args:
+            connection (socket): The connected socket.
+            framer (MessageFramer): The frame decoder of the connection.
+            on_frame (callable): Called on the reactor thread with every
+                complete frame and the perf_counter time its bytes arrived.
+            on_close (callable, optional): Called with the error when the
+                connection is lost or the reactor stops.
+            name (str, optional): The name of the connection in stats.
+
+        Raises:
+            ConnectionError: If the reactor is not running.
+        """
+        entry: dict[str, Any] = {
+            "connection": connection,
+            "framer": framer,
+            "on_frame": on_frame,
+            "on_close": on_close,
+            "name": f"{name or 'connection'}-{connection.fileno()}",
+            "out": bytearray(),
+            "out_lock": Lock(),
+            "writing": False,
+            "frames": 0,
+            "bytes_in": 0,
+            "bytes_out": 0,
+            "latency": LatencyHistogram(),
+            "busy": LatencyHistogram(),
+        }
+
+        def register() -> None:
+            selector = self._selector
+            if selector is None:
+                raise ConnectionError("Reactor is not running")
+            connection.setblocking(False)
+            selector.register(connection, selectors.EVENT_READ, entry)
+            self._channels[connection] = entry
+            # bytes already decrypted by the TLS layer do not wake the
+            # selector, so the connection is read once right away
+            self._read(entry, perf_counter())
+
+        self._call(register)
+
+    def remove(self, connection: Union[ssl.SSLSocket, socket.socket]) -> None:
+        """
+        Hands a connection back in blocking mode without calling its
+        on_close callback. Queued sends are written first.
+        """
+
+        def release() -> None:
+            entry = self._channels.get(connection)
+            if entry is not None:
+                self._release(entry)
+
+        try:
+            self._call(release)
+        except ConnectionError:
+            # a stopped reactor owns no connections
+            pass
+
+    def owns(self, connection: Union[ssl.SSLSocket, socket.socket]) -> bool:
+        """
+        Checks whether a connection is read by the reactor.
+        """
+        return connection in self._channels
+
+    def send(
+        self, connection: Union[ssl.SSLSocket, socket.socket], data: bytes
+    ) -> int:
+        """
+        Queues bytes to be written to an owned connection. Called on the
+        reactor thread, e.g. from a callback, the bytes are written right
+        away.
+
+        Returns:
+            int: The number of queued bytes.
+
+        Raises:
+            ConnectionError: If the connection is not owned by the reactor.
+        """
+        entry = self._channels.get(connection)
+        if entry is None:
+            raise ConnectionError("Connection is not owned by the reactor")
+        with entry["out_lock"]:
+            entry["out"] += data
+        if current_thread() is self._thread:
+            self._flush(entry)
+        else:
+            self._call(lambda: self._flush(entry), wait=False)
+        return len(data)
+
+    def _call(self, change: Callable[[], Any], wait: bool = True) -> None:
+        """
+        Runs a change of the owned connections on the reactor thread,
+        which is the only thread using the selector.
+        """
+        if current_thread() is self._thread:
+            change()
+            return
+        done: Future[Any] = Future()
+        with self._lock:
+            if not self.running:
+                raise ConnectionError("Reactor is not running")
+            self._changes.append((change, done))
+        self._wake()
+        if wait:
+            done.result()
+
+    def _apply_changes(self) -> None:
+        with self._lock:
+            changes, self._changes = self._changes, []
+        for change, done in changes:
+            try:
+                change()
+                done.set_result(None)
+            except Exception as e:
+                done.set_exception(e)
+
+    def _wake(self) -> None:
+        writer = self._wake_writer
+        if writer is None:
+            # never started
+            return
+        try:
+            writer.send(b"\0")
+        except OSError:
+            # the loop is already awake or stopped
+            pass
+
+    def _drain_wake(self) -> None:
+        reader = self._wake_reader
+        if reader is None:
+            return
+        try:
+            while reader.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _release(self, entry: dict[str, Any]) -> None:
+        connection = entry["connection"]
+        self._channels.pop(connection, None)
+        selector = self._selector
+        try:
+            if selector is not None:
+                selector.unregister(connection)
+        except (KeyError, ValueError):
+            pass
+        try:
+            if connection.fileno() != -1:
+                connection.setblocking(True)
+                with entry["out_lock"]:
+                    if entry["out"]:
+                        connection.sendall(entry["out"])
+                        entry["out"] = bytearray()
+        except OSError:
+            pass
+
+    def _lost(self, entry: dict[str, Any], error: Exception) -> None:
+        self._release(entry)
+        self.metrics["lost"] += 1
+        self.logging.warning(f"Connection {entry['name']} lost: {error}")
+        self._closed(entry, error)
+
+    def _closed(self, entry: dict[str, Any], error: Exception) -> None:
+        if entry["on_close"] is not None:
+            try:
+                entry["on_close"](error)
+            except Exception as e:
+                self.logging.error(
+                    f"Close callback of {entry['name']} failed: {e}"
+                )
+
+    def _flush(self, entry: dict[str, Any]) -> None:
+        connection = entry["connection"]
+        if self._channels.get(connection) is not entry:
+            return
+        error: Optional[Exception] = None
+        with entry["out_lock"]:
+            out = entry["out"]
+            try:
+                while out:
+                    sent = connection.send(out)
+                    del out[:sent]
+                    entry["bytes_out"] += sent
+            except (
+                BlockingIOError,
+                ssl.SSLWantReadError,
+                ssl.SSLWantWriteError,
+            ):
+                pass
+            except OSError as e:
+                error = e
+            waiting = bool(out)
+        if error is not None:
+            self._lost(entry, error)
+            return
+        selector = self._selector
+        if selector is not None and waiting != entry["writing"]:
+            entry["writing"] = waiting
+            events = selectors.EVENT_READ
+            if waiting:
+                events |= selectors.EVENT_WRITE
+            selector.modify(connection, events, entry)
+
+    def _read(self, entry: dict[str, Any], arrival: float) -> None:
+        """
+        Reads an owned connection until it would block, dispatching the
+        frames of every chunk before the next one is read.
+        """
+        connection, framer = entry["connection"], entry["framer"]
+        chunks = 0
+        while self._channels.get(connection) is entry:
+            for frame in framer.frames():
+                self._dispatch(entry, frame, arrival)
+                if self._channels.get(connection) is not entry:
+                    return
+            try:
+                received = framer.recv_into(connection)
+            except (
+                BlockingIOError,
+                ssl.SSLWantReadError,
+                ssl.SSLWantWriteError,
+            ):
+                return
+            except OSError as e:
+                self._lost(entry, e)
+                return
+            if not received:
+                self._lost(
+                    entry, ConnectionError("Connection closed by the server")
+                )
+                return
+            if chunks:
+                # bytes read after the first chunk may have arrived after
+                # the wake-up of the loop
+                arrival = perf_counter()
+            chunks += 1
+            entry["bytes_in"] += received
+
+    def _dispatch(
+        self, entry: dict[str, Any], frame: bytes, arrival: float
+    ) -> None:
+        start = perf_counter()
+        entry["latency"].record(start - arrival)
+        try:
+            entry["on_frame"](frame, arrival)
+        except Exception as e:
+            self.metrics["callback_errors"] += 1
+            self.logging.error(f"Callback of {entry['name']} failed: {e}")
+        entry["busy"].record(perf_counter() - start)
+        entry["frames"] += 1
+        self.metrics["frames"] += 1
+
+    def _run(self) -> None:
+        selector = self._selector
+        if selector is None:
+            # set by start before the thread
+            return
+        try:
+            while self.running:
+                self._apply_changes()
+                events = selector.select(self.select_timeout)
+                arrival = perf_counter()
+                self.metrics["wakeups"] += 1
+                for key, mask in events:
+                    entry = key.data
+                    if entry is None:
+                        self._drain_wake()
+                        continue
+                    if mask & selectors.EVENT_WRITE:
+                        self._flush(entry)
+                    if mask & selectors.EVENT_READ:
+                        self._read(entry, arrival)
+        except Exception as e:
+            self.logging.error(f"Reactor stopped: {e}")
+        finally:
+            with self._lock:
+                self.running = False
+            self._apply_changes()
+            for entry in list(self._channels.values()):
+                self._release(entry)
+                self._closed(entry, ConnectionError("Reactor stopped"))
+            selector.close()
+            for wake in (self._wake_reader, self._wake_writer):
+                if wake is not None:
+                    wake.close()
+
+    def stats(self) -> dict[str, Any]:
+        """
+        Returns the loop counters and per owned connection the numbers of
+        frames and bytes, the latency from the arrival of the bytes to the
+        frame callback and the time spent in the callback, in seconds.
+        """
+        return {
+            **self.metrics,
+            "connections": {
+                entry["name"]: {
+                    "frames": entry["frames"],
+                    "bytes_in": entry["bytes_in"],
+                    "bytes_out": entry["bytes_out"],
+                    "latency": entry["latency"].summary(),
+                    "busy": entry["busy"].summary(),
+                }
+                for entry in list(self._channels.values())
+            },
+        }
+
+
+_reactor: Optional[Reactor] = None
+_reactor_lock = Lock()
+
+
+def get_reactor() -> Reactor:
+    """
+    Returns the running process-wide reactor.
+    """
+    global _reactor
+    with _reactor_lock:
+        if _reactor is None or not _reactor.running:
+            _reactor = Reactor().start()
+        return _reactor
+
+
+class MultiplexedChannel:
+    """
+    Shares the main connection of a logged-in client between threads and
+    coroutines. Every command is stamped with a unique customTag, which the
+    server copies to its response, and a reader thread routes the responses
+    to the futures of the waiting callers. Many commands can therefore be
+    in flight on one connection at the same time. With a reactor the
+    responses are routed on the reactor thread instead of an own reader
+    thread.
+
+    Args:
+        client (XTBClient): The connected and logged-in client. The channel
+            owns its main connection while running.
+        tag_prefix (str, optional): The prefix of the custom tags.
+            Defaults to "mx".
+        reactor (Reactor, optional): The running reactor reading the
+            responses. Defaults to None, a reader thread is started.
+
+    Attributes:
+        client (XTBClient): The client whose connection is shared.
+        tag_prefix (str): The prefix of the custom tags.
+        reactor (Reactor): The reactor reading the responses or None.
+        running (bool): Whether the responses are being routed.
+        poll_interval (float): The longest time in seconds the reader
+            thread waits for a response before it checks running.
+    """
+
+    poll_interval: float = 0.1
+
+    def __init__(
+        self,
+        client: XTBClient,
+        tag_prefix: str = "mx",
+        reactor: Optional[Reactor] = None,
+    ) -> None:
+        self.client = client
+        self.tag_prefix = tag_prefix
+        self.reactor = reactor
+        self.running: bool = False
+        self._pending: dict[str, Future[Any]] = {}
+        # command name, start time and size of the commands in flight
+        self._started: dict[str, tuple[str, float, int]] = {}
+        self._pending_lock = Lock()
+        self._send_lock = Lock()
+        self._tags = itertools.count()
+        self._reader: Optional[Thread] = None
+
+    def start(self) -> "MultiplexedChannel":
+        """
+        Starts the thread reading the responses or hands the connection
+        over to the reactor.
+        """
+        if not self.running:
+            self.running = True
+            if self.reactor is not None:
+                self.client.attach_reactor(
+                    self.reactor, self._on_frame, self._closed, stream=False
+                )
+                return self
+            self._reader = Thread(
+                target=self._read_responses, name="mx-reader", daemon=True
+            )
+            self._reader.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Stops routing responses and fails the commands still in flight.
+        The reader thread is joined before the connection is given back,
+        so it does not take the responses of the next users of the
+        client; a reactor hands the connection back.
+        """
+        self.running = False
+        if self.reactor is not None:
+            self.client.detach_reactor(stream=False)
+        self._fail_pending(ConnectionError("Channel stopped"))
+        reader, self._reader = self._reader, None
+        if reader is not None and reader is not current_thread():
+            reader.join(timeout=5)
+
+    def __enter__(self) -> "MultiplexedChannel":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    def in_flight(self) -> int:
+        """
+        Returns the number of commands waiting for their responses.
+        """
+        return len(self._pending)
+
+    def submit(self, packet: dict[str, Any]) -> Future[Any]:
+        """
+        Sends a command and returns the future of its response.
+
+        Args:
+            packet (dict): The packet to be sent. It is not modified.
+
+        Returns:
+            Future: Resolved with the response of the server.
+        """
+        if not self.running:
+            raise ConnectionError("Channel is not running")
+        tag = f"{self.tag_prefix}{next(self._tags)}"
+        future: Future[Any] = Future()
+        message = json.dumps({**packet, "customTag": tag}).encode("utf-8")
+        with self._pending_lock:
+            self._pending[tag] = future
+            self._started[tag] = (
+                packet["command"],
+                perf_counter(),
+                len(message),
+            )
+        try:
+            with self._send_lock:
+                self.client.send_data(message)
+        except Exception as e:
+            with self._pending_lock:
+                self._pending.pop(tag, None)
+                self._started.pop(tag, None)
+            future.set_exception(e)
+        return future
+
+    def send_n_return(
+        self, packet: dict[str, Any], timeout: Optional[float] = None
+    ) -> Any:
+        """
+        Sends a command and blocks until its response arrives. The signature
+        matches XTBClient.send_n_return, so the channel can be passed to the
+        functions of api.commands.
+        """
+        return self.submit(packet).result(timeout)
+
+    async def async_send_n_return(self, packet: dict[str, Any]) -> Any:
+        """
+        Sends a command and awaits its response without blocking the loop.
+        """
+        return await asyncio.wrap_future(self.submit(packet))
+
+    def _resolve(
+        self, response: Any, size: int = 0, decode: float = 0.0
+    ) -> None:
+        tag = response.get("customTag") if isinstance(response, dict) else None
+        with self._pending_lock:
+            if tag not in self._pending:
+                if not self._pending:
+                    self.client.logging.warning(
+                        f"Response without pending command: {response}"
+                    )
+                    return
+                # responses without the tag (e.g. errors of malformed
+                # commands) belong to the oldest command in flight
+                tag = next(iter(self._pending))
+            future = self._pending.pop(tag)
+            started = self._started.pop(tag, None)
+        metrics = getattr(self.client, "metrics", None)
+        if started is not None and isinstance(metrics, ClientMetrics):
+            command, start, sent = started
+            metrics.record_command(
+                command,
+                perf_counter() - start,
+                decode,
+                sent,
+                size,
+                not is_success(response),
+            )
+        future.set_result(response)
+
+    def _fail_pending(self, error: Exception) -> None:
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+            self._started = {}
+        for future in pending.values():
+            future.set_exception(error)
+
+    def _on_frame(self, frame: bytes, arrival: float) -> None:
+        decoded = self.client.decode_frame(
+            frame, self.client.framer, "Multiplexed response error"
+        )
+        if decoded is not None:
+            self._resolve(*decoded)
+
+    def _closed(self, error: Exception) -> None:
+        self.running = False
+        self._fail_pending(ConnectionError(f"Channel closed: {error}"))
+
+    def _readable(self, connection: socket.socket) -> bool:
+        """
+        Waits for the bytes of a response for poll_interval at most.
+        Bytes already decrypted by the TLS layer do not wake select.
+        """
+        if isinstance(connection, ssl.SSLSocket) and connection.pending():
+            return True
+        readable, _, _ = select.select(
+            [connection], [], [], self.poll_interval
+        )
+        return bool(readable)
+
+    def _read_responses(self) -> None:
+        while True:
+            connection = self.client.socket_connection
+            framer = self.client.framer
+            try:
+                # stopped, the reader only drains the responses already
+                # arriving, which belong to the failed commands
+                if not len(framer) and not self._readable(connection):
+                    if self.running:
+                        continue
+                    return
+                response, size, decode = self.client.receive(
+                    connection, framer, "Multiplexed response error"
+                )
+            except (ConnectionError, OSError, ValueError) as e:
+                self.running = False
+                self._fail_pending(ConnectionError(f"Channel closed: {e}"))
+                return
+            self._resolve(response, size, decode)
+
+
+class TokenBucket:
+    """
+    Token bucket limiting the rate of commands sent through one
+    connection.
+
+    Args:
+        rate (float, optional): The number of tokens added per second.
+            Defaults to 5 (one command every 200 ms).
+        capacity (float, optional): The maximum number of stored tokens,
+            i.e. the allowed burst. Defaults to 1.
+
+    Attributes:
+        rate (float): The number of tokens added per second.
+        capacity (float): The maximum number of stored tokens.
+        tokens (float): The tokens available now.
+    """
+
+    def __init__(self, rate: float = 5.0, capacity: float = 1.0) -> None:
+        if rate <= 0 or capacity < 1:
+            raise ValueError("rate must be positive and capacity at least 1")
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = monotonic()
+
+    def _refill(self) -> None:
+        now = monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def delay(self) -> float:
+        """
+        Returns the number of seconds until a token is available.
+        """
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def consume(self) -> bool:
+        """
+        Takes a token if one is available.
+
+        Returns:
+            bool: True if the token was taken.
+        """
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class CommandScheduler:
+    """
+    Sends the commands of many callers through one connection in the
+    order of their priority lanes and no faster than the broker allows.
+    Position closes go first, then position opens, then queries, then
+    history downloads, so an order is never queued behind a chart
+    request. Commands of one lane keep their order.
+
+    Args:
+        target: The connection the commands are sent through: an XTBClient
+            or a MultiplexedChannel. With a channel the commands are
+            pipelined, otherwise sent one after another.
+        rate_limiter (TokenBucket, optional): The rate limit of the
+            connection. Defaults to one command every 200 ms.
+        recover (callable, optional): Returns a new target when the
+            current one stopped running, raising ConnectionError if it can
+            not. The queued commands wait for it, the commands in flight on
+            the lost connection fail, since a trade may have been executed.
+            Defaults to None.
+
+    Attributes:
+        target: The connection the commands are sent through.
+        rate_limiter (TokenBucket): The rate limit of the connection.
+        recover (callable): Returns a new target for a lost connection.
+        running (bool): Whether the dispatching thread is running.
+    """
+
+    LANES = ("close", "open", "query", "history")
+    HISTORY_COMMANDS = frozenset(
+        [
+            "getChartLastRequest",
+            "getChartRangeRequest",
+            "getTradesHistory",
+            "getIbsHistory",
+        ]
+    )
+
+    def __init__(
+        self,
+        target: Any,
+        rate_limiter: Optional[TokenBucket] = None,
+        recover: Optional[Callable[[], Any]] = None,
+    ) -> None:
+        self.target = target
+        self.recover = recover
+        self.rate_limiter = (
+            rate_limiter if rate_limiter is not None else TokenBucket()
+        )
+        self.running: bool = False
+        self._queue: list[tuple[int, int, float, dict[str, Any], Any]] = []
+        self._sequence = itertools.count()
+        self._condition = Condition()
+        self._thread: Optional[Thread] = None
+        self._lanes: dict[str, dict[str, float]] = {
+            lane: {
+                "depth": 0,
+                "submitted": 0,
+                "dispatched": 0,
+                "wait_time": 0.0,
+                "max_wait_time": 0.0,
+            }
+            for lane in self.LANES
+        }
+
+    @classmethod
+    def lane_of(cls, packet: dict[str, Any]) -> str:
+        """
+        Returns the priority lane of a command.
+
+        Args:
+            packet (dict): The command packet.
+        """
+        command = packet.get("command")
+        if command == "tradeTransaction":
+            info = packet.get("arguments", {}).get("tradeTransInfo", {})
+            return "close" if info.get("type") == 2 else "open"
+        if command in cls.HISTORY_COMMANDS:
+            return "history"
+        return "query"
+
+    def start(self) -> "CommandScheduler":
+        """
+        Starts the dispatching thread.
+        """
+        if not self.running:
+            self.running = True
+            self._thread = Thread(
+                target=self._dispatch, name="cmd-scheduler", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Stops dispatching and fails the queued commands.
+        """
+        with self._condition:
+            self.running = False
+            queued, self._queue = self._queue, []
+            self._condition.notify_all()
+        for _, _, _, _, future in queued:
+            future.set_exception(ConnectionError("Scheduler stopped"))
+
+    def is_alive(self) -> bool:
+        """
+        Checks that the scheduler and its connection are running. A lost
+        connection does not count when it can be recovered.
+        """
+        if self.recover is not None:
+            return self.running
+        return self.running and getattr(self.target, "running", True)
+
+    def submit(
+        self, packet: dict[str, Any], lane: Optional[str] = None
+    ) -> Future[Any]:
+        """
+        Queues a command.
+
+        Args:
+            packet (dict): The command packet.
+            lane (str, optional): One of LANES. Defaults to the lane
+                derived from the command.
+
+        Returns:
+            Future: Resolved with the response of the server.
+        """
+        lane = lane if lane is not None else self.lane_of(packet)
+        priority = self.LANES.index(lane)
+        future: Future[Any] = Future()
+        with self._condition:
+            if not self.running:
+                raise ConnectionError("Scheduler is not running")
+            heapq.heappush(
+                self._queue,
+                (priority, next(self._sequence), monotonic(), packet, future),
+            )
+            self._lanes[lane]["depth"] += 1
+            self._lanes[lane]["submitted"] += 1
+            self._condition.notify()
+        return future
+
+    def send_n_return(
+        self,
+        packet: dict[str, Any],
+        lane: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """
+        Queues a command and blocks until its response arrives. The
+        signature matches XTBClient.send_n_return, so the scheduler can be
+        passed to the functions of api.commands.
+        """
+        return self.submit(packet, lane).result(timeout)
+
+    def _next(self) -> Optional[tuple[dict[str, Any], Future[Any]]]:
+        with self._condition:
+            while self.running:
+                if not self._queue:
+                    self._condition.wait()
+                    continue
+                delay = self.rate_limiter.delay()
+                if delay > 0:
+                    # a command of a higher lane may arrive meanwhile
+                    self._condition.wait(delay)
+                    continue
+                self.rate_limiter.consume()
+                priority, _, queued_at, packet, future = heapq.heappop(
+                    self._queue
+                )
+                lane = self._lanes[self.LANES[priority]]
+                waited = monotonic() - queued_at
+                lane["depth"] -= 1
+                lane["dispatched"] += 1
+                lane["wait_time"] += waited
+                lane["max_wait_time"] = max(lane["max_wait_time"], waited)
+                return packet, future
+            return None
+
+    def _dispatch(self) -> None:
+        while True:
+            item = self._next()
+            if item is None:
+                return
+            packet, future = item
+            if self.recover is not None and not getattr(
+                self.target, "running", True
+            ):
+                try:
+                    self.target = self.recover()
+                except Exception as e:
+                    future.set_exception(e)
+                    continue
+            if hasattr(self.target, "submit"):
+                try:
+                    response = self.target.submit(packet)
+                except Exception as e:
+                    future.set_exception(e)
+                    continue
+                response.add_done_callback(
+                    lambda done, future=future: _copy_future(done, future)
+                )
+                continue
+            try:
+                future.set_result(self.target.send_n_return(packet))
+            except Exception as e:
+                future.set_exception(e)
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """
+        Returns per lane the queue depth, the number of submitted and
+        dispatched commands and the mean and maximum waiting time in
+        seconds.
+        """
+        with self._condition:
+            return {
+                lane: {
+                    **values,
+                    "mean_wait_time": (
+                        values["wait_time"] / values["dispatched"]
+                        if values["dispatched"]
+                        else 0.0
+                    ),
+                }
+                for lane, values in self._lanes.items()
+            }
+
+
+def _copy_future(source: Future[Any], destination: Future[Any]) -> None:
+    error = source.exception()
+    if error is not None:
+        destination.set_exception(error)
+    else:
+        destination.set_result(source.result())
+
+
+class KeepAliveManager:
+    """
+    Background keep-alive of the live connections. The main connections
+    are pinged every interval and the round-trip times of the pings are
+    measured. A connection whose pongs go missing max_missed times in a row
+    is marked as stale, so its owner replaces it before the next order is
+    sent. Stream connections are subscribed to keepAlive messages and
+    marked as stale when nothing arrives for stream_timeout seconds.
+
+    Args:
+        interval (float, optional): The seconds between pings of one
+            connection. Defaults to 30.
+        timeout (float, optional): The seconds after which a ping without
+            pong counts as missed. Defaults to 5.
+        max_missed (int, optional): The number of missed pongs in a row
+            marking a connection as stale. Defaults to 2.
+        stream_timeout (float, optional): The seconds of silence marking
+            a stream connection as stale. Defaults to 15.
+
+    Attributes:
+        interval (float): The seconds between pings of one connection.
+        timeout (float): The seconds after which a ping counts as missed.
+        max_missed (int): The missed pongs marking a connection as stale.
+        stream_timeout (float): The silence marking a stream as stale.
+        running (bool): Whether the keep-alive thread is running.
+    """
+
+    PING = {"command": "ping"}
+
+    def __init__(
+        self,
+        interval: float = 30.0,
+        timeout: float = 5.0,
+        max_missed: int = 2,
+        stream_timeout: float = 15.0,
+    ) -> None:
+        self.logging = setup_logger(
+            "keep_alive_logger", "client.log", print_logs=False
+        )
+        self.interval = interval
+        self.timeout = timeout
+        self.max_missed = max_missed
+        self.stream_timeout = stream_timeout
+        self.running: bool = False
+        self._connections: dict[int, dict[str, Any]] = {}
+        self._streams: dict[int, dict[str, Any]] = {}
+        self._condition = Condition()
+        self._thread: Optional[Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def start(self) -> "KeepAliveManager":
+        """
+        Starts the keep-alive thread.
+        """
+        with self._condition:
+            if not self.running:
+                self.running = True
+                self._executor = ThreadPoolExecutor(
+                    max_workers=4, thread_name_prefix="keep-alive-ping"
+                )
+                self._thread = Thread(
+                    target=self._run, name="keep-alive", daemon=True
+                )
+                self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Stops the keep-alive thread. Pings in flight are not waited for.
+        """
+        with self._condition:
+            self.running = False
+            self._condition.notify_all()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def register(
+        self,
+        target: Any,
+        name: Optional[str] = None,
+        on_stale: Optional[Callable[[], Any]] = None,
+    ) -> Any:
+        """
+        Adds a main connection to be pinged.
+
+        Args:
+            target: An XTBClient or an object with submit returning
+                a Future, such as MultiplexedChannel or CommandScheduler.
+                A client shared through a channel must be registered
+                through the channel.
+            name (str, optional): The name of the connection in stats.
+            on_stale (callable, optional): Called from the keep-alive
+                thread when the connection is marked as stale.
+
+        Returns:
+            The registered target.
+        """
+        with self._condition:
+            self._connections[id(target)] = {
+                "target": target,
+                "name": name or f"{type(target).__name__}-{id(target):x}",
+                "on_stale": on_stale,
+                "pending": None,
+                "sent_at": 0.0,
+                "next_ping": monotonic() + self.interval,
+                "pings": 0,
+                "pongs": 0,
+                "missed": 0,
+                "stale": False,
+                "rtt": 0.0,
+                "total_rtt": 0.0,
+                "max_rtt": 0.0,
+            }
+            self._condition.notify()
+        return target
+
+    def register_stream(self, client: Any, name: Optional[str] = None) -> Any:
+        """
+        Subscribes a stream connection to keepAlive messages and watches
+        the time of its last message.
+
+        Args:
+            client: The client with a connected stream socket.
+            name (str, optional): The name of the connection in stats.
+
+        Returns:
+            The registered client.
+        """
+        client.stream_send(
+            {
+                "command": "getKeepAlive",
+                "streamSessionId": client.stream_sesion_id,
+            }
+        )
+        with self._condition:
+            self._streams[id(client)] = {
+                "client": client,
+                "name": name or f"stream-{id(client):x}",
+                "registered": monotonic(),
+                "stale": False,
+            }
+        return client
+
+    def unregister(self, target: Any) -> None:
+        """
+        Stops the keep-alive of a main or stream connection.
+        """
+        with self._condition:
+            self._connections.pop(id(target), None)
+            self._streams.pop(id(target), None)
+
+    def is_stale(self, target: Any) -> bool:
+        """
+        Checks whether a registered connection was marked as stale.
+        Unregistered connections are never stale.
+        """
+        with self._condition:
+            entry = self._connections.get(id(target)) or self._streams.get(
+                id(target)
+            )
+            return bool(entry and entry["stale"])
+
+    def ping(self, target: Any) -> None:
+        """
+        Pings a registered connection now, without waiting for the pong.
+        """
+        with self._condition:
+            entry = self._connections.get(id(target))
+            if entry is not None and entry["pending"] is None:
+                self._send_ping(entry, monotonic())
+
+    def _send_ping(self, entry: dict[str, Any], now: float) -> None:
+        target = entry["target"]
+        try:
+            if hasattr(target, "submit"):
+                pending = target.submit(dict(self.PING))
+            elif self._executor is not None:
+                pending = self._executor.submit(
+                    target.send_n_return, dict(self.PING)
+                )
+            else:
+                return
+        except Exception as e:
+            self.logging.warning(f"Ping of {entry['name']} not sent: {e}")
+            self._missed(entry)
+            entry["next_ping"] = now + self.interval
+            return
+        entry["pending"] = pending
+        entry["sent_at"] = now
+        entry["next_ping"] = now + self.interval
+        entry["pings"] += 1
+        pending.add_done_callback(
+            lambda done, entry=entry: self._pong(entry, done)
+        )
+
+    def _pong(self, entry: dict[str, Any], done: Future[Any]) -> None:
+        rtt = monotonic() - entry["sent_at"]
+        with self._condition:
+            if entry["pending"] is not done:
+                return
+            entry["pending"] = None
+            try:
+                status = done.result()["status"]
+            except Exception:
+                status = False
+            if status is not True or rtt > self.timeout:
+                self._missed(entry)
+                return
+            entry["pongs"] += 1
+            entry["missed"] = 0
+            entry["stale"] = False
+            entry["rtt"] = rtt
+            entry["total_rtt"] += rtt
+            entry["max_rtt"] = max(entry["max_rtt"], rtt)
+
+    def _missed(self, entry: dict[str, Any]) -> None:
+        entry["missed"] += 1
+        if entry["missed"] >= self.max_missed and not entry["stale"]:
+            entry["stale"] = True
+            self.logging.warning(
+                f"{entry['name']} is stale after {entry['missed']} "
+                "missed pongs"
+            )
+            if entry["on_stale"] is not None:
+                try:
+                    entry["on_stale"]()
+                except Exception as e:
+                    self.logging.warning(
+                        f"Stale handler of {entry['name']} failed: {e}"
+                    )
+
+    def _check(self, now: float) -> float:
+        """
+        Sends the due pings, counts the pongs past the timeout and checks
+        the streams. Returns the seconds until the next due check.
+        """
+        next_check = now + self.interval
+        for entry in self._connections.values():
+            if (
+                entry["pending"] is not None
+                and now - entry["sent_at"] > self.timeout
+            ):
+                # the ping stays pending, a late pong does not count
+                entry["pending"] = None
+                self._missed(entry)
+            if entry["pending"] is None and now >= entry["next_ping"]:
+                self._send_ping(entry, now)
+            if entry["pending"] is not None:
+                next_check = min(next_check, entry["sent_at"] + self.timeout)
+            next_check = min(next_check, entry["next_ping"])
+        for entry in self._streams.values():
+            last = max(
+                getattr(entry["client"], "last_stream_message", 0.0),
+                entry["registered"],
+            )
+            stale = now - last > self.stream_timeout
+            if stale and not entry["stale"]:
+                self.logging.warning(
+                    f"{entry['name']} silent for {now - last:.1f} s"
+                )
+            entry["stale"] = stale
+            next_check = min(next_check, last + self.stream_timeout)
+        return next_check
+
+    def _run(self) -> None:
+        with self._condition:
+            while self.running:
+                now = monotonic()
+                next_check = self._check(now)
+                self._condition.wait(max(next_check - now, 0.01))
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """
+        Returns per connection the numbers of pings, pongs and missed
+        pongs, the stale flag and the last, mean and maximum round-trip
+        times in seconds.
+        """
+        with self._condition:
+            stats: dict[str, dict[str, float]] = {}
+            for entry in self._connections.values():
+                stats[entry["name"]] = {
+                    "pings": entry["pings"],
+                    "pongs": entry["pongs"],
+                    "missed": entry["missed"],
+                    "stale": entry["stale"],
+                    "rtt": entry["rtt"],
+                    "mean_rtt": (
+                        entry["total_rtt"] / entry["pongs"]
+                        if entry["pongs"]
+                        else 0.0
+                    ),
+                    "max_rtt": entry["max_rtt"],
+                }
+            for entry in self._streams.values():
+                stats[entry["name"]] = {"stale": entry["stale"]}
+            return stats
+
+
+_keep_alive: Optional[KeepAliveManager] = None
+_keep_alive_lock = Lock()
+
+
+def get_keep_alive_manager() -> KeepAliveManager:
+    """
+    Returns the running process-wide keep-alive manager.
+    """
+    global _keep_alive
+    with _keep_alive_lock:
+        if _keep_alive is None or not _keep_alive.running:
+            _keep_alive = KeepAliveManager().start()
+        return _keep_alive
+
+
+class SessionPool:
+    """
+    Process-wide pool of logged-in sessions. Instead of a TLS connection
+    and a login per component, the main connections are leased from the
+    pool and returned to it still logged in, and the stream connections
+    reuse the stream session ID of one login held by the pool.
+
+    Args:
+        mode (str, optional): The mode of the pooled sessions ("REAL" or
+            "DEMO"). Defaults to "DEMO".
+        max_size (int, optional): The maximum number of main connections
+            held by the pool. Defaults to 8.
+        health_check_interval (float, optional): The number of seconds of
+            idleness after which a session is pinged before it is leased.
+            Defaults to 30.
+        client_factory (callable, optional): Creates a client for the mode.
+            Defaults to XTBClient.
+        keep_alive (KeepAliveManager, optional): Keeps the stream session
+            and the session of the scheduler alive. Defaults to None, no
+            keep-alive.
+
+    Attributes:
+        mode (str): The mode of the pooled sessions.
+        max_size (int): The maximum number of main connections.
+        health_check_interval (float): The idle time before a health check.
+        client_factory (callable): Creates a client for the mode.
+        keep_alive (KeepAliveManager): The keep-alive of the long-lived
+            sessions. None if not kept alive.
+        reconnect_engine (ReconnectEngine): The backoff and the time to
+            recover metrics of the session of the scheduler.
+        metrics (dict): Counters of the pool activity.
+    """
+
+    def __init__(
+        self,
+        mode: str = "DEMO",
+        max_size: int = 8,
+        health_check_interval: float = 30.0,
+        client_factory: Callable[[str], Any] = XTBClient,
+        keep_alive: Optional[KeepAliveManager] = None,
+    ) -> None:
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.logging = setup_logger(
+            "pool_logger", "client.log", print_logs=False
+        )
+        self.mode = mode
+        self.max_size = max_size
+        self.health_check_interval = health_check_interval
+        self.client_factory = client_factory
+        self.keep_alive = keep_alive
+        self.reconnect_engine = ReconnectEngine()
+        self.metrics: dict[str, float] = {
+            "created": 0,
+            "logins": 0,
+            "leases": 0,
+            "reused": 0,
+            "discarded": 0,
+            "health_checks": 0,
+            "failed_health_checks": 0,
+            "waits": 0,
+            "wait_time": 0.0,
+            "max_wait_time": 0.0,
+            "stream_attached": 0,
+            "stale_replaced": 0,
+        }
+        self._idle: list[Any] = []
+        self._last_used: dict[int, float] = {}
+        self._size: int = 0
+        self._leased: int = 0
+        self._anchor: Optional[Any] = None
+        self._scheduler: Optional[CommandScheduler] = None
+        self._scheduler_client: Optional[Any] = None
+        self._condition = Condition()
+        self._anchor_lock = Lock()
+
+    def _open(self) -> Any:
+        """
+        Creates a client connected to the main port and logged in.
+
+        Raises:
+            ConnectionError: If the login was not successful.
+        """
+        client = self.client_factory(self.mode)
+        client.connect()
+        try:
+            client.login()
+        except ConnectionError:
+            self._close(client)
+            raise
+        self.metrics["created"] += 1
+        self.metrics["logins"] += 1
+        if client.login_status is not True:
+            self._close(client)
+            raise ConnectionError("Pool session could not log in")
+        return client
+
+    def _close(self, client: Any) -> None:
+        try:
+            if client.login_status is True:
+                client.logout()
+        except Exception as e:
+            self.logging.warning(f"Pool session not logged out: {e}")
+        client.disconnect_stream()
+        client.disconnect()
+
+    def warm_up(self, count: int = 1, stream: bool = True) -> int:
+        """
+        Pre-connects sockets to the server of the mode, so the next
+        sessions opened by the pool skip the TCP and TLS handshakes.
+
+        Args:
+            count (int, optional): The number of warm main connections.
+                Defaults to 1.
+            stream (bool, optional): Whether a stream connection is warmed
+                up as well. Defaults to True.
+
+        Returns:
+            int: The number of warm sockets.
+        """
+        user = select_user(self.mode)
+        factory = get_connection_factory()
+        warm = factory.warm_up((user.host, user.main_port), count, user.tls)
+        if stream:
+            warm += factory.warm_up(
+                (user.host, user.streaming_port), 1, user.tls
+            )
+        return warm
+
+    def is_healthy(self, client: Any) -> bool:
+        """
+        Checks the session before it is leased. Sessions idle for longer
+        than health_check_interval are pinged.
+
+        Args:
+            client: The pooled client.
+
+        Returns:
+            bool: True if the session can be used.
+        """
+        if client.connection is not True or client.login_status is not True:
+            return False
+        idle = monotonic() - self._last_used.get(id(client), 0.0)
+        if idle < self.health_check_interval:
+            return True
+        self.metrics["health_checks"] += 1
+        try:
+            healthy = client.send_n_return({"command": "ping"})["status"]
+        except Exception as e:
+            self.logging.warning(f"Pool session health check failed: {e}")
+            healthy = False
+        if healthy is not True:
+            self.metrics["failed_health_checks"] += 1
+            return False
+        return True
+
+    def _discard(self, client: Any) -> None:
+        self._last_used.pop(id(client), None)
+        self.metrics["discarded"] += 1
+        try:
+            self._close(client)
+        except Exception as e:
+            self.logging.warning(f"Pool session not closed: {e}")
+
+    def acquire(self, timeout: Optional[float] = None) -> Any:
+        """
+        Leases a logged-in client for exclusive use of its main
+        connection. Waits for a free session when the pool is full.
+
+        Args:
+            timeout (float, optional): The maximum waiting time in seconds.
+                Waits without limit if None.
+
+        Returns:
+            XTBClient: The logged-in client.
+
+        Raises:
+            TimeoutError: If no session was released in time.
+        """
+        start = monotonic()
+        while True:
+            client, create = self._reserve(start, timeout)
+            if create:
+                try:
+                    client = self._open()
+                except Exception:
+                    self._free_slot()
+                    raise
+                break
+            if self.is_healthy(client):
+                self.metrics["reused"] += 1
+                break
+            # the session is dead, its slot can be used for a new one
+            self._free_slot()
+            self._discard(client)
+        waited = monotonic() - start
+        with self._condition:
+            self.metrics["leases"] += 1
+            self.metrics["wait_time"] += waited
+            self.metrics["max_wait_time"] = max(
+                self.metrics["max_wait_time"], waited
+            )
+            self._leased += 1
+        return client
+
+    def _reserve(
+        self, start: float, timeout: Optional[float]
+    ) -> tuple[Optional[Any], bool]:
+        """
+        Takes an idle session or reserves a slot for a new one. The
+        sessions are checked and opened outside of the pool lock.
+        """
+        with self._condition:
+            while True:
+                if self._idle:
+                    return self._idle.pop(), False
+                if self._size < self.max_size:
+                    self._size += 1
+                    return None, True
+                remaining = (
+                    None if timeout is None else timeout - monotonic() + start
+                )
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("No free session in the pool")
+                self.metrics["waits"] += 1
+                self._condition.wait(remaining)
+
+    def _free_slot(self) -> None:
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    def release(self, client: Any, discard: bool = False) -> None:
+        """
+        Returns a leased client to the pool.
+
+        Args:
+            client: The leased client.
+            discard (bool, optional): Closes the session instead of
+                returning it, e.g. after a connection error.
+        """
+        with self._condition:
+            self._leased -= 1
+        if discard or client.connection is not True:
+            self._free_slot()
+            self._discard(client)
+            return
+        with self._condition:
+            self._last_used[id(client)] = monotonic()
+            self._idle.append(client)
+            self._condition.notify()
+
+    @contextmanager
+    def lease(self, timeout: Optional[float] = None) -> Iterator[Any]:
+        """
+        Context manager leasing a logged-in client. The session is
+        discarded if the block ends with a connection error.
+        """
+        client = self.acquire(timeout)
+        discard = False
+        try:
+            yield client
+        except (ConnectionError, OSError):
+            discard = True
+            raise
+        finally:
+            self.release(client, discard=discard)
+
+    def stream_session_id(self) -> str:
+        """
+        Returns the stream session ID of the login held by the pool for
+        stream connections, logging in on first use.
+        """
+        with self._anchor_lock:
+            if (
+                self._anchor is None
+                or self._is_stale(self._anchor)
+                or not self.is_healthy(self._anchor)
+            ):
+                if self._anchor is not None:
+                    self._unregister(self._anchor)
+                    self._discard(self._anchor)
+                self._anchor = self._open()
+                if self.keep_alive is not None:
+                    self.keep_alive.register(
+                        self._anchor, f"{self.mode}-anchor"
+                    )
+            self._last_used[id(self._anchor)] = monotonic()
+            return str(self._anchor.stream_sesion_id)
+
+    def attach_stream(self, client: Any) -> Any:
+        """
+        Connects the streaming port of a client and binds it to the stream
+        session of the pool, so the client needs no login of its own.
+
+        Args:
+            client: The client to be used for streaming.
+
+        Returns:
+            XTBClient: The same client, connected to the streaming port.
+        """
+        session_id = self.stream_session_id()
+        if client.connection_stream is not True:
+            client.connect_stream()
+        client.stream_sesion_id = session_id
+        self.metrics["stream_attached"] += 1
+        return client
+
+    def scheduler(self) -> CommandScheduler:
+        """
+        Returns the process-wide command scheduler of the pool. It holds
+        one leased session whose main connection is shared by all callers
+        through a MultiplexedChannel, rate limited and ordered by the
+        priority lanes of CommandScheduler. A lost or stale session is
+        replaced by the scheduler itself, so callers keep their reference.
+        """
+        with self._anchor_lock:
+            if self._scheduler is None or not self._scheduler.is_alive():
+                if self._scheduler is not None:
+                    self._stop_scheduler()
+                self._scheduler_client = self.acquire()
+                channel = MultiplexedChannel(self._scheduler_client).start()
+                scheduler = CommandScheduler(
+                    channel, recover=self._recover_scheduler_session
+                )
+                self._scheduler = scheduler.start()
+                if self.keep_alive is not None:
+                    self.keep_alive.register(
+                        scheduler,
+                        f"{self.mode}-scheduler",
+                        on_stale=lambda: self._scheduler_stale(scheduler),
+                    )
+            return self._scheduler
+
+    def _scheduler_stale(self, scheduler: CommandScheduler) -> None:
+        """
+        Stops the channel of a stale scheduler session, so the next
+        command, e.g. the next ping, recovers it.
+        """
+        self.metrics["stale_replaced"] += 1
+        scheduler.target.stop()
+
+    def _recover_scheduler_session(self) -> MultiplexedChannel:
+        """
+        Replaces the lost session of the scheduler with a new one, retried
+        with the backoff of reconnect_engine.
+
+        Raises:
+            ConnectionError: If no session could be opened.
+            RuntimeError: If the pool was closed.
+        """
+
+        def reopen() -> MultiplexedChannel:
+            with self._anchor_lock:
+                if self._scheduler is None:
+                    # not retried by the engine
+                    raise RuntimeError("Session pool closed")
+                if self._scheduler_client is not None:
+                    self._scheduler_client.disconnect()
+                    self.release(self._scheduler_client, discard=True)
+                    self._scheduler_client = None
+                self._scheduler_client = self.acquire(
+                    timeout=self.reconnect_engine.max_delay
+                )
+                return MultiplexedChannel(self._scheduler_client).start()
+
+        return self.reconnect_engine.run(reopen, f"{self.mode} scheduler")
+
+    def _is_stale(self, target: Any) -> bool:
+        if self.keep_alive is None or not self.keep_alive.is_stale(target):
+            return False
+        self.metrics["stale_replaced"] += 1
+        return True
+
+    def _unregister(self, target: Any) -> None:
+        if self.keep_alive is not None:
+            self.keep_alive.unregister(target)
+
+    def _stop_scheduler(self) -> None:
+        """
+        Stops the scheduler and discards its session. The connection is
+        closed first, so the channel reader can not take the response of
+        the logout.
+        """
+        if self._scheduler is not None:
+            self._unregister(self._scheduler)
+            self._scheduler.stop()
+            self._scheduler.target.stop()
+            self._scheduler = None
+        if self._scheduler_client is not None:
+            self._scheduler_client.disconnect()
+            self.release(self._scheduler_client, discard=True)
+            self._scheduler_client = None
+
+    def stats(self) -> dict[str, float]:
+        """
+        Returns the pool metrics with the current number of sessions.
+        """
+        with self._condition:
+            return {
+                **self.metrics,
+                "size": self._size,
+                "idle": len(self._idle),
+                "leased": self._leased,
+                "max_size": self.max_size,
+            }
+
+    def close(self) -> None:
+        """
+        Logs out and disconnects all idle sessions, the stream session and
+        the session of the scheduler.
+        """
+        with self._anchor_lock:
+            if self._anchor is not None:
+                self._unregister(self._anchor)
+                self._discard(self._anchor)
+                self._anchor = None
+            if self._scheduler is not None:
+                self._stop_scheduler()
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for client in idle:
+            self._discard(client)
+
+
+_session_pools: dict[str, SessionPool] = {}
+_session_pools_lock = Lock()
+
+
+def get_session_pool(mode: str = "DEMO") -> SessionPool:
+    """
+    Returns the process-wide session pool of the given mode.
+
+    Args:
+        mode (str, optional): "REAL" or "DEMO". Defaults to "DEMO".
+    """
+    with _session_pools_lock:
+        if mode not in _session_pools:
+            _session_pools[mode] = SessionPool(
+                mode=mode, keep_alive=get_keep_alive_manager()
+            )
+        return _session_pools[mode]
 
 
 def session_simulator(func: Callable[..., Any]) -> Callable[..., Any]:
@@ -5,16 +5,118 @@ Module containing commands to APIs used outside the data stream.
 from time import sleep
 from typing import Optional, Any
 import numpy as np
-from api.client import XTBClient
+from api.client import CommandSender
+from data.candles import CANDLE_FIELDS, CANDLE_PARSER
+from utils.metrics import client_metrics
 from utils.technical import setup_logger
 
 
-def get_trades(client: XTBClient, order_no: int) -> dict[str, Any]:
+def trade_transaction_info(
+    symbol: str, volume: float, cmd: int, trade_type: int = 0, order: int = 0
+) -> dict[str, Any]:
+    """
+    Builds the arguments of the tradeTransaction command.
+
+    Args:
+        symbol (str): The symbol of the trading position.
+        volume (float): The volume of the trading position.
+        cmd (int): The command type of the position (buy/sell).
+        trade_type (int, optional): The transaction type (0 - open,
+            2 - close). Defaults to 0.
+        order (int, optional): The position number to be closed.
+            Defaults to 0.
+
+    Returns:
+        dict: The tradeTransInfo arguments.
+    """
+    return {
+        "tradeTransInfo": {
+            "cmd": cmd,
+            "customComment": "",
+            "expiration": 0,
+            "order": order,
+            "price": 1.4,
+            "sl": 0,
+            "tp": 0,
+            "symbol": symbol,
+            "type": trade_type,
+            "volume": volume,
+        }
+    }
+
+
+def opened_trade_data(trade: dict[str, Any], order_no: int) -> dict[str, Any]:
+    """
+    Selects the data of an opened position from a getTrades record.
+    """
+    return {
+        "symbol": trade["symbol"],
+        "order": order_no,
+        "position": trade["position"],
+        "cmd": trade["cmd"],
+        "volume": trade["volume"],
+        "open_price": trade["open_price"],
+        "open_time": trade["open_time"],
+    }
+
+
+def closed_trade_data(trade: dict[str, Any]) -> dict[str, Any]:
+    """
+    Selects the data of a closed position from a getTradesHistory record.
+    """
+    return {
+        "symbol": trade["symbol"],
+        "order": trade["order2"],
+        "position": trade["position"],
+        "cmd": trade["cmd"],
+        "volume": trade["volume"],
+        "profit": trade["profit"],
+        "open_price": trade["open_price"],
+        "open_time": trade["open_time"],
+        "close_price": trade["close_price"],
+        "close_time": trade["close_time"],
+    }
+
+
+def candles_to_array(
+    candles_data: list[dict[str, Any]], digits: int = 0
+) -> np.ndarray[Any, np.dtype[Any]]:
+    """
+    Converts the rateInfos records of chart commands to an array of
+    candles with absolute close, high and low prices, in the order of
+    CANDLE_FIELDS. The records are read by key without modification.
+
+    Args:
+        candles_data (list): The rateInfos records.
+        digits (int, optional): The digits of the chart response; the
+            open price and the shifts are in units of 10**-digits.
+            Defaults to 0.
+
+    Returns:
+        np.ndarray: An array containing the candle data.
+
+    Raises:
+        KeyError: If a record misses a field.
+    """
+    # the records are read by key into the layout of CANDLE_FIELDS and
+    # the close, high and low shifts are added to open
+    historical_data = (
+        CANDLE_PARSER.records(candles_data)
+        .view(np.float64)
+        .reshape(-1, len(CANDLE_FIELDS))
+    )
+    historical_data[:, 2:5] += historical_data[:, 1:2]
+    if digits:
+        historical_data[:, 1:5] /= 10**digits
+    return historical_data
+
+
+def get_trades(client: CommandSender, order_no: int) -> dict[str, Any]:
     """
     Retrieves trading data for a specific order number from the specified API.
 
     Args:
-        client (XTBClient): An object representing the API to use for
+        client (CommandSender): An object representing the API to use for
             retrieving the data.
         order_no (int): An optional integer representing the order number.
 
@@ -32,22 +134,15 @@ def get_trades(client: XTBClient, order_no: int) -> dict[str, Any]:
                 for trade in response["returnData"]:
                     if int(trade.get("order2", 0)) == order_no:
                         data_recived = True
-                        return {
-                            "symbol": trade["symbol"],
-                            "order": order_no,
-                            "position": trade["position"],
-                            "cmd": trade["cmd"],
-                            "volume": trade["volume"],
-                            "open_price": trade["open_price"],
-                            "open_time": trade["open_time"],
-                        }
+                        return opened_trade_data(trade, order_no)
         except Exception:
             pass
+        client_metrics.record_retry("getTrades")
     return {}
 
 
 def get_margin(
-    client: XTBClient, symbol: str, volume: float
+    client: CommandSender, symbol: str, volume: float
 ) -> Optional[float]:
     """
     Calculate the margin required for a given trading position.
@@ -72,13 +167,13 @@ def get_margin(
 
 
 def buy_transaction(
-    client: XTBClient, symbol: str, volume: float
+    client: CommandSender, symbol: str, volume: float
 ) -> dict[str, Any]:
     """
     Opens a buy transaction and returns the position information.
 
     Args:
-        client (XTBClient): An object representing the API used to execute
+        client (CommandSender): An object representing the API used to execute
             the transaction.
         symbol (str): A string representing the symbol of the asset
             to be bought.
@@ -91,20 +186,9 @@ def buy_transaction(
     """
     # Define arguments for the buy transaction.
     logging = setup_logger("buy", "buy.log")
-    buy_arguments = {
-        "tradeTransInfo": {
-            "cmd": 0,
-            "customComment": "",
-            "expiration": 0,
-            "order": 0,
-            "price": 1.4,
-            "sl": 0,
-            "tp": 0,
-            "symbol": symbol,
-            "type": 0,
-            "volume": volume,
-        }
-    }
+    buy_arguments = trade_transaction_info(
+        symbol=symbol, volume=volume, cmd=0
+    )
     # Send the buy transaction request.
     buy_response = client.send_n_return(
         {"command": "tradeTransaction", "arguments": buy_arguments}
@@ -137,13 +221,13 @@ def buy_transaction(
 
 
 def sell_transaction(
-    client: XTBClient, symbol: str, volume: float
+    client: CommandSender, symbol: str, volume: float
 ) -> dict[str, Any]:
     """
     Opens a sell transaction and returns the position information.
 
     Args:
-        client (XTBClient): An object representing the API used to execute
+        client (CommandSender): An object representing the API used to execute
             the transaction.
         symbol (str): A string representing the symbol of the asset
             to be bought.
@@ -156,20 +240,9 @@ def sell_transaction(
     """
     # Define arguments for the buy transaction.
     logging = setup_logger("sell", "sell.log")
-    sell_arguments = {
-        "tradeTransInfo": {
-            "cmd": 1,
-            "customComment": "",
-            "expiration": 0,
-            "order": 0,
-            "price": 1.4,
-            "sl": 0,
-            "tp": 0,
-            "symbol": symbol,
-            "type": 0,
-            "volume": volume,
-        }
-    }
+    sell_arguments = trade_transaction_info(
+        symbol=symbol, volume=volume, cmd=1
+    )
     # Send the buy transaction request.
     sell_response = client.send_n_return(
         {"command": "tradeTransaction", "arguments": sell_arguments}
@@ -200,13 +273,13 @@ def sell_transaction(
 
 
 def close_position(
-    client: XTBClient, symbol: str, position: int, volume: float, cmd: int
+    client: CommandSender, symbol: str, position: int, volume: float, cmd: int
 ) -> dict[str, Any]:
     """
     Close a trading position.
 
     Args:
-        client (XTBClient): The client object used for API communication.
+        client (CommandSender): The client object used for API communication.
         symbol (str): The symbol of the trading position to be closed.
         position (int): The position number to be closed.
         volume (float): The volume of the trading position to be closed.
@@ -216,27 +289,18 @@ def close_position(
         dict: Information about the closed position, including order
             details and profit.
     """
-    close_arguments = {
-        "tradeTransInfo": {
-            "cmd": cmd,
-            "customComment": "",
-            "expiration": 0,
-            "order": position,
-            "price": 1.4,
-            "sl": 0,
-            "tp": 0,
-            "symbol": symbol,
-            "type": 2,
-            "volume": volume,
-        }
-    }
+    close_arguments = trade_transaction_info(
+        symbol=symbol, volume=volume, cmd=cmd, trade_type=2, order=position
+    )
     # Send the buy transaction request.
     close_status = False
     while not close_status:
         close_response = client.send_n_return(
             {"command": "tradeTransaction", "arguments": close_arguments}
         )
-        if close_response["status"] is True:
+        if close_response["status"] is not True:
+            client_metrics.record_retry("tradeTransaction")
+        else:
             close_status = True
             server_time_recv = client.send_n_return(
                 {"command": "getServerTime"}
@@ -260,20 +324,10 @@ def close_position(
                         for trade in trades_stats:
                             if int(trade.get("position", 0)) == position:
                                 data_recived = True
-                                return {
-                                    "symbol": trade["symbol"],
-                                    "order": trade["order2"],
-                                    "position": trade["position"],
-                                    "cmd": trade["cmd"],
-                                    "volume": trade["volume"],
-                                    "profit": trade["profit"],
-                                    "open_price": trade["open_price"],
-                                    "open_time": trade["open_time"],
-                                    "close_price": trade["close_price"],
-                                    "close_time": trade["close_time"],
-                                }
+                                return closed_trade_data(trade)
                 except Exception:
                     pass
+                client_metrics.record_retry("getTradesHistory")
     return {}
 
 
@@ -313,28 +367,63 @@ def get_historical_candles(
                     },
                 }
             )
-            candles_data = data["returnData"]["rateInfos"]
-            for candle in candles_data:
-                candle.pop("ctmString")
-                candle_data = np.fromiter(
-                    candle.values(), dtype=float
-                ).reshape(1, 6)
-                candle_data[0, 2] = candle_data[0, 1] + candle_data[0, 2]
-                candle_data[0, 3] = candle_data[0, 1] + candle_data[0, 3]
-                candle_data[0, 4] = candle_data[0, 1] + candle_data[0, 4]
-                historical_data = np.vstack([historical_data, candle_data])
+            historical_data = candles_to_array(
+                data["returnData"]["rateInfos"], data["returnData"]["digits"]
+            )
             data_status = True
         except Exception:
+            client_metrics.record_retry("getChartLastRequest")
             sleep(1)
     return historical_data
 
 
-def get_server_time(client: XTBClient) -> Optional[int]:
+def get_candles_range(
+    client, symbol: str, start: float, end: float, period: int = 1
+) -> np.ndarray[Any, np.dtype[Any]]:
+    """
+    Retrieves the candles of a symbol between two times with
+    getChartRangeRequest, e.g. to fill a gap of the candle stream. Unlike
+    get_historical_candles it makes one attempt.
+
+    Args:
+        client: The client object used for API communication.
+        symbol (str): The symbol of the candles.
+        start (float): The time in milliseconds of the first candle.
+        end (float): The time in milliseconds of the last candle.
+        period (int, optional): The period of each candle in minutes.
+            Defaults to 1.
+
+    Returns:
+        np.ndarray: The candles in the order of CANDLE_FIELDS.
+
+    Raises:
+        KeyError: If the command failed.
+    """
+    data = client.send_n_return(
+        {
+            "command": "getChartRangeRequest",
+            "arguments": {
+                "info": {
+                    "end": int(end),
+                    "period": period,
+                    "start": int(start),
+                    "symbol": symbol,
+                    "ticks": 0,
+                }
+            },
+        }
+    )
+    return candles_to_array(
+        data["returnData"]["rateInfos"], data["returnData"]["digits"]
+    )
+
+
+def get_server_time(client: CommandSender) -> Optional[int]:
     """
     Retrieves the server time from the specified client.
 
     Args:
-        client (XTBClient): The client object used to communicate with
+        client (CommandSender): The client object used to communicate with
             the server.
     """
     data = client.send_n_return({"command": "getServerTime"}).get(
@@ -0,0 +1,314 @@
+"""
+Module containing the capture of the frames exchanged with the API and
+a client replaying them. A capture records every raw frame with the
+monotonic time it was sent or received, so latency regressions can be
+reproduced and the stream consumers benchmarked on real market data.
+"""
+
+import json
+import os
+import struct
+from threading import Lock
+from time import monotonic, sleep
+from typing import Any, BinaryIO, Iterator, NamedTuple, Optional
+from utils.technical import setup_logger
+
+COMMAND_SENT = 0
+COMMAND_RECEIVED = 1
+STREAM_SENT = 2
+STREAM_RECEIVED = 3
+
+MAGIC = b"XTBCAP1\n"
+# channel, monotonic timestamp in seconds, payload length
+RECORD = struct.Struct("<BdI")
+DECODER = json.JSONDecoder()
+
+
+class Frame(NamedTuple):
+    """
+    A captured frame.
+
+    Attributes:
+        channel (int): One of COMMAND_SENT, COMMAND_RECEIVED, STREAM_SENT
+            and STREAM_RECEIVED.
+        timestamp (float): The monotonic time of the frame in seconds.
+        payload (bytes): The raw frame without its terminator.
+    """
+
+    channel: int
+    timestamp: float
+    payload: bytes
+
+
+class CaptureWriter:
+    """
+    Append-only writer of captured frames. Every record is a 13 byte
+    header (channel, timestamp, length) followed by the raw frame, so
+    capturing costs one buffered write per frame and no encoding.
+
+    Args:
+        path (str): The capture file. Records are appended if it exists.
+        buffering (int, optional): The size of the write buffer in bytes.
+            Defaults to 65536.
+
+    Attributes:
+        path (str): The capture file.
+        records (int): The number of frames written by this writer.
+    """
+
+    def __init__(self, path: str, buffering: int = 65536) -> None:
+        self.path = path
+        self.records: int = 0
+        self._lock = Lock()
+        self._file: Optional[BinaryIO] = open(path, "ab", buffering=buffering)
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+
+    def write(
+        self, channel: int, payload: bytes, timestamp: Optional[float] = None
+    ) -> None:
+        """
+        Appends a frame to the capture.
+
+        Args:
+            channel (int): The channel the frame was seen on.
+            payload (bytes): The raw frame.
+            timestamp (float, optional): The monotonic time of the frame.
+                Defaults to now.
+        """
+        if timestamp is None:
+            timestamp = monotonic()
+        header = RECORD.pack(channel, timestamp, len(payload))
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(header)
+            self._file.write(payload)
+            self.records += 1
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self) -> "CaptureWriter":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+def read_capture(path: str) -> Iterator[Frame]:
+    """
+    Yields the frames of a capture file in the order they were written.
+    A record cut short by an interrupted capture ends the iteration.
+
+    Args:
+        path (str): The capture file.
+
+    Raises:
+        ValueError: If the file is not a capture.
+    """
+    with open(path, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a capture file")
+        while True:
+            header = file.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            channel, timestamp, length = RECORD.unpack(header)
+            payload = file.read(length)
+            if len(payload) < length:
+                return
+            yield Frame(channel, timestamp, payload)
+
+
+class ReplayClient:
+    """
+    Client playing a capture back in place of XTBClient. Stream messages
+    are returned by stream_read with the recorded gaps divided by speed,
+    command responses are returned by send_n_return in the recorded order
+    after the recorded round trip. Sent commands are not checked against
+    the capture.
+
+    Args:
+        path (str): The capture file.
+        speed (float, optional): The replay speed, 1 plays in real time,
+            N plays N times faster and None plays at maximum speed.
+            Defaults to 1.
+
+    Attributes:
+        path (str): The capture file.
+        speed (float): The replay speed, None for maximum speed.
+        stream_sesion_id (str): The stream session ID of the recorded login.
+        login_status (bool): Whether the client is logged in.
+        connection (bool): Whether the main connection is open.
+        connection_stream (bool): Whether the stream connection is open.
+        metrics (dict): The numbers of replayed messages and responses and
+            the total lag of the stream behind its schedule in seconds.
+    """
+
+    def __init__(self, path: str, speed: Optional[float] = 1.0) -> None:
+        if speed is not None and speed <= 0:
+            raise ValueError("speed must be positive or None")
+        self.logging = setup_logger(
+            "client_logger", "client.log", print_logs=False
+        )
+        self.path = path
+        self.speed = speed
+        self.login_status: bool = False
+        self.stream_sesion_id: str = str()
+        self.connection: bool = False
+        self.connection_stream: bool = False
+        self.metrics: dict[str, float] = {
+            "stream_messages": 0,
+            "responses": 0,
+            "lag": 0.0,
+        }
+        self._stream: list[Frame] = []
+        # responses with the round trip measured from the preceding command
+        self._responses: list[tuple[float, bytes]] = []
+        self._load()
+        self._stream_index = 0
+        self._response_index = 0
+        self._origin: Optional[float] = None
+
+    def _load(self) -> None:
+        sent_at: Optional[float] = None
+        for frame in read_capture(self.path):
+            if frame.channel == STREAM_RECEIVED:
+                self._stream.append(frame)
+            elif frame.channel == COMMAND_SENT:
+                sent_at = frame.timestamp
+            elif frame.channel == COMMAND_RECEIVED:
+                round_trip = (
+                    frame.timestamp - sent_at if sent_at is not None else 0.0
+                )
+                self._responses.append((max(round_trip, 0.0), frame.payload))
+                sent_at = None
+                if (
+                    not self.stream_sesion_id
+                    and b"streamSessionId" in frame.payload
+                ):
+                    response = DECODER.decode(frame.payload.decode("utf-8"))
+                    self.stream_sesion_id = response.get("streamSessionId", "")
+
+    def __len__(self) -> int:
+        """
+        Returns the number of stream messages left to replay.
+        """
+        return len(self._stream) - self._stream_index
+
+    def rewind(self) -> None:
+        """
+        Starts the replay from the first frame again.
+        """
+        self._stream_index = 0
+        self._response_index = 0
+        self._origin = None
+
+    def connect(self) -> None:
+        self.connection = True
+
+    def connect_stream(self) -> None:
+        self.connection_stream = True
+
+    def disconnect(self) -> None:
+        self.connection = False
+
+    def disconnect_stream(self) -> None:
+        self.connection_stream = False
+
+    def login(self) -> None:
+        self.login_status = True
+
+    def logout(self) -> None:
+        self.login_status = False
+
+    def open_session(self) -> None:
+        self.connect()
+        self.connect_stream()
+        self.login()
+
+    def close_session(self) -> None:
+        self.logout()
+        self.disconnect()
+        self.disconnect_stream()
+
+    def send_packet(self, packet: dict[str, Any]) -> None:
+        pass
+
+    def stream_send(self, message: dict[str, Any]) -> int:
+        return len(json.dumps(message))
+
+    def send_n_return(self, packet: dict[str, Any]) -> Any:
+        """
+        Returns the next recorded command response.
+
+        Raises:
+            ConnectionError: If all responses were replayed.
+        """
+        if self._response_index >= len(self._responses):
+            raise ConnectionError("End of the captured responses")
+        round_trip, payload = self._responses[self._response_index]
+        self._response_index += 1
+        if self.speed is not None and round_trip > 0:
+            sleep(round_trip / self.speed)
+        self.metrics["responses"] += 1
+        return DECODER.decode(payload.decode("utf-8"))
+
+    def stream_read(self) -> Any:
+        """
+        Returns the next recorded stream message at its scheduled time.
+
+        Raises:
+            ConnectionError: If all stream messages were replayed.
+        """
+        if self._stream_index >= len(self._stream):
+            self.connection_stream = False
+            raise ConnectionError("End of the captured stream")
+        frame = self._stream[self._stream_index]
+        self._stream_index += 1
+        if self.speed is not None:
+            now = monotonic()
+            if self._origin is None:
+                self._origin = now
+            due = (
+                self._origin
+                + (frame.timestamp - self._stream[0].timestamp) / self.speed
+            )
+            if due > now:
+                sleep(due - now)
+            else:
+                self.metrics["lag"] += now - due
+        self.metrics["stream_messages"] += 1
+        return DECODER.decode(frame.payload.decode("utf-8"))
+
+    def stream_messages(self) -> Iterator[Any]:
+        """
+        Generator of the recorded stream messages.
+        """
+        while self.connection_stream is True:
+            yield self.stream_read()
+
+
+def capture_size(path: str) -> dict[str, int]:
+    """
+    Returns the number of frames per channel and the size of a capture.
+    """
+    counts = {
+        "command_sent": 0,
+        "command_received": 0,
+        "stream_sent": 0,
+        "stream_received": 0,
+    }
+    names = list(counts)
+    for frame in read_capture(path):
+        counts[names[frame.channel]] += 1
+    return {**counts, "bytes": os.path.getsize(path)}
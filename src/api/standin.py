@@ -0,0 +1,748 @@
+"""
+Module containing a local stand-in for the XTB API server. It speaks the
+JSON protocol of the main and streaming ports on localhost, over TLS with
+a self-signed certificate or over plain TCP, so the clients can be tested
+and benchmarked without a live account.
+"""
+
+import json
+import os
+import random
+import shutil
+import socket
+import ssl
+import subprocess
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from itertools import count
+from threading import Thread, Lock, Event
+from time import monotonic, time
+from typing import Any, Iterator, Optional
+from utils.technical import setup_logger
+
+
+def generate_certificate(directory: str) -> tuple[str, str]:
+    """
+    Creates a self-signed certificate for localhost with the openssl
+    command line tool.
+
+    Args:
+        directory (str): The directory to write the files to.
+
+    Returns:
+        tuple: The paths of the certificate and of the private key.
+
+    Raises:
+        RuntimeError: If openssl is not available.
+    """
+    openssl = shutil.which("openssl")
+    if openssl is None:
+        raise RuntimeError(
+            "openssl is required to generate the certificate of the "
+            "stand-in server, pass certfile and keyfile or use tls=False"
+        )
+    certfile = os.path.join(directory, "standin.crt")
+    keyfile = os.path.join(directory, "standin.key")
+    subprocess.run(
+        [
+            openssl,
+            "req",
+            "-x509",
+            "-newkey",
+            "rsa:2048",
+            "-nodes",
+            "-days",
+            "2",
+            "-subj",
+            "/CN=localhost",
+            "-keyout",
+            keyfile,
+            "-out",
+            certfile,
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return certfile, keyfile
+
+
+class RequestReader:
+    """
+    Decoder of the commands sent by a client. The clients do not terminate
+    the commands, so the JSON objects are read one after another from the
+    received text.
+    """
+
+    DECODER = json.JSONDecoder()
+
+    def __init__(self) -> None:
+        self.buffer = ""
+
+    def feed(self, data: bytes) -> list[Any]:
+        """
+        Adds received bytes and returns the complete commands.
+        """
+        self.buffer += data.decode("utf-8")
+        requests = []
+        while True:
+            self.buffer = self.buffer.lstrip()
+            if not self.buffer:
+                break
+            try:
+                request, size = self.DECODER.raw_decode(self.buffer)
+            except ValueError:
+                break
+            requests.append(request)
+            self.buffer = self.buffer[size:]
+        return requests
+
+
+class XTBStandInServer:
+    """
+    Local server imitating the XTB API. The main port handles login,
+    queries, chart requests and trade transactions on an in-memory
+    account. The streaming port sends tickPrices, candle, balance, profit
+    and keepAlive messages at configurable rates to the subscribed
+    connections.
+
+    Args:
+        host (str, optional): The address to listen on.
+            Defaults to "127.0.0.1".
+        main_port (int, optional): The main port, 0 picks a free one.
+        streaming_port (int, optional): The streaming port, 0 picks
+            a free one.
+        tls (bool, optional): Whether the connections use TLS.
+            Defaults to True.
+        certfile (str, optional): The certificate for TLS. A self-signed
+            one is generated if not given.
+        keyfile (str, optional): The private key of certfile.
+        login (str, optional): The accepted user ID.
+        password (str, optional): The accepted password.
+        tick_rate (float, optional): The tickPrices messages per second
+            and symbol. Defaults to 10.
+        candle_interval (float, optional): The seconds between candle
+            messages of a symbol. Every candle covers the next minute of
+            the simulated chart. Defaults to 60.
+        balance_interval (float, optional): The seconds between balance
+            messages. Defaults to 1.
+        profit_interval (float, optional): The seconds between profit
+            messages of every open position. Defaults to 1.
+        keep_alive_interval (float, optional): The seconds between
+            keepAlive messages. Defaults to 3.
+        seed (int, optional): The seed of the simulated prices.
+
+    Attributes:
+        host (str): The address the server listens on.
+        main_port (int): The main port, known after start.
+        streaming_port (int): The streaming port, known after start.
+        tls (bool): Whether the connections use TLS.
+        stream_session_id (str): The stream session ID given at login.
+        positions (dict): The open positions by position number.
+        history (list): The closed positions.
+        metrics (dict): Counters of the served commands and messages.
+    """
+
+    BASE_PRICES = {"EURUSD": 1.08, "USDJPY": 148.5, "GBPUSD": 1.26}
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        main_port: int = 0,
+        streaming_port: int = 0,
+        tls: bool = True,
+        certfile: Optional[str] = None,
+        keyfile: Optional[str] = None,
+        login: str = "standin",
+        password: str = "standin",
+        tick_rate: float = 10.0,
+        candle_interval: float = 60.0,
+        balance_interval: float = 1.0,
+        profit_interval: float = 1.0,
+        keep_alive_interval: float = 3.0,
+        seed: int = 0,
+    ) -> None:
+        self.logging = setup_logger(
+            "standin_logger", "standin.log", print_logs=False
+        )
+        self.host = host
+        self.main_port = main_port
+        self.streaming_port = streaming_port
+        self.tls = tls
+        self.certfile = certfile
+        self.keyfile = keyfile
+        self.login = login
+        self.password = password
+        self.tick_rate = tick_rate
+        self.candle_interval = candle_interval
+        self.balance_interval = balance_interval
+        self.profit_interval = profit_interval
+        self.keep_alive_interval = keep_alive_interval
+        self.stream_session_id = f"standin-{seed}"
+        self.balance: float = 10000.0
+        self.positions: dict[int, dict[str, Any]] = {}
+        self.history: list[dict[str, Any]] = []
+        self.metrics: dict[str, int] = {
+            "connections": 0,
+            "commands": 0,
+            "stream_messages": 0,
+        }
+        self._random = random.Random(seed)
+        self._prices: dict[str, float] = {}
+        self._orders = count(1000000)
+        self._lock = Lock()
+        self._stopped = Event()
+        self._listeners: list[socket.socket] = []
+        self._connections: list[socket.socket] = []
+        self._context: Optional[ssl.SSLContext] = None
+        self._certdir: Optional[tempfile.TemporaryDirectory[str]] = None
+
+    def start(self) -> "XTBStandInServer":
+        """
+        Binds both ports and starts accepting connections.
+        """
+        if self.tls:
+            if self.certfile is None:
+                self._certdir = tempfile.TemporaryDirectory()
+                self.certfile, self.keyfile = generate_certificate(
+                    self._certdir.name
+                )
+            self._context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            self._context.load_cert_chain(self.certfile, self.keyfile)
+        self._stopped.clear()
+        main = self._listen(self.main_port)
+        stream = self._listen(self.streaming_port)
+        self.main_port = main.getsockname()[1]
+        self.streaming_port = stream.getsockname()[1]
+        for listener, handler in ((main, self._serve_main), (stream, None)):
+            Thread(
+                target=self._accept,
+                args=(listener, handler or self._serve_stream),
+                daemon=True,
+            ).start()
+        self.logging.info(
+            f"Stand-in listening on {self.host}:{self.main_port}"
+            f"/{self.streaming_port} (tls: {self.tls})"
+        )
+        return self
+
+    def stop(self) -> None:
+        """
+        Closes the listening sockets and all connections.
+        """
+        self._stopped.set()
+        with self._lock:
+            sockets = self._listeners + self._connections
+            self._listeners, self._connections = [], []
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+        if self._certdir is not None:
+            self._certdir.cleanup()
+            self._certdir = None
+            self.certfile = self.keyfile = None
+
+    def drop_connections(self) -> int:
+        """
+        Closes all client connections while the server keeps listening,
+        as after a network blip.
+
+        Returns:
+            int: The number of closed connections.
+        """
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conn.close()
+        return len(connections)
+
+    def __enter__(self) -> "XTBStandInServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    def environ(self, mode: str = "DEMO") -> dict[str, str]:
+        """
+        Returns the environment variables pointing the user settings of
+        the mode at the server.
+
+        Args:
+            mode (str, optional): "DEMO" or "REAL". Defaults to "DEMO".
+        """
+        return {
+            f"XTB_LOGIN_{mode}": self.login,
+            f"XTB_PASSWORD_{mode}": self.password,
+            f"XTB_HOST_{mode}": self.host,
+            f"XTB_MAIN_PORT_{mode}": str(self.main_port),
+            f"XTB_STREAMING_PORT_{mode}": str(self.streaming_port),
+            f"XTB_TLS_{mode}": str(self.tls),
+        }
+
+    @contextmanager
+    def patch_environ(self, mode: str = "DEMO") -> Iterator[None]:
+        """
+        Context manager pointing the settings of the mode at the server,
+        so XTBClient(mode) connects to it.
+        """
+        variables = self.environ(mode)
+        previous = {key: os.environ.get(key) for key in variables}
+        os.environ.update(variables)
+        try:
+            yield
+        finally:
+            for key, value in previous.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+
+    def _listen(self, port: int) -> socket.socket:
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self.host, port))
+        listener.listen()
+        with self._lock:
+            self._listeners.append(listener)
+        return listener
+
+    def _accept(self, listener: socket.socket, handler: Any) -> None:
+        while not self._stopped.is_set():
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return
+            Thread(
+                target=self._handle, args=(conn, handler), daemon=True
+            ).start()
+
+    def _handle(self, conn: socket.socket, handler: Any) -> None:
+        try:
+            if self._context is not None:
+                conn = self._context.wrap_socket(conn, server_side=True)
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except (OSError, ssl.SSLError) as e:
+            self.logging.warning(f"Handshake failed: {e}")
+            conn.close()
+            return
+        with self._lock:
+            self._connections.append(conn)
+            self.metrics["connections"] += 1
+        try:
+            handler(conn)
+        except (OSError, ssl.SSLError, ValueError) as e:
+            self.logging.info(f"Connection closed: {e}")
+        finally:
+            with self._lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
+            conn.close()
+
+    @staticmethod
+    def _send(conn: socket.socket, message: dict[str, Any]) -> None:
+        conn.sendall(json.dumps(message).encode("utf-8") + b"\n\n")
+
+    # main port
+
+    def _serve_main(self, conn: socket.socket) -> None:
+        reader = RequestReader()
+        logged = False
+        while not self._stopped.is_set():
+            data = conn.recv(65536)
+            if not data:
+                return
+            for request in reader.feed(data):
+                self.metrics["commands"] += 1
+                response, logged = self.respond(request, logged)
+                if "customTag" in request:
+                    response["customTag"] = request["customTag"]
+                self._send(conn, response)
+
+    def respond(
+        self, request: dict[str, Any], logged: bool
+    ) -> tuple[dict[str, Any], bool]:
+        """
+        Builds the response to a command of the main port.
+
+        Args:
+            request (dict): The received command.
+            logged (bool): Whether the connection is logged in.
+
+        Returns:
+            tuple: The response and the login state of the connection.
+        """
+        command = request.get("command")
+        arguments = request.get("arguments", {})
+        if command == "login":
+            if (
+                str(arguments.get("userId")) == self.login
+                and arguments.get("password") == self.password
+            ):
+                return {
+                    "status": True,
+                    "streamSessionId": self.stream_session_id,
+                }, True
+            return (
+                self.error("BE005", "userPasswordCheck: Invalid login"),
+                False,
+            )
+        if command == "ping":
+            return {"status": True}, logged
+        if not logged:
+            return self.error("BE103", "User is not logged"), False
+        if command == "logout":
+            return {"status": True}, False
+        handler = getattr(self, f"command_{command}", None)
+        if handler is None:
+            return self.error("EX000", f"Unknown command {command}"), logged
+        try:
+            return {"status": True, "returnData": handler(arguments)}, logged
+        except (KeyError, TypeError, ValueError) as e:
+            return self.error("BE001", f"Invalid parameters: {e}"), logged
+
+    @staticmethod
+    def error(code: str, description: str) -> dict[str, Any]:
+        return {"status": False, "errorCode": code, "errorDescr": description}
+
+    @staticmethod
+    def now() -> int:
+        return int(time() * 1000)
+
+    def price(self, symbol: str, move: bool = False) -> float:
+        """
+        Returns the simulated price of a symbol, moving it randomly if
+        requested.
+        """
+        with self._lock:
+            price = self._prices.get(
+                symbol, self.BASE_PRICES.get(symbol, 100.0)
+            )
+            if move:
+                price = round(price * (1 + self._random.gauss(0, 1e-4)), 5)
+            self._prices[symbol] = price
+            return price
+
+    def command_getVersion(self, arguments: dict[str, Any]) -> Any:
+        return {"version": "2.5.0"}
+
+    def command_getServerTime(self, arguments: dict[str, Any]) -> Any:
+        now = self.now()
+        return {"time": now, "timeString": self.time_string(now)}
+
+    def command_getMarginTrade(self, arguments: dict[str, Any]) -> Any:
+        price = self.price(arguments["symbol"])
+        return {"margin": round(price * float(arguments["volume"]) * 3.33, 2)}
+
+    def command_getTrades(self, arguments: dict[str, Any]) -> Any:
+        with self._lock:
+            trades = [dict(trade) for trade in self.positions.values()]
+        for trade in trades:
+            trade["profit"] = self.profit(trade)
+        return trades
+
+    def command_getTradesHistory(self, arguments: dict[str, Any]) -> Any:
+        start = int(arguments.get("start", 0))
+        end = int(arguments.get("end", 0)) or self.now()
+        with self._lock:
+            return [
+                dict(trade)
+                for trade in self.history
+                if start <= trade["close_time"] <= end
+            ]
+
+    def command_tradeTransaction(self, arguments: dict[str, Any]) -> Any:
+        info = arguments["tradeTransInfo"]
+        order = next(self._orders)
+        if int(info.get("type", 0)) == 2:
+            self.close(int(info["order"]))
+            return {"order": order}
+        symbol = info["symbol"]
+        cmd = int(info["cmd"])
+        price = self.price(symbol)
+        trade = {
+            "close_price": price,
+            "close_time": None,
+            "closed": False,
+            "cmd": cmd,
+            "customComment": info.get("customComment", ""),
+            "open_price": price,
+            "open_time": self.now(),
+            "order": next(self._orders),
+            "order2": order,
+            "position": order,
+            "profit": 0.0,
+            "symbol": symbol,
+            "volume": float(info["volume"]),
+        }
+        with self._lock:
+            self.positions[order] = trade
+        return {"order": order}
+
+    def command_tradeTransactionStatus(self, arguments: dict[str, Any]) -> Any:
+        return {
+            "order": arguments["order"],
+            "requestStatus": 3,
+            "message": None,
+        }
+
+    def command_getChartLastRequest(self, arguments: dict[str, Any]) -> Any:
+        info = arguments["info"]
+        return self.chart(info["symbol"], int(info["period"]), info["start"])
+
+    def command_getChartRangeRequest(self, arguments: dict[str, Any]) -> Any:
+        info = arguments["info"]
+        return self.chart(
+            info["symbol"],
+            int(info["period"]),
+            info["start"],
+            info.get("end") or None,
+        )
+
+    def chart(
+        self,
+        symbol: str,
+        period: int,
+        start: float,
+        end: Optional[float] = None,
+    ) -> dict[str, Any]:
+        """
+        Builds rateInfos of simulated candles between start and end. Like
+        the server, the open price and the close, high and low shifts
+        from it are given in units of 10**-digits.
+        """
+        digits = 5
+        scale = 10**digits
+        step = period * 60000
+        end = end if end is not None else self.now()
+        first = int(start) // step * step
+        rate_infos = []
+        price = self.price(symbol)
+        chart_random = random.Random(f"{symbol}{period}{first}")
+        for ctm in range(first, int(end) - step + 1, step):
+            open_price = price
+            close = open_price * (1 + chart_random.gauss(0, 2e-4))
+            high = max(open_price, close) * (
+                1 + abs(chart_random.gauss(0, 1e-4))
+            )
+            low = min(open_price, close) * (
+                1 - abs(chart_random.gauss(0, 1e-4))
+            )
+            rate_infos.append(
+                {
+                    "close": float(round((close - open_price) * scale)),
+                    "ctm": ctm,
+                    "ctmString": self.time_string(ctm),
+                    "high": float(round((high - open_price) * scale)),
+                    "low": float(round((low - open_price) * scale)),
+                    "open": float(round(open_price * scale)),
+                    "vol": float(chart_random.randint(1, 500)),
+                }
+            )
+            price = close
+        return {"digits": digits, "rateInfos": rate_infos[-1000:]}
+
+    def close(self, position: int) -> None:
+        """
+        Moves an open position to the history.
+        """
+        with self._lock:
+            trade = self.positions.pop(position, None)
+        if trade is None:
+            raise ValueError(f"No open position {position}")
+        trade["profit"] = self.profit(trade)
+        trade["close_price"] = self.price(trade["symbol"])
+        trade["close_time"] = self.now()
+        trade["closed"] = True
+        with self._lock:
+            self.balance += trade["profit"]
+            self.history.append(trade)
+
+    def profit(self, trade: dict[str, Any]) -> float:
+        direction = 1 if trade["cmd"] == 0 else -1
+        change = self.price(trade["symbol"]) - trade["open_price"]
+        profit: float = round(direction * change * trade["volume"] * 1e5, 2)
+        return profit
+
+    @staticmethod
+    def time_string(ctm: int) -> str:
+        return datetime.fromtimestamp(ctm / 1000, tz=timezone.utc).strftime(
+            "%b %d, %Y %I:%M:%S %p"
+        )
+
+    # streaming port
+
+    def _serve_stream(self, conn: socket.socket) -> None:
+        reader = RequestReader()
+        # (command, symbol) -> time of the next message
+        subscriptions: dict[tuple[str, Optional[str]], float] = {}
+        candles: dict[str, int] = {}
+        while not self._stopped.is_set():
+            now = monotonic()
+            wait = min([due - now for due in subscriptions.values()] + [0.05])
+            conn.settimeout(max(wait, 0.001))
+            try:
+                data = conn.recv(65536)
+                if not data:
+                    return
+                for request in reader.feed(data):
+                    self._subscription(request, subscriptions)
+            except (socket.timeout, ssl.SSLWantReadError):
+                pass
+            now = monotonic()
+            for (command, symbol), due in list(subscriptions.items()):
+                if due > now:
+                    continue
+                interval = self._emit(conn, command, symbol, candles)
+                subscriptions[(command, symbol)] = due + interval
+                if subscriptions[(command, symbol)] < now:
+                    # the connection is too slow for the rate, skip ahead
+                    subscriptions[(command, symbol)] = now + interval
+
+    def _subscription(
+        self,
+        request: dict[str, Any],
+        subscriptions: dict[tuple[str, Optional[str]], float],
+    ) -> None:
+        command = str(request.get("command", ""))
+        if request.get("streamSessionId") != self.stream_session_id:
+            self.logging.warning(f"Invalid stream session in {request}")
+            return
+        symbol = request.get("symbol")
+        streams = {
+            "TickPrices": "tickPrices",
+            "Candles": "candle",
+            "Balance": "balance",
+            "Profits": "profit",
+            "KeepAlive": "keepAlive",
+        }
+        if command.startswith("get") and command[3:] in streams:
+            subscriptions.setdefault(
+                (streams[command[3:]], symbol), monotonic()
+            )
+        elif command.startswith("stop") and command[4:] in streams:
+            subscriptions.pop((streams[command[4:]], symbol), None)
+
+    def _emit(
+        self,
+        conn: socket.socket,
+        command: str,
+        symbol: Optional[str],
+        candles: dict[str, int],
+    ) -> float:
+        """
+        Sends the due message of a subscription and returns the interval
+        to the next one.
+        """
+        if command == "tickPrices" and symbol is not None:
+            self._stream_send(conn, command, self.tick(symbol))
+            return 1 / self.tick_rate
+        if command == "candle" and symbol is not None:
+            ctm = candles.get(symbol, self.now() // 60000 * 60000)
+            candles[symbol] = ctm + 60000
+            self._stream_send(conn, command, self.candle(symbol, ctm))
+            return self.candle_interval
+        if command == "balance":
+            self._stream_send(conn, command, self.balance_data())
+            return self.balance_interval
+        if command == "profit":
+            with self._lock:
+                trades = list(self.positions.values())
+            for trade in trades:
+                self._stream_send(
+                    conn,
+                    command,
+                    {
+                        "order": trade["order"],
+                        "order2": trade["order2"],
+                        "position": trade["position"],
+                        "profit": self.profit(trade),
+                    },
+                )
+            return self.profit_interval
+        if command == "keepAlive":
+            self._stream_send(conn, command, {"timestamp": self.now()})
+            return self.keep_alive_interval
+        return 1.0
+
+    def _stream_send(
+        self, conn: socket.socket, command: str, data: dict[str, Any]
+    ) -> None:
+        self._send(conn, {"command": command, "data": data})
+        self.metrics["stream_messages"] += 1
+
+    def tick(self, symbol: str) -> dict[str, Any]:
+        price = self.price(symbol, move=True)
+        spread = round(price * 1e-5, 5)
+        return {
+            "ask": round(price + spread, 5),
+            "askVolume": self._random.randint(1, 50) * 1000,
+            "bid": price,
+            "bidVolume": self._random.randint(1, 50) * 1000,
+            "high": round(price * 1.001, 5),
+            "level": 0,
+            "low": round(price * 0.999, 5),
+            "quoteId": 1,
+            "spreadRaw": spread,
+            "spreadTable": round(spread * 1e4, 2),
+            "symbol": symbol,
+            "timestamp": self.now(),
+        }
+
+    def candle(self, symbol: str, ctm: int) -> dict[str, Any]:
+        close = self.price(symbol, move=True)
+        open_price = self.price(symbol)
+        return {
+            "close": close,
+            "ctm": ctm,
+            "ctmString": self.time_string(ctm),
+            "high": max(open_price, close),
+            "low": min(open_price, close),
+            "open": open_price,
+            "quoteId": 1,
+            "symbol": symbol,
+            "vol": float(self._random.randint(1, 500)),
+        }
+
+    def balance_data(self) -> dict[str, Any]:
+        with self._lock:
+            trades = list(self.positions.values())
+            balance = self.balance
+        profit = sum(self.profit(trade) for trade in trades)
+        margin = sum(
+            trade["open_price"] * trade["volume"] * 3.33 for trade in trades
+        )
+        equity = round(balance + profit, 2)
+        return {
+            "balance": round(balance, 2),
+            "margin": round(margin, 2),
+            "equityFX": equity,
+            "equity": equity,
+            "marginLevel": round(equity / margin * 100, 2) if margin else 0.0,
+            "marginFree": round(equity - margin, 2),
+            "credit": 0.0,
+            "stockValue": 0.0,
+            "stockLock": 0.0,
+            "cashStockValue": 0.0,
+        }
+
+
+if __name__ == "__main__":
+    from time import sleep
+
+    server = XTBStandInServer(main_port=5124, streaming_port=5125).start()
+    print(
+        f"XTB stand-in on {server.host}:{server.main_port}"
+        f"/{server.streaming_port}, login {server.login}/{server.password}"
+    )
+    try:
+        while True:
+            sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
@@ -2,54 +2,930 @@
 Data streaming tools
 """
 
-from threading import Thread
-from copy import copy
-from time import sleep
+from threading import Thread, Lock, Event, Condition
+from functools import partial
+from queue import Queue, Empty, Full
+from time import monotonic, perf_counter
 import numpy as np
-from typing import Any
-from api.client import XTBClient
+from typing import (
+    Any,
+    Callable,
+    Hashable,
+    Iterable,
+    NamedTuple,
+    Optional,
+    Union,
+)
+from api.client import (
+    XTBClient,
+    Reactor,
+    SessionPool,
+    get_reactor,
+    get_session_pool,
+)
+from api.commands import get_candles_range
+from data.buffers import TICK_DTYPE, RingBuffer
+from data.candles import MINUTE, BarBuilder, CandleAggregator
+from data.depth import DepthBook
+from data.records import BALANCE_DTYPE, RecordParser
+from data.snapshots import MarketSnapshot, SnapshotStore, frozen
+from utils.metrics import LatencyHistogram
 from utils.technical import setup_logger
 
 
+Topic = tuple[str, Optional[Hashable]]
+Subscription = tuple[str, Optional[str]]
+BALANCE_PARSER = RecordParser(BALANCE_DTYPE, "balance")
+
+# the merge of the values of an argument of a subscription shared by
+# consumers asking for different ones, and the value of the server when
+# the argument is missing
+ARGUMENT_MERGES: dict[str, Callable[[Any, Any], Any]] = {
+    "maxLevel": max,
+    "minArrivalTime": min,
+}
+ARGUMENT_DEFAULTS = {"maxLevel": 0, "minArrivalTime": 200}
+DELIVERY_MODES = ("all", "conflated", "throttled")
+
+# the stop command of every stream subscription command
+STOP_COMMANDS = {
+    "getBalance": "stopBalance",
+    "getCandles": "stopCandles",
+    "getKeepAlive": "stopKeepAlive",
+    "getNews": "stopNews",
+    "getProfits": "stopProfits",
+    "getTickPrices": "stopTickPrices",
+    "getTrades": "stopTrades",
+    "getTradeStatus": "stopTradeStatus",
+}
+
+
+class DeliveryPolicy(NamedTuple):
+    """
+    How a StreamSubscriber delivers the messages of some commands to its
+    consumer.
+
+    Attributes:
+        mode (str): "all" queues every message, "conflated" keeps only
+            the latest unread message of every symbol and level, and
+            "throttled" is conflated and delivers a message of a symbol
+            and level at most once per interval.
+        interval (float): The shortest time in milliseconds between two
+            messages of a symbol and level delivered by "throttled".
+        commands (tuple): The commands the policy applies to, the
+            messages of the other ones are all queued.
+    """
+
+    mode: str = "all"
+    interval: float = 0.0
+    commands: tuple[str, ...] = ("tickPrices",)
+
+    def arguments(self) -> dict[str, Any]:
+        """
+        Returns the arguments of getTickPrices asking the server for the
+        interval of a throttled policy.
+        """
+        if self.mode == "throttled" and self.interval >= 1:
+            return {"minArrivalTime": int(self.interval)}
+        return {}
+
+
+class StreamSubscriber:
+    """
+    Queue of the stream messages delivered to one consumer by
+    a StreamDemultiplexer. It offers stream_read like XTBClient, so
+    consumers read from it the same way as from a dedicated connection.
+    A conflating policy queues a message of a symbol only once until it is
+    read and replaces it with the newer ones meanwhile, so a burst costs
+    a slow consumer no latency.
+
+    Args:
+        topics (iterable): The (command, key) pairs of the messages to be
+            delivered. A key of None means all messages of the command.
+        maxsize (int, optional): The capacity of the queue. When a slow
+            consumer fills it, the oldest message is dropped. Defaults
+            to 10000.
+        policy (DeliveryPolicy, optional): The delivery of the messages.
+            Defaults to all messages.
+
+    Attributes:
+        topics (set): The subscribed (command, key) pairs.
+        queue (Queue): The messages waiting for the consumer.
+        policy (DeliveryPolicy): The delivery of the messages.
+        dropped (int): The number of messages dropped on overflow.
+        conflated (int): The number of messages replaced by newer ones
+            before they were read.
+
+    Raises:
+        ValueError: If the mode of the policy is unknown.
+    """
+
+    CLOSED = object()
+
+    def __init__(
+        self,
+        topics: Iterable[Topic],
+        maxsize: int = 10000,
+        policy: DeliveryPolicy = DeliveryPolicy(),
+    ) -> None:
+        if policy.mode not in DELIVERY_MODES:
+            raise ValueError(f"Unknown delivery mode {policy.mode}")
+        self.topics: set[Topic] = set(topics)
+        self.queue: Queue[Any] = Queue(maxsize=maxsize)
+        self.policy = policy
+        self.dropped: int = 0
+        self.conflated: int = 0
+        self.closed: bool = False
+        # the latest unread message of every key queued in its place
+        self._latest: dict[tuple[Any, ...], Any] = {}
+        self._delivered: dict[tuple[Any, ...], float] = {}
+        self._lock = Lock()
+        self._closing = Event()
+
+    def _key(self, message: Any) -> Optional[tuple[Any, ...]]:
+        # None for the messages queued as they came
+        if self.policy.mode == "all" or not isinstance(message, dict):
+            return None
+        command, data = message.get("command"), message.get("data")
+        if command not in self.policy.commands or not isinstance(data, dict):
+            return None
+        return command, data.get("symbol"), data.get("level")
+
+    def put(self, message: Any) -> None:
+        """
+        Delivers a message without ever blocking the demultiplexer.
+        """
+        key = None if message is self.CLOSED else self._key(message)
+        if key is not None:
+            with self._lock:
+                pending = key in self._latest
+                self._latest[key] = message
+            if pending:
+                self.conflated += 1
+                return
+            message = key
+        while True:
+            try:
+                self.queue.put_nowait(message)
+                return
+            except Full:
+                try:
+                    dropped = self.queue.get_nowait()
+                    self.dropped += 1
+                except Empty:
+                    continue
+                if isinstance(dropped, tuple):
+                    with self._lock:
+                        self._latest.pop(dropped, None)
+
+    def stream_read(self, timeout: Optional[float] = None) -> Any:
+        """
+        Returns the next delivered message.
+
+        Args:
+            timeout (float, optional): The maximum waiting time in seconds.
+
+        Raises:
+            queue.Empty: If no message arrived in time.
+            ConnectionError: If the demultiplexer stopped.
+        """
+        message = self.queue.get(timeout=timeout)
+        if message is self.CLOSED:
+            self.closed = True
+            self.queue.put_nowait(self.CLOSED)
+            raise ConnectionError("Stream demultiplexer stopped")
+        if not isinstance(message, tuple):
+            return message
+        key = message
+        if self.policy.mode == "throttled":
+            delay = (
+                self._delivered.get(key, float("-inf"))
+                + self.policy.interval / 1000
+                - monotonic()
+            )
+            if delay > 0:
+                # the message may still be replaced by a newer one
+                self._closing.wait(delay)
+        with self._lock:
+            message = self._latest.pop(key)
+        self._delivered[key] = monotonic()
+        return message
+
+    def close(self) -> None:
+        """
+        Wakes up the consumer waiting for a message.
+        """
+        self._closing.set()
+        self.put(self.CLOSED)
+
+
+class CallbackSubscriber:
+    """
+    Consumer of a StreamDemultiplexer called with every delivered message
+    instead of queueing it, so no thread waits for its messages. The
+    callback runs on the thread dispatching the stream (the reactor thread
+    for a shared stream) and must not block.
+
+    Args:
+        topics (iterable): The (command, key) pairs of the messages to be
+            delivered. A key of None means all messages of the command.
+        callback (callable): Called with every delivered message.
+
+    Attributes:
+        topics (set): The subscribed (command, key) pairs.
+        callback (callable): Called with every delivered message.
+        errors (int): The number of messages the callback failed on.
+        closed (bool): Whether the demultiplexer stopped.
+    """
+
+    def __init__(
+        self, topics: Iterable[Topic], callback: Callable[[Any], Any]
+    ) -> None:
+        self.logging = setup_logger(
+            "demux_logger", "data_stream.log", print_logs=False
+        )
+        self.topics: set[Topic] = set(topics)
+        self.callback = callback
+        self.errors: int = 0
+        self.closed: bool = False
+        self._closed = Event()
+
+    def put(self, message: Any) -> None:
+        """
+        Calls the callback, which must not stop the stream by failing.
+        """
+        try:
+            self.callback(message)
+        except Exception as e:
+            self.errors += 1
+            self.logging.error(f"Stream callback failed: {e}")
+
+    def close(self) -> None:
+        self.closed = True
+        self._closed.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until the demultiplexer stops.
+
+        Returns:
+            bool: Whether it stopped within the timeout.
+        """
+        return self._closed.wait(timeout)
+
+
+Subscriber = Union[StreamSubscriber, CallbackSubscriber]
+
+
+class TickEvent(NamedTuple):
+    """
+    A tick published by a DataStream.
+
+    Attributes:
+        symbol (str): The symbol of the tick.
+        tick (np.void): The tick, a read-only record.
+        received (float): The perf_counter time the message was
+            dispatched to the data stream.
+    """
+
+    symbol: str
+    tick: np.void
+    received: float
+
+
+class CandleEvent(NamedTuple):
+    """
+    A closed candle or bar published by a DataStream.
+
+    Attributes:
+        symbol (str): The symbol of the candle.
+        timeframe: The timeframe in minutes of a candle or the
+            (kind, size) of a bar built from the ticks.
+        bar (np.void): The closed candle, a read-only record.
+        received (float): The perf_counter time the message closing the
+            candle was dispatched to the data stream.
+    """
+
+    symbol: str
+    timeframe: Hashable
+    bar: np.void
+    received: float
+
+
+class EventBus:
+    """
+    Publisher of the latest event of every topic to the threads blocked
+    in wait, on one condition variable. Every topic has a sequence
+    counted from 1 and a consumer waits for a sequence after the last one
+    it has seen, so no event published between two waits goes unnoticed.
+    Delivery is conflated: a consumer slower than the publisher gets the
+    latest event and tells the skipped ones by the sequence.
+
+    Attributes:
+        sequences (dict): The sequence of the latest event per topic.
+        skipped (int): The number of events the waiting consumers did not
+            get since newer ones replaced them.
+        latency (LatencyHistogram): The times from the receipt of the
+            events to the wake up of their consumers.
+        closed (bool): Whether the publisher stopped, waking all
+            consumers.
+    """
+
+    def __init__(self) -> None:
+        self._condition = Condition()
+        self._latest: dict[Hashable, Any] = {}
+        self.sequences: dict[Hashable, int] = {}
+        self.latency = LatencyHistogram()
+        self.skipped: int = 0
+        self.closed: bool = False
+
+    def publish(self, topic: Hashable, event: Any) -> int:
+        """
+        Stores the event as the latest of the topic and wakes the
+        consumers.
+
+        Returns:
+            int: The sequence of the event.
+        """
+        with self._condition:
+            sequence = self.sequences.get(topic, 0) + 1
+            self.sequences[topic] = sequence
+            self._latest[topic] = event
+            self._condition.notify_all()
+        return sequence
+
+    def latest(self, topic: Hashable) -> tuple[int, Any]:
+        """
+        Returns the sequence and the latest event of the topic, (0, None)
+        before the first one.
+        """
+        with self._condition:
+            return self.sequences.get(topic, 0), self._latest.get(topic)
+
+    def wait(
+        self,
+        topic: Hashable,
+        after: int = 0,
+        timeout: Optional[float] = None,
+    ) -> tuple[int, Any]:
+        """
+        Blocks until an event of the topic with a sequence after the given
+        one is published and records its latency.
+
+        Args:
+            topic: The topic of the events.
+            after (int, optional): The last sequence seen by the consumer.
+                Defaults to 0, returning any published event at once.
+            timeout (float, optional): The longest wait in seconds.
+                Defaults to None, waiting until an event or close.
+
+        Returns:
+            tuple: The sequence and the latest event, (after, None) on
+            a timeout or once the bus is closed.
+        """
+        with self._condition:
+            ready = self._condition.wait_for(
+                lambda: self.closed or self.sequences.get(topic, 0) > after,
+                timeout,
+            )
+            if not ready or self.sequences.get(topic, 0) <= after:
+                return after, None
+            event = self._latest[topic]
+            sequence = self.sequences[topic]
+            if after:
+                self.skipped += sequence - after - 1
+            self.latency.record(perf_counter() - event.received)
+            return sequence, event
+
+    def close(self) -> None:
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+    def reopen(self) -> None:
+        with self._condition:
+            self.closed = False
+
+
+class SubscriptionManager:
+    """
+    Reference counts of the subscriptions of a stream connection shared by
+    many consumers. The subscription command of a (command, symbol) is
+    sent when its first consumer acquires it and the stop command when the
+    last one releases it, so the server streams every topic once and
+    stops streaming what nobody reads. The client remembers the sent
+    subscriptions and replays them after a reconnection.
+
+    Args:
+        client (XTBClient): The client with the stream connection.
+
+    Attributes:
+        client (XTBClient): The client the commands are sent through.
+        metrics (dict): The numbers of subscription and stop commands
+            sent and of stop commands lost with the connection.
+    """
+
+    def __init__(self, client: XTBClient) -> None:
+        self.logging = setup_logger(
+            "demux_logger", "data_stream.log", print_logs=False
+        )
+        self.client = client
+        self.metrics = {"subscribed": 0, "stopped": 0, "lost": 0}
+        self._counts: dict[Subscription, int] = {}
+        self._arguments: dict[Subscription, dict[str, Any]] = {}
+        self._lock = Lock()
+
+    def acquire(
+        self, command: str, symbol: Optional[str] = None, **arguments: Any
+    ) -> int:
+        """
+        Registers a consumer of a subscription. The command is sent for
+        the first consumer and again for a consumer adding arguments,
+        e.g. a higher maxLevel, which are kept for the next ones. The
+        arguments of ARGUMENT_MERGES are merged to serve all consumers,
+        e.g. the shortest minArrivalTime.
+
+        Args:
+            command (str): The subscription command, e.g. "getCandles".
+            symbol (str, optional): The symbol of the subscription, None
+                for the commands without one.
+            **arguments: Other fields of the command, e.g. maxLevel.
+
+        Returns:
+            int: The number of consumers of the subscription.
+
+        Raises:
+            ValueError: If the command is not a stream subscription.
+        """
+        if command not in STOP_COMMANDS:
+            raise ValueError(f"Unknown stream subscription {command}")
+        key = (command, symbol)
+        with self._lock:
+            count = self._counts.get(key, 0) + 1
+            self._counts[key] = count
+            current = self._arguments.get(key, {})
+            merged = (
+                dict(arguments)
+                if count == 1
+                else self._merge(current, arguments)
+            )
+            if count == 1 or merged != current:
+                self._arguments[key] = merged
+                message = {
+                    "command": command,
+                    "streamSessionId": self.client.stream_sesion_id,
+                }
+                if symbol is not None:
+                    message["symbol"] = symbol
+                self.client.stream_send({**message, **merged})
+                self.metrics["subscribed"] += 1
+            return count
+
+    @staticmethod
+    def _merge(
+        current: dict[str, Any], arguments: dict[str, Any]
+    ) -> dict[str, Any]:
+        merged = {**current, **arguments}
+        for name, merge in ARGUMENT_MERGES.items():
+            if name not in merged:
+                continue
+            default = ARGUMENT_DEFAULTS[name]
+            value = merge(
+                current.get(name, default), arguments.get(name, default)
+            )
+            if name in current or value != default:
+                merged[name] = value
+            else:
+                del merged[name]
+        return merged
+
+    def release(self, command: str, symbol: Optional[str] = None) -> int:
+        """
+        Unregisters a consumer of a subscription, sending the stop command
+        for the last one. A release without an acquire is ignored.
+
+        Returns:
+            int: The number of consumers left.
+        """
+        key = (command, symbol)
+        with self._lock:
+            count = self._counts.get(key, 0)
+            if count > 1:
+                self._counts[key] = count - 1
+                return count - 1
+            if not count:
+                return 0
+            del self._counts[key]
+            self._arguments.pop(key, None)
+            message = {"command": STOP_COMMANDS[command]}
+            if symbol is not None:
+                message["symbol"] = symbol
+            try:
+                self.client.stream_send(message)
+            except (ConnectionError, OSError) as e:
+                # the subscription ended with the connection
+                self.metrics["lost"] += 1
+                self.logging.warning(f"{message['command']} not sent: {e}")
+                return 0
+            self.metrics["stopped"] += 1
+            return 0
+
+    def count(self, command: str, symbol: Optional[str] = None) -> int:
+        """
+        Returns the number of consumers of a subscription.
+        """
+        with self._lock:
+            return self._counts.get((command, symbol), 0)
+
+    def active(self) -> dict[Subscription, int]:
+        """
+        Returns the number of consumers of every active subscription.
+        """
+        with self._lock:
+            return dict(self._counts)
+
+
+class StreamDemultiplexer:
+    """
+    Owner of a stream connection shared by many consumers. Every message
+    is read and decoded once and then dispatched by its command and key
+    (the symbol for prices and candles, the order for profits) to the
+    queues of the subscribers of that topic. The stream is read either by
+    an own thread (start) or by a reactor (attach), which serves all
+    streams of the process on one thread.
+
+    Args:
+        client (XTBClient): The client with the connected stream socket.
+        recover (callable, optional): Restores the stream connection of
+            client after it was lost, raising ConnectionError if it can
+            not. The subscribers are kept while it runs. Defaults to None,
+            the demultiplexer stops when the connection is lost.
+
+    Attributes:
+        client (XTBClient): The client owning the stream socket.
+        subscriptions (SubscriptionManager): The reference counted
+            subscriptions of the consumers, sent through client.
+        recover (callable): Restores the lost stream connection.
+        routes (dict): Handler table mapping a command to the function
+            returning the routing key of its messages. Commands missing
+            from the table are delivered to the subscribers of
+            (command, None).
+        reactor (Reactor): The reactor reading the stream or None.
+        running (bool): Whether the stream is being dispatched.
+        metrics (dict): Counters of the received and dispatched messages.
+    """
+
+    def __init__(
+        self,
+        client: XTBClient,
+        recover: Optional[Callable[..., Any]] = None,
+    ) -> None:
+        self.logging = setup_logger(
+            "demux_logger", "data_stream.log", print_logs=False
+        )
+        self.client = client
+        self.subscriptions = SubscriptionManager(client)
+        self.recover = recover
+        self.routes: dict[str, Callable[[Any], Hashable]] = {
+            "tickPrices": lambda message: message["data"]["symbol"],
+            "candle": lambda message: message["data"]["symbol"],
+            "trade": lambda message: message["data"]["symbol"],
+            "profit": lambda message: message["data"]["order2"],
+        }
+        self.reactor: Optional[Reactor] = None
+        self.running: bool = False
+        self.metrics: dict[str, int] = {
+            "received": 0,
+            "delivered": 0,
+            "unrouted": 0,
+            "reconnects": 0,
+        }
+        self._subscribers: dict[Topic, list[Subscriber]] = {}
+        self._lock = Lock()
+        self._thread: Optional[Thread] = None
+
+    def subscribe(
+        self,
+        topics: Iterable[Topic],
+        maxsize: int = 10000,
+        policy: DeliveryPolicy = DeliveryPolicy(),
+    ) -> StreamSubscriber:
+        """
+        Registers a consumer of the given topics.
+
+        Args:
+            topics (iterable): The (command, key) pairs to be delivered,
+                e.g. [("tickPrices", "EURUSD"), ("balance", None)].
+            maxsize (int, optional): The capacity of the consumer queue.
+            policy (DeliveryPolicy, optional): The delivery of the
+                messages to the consumer. Defaults to all messages.
+
+        Returns:
+            StreamSubscriber: The queue of the consumer.
+        """
+        subscriber = StreamSubscriber(topics, maxsize=maxsize, policy=policy)
+        with self._lock:
+            for topic in subscriber.topics:
+                self._subscribers.setdefault(topic, []).append(subscriber)
+        return subscriber
+
+    def subscribe_callback(
+        self, topics: Iterable[Topic], callback: Callable[[Any], Any]
+    ) -> CallbackSubscriber:
+        """
+        Registers a consumer called with the messages of the given topics
+        on the dispatching thread.
+
+        Args:
+            topics (iterable): The (command, key) pairs to be delivered.
+            callback (callable): Called with every delivered message.
+
+        Returns:
+            CallbackSubscriber: The registered consumer.
+        """
+        subscriber = CallbackSubscriber(topics, callback)
+        with self._lock:
+            for topic in subscriber.topics:
+                self._subscribers.setdefault(topic, []).append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        """
+        Removes a consumer from all its topics.
+        """
+        with self._lock:
+            for topic in subscriber.topics:
+                queues = self._subscribers.get(topic, [])
+                if subscriber in queues:
+                    queues.remove(subscriber)
+                if not queues:
+                    self._subscribers.pop(topic, None)
+
+    def route(self, message: Any) -> Topic:
+        """
+        Returns the topic of a message using the handler table.
+        """
+        command = message.get("command")
+        handler = self.routes.get(command)
+        if handler is None:
+            return command, None
+        try:
+            return command, handler(message)
+        except (KeyError, TypeError):
+            return command, None
+
+    def dispatch(self, message: Any) -> int:
+        """
+        Delivers a message to the subscribers of its topic and of all
+        messages of its command.
+
+        Returns:
+            int: The number of subscribers the message was delivered to.
+        """
+        self.metrics["received"] += 1
+        command, key = self.route(message)
+        with self._lock:
+            targets = list(self._subscribers.get((command, key), ()))
+            if key is not None:
+                for subscriber in self._subscribers.get((command, None), ()):
+                    if subscriber not in targets:
+                        targets.append(subscriber)
+        for subscriber in targets:
+            subscriber.put(message)
+        if targets:
+            self.metrics["delivered"] += len(targets)
+        else:
+            self.metrics["unrouted"] += 1
+        return len(targets)
+
+    def run(self) -> None:
+        """
+        Reads and dispatches messages until the stream connection ends.
+        A lost connection is restored with recover if it is set.
+        """
+        try:
+            while self.is_running():
+                try:
+                    for message in self.client.stream_messages():
+                        self.dispatch(message)
+                        if not self.is_running():
+                            break
+                    return
+                except (ConnectionError, OSError) as e:
+                    if not self.running or self.recover is None:
+                        self.logging.warning(
+                            f"Stream demultiplexer stopped: {e}"
+                        )
+                        return
+                    self.logging.warning(f"Stream lost, recovering: {e}")
+                    lost = monotonic()
+                try:
+                    self.recover(since=lost)
+                except ConnectionError as e:
+                    self.logging.warning(f"Stream demultiplexer stopped: {e}")
+                    return
+                self.metrics["reconnects"] += 1
+        finally:
+            self._finish()
+
+    def is_running(self) -> bool:
+        """
+        Checks whether the stream is being dispatched, which stop may
+        change while a message is dispatched.
+        """
+        return self.running
+
+    def _finish(self) -> None:
+        self.running = False
+        with self._lock:
+            subscribers = {
+                id(subscriber): subscriber
+                for queues in self._subscribers.values()
+                for subscriber in queues
+            }
+        for subscriber in subscribers.values():
+            subscriber.close()
+
+    def start(self) -> "StreamDemultiplexer":
+        """
+        Starts the reading thread.
+        """
+        if not self.running:
+            self.running = True
+            self._thread = Thread(
+                target=self.run, name="stream-demux", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def attach(self, reactor: Reactor) -> "StreamDemultiplexer":
+        """
+        Hands the stream connection over to a reactor, which dispatches
+        the messages on its thread instead of an own reading thread.
+
+        Args:
+            reactor (Reactor): The running reactor.
+        """
+        if not self.running:
+            self.reactor = reactor
+            self.running = True
+            self.client.stream_to(reactor, self.dispatch, self._lost)
+        return self
+
+    def _lost(self, error: Exception) -> None:
+        if (
+            not self.running
+            or self.recover is None
+            or self.reactor is None
+            or not self.reactor.running
+        ):
+            self.logging.warning(f"Stream demultiplexer stopped: {error}")
+            self._finish()
+            return
+        self.logging.warning(f"Stream lost, recovering: {error}")
+        # the backoff must not hold up the other connections of the reactor
+        Thread(
+            target=self._recover_attached,
+            args=(monotonic(),),
+            name="stream-recover",
+            daemon=True,
+        ).start()
+
+    def _recover_attached(self, lost: float) -> None:
+        recover, reactor = self.recover, self.reactor
+        try:
+            if recover is None or reactor is None:
+                raise ConnectionError("Stream can not be recovered")
+            recover(since=lost)
+            if not self.is_running():
+                raise ConnectionError("Stopped while recovering")
+            self.client.stream_to(reactor, self.dispatch, self._lost)
+        except ConnectionError as e:
+            self.logging.warning(f"Stream demultiplexer stopped: {e}")
+            self._finish()
+            return
+        self.metrics["reconnects"] += 1
+
+    def stop(self) -> None:
+        """
+        Stops reading and closes the stream connection.
+        """
+        self.running = False
+        self.client.disconnect_stream()
+        if self.reactor is not None:
+            self._finish()
+
+    def stats(self) -> dict[str, int]:
+        """
+        Returns the message counters, the number of subscribed topics,
+        the number of active stream subscriptions and the numbers of
+        messages dropped and conflated by the queues of the consumers.
+        """
+        with self._lock:
+            topics = len(self._subscribers)
+            queues = {
+                id(subscriber): subscriber
+                for subscribers in self._subscribers.values()
+                for subscriber in subscribers
+                if isinstance(subscriber, StreamSubscriber)
+            }.values()
+        subscriptions = len(self.subscriptions.active())
+        return {
+            **self.metrics,
+            "topics": topics,
+            "subscriptions": subscriptions,
+            "dropped": sum(queue.dropped for queue in queues),
+            "conflated": sum(queue.conflated for queue in queues),
+        }
+
+
+_demultiplexers: dict[int, StreamDemultiplexer] = {}
+_demultiplexers_lock = Lock()
+
+
+def shared_demultiplexer(pool: SessionPool) -> StreamDemultiplexer:
+    """
+    Returns the running stream demultiplexer of the pool's stream session,
+    opening its stream connection on first use. The stream is read by the
+    process-wide reactor.
+
+    Args:
+        pool (SessionPool): The pool providing the stream session.
+    """
+    with _demultiplexers_lock:
+        demux = _demultiplexers.get(id(pool))
+        if demux is None or not demux.running:
+            if demux is not None and pool.keep_alive is not None:
+                pool.keep_alive.unregister(demux.client)
+            client = pool.client_factory(pool.mode)
+            pool.attach_stream(client)
+            if pool.keep_alive is not None:
+                pool.keep_alive.register_stream(client, f"{pool.mode}-stream")
+            recover = None
+            if hasattr(client, "reconnect_stream"):
+                recover = partial(
+                    client.reconnect_stream, pool.stream_session_id
+                )
+            demux = StreamDemultiplexer(client, recover).attach(get_reactor())
+            _demultiplexers[id(pool)] = demux
+        return demux
+
+
 class WalletStream:
     """
     Represents a wallet data stream.
 
     Args:
-        client(XTBClient): The API client object associated with
-            the wallet stream.
+        pool (SessionPool, optional): The session pool providing the stream
+            session. Defaults to the process-wide DEMO pool.
 
     Attributes:
+        pool: The session pool providing the stream session.
         client: The API client object associated with the wallet stream.
+        subscriber: The queue of the shared stream delivering balance
+            messages. None if the stream is read from client.
+        subscriptions (SubscriptionManager): The subscriptions of the
+            stream connection.
         balance: The balance of the wallet.
     """
 
-    def __init__(self) -> None:
-        self.client = XTBClient("DEMO")
+    def __init__(self, pool: Optional[SessionPool] = None) -> None:
+        self.pool = pool if pool is not None else get_session_pool("DEMO")
+        self.client = self.pool.client_factory(self.pool.mode)
+        self.subscriber: Optional[StreamSubscriber] = None
+        self.subscriptions = SubscriptionManager(self.client)
         self.balance: np.ndarray[Any, np.dtype[Any]] = np.array([])
 
     def subscribe(self) -> None:
         """
         Subscribes to portfolio data for obtaining stream data from api.
         """
-        self.client.stream_send(
-            {
-                "command": "getBalance",
-                "streamSessionId": self.client.stream_sesion_id,
-            }
-        )
+        self.subscriptions.acquire("getBalance")
+
+    def unsubscribe(self) -> None:
+        """
+        Stops the portfolio data unless other consumers read it.
+        """
+        self.subscriptions.release("getBalance")
+
+    def next_message(self) -> Any:
+        """
+        Returns the next message of the shared stream or, without
+        a subscriber, of the client connection.
+        """
+        if self.subscriber is not None:
+            return self.subscriber.stream_read()
+        return self.client.stream_read()
 
     def read_stream(self) -> None:
         """
         Reads data from the stream and writes it to the balance
         class attribute.
         """
-        message = self.client.stream_read()
+        message = self.next_message()
         try:
             if message["command"] == "balance":
-                self.balance = np.fromiter(
-                    message["data"].values(), dtype=float
-                )
+                self.balance = BALANCE_PARSER.array(message["data"])
         except Exception:
             # skip if there is no portfolio balance data in the stream
             pass
@@ -58,10 +934,17 @@ class WalletStream:
         """
         Begins subscriptions and continuous stream data reading.
         """
-        self.client.open_session()
+        demux = shared_demultiplexer(self.pool)
+        self.client = demux.client
+        self.subscriptions = demux.subscriptions
+        self.subscriber = demux.subscribe([("balance", None)])
         self.subscribe()
-        while self.client.connection_stream is True:
-            self.read_stream()
+        try:
+            while self.client.connection_stream is True:
+                self.read_stream()
+        finally:
+            demux.unsubscribe(self.subscriber)
+            self.unsubscribe()
 
 
 class PositionObservator:
@@ -74,135 +957,140 @@ class PositionObservator:
             PositionObservator.
         symbol (str): The symbol associated with the PObservator.
         order_no (int): The order number associated with the PObservator.
+        demux (StreamDemultiplexer, optional): The shared stream to read
+            from instead of the stream connection of the client.
+        tick_capacity (int, optional): The number of ticks kept.
+            Defaults to 4096.
+        policy (DeliveryPolicy, optional): The delivery of the ticks of
+            the shared stream; the interval of a throttled policy is also
+            asked of the server. Defaults to all ticks.
 
     Attributes:
+        demux: The shared stream or None.
+        policy (DeliveryPolicy): The delivery of the ticks.
         logging: The logger object for recording observations.
         client (XTBClient): The API client object associated with the
-            PositionObservator.
+            PositionObservator (the client of demux if given).
+        subscriber: The queue of the shared stream delivering the messages
+            of the position. None if the stream is read from client.
+        subscriptions (SubscriptionManager): The subscriptions of the
+            stream connection, shared with the other consumers of demux.
         symbol (str): The symbol associated with the PositionObservator.
         order_no (int): The order number associated with the
             PositionObservator.
-        current_price: An array to store the current price observations.
+        ticks (RingBuffer): The recent ticks of the symbol.
+        current_price: The last tick as a row of floats in the order of
+            TICK_FIELDS, a view of ticks.
         profit: The profit associated with the PositionObservator.
-        minute_1: An array to store candles at 1-minute intervals.
-        minute_5: An array to store candles at 5-minute intervals.
-        minute_15: An array to store candles at 15-minute intervals.
-        minute_1_5box: An array to store candles at 1-minute intervals
-            using a 5-box method.
-        minute_5_15box: An array to store candles at 5-minute intervals
-            using a 15-box method.
+        candles (CandleAggregator): The 1, 5 and 15-minute candles of the
+            symbol aligned on the clock.
+        minute_1: The last 1-minute candle as a row of floats in the
+            order of CANDLE_FIELDS, a view of candles.
+        minute_5: The last closed 5-minute candle, a view of candles.
+        minute_15: The last closed 15-minute candle, a view of candles.
     """
 
-    def __init__(self, client: XTBClient, symbol: str, order_no: int) -> None:
+    def __init__(
+        self,
+        client: XTBClient,
+        symbol: str,
+        order_no: int,
+        demux: Optional[StreamDemultiplexer] = None,
+        tick_capacity: int = 4096,
+        policy: DeliveryPolicy = DeliveryPolicy(),
+    ) -> None:
         self.logging = setup_logger(
             f"{symbol}-{order_no}", "obs_logger.log", print_logs=False
         )
-        self.client = client
+        self.policy = policy
+        self.client = client if demux is None else demux.client
+        self.demux = demux
+        self.subscriber: Optional[StreamSubscriber] = None
+        self.subscriptions = (
+            SubscriptionManager(self.client)
+            if demux is None
+            else demux.subscriptions
+        )
+        self._acquired: list[Subscription] = []
+        if demux is not None:
+            self.subscriber = demux.subscribe(
+                [
+                    ("tickPrices", symbol),
+                    ("candle", symbol),
+                    ("profit", order_no),
+                ],
+                policy=policy,
+            )
         self.symbol = symbol
         self.order_no = order_no
+        self.ticks = RingBuffer(TICK_DTYPE, tick_capacity)
         self.curent_price = np.empty(shape=[0, 11])
         self.profit: float = 0.0
-        self.minute_1 = np.empty(shape=[0, 7])
-        self.minute_5 = np.empty(shape=[0, 7])
-        self.minute_15 = np.empty(shape=[0, 7])
-        self.minute_1_5box = np.empty(shape=[0, 7])
-        self.minute_5_15box = np.empty(shape=[0, 7])
+        self.candles = CandleAggregator((1, 5, 15))
+        self.minute_1 = self.candles.values(1, 1)
+        self.minute_5 = self.candles.values(5, 1)
+        self.minute_15 = self.candles.values(15, 1)
 
     def subscribe(self):
         """
         Subscribes to candles, tick price and profits data for obtaining
-        stream data from api.
+        stream data from api. Released by detach.
         """
-        self.client.stream_send(
-            {
-                "command": "getCandles",
-                "streamSessionId": self.client.stream_sesion_id,
-                "symbol": self.symbol,
-            }
-        )
-        self.client.stream_send(
-            {
-                "command": "getTickPrices",
-                "streamSessionId": self.client.stream_sesion_id,
-                "symbol": self.symbol,
-            }
-        )
-        self.client.stream_send(
-            {
-                "command": "getProfits",
-                "streamSessionId": self.client.stream_sesion_id,
-            }
-        )
+        for subscription, arguments in (
+            (("getCandles", self.symbol), {}),
+            (("getTickPrices", self.symbol), self.policy.arguments()),
+            (("getProfits", None), {}),
+        ):
+            self.subscriptions.acquire(*subscription, **arguments)
+            self._acquired.append(subscription)
+
+    def next_message(self) -> Any:
+        """
+        Returns the next message of the shared stream or, without
+        a subscriber, of the client connection.
+        """
+        if self.subscriber is not None:
+            return self.subscriber.stream_read()
+        return self.client.stream_read()
+
+    def detach(self):
+        """
+        Stops the delivery of the shared stream messages and releases the
+        subscriptions, which are stopped unless other consumers read
+        them.
+        """
+        if self.demux is not None and self.subscriber is not None:
+            self.demux.unsubscribe(self.subscriber)
+        while self._acquired:
+            self.subscriptions.release(*self._acquired.pop())
 
     def read_stream(self):
         """
         Reads data from the stream and writes it to the class attributes.
         """
-        message = self.client.stream_read()
+        message = self.next_message()
         if message["command"] == "tickPrices":
-            # 'ask','bid','high','low','askVolume','bidVolume',
-            # 'timestamp','level','quoteId','spreadTable','spreadRaw'
-            dictor = copy(message["data"])
-            if dictor["symbol"] == self.symbol:
-                dictor.pop("symbol")
-                self.curent_price = np.fromiter(
-                    dictor.values(), dtype=float
-                ).reshape(1, 11)
+            data = message["data"]
+            # the deeper levels of the depth subscribed by a data stream
+            if data["symbol"] == self.symbol and not data["level"]:
+                self.ticks.append_fields(data)
+                self.curent_price = self.ticks.values(1)
         if message["command"] == "profit":
-            dictor = copy(message["data"])
-            if dictor["order2"] == self.order_no:
-                self.profit = dictor["profit"]
+            data = message["data"]
+            if data["order2"] == self.order_no:
+                self.profit = data["profit"]
         if message["command"] == "candle":
-            dictor = copy(message["data"])
-            # 'ctm', 'open', 'close', 'high', 'low', 'vol', 'quoteId'
-            if dictor["symbol"] == self.symbol:
-                dictor.pop("ctmString")
-                dictor.pop("symbol")
-                self.minute_1 = np.fromiter(
-                    dictor.values(), dtype=float
-                ).reshape(1, 7)
-                self.minute_1_5box = np.vstack(
-                    [self.minute_1_5box, self.minute_1]
-                )
+            if message["data"]["symbol"] == self.symbol:
+                self.candles.update(message["data"])
+                self.minute_1 = self.candles.values(1, 1)
 
     def make_more_candles(self):
         """
-        Aggregates candles to a higher interval
+        Points minute_5 and minute_15 at the last closed candles of their
+        timeframes, which candles closes on the clock boundaries.
         """
-        if np.shape(self.minute_1_5box)[0] == 5:
-            self.minute_5 = np.array(
-                [
-                    [
-                        self.minute_1_5box[-1, 0],
-                        self.minute_1_5box[0, 1],
-                        self.minute_1_5box[-1, 2],
-                        np.max(self.minute_1_5box[:, 3]),
-                        np.min(self.minute_1_5box[:, 4]),
-                        self.minute_1_5box[:, 5].sum(),
-                        self.minute_1_5box[-1, 6],
-                    ]
-                ]
-            )
-            self.minute_1_5box = np.empty(shape=[0, 7])
-            self.minute_5_15box = np.vstack(
-                [self.minute_5_15box, self.minute_5]
-            )
-
-        if np.shape(self.minute_5_15box)[0] == 3:
-            self.minute_15 = np.array(
-                [
-                    [
-                        self.minute_5_15box[-1, 0],
-                        self.minute_5_15box[0, 1],
-                        self.minute_5_15box[-1, 2],
-                        np.max(self.minute_5_15box[:, 3]),
-                        np.min(self.minute_5_15box[:, 4]),
-                        self.minute_5_15box[:, 5].sum(),
-                        self.minute_5_15box[-1, 6],
-                    ]
-                ]
-            )
-            self.minute_5_15box = np.empty(shape=[0, 7])
+        self.minute_5 = self.candles.values(5, 1)
+        self.minute_15 = self.candles.values(15, 1)
 
     def stream(self):
         """
@@ -218,26 +1106,115 @@ class DataStream:
 
     Args:
         symbol: The symbol associated with the DataStream.
+        pool (SessionPool, optional): The session pool providing the stream
+            session. Defaults to the process-wide DEMO pool.
+        tick_capacity (int, optional): The number of ticks kept.
+            Defaults to 4096.
+        timeframes (iterable, optional): The timeframes of the candles
+            in minutes. Defaults to (1, 5, 15).
+        bar_specs (iterable, optional): The (kind, size) pairs of the
+            bars built from the ticks, see BarBuilder. Defaults to time
+            bars of 1, 5, 10 and 30 seconds.
+        levels (int, optional): The number of levels of the market depth
+            subscribed, 1 for the best prices only. Defaults to 1.
+        backfill (bool, optional): Whether the gaps of the candle stream
+            are filled with getChartRangeRequest. Defaults to True.
+        snapshots (SnapshotStore, optional): The store the snapshots of
+            the symbol are published to, e.g. shared by the data streams
+            of many symbols. Defaults to a store of its own.
 
     Attributes:
-        client: The API client object associated with the DataStream.
+        pool: The session pool providing the stream session.
+        client: The API client object associated with the DataStream
+            (the client of the shared stream once running).
+        listener: The consumer of the shared stream updating the
+            attributes on the reactor thread while running.
+        subscriptions (SubscriptionManager): The subscriptions of the
+            stream connection (of the shared stream once running).
         symbol: The symbol associated with the DataStream.
         server_time: The server time of the DataStream.
         tick_msg: The tick message of the DataStream.
         candle_msg: The candle message of the DataStream.
-        symbols_price: An array to store symbol prices.
-        symbols_last_1M: An array to store last 1-minute symbols data.
+        ticks (RingBuffer): The recent ticks of level 0 (the best prices)
+            of the symbol.
+        symbols_price: The last tick as a read-only row of floats in the
+            order of TICK_FIELDS, replaced by every tick.
+        depth (DepthBook): The quotes of the subscribed levels.
+        candles (CandleAggregator): The candles of the symbol in the
+            timeframes, aligned on the clock.
+        symbols_last_1M: The last 1-minute candle as a read-only row of
+            floats in the order of CANDLE_FIELDS.
+        bars (dict): The BarBuilder of every (kind, size) of bar_specs,
+            e.g. bars[("time", 5)].values(1) is the last 5-second bar in
+            the format of symbols_last_1M.
+        events (EventBus): The TickEvent of every tick on the topic
+            "tick" and the CandleEvent of every closed candle on the
+            topics ("candle", timeframe) and ("bar", (kind, size)).
+        backfill (bool): Whether the gaps of the candle stream are filled.
+        gaps (dict): The numbers of gaps found in the candle stream, of
+            their missing minutes, of gaps filled, of gaps the server had
+            no candles for, of failed backfills and of backfilled
+            candles.
+        snapshots (SnapshotStore): The latest quote and closed candles of
+            the symbol, published before their events, see snapshot.
+        snapshot_candles (int): The number of closed candles of every
+            timeframe in the snapshots.
         stream_logger: The logger object for the data stream.
     """
 
-    def __init__(self, symbol: str):
-        self.client = XTBClient("DEMO")
+    snapshot_candles: int = 60
+
+    def __init__(
+        self,
+        symbol: str,
+        pool: Optional[SessionPool] = None,
+        tick_capacity: int = 4096,
+        timeframes: Iterable[int] = (1, 5, 15),
+        bar_specs: Iterable[tuple[str, float]] = (
+            ("time", 1),
+            ("time", 5),
+            ("time", 10),
+            ("time", 30),
+        ),
+        levels: int = 1,
+        backfill: bool = True,
+        snapshots: Optional[SnapshotStore] = None,
+    ):
+        self.pool = pool if pool is not None else get_session_pool("DEMO")
+        self.client: Optional[XTBClient] = None
+        self.listener: Optional[CallbackSubscriber] = None
+        self.subscriptions: Optional[SubscriptionManager] = None
         self.symbol = symbol
         self.server_time = None
         self.tick_msg: dict[str, Any] = {}
         self.candle_msg: dict[str, Any] = {}
+        self.ticks = RingBuffer(TICK_DTYPE, tick_capacity)
         self.symbols_price = np.empty(shape=[0, 11])
+        self.depth = DepthBook(levels)
+        self.candles = CandleAggregator(timeframes)
+        self.bars: dict[tuple[str, float], BarBuilder] = {
+            (kind, size): BarBuilder(kind, size) for kind, size in bar_specs
+        }
         self.symbols_last_1M = np.empty(shape=[0, 7])
+        self.events = EventBus()
+        self.snapshots = (
+            snapshots if snapshots is not None else SnapshotStore()
+        )
+        self.backfill = backfill
+        self.gaps = {
+            "found": 0,
+            "minutes": 0,
+            "filled": 0,
+            "empty": 0,
+            "failed": 0,
+            "candles": 0,
+        }
+        self._received: float = 0.0
+        self._candles_lock = Lock()
+        self.candles.add_listener(self._on_candle)
+        self.candles.add_gap_listener(self._on_gap)
+        for spec, builder in self.bars.items():
+            builder.add_listener(partial(self._on_bar, spec))
         self.stream_logger = setup_logger(
             name=f"[DATASTREAM] {symbol}",
             log_file_name="data_stream.log",
@@ -248,21 +1225,28 @@ class DataStream:
         """
         Subscribes to tick price and candles data for obtaining stream
         data from api.
+
+        Raises:
+            ConnectionError: If the data stream is not attached to a
+                stream client yet.
         """
-        self.client.stream_send(
-            {
-                "command": "getTickPrices",
-                "streamSessionId": self.client.stream_sesion_id,
-                "symbol": self.symbol,
-            }
-        )
-        self.client.stream_send(
-            {
-                "command": "getCandles",
-                "streamSessionId": self.client.stream_sesion_id,
-                "symbol": self.symbol,
-            }
+        if self.subscriptions is None:
+            if self.client is None:
+                raise ConnectionError("Data stream without a stream client")
+            self.subscriptions = SubscriptionManager(self.client)
+        self.subscriptions.acquire(
+            "getTickPrices", self.symbol, maxLevel=self.depth.levels - 1
         )
+        self.subscriptions.acquire("getCandles", self.symbol)
+
+    def unsubscribe(self):
+        """
+        Releases the tick price and candles data, which are stopped unless
+        other consumers read them.
+        """
+        if self.subscriptions is not None:
+            self.subscriptions.release("getTickPrices", self.symbol)
+            self.subscriptions.release("getCandles", self.symbol)
 
     def is_connected(self):
         """
@@ -270,79 +1254,209 @@ class DataStream:
         """
         # TODO: add more complete environmental monitoring
         # than just a stream connection
-        if self.client.connection_stream is True:
+        if self.client is not None and self.client.connection_stream is True:
             return True
         else:
             return False
 
-    def read_stream_messages(self):
+    def on_message(self, message: Any) -> None:
         """
-        Reads data from the stream and writes it to the class attributes
-        (candle or tick).
+        Stores and converts a message of the shared stream as soon as it
+        is dispatched.
         """
-        while self.is_connected() is True:
-            message = self.client.stream_read()
-            if message["command"] == "tickPrices":
-                self.tick_msg = message
-            if message["command"] == "candle":
-                self.candle_msg = message
+        self._received = perf_counter()
+        if message["command"] == "tickPrices":
+            self.tick_msg = message
+            self.update_prices(message)
+        elif message["command"] == "candle":
+            self.candle_msg = message
+            self.update_last_1M(message)
 
-    def read_prices(self):
+    def update_prices(self, message: dict[str, Any]) -> None:
         """
-        Aggregates price msg.
+        Writes a tick price message into the depth book. A tick of level
+        0 is also appended to ticks, copied into symbols_price and the
+        snapshot, added to the bars and published as a TickEvent. The
+        message is shared with other consumers of the stream, so it is
+        read by key without modification.
         """
-        while self.is_connected() is True:
-            try:
-                dictor = self.tick_msg["data"]
-                # 'ask','bid','high','low','askVolume','bidVolume',
-                # 'timestamp','level','quoteId','spreadTable','spreadRaw'
-                dictor.pop("symbol")
-                self.symbols_price = np.fromiter(
-                    dictor.values(), dtype=float
-                ).reshape(1, 11)
-            except Exception:
-                sleep(0.5)
+        data = message["data"]
+        self.depth.update(data)
+        if data["level"]:
+            return
+        self.ticks.append_fields(data)
+        # one read-only copy serves as the row and the record
+        row = frozen(self.ticks.values(1))
+        quote: np.void = np.ndarray((1,), TICK_DTYPE, row)[0]
+        self.symbols_price = row
+        self.snapshots.update(self.symbol, quote=quote)
+        for builder in self.bars.values():
+            builder.update(data)
+        self.events.publish(
+            "tick",
+            TickEvent(self.symbol, quote, self._received or perf_counter()),
+        )
 
-    def read_last_1M(self):
+    def update_last_1M(self, message: dict[str, Any]) -> None:
         """
-        Aggregates candles msg.
+        Aggregates a candle message into candles and copies the last
+        1-minute candle into symbols_last_1M.
         """
-        while self.is_connected() is True:
-            try:
-                dictor = self.candle_msg["data"]
-                # 'ctm', 'open', 'close', 'high', 'low', 'vol', 'quoteId'
-                for key in ["symbol", "quoteId", "ctmString"]:
-                    dictor.pop(key)
-                self.symbols_last_1M = np.fromiter(
-                    dictor.values(), dtype=float
-                ).reshape(1, 6)
-            except Exception:
-                sleep(1)
+        with self._candles_lock:
+            self.candles.update(message["data"])
+            self.symbols_last_1M = frozen(self.candles.values(1, 1))
 
-    def run(self):
+    def load_candles(self, rows: Iterable[Any]) -> int:
         """
-        Data subscraptions, and threads for reading messages from
-        the stream and aggregating them into prices and candles to
-        minimize the probability of lost messages.
+        Merges historical candles into candles, see CandleAggregator.load,
+        and publishes the merged candles in the snapshot.
+
+        Returns:
+            int: The number of candles added.
         """
-        self.client.open_session()
-        self.subscribe()
-        thread_read = Thread(target=self.read_stream_messages, args=())
-        thread_prices = Thread(target=self.read_prices, args=())
-        thread_candles = Thread(target=self.read_last_1M, args=())
+        with self._candles_lock:
+            added = self.candles.load(rows)
+            self.symbols_last_1M = frozen(self.candles.values(1, 1))
+            self.snapshots.update(
+                self.symbol,
+                candles={
+                    timeframe: self._candle_window(timeframe)
+                    for timeframe in self.candles.timeframes
+                },
+            )
+        return added
 
-        thread_read.start()
-        while True:
-            if not self.candle_msg and not self.tick_msg:
-                sleep(1)
-            else:
-                break
-        print("started")  # FIXME: make some loger
-        thread_prices.start()
-        thread_candles.start()
+    def _candle_window(self, timeframe: int) -> np.ndarray:
+        return frozen(self.candles.values(timeframe, self.snapshot_candles))
+
+    def snapshot(self) -> MarketSnapshot:
+        """
+        Returns the latest snapshot of the symbol, whose quote and candles
+        never change once returned. Readers on any thread get it without
+        a lock or a retry.
+        """
+        return self.snapshots.get(self.symbol)
+
+    def _on_gap(self, start: float, end: float) -> None:
+        # called while the candle after the gap is aggregated, e.g. on the
+        # reactor thread, so the download runs on its own thread
+        self.gaps["found"] += 1
+        self.gaps["minutes"] += int((end - start) // MINUTE)
+        self.stream_logger.warning(
+            f"Candles missing from {int(start)} to {int(end)}"
+        )
+        if self.backfill:
+            Thread(
+                target=self.fill_gap, args=(start, end), daemon=True
+            ).start()
+
+    def fill_gap(self, start: float, end: float) -> int:
+        """
+        Downloads the candles from start to end (excluded) with
+        getChartRangeRequest on the scheduler of the pool and merges them
+        into candles in the order of their ctm. The last closed candle of
+        every timeframe is then published again, so the consumers of the
+        candle events compute on the filled history.
 
-        thread_read.join()
-        thread_prices.join()
-        thread_candles.join()
+        Args:
+            start (float): The ctm of the first missing candle.
+            end (float): The ctm of the candle after the gap.
 
-        self.client.close_session()
+        Returns:
+            int: The number of candles added.
+        """
+        try:
+            rows = get_candles_range(
+                self.pool.scheduler(),
+                self.symbol,
+                start,
+                end,
+                period=self.candles.base,
+            )
+        except Exception as e:
+            self.gaps["failed"] += 1
+            self.stream_logger.error(f"Backfill of candles failed: {e}")
+            return 0
+        added = self.load_candles(
+            [row for row in rows if start <= row[0] < end]
+        )
+        if not added:
+            self.gaps["empty"] += 1
+            return 0
+        self.gaps["filled"] += 1
+        self.gaps["candles"] += added
+        with self._candles_lock:
+            for timeframe in self.candles.timeframes:
+                bar = self.candles.last_closed(timeframe)
+                if bar is not None:
+                    self._on_candle(timeframe, bar)
+        return added
+
+    def _on_candle(self, timeframe: int, bar: np.void) -> None:
+        # the snapshot is ready for the consumers woken by the event
+        self.snapshots.update(
+            self.symbol, candles={timeframe: self._candle_window(timeframe)}
+        )
+        self._publish_candle("candle", timeframe, bar)
+
+    def _on_bar(
+        self, spec: tuple[str, float], size: float, bar: np.void
+    ) -> None:
+        self._publish_candle("bar", spec, bar)
+
+    def _publish_candle(
+        self, kind: str, timeframe: Hashable, bar: np.void
+    ) -> None:
+        record: np.void = frozen([bar], bar.dtype)[0]
+        self.events.publish(
+            (kind, timeframe),
+            CandleEvent(
+                self.symbol,
+                timeframe,
+                record,
+                self._received or perf_counter(),
+            ),
+        )
+
+    def wait_tick(
+        self, after: int = 0, timeout: Optional[float] = None
+    ) -> tuple[int, Optional[TickEvent]]:
+        """
+        Blocks until a tick after the given sequence, see EventBus.wait.
+        """
+        return self.events.wait("tick", after, timeout)
+
+    def wait_candle(
+        self,
+        timeframe: Hashable,
+        after: int = 0,
+        timeout: Optional[float] = None,
+    ) -> tuple[int, Optional[CandleEvent]]:
+        """
+        Blocks until a candle of the timeframe (or a bar of the
+        (kind, size)) closes after the given sequence, see
+        EventBus.wait.
+        """
+        kind = "bar" if isinstance(timeframe, tuple) else "candle"
+        return self.events.wait((kind, timeframe), after, timeout)
+
+    def run(self):
+        """
+        Data subscriptions on the shared stream. The messages of the
+        symbol are converted into prices and candles by on_message on the
+        reactor thread, so no thread is started per symbol. Blocks until
+        the shared stream stops.
+        """
+        demux = shared_demultiplexer(self.pool)
+        self.client = demux.client
+        self.subscriptions = demux.subscriptions
+        self.events.reopen()
+        self.listener = demux.subscribe_callback(
+            [("tickPrices", self.symbol), ("candle", self.symbol)],
+            self.on_message,
+        )
+        self.subscribe()
+        self.listener.wait()
+        demux.unsubscribe(self.listener)
+        self.unsubscribe()
+        self.events.close()
@@ -0,0 +1,187 @@
+"""
+The module includes the fixed-capacity buffers keeping the history of
+the stream data in preallocated numpy arrays.
+"""
+
+from typing import Any, Iterable, Optional
+import numpy as np
+from data.records import RecordParser
+
+# fields of the tickPrices messages, in the order of the API
+TICK_FIELDS = (
+    "ask",
+    "askVolume",
+    "bid",
+    "bidVolume",
+    "high",
+    "level",
+    "low",
+    "quoteId",
+    "spreadRaw",
+    "spreadTable",
+    "timestamp",
+)
+# every field is a float64, so a buffer is also viewed as rows of floats;
+# the millisecond timestamps are exact below 2**53
+TICK_DTYPE = np.dtype([(field, np.float64) for field in TICK_FIELDS])
+
+
+class RingBuffer:
+    """
+    Fixed-capacity ring buffer of structured records. Every record is
+    written twice, at its slot and at the slot plus the capacity, so
+    the last n records are always contiguous and returned as views
+    without copying. Appending is O(1) and never allocates.
+
+    The views share the memory of the buffer: a view of the last n
+    records stays valid for capacity - n further appends, copy it to
+    keep it longer.
+
+    Args:
+        dtype (np.dtype, optional): The structured type of the records.
+            Defaults to TICK_DTYPE.
+        capacity (int, optional): The number of records kept. Defaults
+            to 4096.
+        time_field (str, optional): The field of non-decreasing
+            timestamps searched by since. Defaults to "timestamp".
+
+    Attributes:
+        capacity (int): The number of records kept.
+        count (int): The number of records appended since the creation
+            or the last clear, including the overwritten ones.
+        time_field (str): The field of the timestamps.
+    """
+
+    def __init__(
+        self,
+        dtype: np.dtype = TICK_DTYPE,
+        capacity: int = 4096,
+        time_field: str = "timestamp",
+    ) -> None:
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.dtype = np.dtype(dtype)
+        names = self.dtype.names
+        if names is None or time_field not in names:
+            raise ValueError(f"{time_field} is not a field of the dtype")
+        self._width = len(names)
+        self.capacity = capacity
+        self.time_field = time_field
+        self.count: int = 0
+        self._records = np.zeros(2 * capacity, dtype=self.dtype)
+        self._head: int = 0
+        self._parser = RecordParser(self.dtype)
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def append(self, record: Any) -> None:
+        """
+        Writes a record over the oldest one once the buffer is full.
+
+        Args:
+            record: A tuple of the field values in the order of the
+                dtype or a record of the dtype.
+        """
+        head = self._head
+        self._records[head] = record
+        self._records[head + self.capacity] = record
+        self._head = head + 1 if head + 1 < self.capacity else 0
+        self.count += 1
+
+    def append_fields(self, values: dict[str, Any]) -> None:
+        """
+        Writes a record from a mapping of the field names, e.g. the data
+        of a stream message. Keys that are not fields are ignored and the
+        mapping is not modified.
+
+        Raises:
+            KeyError: If a field is missing.
+        """
+        self.append(self._parser.values(values))
+
+    def extend(self, records: Iterable[Any]) -> None:
+        """
+        Appends records in their order.
+        """
+        for record in records:
+            self.append(record)
+
+    def last(self, n: Optional[int] = None) -> np.ndarray:
+        """
+        Returns a view of the last n records, oldest first, or of all
+        kept records if n is None.
+        """
+        size = len(self) if n is None else min(max(n, 0), len(self))
+        end = self._head + self.capacity
+        start = end - size
+        return self._records[start:end]
+
+    def latest(self) -> Optional[np.void]:
+        """
+        Returns the last record, None if the buffer is empty.
+        """
+        if not self.count:
+            return None
+        record: np.void = self._records[self._head + self.capacity - 1]
+        return record
+
+    def since(self, timestamp: float) -> np.ndarray:
+        """
+        Returns a view of the records with a timestamp at or after the
+        given one, found by binary search.
+        """
+        window = self.last()
+        start = np.searchsorted(window[self.time_field], timestamp, "left")
+        return window[start:]
+
+    def values(self, n: Optional[int] = None) -> np.ndarray:
+        """
+        Returns the last n records as a view of rows of floats, one
+        column per field. Needs a dtype whose fields are all float64.
+        """
+        return self.last(n).view(np.float64).reshape(-1, self._width)
+
+    def clear(self) -> None:
+        self.count = 0
+        self._head = 0
+
+
+class TickStore:
+    """
+    Ring buffers of the ticks of many symbols, created on the first tick
+    of a symbol.
+
+    Args:
+        capacity (int, optional): The number of ticks kept per symbol.
+            Defaults to 4096.
+
+    Attributes:
+        capacity (int): The number of ticks kept per symbol.
+        buffers (dict): The ring buffer of every symbol.
+    """
+
+    def __init__(self, capacity: int = 4096) -> None:
+        self.capacity = capacity
+        self.buffers: dict[str, RingBuffer] = {}
+
+    def __getitem__(self, symbol: str) -> RingBuffer:
+        buffer = self.buffers.get(symbol)
+        if buffer is None:
+            buffer = self.buffers[symbol] = RingBuffer(
+                TICK_DTYPE, self.capacity
+            )
+        return buffer
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self.buffers
+
+    def append(self, data: dict[str, Any]) -> None:
+        """
+        Appends the data of a tickPrices message to the buffer of its
+        symbol.
+        """
+        self[data["symbol"]].append_fields(data)
+
+    def symbols(self) -> list[str]:
+        return list(self.buffers)
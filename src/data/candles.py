@@ -0,0 +1,408 @@
+"""
+The module includes the aggregation of 1-minute candles into candles of
+higher timeframes aligned on the clock and the bars built from ticks.
+"""
+
+from typing import Any, Callable, Iterable, Optional, Sequence
+import numpy as np
+from data.buffers import RingBuffer
+from data.records import RecordParser
+
+# fields of the candles in the order of the rateInfos records of the
+# chart commands, the layout of get_historical_candles
+CANDLE_FIELDS = ("ctm", "open", "close", "high", "low", "vol")
+CANDLE_DTYPE = np.dtype([(field, np.float64) for field in CANDLE_FIELDS])
+CANDLE_PARSER = RecordParser(CANDLE_DTYPE, "candle")
+# timeframes of the API in minutes, M1 to D1
+TIMEFRAMES = (1, 5, 15, 30, 60, 240, 1440)
+MINUTE = 60000
+
+BarListener = Callable[[int, np.void], None]
+GapListener = Callable[[float, float], None]
+
+
+class CandleAggregator:
+    """
+    Incremental OHLCV aggregation of the candles of one symbol into
+    several timeframes. A bar covers the interval of its timeframe that
+    contains the ctm of its candles, counted from the epoch, so the bars
+    follow the clock whichever candles are missed and whenever the
+    aggregation starts. A bar is closed as soon as the candle of its last
+    minute arrives, or by the first candle of a later interval if that
+    one is missing, and is then stored in the history of its timeframe
+    and passed to the listeners. A candle later than the next expected
+    one (by a whole base interval at least) is a gap in the input, whose
+    missing interval is passed to the gap listeners.
+
+    Args:
+        timeframes (iterable, optional): The timeframes in minutes, each
+            a multiple of base, which is always included. Defaults to
+            (1, 5, 15).
+        capacity (int, optional): The number of closed bars kept per
+            timeframe. Defaults to 2048.
+        base (int, optional): The timeframe of the input candles in
+            minutes. Defaults to 1.
+        offset (int, optional): The shift of the interval boundaries in
+            milliseconds, e.g. for days starting at the midnight of the
+            server. Defaults to 0.
+
+    Attributes:
+        timeframes (tuple): The sorted timeframes in minutes.
+        base (int): The timeframe of the input candles.
+        offset (int): The shift of the interval boundaries.
+        history (dict): The ring buffer of the closed bars per timeframe.
+        listeners (list): The callbacks called with the timeframe and the
+            bar of every closed bar.
+        gap_listeners (list): The callbacks called with the ctm of the
+            first missing candle and the ctm of the candle after the gap.
+        metrics (dict): The numbers of aggregated and loaded candles, of
+            candles ignored as duplicate or late, of closed bars and of
+            gaps.
+    """
+
+    def __init__(
+        self,
+        timeframes: Iterable[int] = (1, 5, 15),
+        capacity: int = 2048,
+        base: int = 1,
+        offset: int = 0,
+    ) -> None:
+        # the closed bars of the base timeframe are the input candles
+        # aggregated again by load
+        self.timeframes = tuple(sorted(set(timeframes) | {base}))
+        if any(timeframe % base for timeframe in self.timeframes):
+            raise ValueError(f"Timeframes must be multiples of {base}")
+        self.base = base
+        self.offset = offset
+        self.history: dict[int, RingBuffer] = {
+            timeframe: RingBuffer(CANDLE_DTYPE, capacity, time_field="ctm")
+            for timeframe in self.timeframes
+        }
+        self.listeners: list[BarListener] = []
+        self.gap_listeners: list[GapListener] = []
+        self.metrics: dict[str, int] = {
+            "candles": 0,
+            "loaded": 0,
+            "ignored": 0,
+            "closed": 0,
+            "gaps": 0,
+        }
+        # the bar being formed per timeframe as
+        # [start, open, close, high, low, vol], None between bars
+        self._forming: dict[int, Optional[list[float]]] = {
+            timeframe: None for timeframe in self.timeframes
+        }
+        self._last_ctm: Optional[float] = None
+
+    def start_of(self, ctm: float, timeframe: int) -> float:
+        """
+        Returns the start of the interval of the timeframe containing
+        the ctm.
+        """
+        return ctm - (ctm - self.offset) % (timeframe * MINUTE)
+
+    def add(self, candle: Sequence[float]) -> list[tuple[int, np.void]]:
+        """
+        Aggregates a candle of the base timeframe. Candles not later than
+        the previous one are ignored.
+
+        Args:
+            candle (sequence): The values in the order of CANDLE_FIELDS.
+
+        Returns:
+            list: The (timeframe, bar) pairs of the bars it closed.
+        """
+        ctm, open_, close, high, low, vol = candle
+        last = self._last_ctm
+        if last is not None and ctm <= last:
+            self.metrics["ignored"] += 1
+            return []
+        self._last_ctm = ctm
+        step = self.base * MINUTE
+        if last is not None and ctm >= last + 2 * step:
+            self.metrics["gaps"] += 1
+            for gap_listener in self.gap_listeners:
+                gap_listener(last + step, ctm)
+        self.metrics["candles"] += 1
+        closed = []
+        for timeframe in self.timeframes:
+            # the candles of the base timeframe are kept as they came
+            start = (
+                ctm
+                if timeframe == self.base
+                else self.start_of(ctm, timeframe)
+            )
+            bar = self._forming[timeframe]
+            if bar is not None and bar[0] != start:
+                # the last minutes of the bar were missed
+                closed.append(self._close(timeframe, bar))
+                bar = None
+            if bar is None:
+                bar = [start, open_, close, high, low, vol]
+                self._forming[timeframe] = bar
+            else:
+                bar[2] = close
+                if high > bar[3]:
+                    bar[3] = high
+                if low < bar[4]:
+                    bar[4] = low
+                bar[5] += vol
+            if ctm + self.base * MINUTE >= start + timeframe * MINUTE:
+                closed.append(self._close(timeframe, bar))
+        for timeframe, record in closed:
+            for listener in self.listeners:
+                listener(timeframe, record)
+        return closed
+
+    def _close(self, timeframe: int, bar: list[float]) -> tuple[int, np.void]:
+        record = np.void(tuple(bar), CANDLE_DTYPE)
+        self.history[timeframe].append(record)
+        self._forming[timeframe] = None
+        self.metrics["closed"] += 1
+        return timeframe, record
+
+    def update(self, data: dict[str, Any]) -> list[tuple[int, np.void]]:
+        """
+        Aggregates the data of a candle stream message, read by key
+        without modification.
+        """
+        return self.add(CANDLE_PARSER.values(data))
+
+    def load(self, rows: Iterable[Sequence[float]]) -> int:
+        """
+        Merges historical candles of the base timeframe, e.g. of
+        get_historical_candles, with the kept ones in the order of their
+        ctm and aggregates them again into all timeframes, so history
+        loaded after the first streamed candles is not lost. The kept
+        candles win over loaded ones of the same ctm, and the listeners
+        are not called for the bars and the gaps of the merge.
+
+        Args:
+            rows (iterable): The candles in the order of CANDLE_FIELDS.
+
+        Returns:
+            int: The number of candles added.
+        """
+        kept = [tuple(bar) for bar in self.history[self.base].last()]
+        known = {bar[0] for bar in kept}
+        added = [tuple(row) for row in rows if row[0] not in known]
+        if not added:
+            return 0
+        metrics = dict(self.metrics)
+        listeners, self.listeners = self.listeners, []
+        gap_listeners, self.gap_listeners = self.gap_listeners, []
+        try:
+            self.clear()
+            for candle in sorted(kept + added):
+                self.add(candle)
+        finally:
+            self.listeners = listeners
+            self.gap_listeners = gap_listeners
+            self.metrics = metrics
+        self.metrics["loaded"] += len(added)
+        return len(added)
+
+    def clear(self) -> None:
+        """
+        Forgets the closed bars and the bars being formed.
+        """
+        for history in self.history.values():
+            history.clear()
+        self._forming = {timeframe: None for timeframe in self.timeframes}
+        self._last_ctm = None
+
+    def add_listener(self, listener: BarListener) -> None:
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener: BarListener) -> None:
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def add_gap_listener(self, listener: GapListener) -> None:
+        self.gap_listeners.append(listener)
+
+    def remove_gap_listener(self, listener: GapListener) -> None:
+        if listener in self.gap_listeners:
+            self.gap_listeners.remove(listener)
+
+    def bars(self, timeframe: int, n: Optional[int] = None) -> np.ndarray:
+        """
+        Returns a view of the last n closed bars of the timeframe, oldest
+        first, or of all kept bars if n is None.
+        """
+        return self.history[timeframe].last(n)
+
+    def values(self, timeframe: int, n: Optional[int] = None) -> np.ndarray:
+        """
+        Returns the last n closed bars of the timeframe as a view of rows
+        of floats in the order of CANDLE_FIELDS.
+        """
+        return self.history[timeframe].values(n)
+
+    def last_closed(self, timeframe: int) -> Optional[np.void]:
+        """
+        Returns the last closed bar of the timeframe, None if no bar was
+        closed yet.
+        """
+        return self.history[timeframe].latest()
+
+    def forming(self, timeframe: int) -> Optional[tuple[float, ...]]:
+        """
+        Returns the bar of the timeframe being formed in the order of
+        CANDLE_FIELDS, None if no candle of its interval arrived yet.
+        """
+        bar = self._forming[timeframe]
+        return None if bar is None else tuple(bar)
+
+
+class BarBuilder:
+    """
+    Builds bars from the ticks of one symbol in the layout of the candles,
+    each tick updating the bar being formed in constant time. Time bars
+    cover intervals of size seconds counted from the epoch and are closed
+    by the first tick of a later interval, tick bars hold size ticks and
+    volume bars close once the volume of their ticks reaches size.
+
+    Args:
+        kind (str): "time", "ticks" or "volume".
+        size (float): The seconds, the number of ticks or the volume of
+            a bar.
+        capacity (int, optional): The number of closed bars kept.
+            Defaults to 2048.
+        price (str, optional): The tick field of the prices. Defaults to
+            "bid", the price of the candles of the API.
+        volume (str, optional): The tick field of the volumes. Defaults
+            to "bidVolume".
+
+    Attributes:
+        kind (str): The kind of the bars.
+        size (float): The size of the bars.
+        price (str): The tick field of the prices.
+        volume (str): The tick field of the volumes.
+        history (RingBuffer): The closed bars.
+        listeners (list): The callbacks called with the size and the bar
+            of every closed bar.
+        metrics (dict): The numbers of ticks, of ticks ignored as late in
+            time bars and of closed bars.
+    """
+
+    KINDS = ("time", "ticks", "volume")
+
+    def __init__(
+        self,
+        kind: str,
+        size: float,
+        capacity: int = 2048,
+        price: str = "bid",
+        volume: str = "bidVolume",
+    ) -> None:
+        if kind not in self.KINDS:
+            raise ValueError(f"kind must be one of {self.KINDS}")
+        if size <= 0:
+            raise ValueError("size must be positive")
+        self.kind = kind
+        self.size = size
+        self.price = price
+        self.volume = volume
+        self.history = RingBuffer(CANDLE_DTYPE, capacity, time_field="ctm")
+        self.listeners: list[Callable[[float, np.void], None]] = []
+        self.metrics: dict[str, int] = {"ticks": 0, "ignored": 0, "bars": 0}
+        # [ctm, open, close, high, low, vol] of the bar being formed
+        self._forming: Optional[list[float]] = None
+        self._ticks: int = 0
+        self._span = size * 1000
+
+    def add(
+        self, timestamp: float, price: float, volume: float = 0.0
+    ) -> Optional[np.void]:
+        """
+        Adds a tick.
+
+        Args:
+            timestamp (float): The time of the tick in milliseconds.
+            price (float): The price of the tick.
+            volume (float, optional): The volume of the tick.
+
+        Returns:
+            The bar the tick closed, None if no bar was closed.
+        """
+        bar = self._forming
+        closed: Optional[np.void] = None
+        if self.kind == "time":
+            start = timestamp - timestamp % self._span
+            if bar is not None and start != bar[0]:
+                if start < bar[0]:
+                    self.metrics["ignored"] += 1
+                    return None
+                closed = self._close(bar)
+                bar = None
+        else:
+            start = timestamp
+        self.metrics["ticks"] += 1
+        if bar is None:
+            bar = self._forming = [start, price, price, price, price, volume]
+            self._ticks = 1
+        else:
+            bar[2] = price
+            if price > bar[3]:
+                bar[3] = price
+            if price < bar[4]:
+                bar[4] = price
+            bar[5] += volume
+            self._ticks += 1
+        if (self.kind == "ticks" and self._ticks >= self.size) or (
+            self.kind == "volume" and bar[5] >= self.size
+        ):
+            closed = self._close(bar)
+        return closed
+
+    def _close(self, bar: list[float]) -> np.void:
+        record = np.void(tuple(bar), CANDLE_DTYPE)
+        self.history.append(record)
+        self._forming = None
+        self.metrics["bars"] += 1
+        for listener in self.listeners:
+            listener(self.size, record)
+        return record
+
+    def update(self, data: dict[str, Any]) -> Optional[np.void]:
+        """
+        Adds the data of a tickPrices message, read by key without
+        modification.
+        """
+        return self.add(
+            data["timestamp"], data[self.price], data.get(self.volume, 0.0)
+        )
+
+    def add_listener(self, listener: Callable[[float, np.void], None]) -> None:
+        self.listeners.append(listener)
+
+    def remove_listener(
+        self, listener: Callable[[float, np.void], None]
+    ) -> None:
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def bars(self, n: Optional[int] = None) -> np.ndarray:
+        """
+        Returns a view of the last n closed bars, oldest first, or of all
+        kept bars if n is None.
+        """
+        return self.history.last(n)
+
+    def values(self, n: Optional[int] = None) -> np.ndarray:
+        """
+        Returns the last n closed bars as a view of rows of floats in the
+        order of CANDLE_FIELDS, the format of symbols_last_1M.
+        """
+        return self.history.values(n)
+
+    def last_closed(self) -> Optional[np.void]:
+        return self.history.latest()
+
+    def forming(self) -> Optional[tuple[float, ...]]:
+        """
+        Returns the bar being formed in the order of CANDLE_FIELDS, None
+        between bars.
+        """
+        return None if self._forming is None else tuple(self._forming)
@@ -0,0 +1,164 @@
+"""
+The module includes the depth book of a symbol, built from the quotes of
+all levels streamed by getTickPrices with maxLevel.
+"""
+
+from typing import Any, NamedTuple, Optional
+import numpy as np
+from data.records import RecordParser
+
+# fields of the tickPrices messages kept per level
+DEPTH_FIELDS = ("bid", "bidVolume", "ask", "askVolume", "timestamp")
+DEPTH_DTYPE = np.dtype([(field, np.float64) for field in DEPTH_FIELDS])
+
+
+class DepthSnapshot(NamedTuple):
+    """
+    A copy of the state of a depth book.
+
+    Attributes:
+        bid (float): The best bid, nan before the first quote.
+        ask (float): The best ask, nan before the first quote.
+        bid_volume (np.ndarray): The cumulative bid volume up to every
+            quoted level.
+        ask_volume (np.ndarray): The cumulative ask volume up to every
+            quoted level.
+        imbalance (float): The imbalance of the quoted levels, see
+            DepthBook.imbalance.
+        timestamp (float): The newest timestamp of the quoted levels.
+    """
+
+    bid: float
+    ask: float
+    bid_volume: np.ndarray
+    ask_volume: np.ndarray
+    imbalance: float
+    timestamp: float
+
+
+class DepthBook:
+    """
+    Quotes of the levels of the market depth of a symbol, kept in one
+    structured array indexed by level and updated in place: a quote of
+    level n (0 is the best price) replaces the previous quote of level n.
+    The volumes are in the units of the bidVolume and askVolume fields.
+
+    The book is written by the thread dispatching the stream; a reader
+    on another thread should take a snapshot.
+
+    Args:
+        levels (int, optional): The number of levels kept, level 0 up to
+            levels - 1. Defaults to 5.
+
+    Attributes:
+        levels (int): The number of levels kept.
+        book (np.ndarray): The quote of every level, DEPTH_DTYPE records
+            with nan in the levels not quoted yet.
+        depth (int): The number of levels quoted, from level 0.
+        metrics (dict): The numbers of updates and of quotes of levels
+            above the kept ones.
+    """
+
+    def __init__(self, levels: int = 5) -> None:
+        if levels < 1:
+            raise ValueError("levels must be at least 1")
+        self.levels = levels
+        self.book = np.empty(levels, DEPTH_DTYPE)
+        self.depth: int = 0
+        self.metrics = {"updates": 0, "ignored": 0}
+        self._parser = RecordParser(DEPTH_DTYPE, "tickPrices")
+        self.clear()
+
+    def update(self, data: dict[str, Any]) -> bool:
+        """
+        Writes the quote of the data of a tickPrices message into its
+        level, read by key without modification.
+
+        Returns:
+            bool: Whether the level is kept.
+        """
+        level = int(data["level"])
+        if not 0 <= level < self.levels:
+            self.metrics["ignored"] += 1
+            return False
+        self.book[level] = self._parser.values(data)
+        if level >= self.depth:
+            self.depth = level + 1
+        self.metrics["updates"] += 1
+        return True
+
+    def quoted(self) -> np.ndarray:
+        """
+        Returns a view of the quoted levels.
+        """
+        return self.book[: self.depth]
+
+    def best(self) -> tuple[float, float]:
+        """
+        Returns the best bid and ask, nan before the first quote.
+        """
+        best = self.book[0]
+        return float(best["bid"]), float(best["ask"])
+
+    def cumulative(self, side: str = "bid") -> np.ndarray:
+        """
+        Returns the cumulative volume of a side ("bid" or "ask") up to
+        every quoted level.
+        """
+        volume = self.book[f"{side}Volume"][: self.depth]
+        return np.cumsum(np.nan_to_num(volume))
+
+    def imbalance(self, n: Optional[int] = None) -> float:
+        """
+        Returns (bid volume - ask volume) / (bid volume + ask volume) of
+        the first n quoted levels or of all of them if n is None, from -1
+        (only asks) to 1 (only bids), 0 without volume.
+        """
+        n = self.depth if n is None else min(n, self.depth)
+        if n < 1:
+            return 0.0
+        bid = self.cumulative("bid")[n - 1]
+        ask = self.cumulative("ask")[n - 1]
+        total = bid + ask
+        return float((bid - ask) / total) if total else 0.0
+
+    def price_for(self, volume: float, side: str = "buy") -> Optional[float]:
+        """
+        Returns the average price of a market order of the volume filled
+        level by level, at the asks for a buy and the bids for a sell.
+
+        Returns:
+            The volume-weighted price or None if the quoted levels do not
+            hold the volume.
+        """
+        prices, volumes = ("ask", "askVolume")
+        if side == "sell":
+            prices, volumes = ("bid", "bidVolume")
+        book = self.quoted()
+        available = np.nan_to_num(book[volumes])
+        total = np.cumsum(available)
+        if volume <= 0 or not len(total) or total[-1] < volume:
+            return None
+        # the volume taken from every level after the better ones
+        filled = np.clip(volume - (total - available), 0.0, available)
+        return float(np.dot(filled, np.nan_to_num(book[prices])) / volume)
+
+    def snapshot(self) -> DepthSnapshot:
+        """
+        Returns a copy of the best prices, the cumulative volumes and the
+        imbalance of the quoted levels.
+        """
+        bid, ask = self.best()
+        quoted = self.quoted()
+        return DepthSnapshot(
+            bid,
+            ask,
+            self.cumulative("bid"),
+            self.cumulative("ask"),
+            self.imbalance(),
+            float(np.nanmax(quoted["timestamp"])) if len(quoted) else 0.0,
+        )
+
+    def clear(self) -> None:
+        self.book[:] = (np.nan,) * len(DEPTH_FIELDS)
+        self.depth = 0
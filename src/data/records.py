@@ -0,0 +1,96 @@
+"""
+The module includes the parsers of the data of the API messages into
+numpy structured records, reading every field by its key.
+"""
+
+from operator import itemgetter
+from typing import Any, Iterable
+import numpy as np
+
+# fields of the balance stream messages, in the order of the API
+BALANCE_FIELDS = (
+    "balance",
+    "margin",
+    "equityFX",
+    "equity",
+    "marginLevel",
+    "marginFree",
+    "credit",
+    "stockValue",
+    "stockLock",
+    "cashStockValue",
+)
+BALANCE_DTYPE = np.dtype([(field, np.float64) for field in BALANCE_FIELDS])
+
+
+class RecordParser:
+    """
+    Parser of the data of messages into records of a structured dtype.
+    The fields are read by key with one itemgetter, so the columns do not
+    depend on the key order of the server, keys that are not fields are
+    ignored and the messages, which may be shared by many consumers, are
+    never modified.
+
+    Args:
+        dtype (np.dtype): The structured type of the records, whose field
+            names are the keys of the messages.
+        name (str, optional): The name of the messages in the errors.
+            Defaults to "message".
+
+    Attributes:
+        dtype (np.dtype): The structured type of the records.
+        fields (tuple): The keys read, in the order of the dtype.
+        name (str): The name of the messages in the errors.
+    """
+
+    def __init__(self, dtype: np.dtype, name: str = "message") -> None:
+        self.dtype = np.dtype(dtype)
+        if not self.dtype.names:
+            raise ValueError("dtype without fields")
+        self.fields: tuple[str, ...] = self.dtype.names
+        self.name = name
+        getter = itemgetter(*self.fields)
+        if len(self.fields) == 1:
+            self._get = lambda data: (getter(data),)
+        else:
+            self._get = getter
+
+    def values(self, data: dict[str, Any]) -> tuple[Any, ...]:
+        """
+        Returns the values of the fields in the order of the dtype.
+
+        Raises:
+            KeyError: If a field is missing, naming the field.
+        """
+        try:
+            return self._get(data)
+        except KeyError as e:
+            raise KeyError(
+                f"{self.name} without the field {e.args[0]}"
+            ) from None
+
+    def missing(self, data: dict[str, Any]) -> list[str]:
+        """
+        Returns the fields missing from the data.
+        """
+        return [field for field in self.fields if field not in data]
+
+    def record(self, data: dict[str, Any]) -> np.void:
+        """
+        Returns the data as a record of the dtype.
+        """
+        return np.void(self.values(data), self.dtype)
+
+    def array(self, data: dict[str, Any]) -> np.ndarray:
+        """
+        Returns the values of the fields as a 1-D array of floats. Needs
+        a dtype whose fields are all numbers.
+        """
+        return np.fromiter(self.values(data), np.float64, len(self.fields))
+
+    def records(self, items: Iterable[dict[str, Any]]) -> np.ndarray:
+        """
+        Returns an array of the records of many messages, e.g. of the
+        rateInfos of a chart command.
+        """
+        return np.array([self.values(data) for data in items], self.dtype)
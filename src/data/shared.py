@@ -0,0 +1,322 @@
+"""
+The module includes the market data bus in shared memory: one feed
+process publishes the latest quote and the recent candles of every symbol
+into a multiprocessing.shared_memory segment, and the strategy processes
+read them through read-only views without any serialization.
+"""
+
+import mmap
+import os
+import re
+import sys
+from multiprocessing.shared_memory import SharedMemory
+from time import monotonic
+from typing import Any, Callable, Iterable, Optional
+import numpy as np
+from data.buffers import TICK_DTYPE
+from data.candles import CANDLE_DTYPE, CANDLE_PARSER
+from data.records import RecordParser
+
+# the header of a segment, int64 slots
+VERSION = 1
+HEADER_SIZE = 8
+_VERSION, _SEQUENCE, _TICKS, _CANDLES, _HEAD, _CAPACITY = range(6)
+_QUOTE_OFFSET = HEADER_SIZE * 8
+_CANDLES_OFFSET = _QUOTE_OFFSET + TICK_DTYPE.itemsize
+
+TICK_PARSER = RecordParser(TICK_DTYPE, "tickPrices")
+
+
+def segment_name(prefix: str, symbol: str) -> str:
+    """
+    Returns the name of the shared memory segment of a symbol.
+    """
+    return f"{prefix}_{re.sub(r'[^A-Za-z0-9]', '_', symbol)}"
+
+
+def _map_readonly(name: str) -> mmap.mmap:
+    """
+    Maps an existing segment read-only. On POSIX systems the segment is
+    opened without SharedMemory, which would register it with the
+    resource tracker of the process and unlink the segment of the
+    publisher when a reader exits. On Windows SharedMemory checks that
+    the segment exists and gives its size, and the named mapping is
+    opened again read-only.
+    """
+    if sys.platform == "win32":
+        memory = SharedMemory(name)
+        try:
+            return mmap.mmap(
+                -1, memory.size, tagname=name, access=mmap.ACCESS_READ
+            )
+        finally:
+            memory.close()
+    else:
+        from _posixshmem import shm_open
+
+        fd = shm_open(f"/{name}", os.O_RDONLY)
+        try:
+            return mmap.mmap(fd, os.fstat(fd).st_size, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+
+
+class _Segment:
+    """
+    The views of the header, the quote and the mirrored candle ring of
+    a segment. The candles are written twice, at their slot and at the
+    slot plus the capacity, so the last n candles are contiguous.
+    """
+
+    def __init__(self, buffer: Any, capacity: int) -> None:
+        self.capacity = capacity
+        self.header = np.ndarray((HEADER_SIZE,), np.int64, buffer)
+        self.quote = np.ndarray((), TICK_DTYPE, buffer, _QUOTE_OFFSET)
+        self.candles = np.ndarray(
+            (2 * capacity,), CANDLE_DTYPE, buffer, _CANDLES_OFFSET
+        )
+
+    @staticmethod
+    def size(capacity: int) -> int:
+        return _CANDLES_OFFSET + 2 * capacity * CANDLE_DTYPE.itemsize
+
+    def release(self) -> None:
+        # the views must go before the memory map is closed
+        del self.header, self.quote, self.candles
+
+
+class MarketDataPublisher:
+    """
+    Writer of the market data of symbols into shared memory segments
+    named after a prefix and the symbol. Every segment has a sequence
+    counter, odd while the segment is written, so readers tell a torn
+    read and retry (a seqlock). There must be one publisher per segment.
+
+    The publisher is fed with the stream messages, e.g. on the reactor
+    thread of a shared stream:
+
+        demux.subscribe_callback(publisher.topics(), publisher.on_message)
+
+    Args:
+        symbols (iterable): The symbols published.
+        capacity (int, optional): The number of candles kept per symbol.
+            Defaults to 1024.
+        prefix (str, optional): The prefix of the segment names.
+            Defaults to "semper_market".
+
+    Attributes:
+        symbols (list): The symbols published.
+        capacity (int): The number of candles kept per symbol.
+        prefix (str): The prefix of the segment names.
+        metrics (dict): The numbers of published ticks and candles and of
+            messages of other symbols.
+    """
+
+    def __init__(
+        self,
+        symbols: Iterable[str],
+        capacity: int = 1024,
+        prefix: str = "semper_market",
+    ) -> None:
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.symbols = list(symbols)
+        self.capacity = capacity
+        self.prefix = prefix
+        self.metrics = {"ticks": 0, "candles": 0, "unknown": 0}
+        self._segments: dict[str, _Segment] = {}
+        self._memory: dict[str, SharedMemory] = {}
+        try:
+            for symbol in self.symbols:
+                self._memory[symbol] = self._create(symbol)
+                self._segments[symbol] = self._init(self._memory[symbol])
+        except Exception:
+            self.close()
+            raise
+
+    def _create(self, symbol: str) -> SharedMemory:
+        name = segment_name(self.prefix, symbol)
+        size = _Segment.size(self.capacity)
+        try:
+            segment = SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            # left by a publisher that did not close
+            stale = SharedMemory(name)
+            stale.unlink()
+            stale.close()
+            segment = SharedMemory(name, create=True, size=size)
+        return segment
+
+    def _init(self, segment: SharedMemory) -> _Segment:
+        view = _Segment(segment.buf, self.capacity)
+        view.header[:] = 0
+        view.header[_CAPACITY] = self.capacity
+        view.header[_VERSION] = VERSION
+        return view
+
+    def topics(self) -> list[tuple[str, str]]:
+        """
+        Returns the (command, symbol) topics of the published messages.
+        """
+        return [
+            (command, symbol)
+            for symbol in self.symbols
+            for command in ("tickPrices", "candle")
+        ]
+
+    def write_quote(self, symbol: str, values: tuple[Any, ...]) -> None:
+        """
+        Writes the latest quote of a symbol.
+
+        Args:
+            symbol (str): The symbol of the quote.
+            values (tuple): The fields in the order of TICK_FIELDS.
+        """
+        view = self._segments[symbol]
+        header = view.header
+        header[_SEQUENCE] += 1
+        view.quote[()] = values
+        header[_TICKS] += 1
+        header[_SEQUENCE] += 1
+        self.metrics["ticks"] += 1
+
+    def write_candle(self, symbol: str, values: tuple[Any, ...]) -> None:
+        """
+        Appends a candle of a symbol to its ring.
+
+        Args:
+            symbol (str): The symbol of the candle.
+            values (tuple): The fields in the order of CANDLE_FIELDS.
+        """
+        view = self._segments[symbol]
+        header = view.header
+        head = int(header[_HEAD])
+        header[_SEQUENCE] += 1
+        view.candles[head] = values
+        view.candles[head + view.capacity] = values
+        header[_HEAD] = head + 1 if head + 1 < view.capacity else 0
+        header[_CANDLES] += 1
+        header[_SEQUENCE] += 1
+        self.metrics["candles"] += 1
+
+    def on_message(self, message: Any) -> None:
+        """
+        Publishes a tickPrices message of level 0 or a candle message of
+        a published symbol. The message is read by key without
+        modification.
+        """
+        data = message["data"]
+        symbol = data.get("symbol")
+        if symbol not in self._segments:
+            self.metrics["unknown"] += 1
+        elif message["command"] == "tickPrices":
+            if not data["level"]:
+                self.write_quote(symbol, TICK_PARSER.values(data))
+        elif message["command"] == "candle":
+            self.write_candle(symbol, CANDLE_PARSER.values(data))
+
+    def close(self) -> None:
+        """
+        Closes and removes the segments.
+        """
+        for view in self._segments.values():
+            view.release()
+        self._segments.clear()
+        for segment in self._memory.values():
+            segment.close()
+            segment.unlink()
+        self._memory.clear()
+
+
+class MarketDataReader:
+    """
+    Read-only handle of the segment of a symbol written by
+    a MarketDataPublisher, in this or another process. The segment is
+    mapped read-only and every read is a copy made between two equal
+    even sequences, so it is never torn.
+
+    Args:
+        symbol (str): The symbol read.
+        prefix (str, optional): The prefix of the segment names.
+            Defaults to "semper_market".
+        timeout (float, optional): The longest time in seconds a read
+            retries while the segment is written. Defaults to 0.1.
+
+    Attributes:
+        symbol (str): The symbol read.
+        capacity (int): The number of candles kept by the publisher.
+        timeout (float): The longest time in seconds a read retries.
+
+    Raises:
+        FileNotFoundError: If the segment is not published.
+        ValueError: If the segment has another layout version.
+    """
+
+    def __init__(
+        self, symbol: str, prefix: str = "semper_market", timeout: float = 0.1
+    ) -> None:
+        self.symbol = symbol
+        self.timeout = timeout
+        self._map = _map_readonly(segment_name(prefix, symbol))
+        header = np.ndarray((HEADER_SIZE,), np.int64, self._map)
+        version, capacity = int(header[_VERSION]), int(header[_CAPACITY])
+        del header
+        if version != VERSION:
+            self._map.close()
+            raise ValueError(f"Segment of {symbol} has version {version}")
+        self.capacity = capacity
+        self._view = _Segment(self._map, capacity)
+
+    @property
+    def sequence(self) -> int:
+        """
+        The number of writes of the segment, which changes with every
+        published tick or candle.
+        """
+        return int(self._view.header[_SEQUENCE]) // 2
+
+    def _read(self, copy: Callable[[], Any]) -> tuple[int, Any]:
+        header = self._view.header
+        deadline = None
+        while True:
+            start = int(header[_SEQUENCE])
+            if not start & 1:
+                value = copy()
+                if int(header[_SEQUENCE]) == start:
+                    return start // 2, value
+            if deadline is None:
+                deadline = monotonic() + self.timeout
+            elif monotonic() > deadline:
+                raise TimeoutError(f"Segment of {self.symbol} is not read")
+
+    def quote(self) -> tuple[int, Optional[np.void]]:
+        """
+        Returns the sequence and a copy of the latest quote, None before
+        the first one.
+        """
+        view = self._view
+        sequence, (ticks, quote) = self._read(
+            lambda: (int(view.header[_TICKS]), view.quote.copy()[()])
+        )
+        return sequence, quote if ticks else None
+
+    def candles(self, n: Optional[int] = None) -> tuple[int, np.ndarray]:
+        """
+        Returns the sequence and a copy of the last n candles, oldest
+        first, or of all kept candles if n is None.
+        """
+        view = self._view
+
+        def copy() -> np.ndarray:
+            header = view.header
+            kept = min(int(header[_CANDLES]), view.capacity)
+            size = kept if n is None else min(max(n, 0), kept)
+            end = int(header[_HEAD]) + view.capacity
+            start = end - size
+            return view.candles[start:end].copy()
+
+        return self._read(copy)
+
+    def close(self) -> None:
+        self._view.release()
+        self._map.close()
@@ -0,0 +1,100 @@
+"""
+The module includes the store of the latest market data of symbols as
+immutable snapshots, read by any thread without locks.
+"""
+
+from threading import Lock
+from types import MappingProxyType
+from typing import Any, Mapping, NamedTuple, Optional
+import numpy as np
+
+
+def frozen(values: Any, dtype: Any = None) -> np.ndarray:
+    """
+    Returns a read-only copy of an array or a record, which no writer can
+    change after it is published.
+    """
+    copied = np.array(values, dtype=dtype, copy=True)
+    copied.flags.writeable = False
+    return copied
+
+
+class MarketSnapshot(NamedTuple):
+    """
+    The latest market data of a symbol. Every field is immutable and
+    a new snapshot replaces the previous one, so a snapshot never changes
+    once it is read.
+
+    Attributes:
+        symbol (str): The symbol of the data.
+        sequence (int): The number of updates of the symbol.
+        quote (np.void): The latest tick of level 0, a read-only record,
+            None before the first one.
+        candles (Mapping): The read-only rows of floats in the order of
+            CANDLE_FIELDS of the last closed candles of every timeframe.
+    """
+
+    symbol: str
+    sequence: int = 0
+    quote: Optional[np.void] = None
+    candles: Mapping[Any, np.ndarray] = MappingProxyType({})
+
+
+class SnapshotStore:
+    """
+    Snapshots of the market data of symbols. A writer builds a new
+    snapshot from the previous one and swaps it in with a single reference
+    assignment, which is atomic, so a reader gets either the previous or
+    the new snapshot and never a partial update, without a lock or
+    a retry. The writers of a symbol are serialized.
+    """
+
+    def __init__(self) -> None:
+        self._snapshots: dict[str, MarketSnapshot] = {}
+        self._lock = Lock()
+
+    def get(self, symbol: str) -> MarketSnapshot:
+        """
+        Returns the latest snapshot of a symbol, empty before the first
+        update.
+        """
+        snapshot = self._snapshots.get(symbol)
+        return MarketSnapshot(symbol) if snapshot is None else snapshot
+
+    def update(
+        self,
+        symbol: str,
+        quote: Optional[np.void] = None,
+        candles: Optional[Mapping[Any, np.ndarray]] = None,
+    ) -> MarketSnapshot:
+        """
+        Publishes a new snapshot of a symbol with the given fields, which
+        must be read-only (see frozen), and the previous values of the
+        other ones.
+
+        Args:
+            symbol (str): The symbol of the data.
+            quote (np.void, optional): The latest tick.
+            candles (Mapping, optional): The last closed candles of the
+                updated timeframes.
+
+        Returns:
+            MarketSnapshot: The published snapshot.
+        """
+        with self._lock:
+            previous = self.get(symbol)
+            snapshot = MarketSnapshot(
+                symbol,
+                previous.sequence + 1,
+                previous.quote if quote is None else quote,
+                (
+                    previous.candles
+                    if candles is None
+                    else MappingProxyType({**previous.candles, **candles})
+                ),
+            )
+            self._snapshots[symbol] = snapshot
+            return snapshot
+
+    def symbols(self) -> list[str]:
+        return list(self._snapshots)
@@ -4,10 +4,16 @@ Module containing models for closing positions.
 
 from threading import Thread
 from time import sleep
-from typing import Any
+from typing import Any, Optional
+import numpy as np
 from api.client import XTBClient
-from api.streamtools import PositionObservator
+from api.streamtools import (
+    DeliveryPolicy,
+    PositionObservator,
+    StreamDemultiplexer,
+)
 from api.commands import close_position
+from data.buffers import TICK_FIELDS
 from utils.technical import setup_logger
 
 
@@ -36,8 +42,8 @@ class DefaultCloseSignal:
         price_data: Placeholder for storing price-related data.
         multiplier_value: The multiplier value used in position
             calculations.
-        as_bid_position: Placeholder for storing bid-related
-            position information.
+        as_bid_position: The column of the closing price in the ticks,
+            the bid for buy positions and the ask for sell positions.
         cs_function: Placeholder for storing the close signal function.
         not_earnings_stage (bool): Flag indicating whether the position
             is not in the earnings stage.
@@ -53,8 +59,13 @@ class DefaultCloseSignal:
             stage 5.
         acc_earnings_stage_15 (bool): Flag indicating accumulated earnings
             stage 15.
+        tick_policy (DeliveryPolicy): The delivery of the ticks of the
+            shared stream, conflated since the model reads the latest
+            price only.
     """
 
+    tick_policy = DeliveryPolicy("conflated")
+
     def __init__(self):
         self.logging = setup_logger("DCS_logger", "DCS_logger.log")
         self.closedata: dict[str, Any]
@@ -91,10 +102,12 @@ class DefaultCloseSignal:
         tp_min: float = 0.5,
         tp_max: float = 0.1,
         asymetyric_tp: float = 0.5,
+        demux: Optional[StreamDemultiplexer] = None,
     ):
         """
         A method that allows you to define the parameters of the model after
-        the execution of the transaction .
+        the execution of the transaction. With demux the position data is
+        read from the shared stream instead of the stream of the client.
         """
         self.client = client
         self.order = position_data.get("order_no", 0)
@@ -111,18 +124,22 @@ class DefaultCloseSignal:
             self.cmd = transaction_data.get("cmd", 0)
             self.volume = transaction_data.get("volume", 0)
             self.price_data = PositionObservator(
-                client=client, symbol=self.symbol, order_no=self.order
+                client=client,
+                symbol=self.symbol,
+                order_no=self.order,
+                demux=demux,
+                policy=self.tick_policy,
             )
         else:
             self.logging.info("Not transactions data")
 
         if self.cmd == 1:
             self.multiplier_value = 1
-            self.as_bid_position = 0
+            self.as_bid_position = TICK_FIELDS.index("ask")
             self.cs_function = self.sell_take_profit_signal
         else:
             self.multiplier_value = -1
-            self.as_bid_position = 1
+            self.as_bid_position = TICK_FIELDS.index("bid")
             self.cs_function = self.buy_take_profit_signal
 
     def subscribe_data(self):
@@ -131,6 +148,12 @@ class DefaultCloseSignal:
         """
         self.price_data.subscribe()
 
+    def unsubscribe_data(self):
+        """
+        Ends the data subscription of the closed position.
+        """
+        self.price_data.detach()
+
     def read_data(self):
         """
         Reading data from the stream in the position observation object.
@@ -160,6 +183,22 @@ class DefaultCloseSignal:
         mean_prince = (cendle_data[0, 2] - cendle_data[0, 1]) / 2
         return cendle_data[0, 1] + mean_prince
 
+    def last_candle(self) -> Optional[np.ndarray]:
+        """
+        Returns the last closed 15-minute candle of the position, or the
+        last closed 5-minute candle before the first 15 minutes, aligned
+        on the clock by the candles of the price data.
+
+        Return:
+            The candle as a row of floats in the order of CANDLE_FIELDS,
+            None before the first 5-minute candle is closed.
+        """
+        for timeframe in (15, 5):
+            candle = self.price_data.candles.values(timeframe, 1)
+            if len(candle):
+                return candle
+        return None
+
     def control_asset(self):
         """
         Monitoring by position type
@@ -232,22 +271,9 @@ class DefaultCloseSignal:
                     )
                     self.status_to_close = True
             if current_percentage > 0:
-                if self.price_data.minute_15.any():
-                    self.calculate_buy_cs(
-                        self.price_data.minute_15, current_price
-                    )
-                elif self.price_data.minute_5.any():
-                    self.calculate_buy_cs(
-                        self.price_data.minute_5, current_price
-                    )
-                elif self.price_data.minute_1.any():
-                    # self.calculate_buy_cs
-                    # (self.price_data.minute_1,current_price)
-                    pass
-                elif not self.price_data.minute_1.any():
-                    pass
-                else:
-                    self.logging.info("PASS")
+                candle = self.last_candle()
+                if candle is not None:
+                    self.calculate_buy_cs(candle, current_price)
         except Exception:
             pass
 
@@ -274,22 +300,9 @@ class DefaultCloseSignal:
                     )
                     self.status_to_close = True
             if current_percentage > 0:
-                if self.price_data.minute_15.any():
-                    self.calculate_sell_cs(
-                        self.price_data.minute_15, current_price
-                    )
-                elif self.price_data.minute_5.any():
-                    self.calculate_sell_cs(
-                        self.price_data.minute_5, current_price
-                    )
-                elif self.price_data.minute_1.any():
-                    # self.calculate_sell_cs
-                    # (self.price_data.minute_1,current_price)
-                    pass
-                elif not self.price_data.minute_1.any():
-                    pass
-                else:
-                    self.logging.info("PASS")
+                candle = self.last_candle()
+                if candle is not None:
+                    self.calculate_sell_cs(candle, current_price)
         except Exception:
             pass
 
@@ -307,3 +320,4 @@ class DefaultCloseSignal:
 
         read_thread.join()
         control_thread.join()
+        self.unsubscribe_data()
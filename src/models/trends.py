@@ -2,11 +2,10 @@
 Module containing models that make decisions based on trend.
 """
 
-from threading import Thread
-from time import sleep
-from typing import Any
+from threading import Event, Thread
+from typing import Any, Optional
 import numpy as np
-from api.client import XTBClient
+from api.client import SessionPool, get_session_pool
 from api.commands import get_historical_candles
 
 
@@ -17,25 +16,31 @@ class MovingAVG:
     Args:
         symbol (str): The symbol for which Moving Average calculations
             are performed.
-        period (int, optional): The period of Moving Average. Defaults
-            to 1 (based on 1-minutes candles).
+        period (int, optional): The period of Moving Average in minutes,
+            one of the timeframes of the candles of the data stream.
+            Defaults to 1 (based on 1-minutes candles).
+        pool (SessionPool, optional): The session pool used for API calls.
+            Defaults to the process-wide DEMO pool.
 
     Attributes:
-        client (XTBClient): An instance of the XTBClient class for
-            making API calls.
+        pool (SessionPool): The session pool whose command scheduler
+            makes the API calls.
         symbol (str): The symbol for which Moving Average calculations
             are performed.
         period (int): The period of Moving Average.
-        base_data: Placeholder for storing the base data.
+        base_data: The last 60 candles of the period, read-only rows of
+            the snapshot of the data stream.
         means: Array for storing the calculated moving averages.
         mean: Array for storing the latest moving average.
-        last_1M_candle: Array for storing the data of the last
-            1-minute candle.
+        last_1M_candle: The last closed candle of the period.
         signal: The generated signal based on Moving Average calculations.
+        signal_ready (Event): Set once the first signal is generated.
     """
 
-    def __init__(self, symbol: str, period: int = 1) -> None:
-        self.client = XTBClient("DEMO")
+    def __init__(
+        self, symbol: str, period: int = 1, pool: Optional[SessionPool] = None
+    ) -> None:
+        self.pool = pool if pool is not None else get_session_pool("DEMO")
         self.symbol = symbol
         self.period = period
         self.base_data: np.ndarray[Any, np.dtype[Any]] = np.array([])
@@ -45,6 +50,23 @@ class MovingAVG:
         self.signal: int = 20  # number outside the pool of orders but meeting
         # the requirements of the specified type of variables (zero is the
         # type of order)
+        self.signal_ready = Event()
+
+    def check_period(self, symbol_data) -> None:
+        """
+        Checks that the period is a timeframe of the candles of the data
+        stream.
+
+        Raises:
+            ValueError: If the data stream does not aggregate candles of
+                the period.
+        """
+        timeframes = symbol_data.candles.timeframes
+        if self.period not in timeframes:
+            raise ValueError(
+                f"The period {self.period} of {self.symbol} is not one of "
+                f"the timeframes of the data stream {timeframes}"
+            )
 
     def get_means(self):
         """
@@ -65,43 +87,71 @@ class MovingAVG:
         self.means = np.vstack([self.means, data])
         self.mean = data
 
-    def market_observe(self, symbol_data):
+    def update_signal(self, candles: np.ndarray) -> None:
         """
-        A method that observes market behavior using streamed data.
+        Recalculates the moving averages and the signal from the last 60
+        candles of the period, rows of floats in the order of
+        CANDLE_FIELDS.
         """
-        while symbol_data.symbols_last_1M.shape == (0, 7):
-            sleep(1)
+        if len(candles) < 60:
+            # too short a history for the 60-candle average
+            return
+        self.last_1M_candle = candles[-1:]
+        self.base_data = candles[-60:]
+        try:
+            self.get_means()
+            if self.mean[4] > self.mean[3]:
+                self.signal = 0
+            if self.mean[4] < self.mean[3]:
+                self.signal = 1
+        except Exception:
+            pass
+        if self.signal != 20:
+            self.signal_ready.set()
 
-        while self.client.connection_stream is True:
-            if self.last_1M_candle[0, 0] == symbol_data.symbols_last_1M[0, 0]:
-                pass
-            else:
-                self.last_1M_candle = symbol_data.symbols_last_1M
-                self.base_data = np.vstack(
-                    [self.base_data, self.last_1M_candle]
-                )
-                self.base_data = self.base_data[-60:, :]
-                try:
-                    self.get_means()
-                    if self.mean[4] > self.mean[3]:
-                        self.signal = 0
-                    if self.mean[4] < self.mean[3]:
-                        self.signal = 1
-                except Exception:
-                    pass
-            sleep(1)
+    def market_observe(self, symbol_data):
+        """
+        A method that observes market behavior using the candles of the
+        period aggregated by the data stream. It blocks until a candle of
+        the period closes, so the signal follows a candle without delay.
+        The candles are read from the snapshot of the data stream, which
+        the stream thread does not change.
+
+        Raises:
+            ValueError: If the period is not a timeframe of the data stream.
+        """
+        self.check_period(symbol_data)
+        candles = symbol_data.snapshot().candles.get(self.period)
+        if candles is not None and len(candles):
+            # the loaded history
+            self.update_signal(candles)
+        sequence = 0
+        while symbol_data.is_connected() is True:
+            sequence, event = symbol_data.wait_candle(
+                self.period, sequence, timeout=1.0
+            )
+            if event is not None:
+                self.update_signal(symbol_data.snapshot().candles[self.period])
 
     def run(self, symbol_data):
         """
         A method that runs the model's work along with downloading
         historical data.
+
+        Raises:
+            ValueError: If the period is not a timeframe of the data stream.
         """
-        self.client.open_session()
-        self.base_data = get_historical_candles(
-            client=self.client,
+        self.check_period(symbol_data)
+        # chart requests go through the history lane of the scheduler,
+        # behind the orders of open positions; the 1-minute candles of
+        # 61 periods are aggregated by the data stream into the period,
+        # the extra one covering the bar cut by the start of the history
+        history = get_historical_candles(
+            client=self.pool.scheduler(),
             symbol=self.symbol,
-            shift=60,
-            period=self.period,
+            shift=61 * self.period,
+            period=1,
         )
+        symbol_data.load_candles(history)
         read_thread = Thread(target=self.market_observe, args=(symbol_data,))
         read_thread.start()
@@ -3,12 +3,12 @@ The module allows you to run a trading session with the use of an
 entry model and an exit model.
 """
 
-from time import sleep
-from typing import Any
+from typing import Any, Optional
 from threading import Thread
-from api.client import XTBClient
+from api.client import SessionPool, CommandScheduler, get_session_pool
 from api.commands import buy_transaction, sell_transaction
-from api.streamtools import DataStream
+from api.streamtools import DataStream, shared_demultiplexer
+from data.shared import MarketDataPublisher
 from models.close_signals import DefaultCloseSignal
 from models.trends import MovingAVG
 from utils.technical import setup_logger
@@ -77,9 +77,14 @@ class TradingPool:
 
     Args:
         symbols (list): A list of symbols associated with the trading pool.
+        publish (bool, optional): Whether the quotes and candles of the
+            symbols are published in shared memory for model processes,
+            see MarketDataPublisher. Defaults to False.
 
     Attributes:
         symbols (list): A list of symbols associated with the trading pool.
+        publisher: The MarketDataPublisher of the symbols while the pool
+            runs with publish, otherwise None.
             risk_data: Risk management data - position size or value of
                 starting stoplos (functionality in plans)
             session_data: Data on the proper functioning of stock market
@@ -87,11 +92,40 @@ class TradingPool:
                 (functionality in plans)
     """
 
-    def __init__(self, symbols: list[str]) -> None:
+    def __init__(self, symbols: list[str], publish: bool = False) -> None:
         self.symbols = symbols
+        self.publish = publish
+        self.publisher: Optional[MarketDataPublisher] = None
         self.risk_data = None
         self.session_data = None
 
+    def start_publisher(self) -> None:
+        """
+        Publishes the messages of the symbols on the shared stream into
+        shared memory segments, read by MarketDataReader in other
+        processes.
+        """
+        self.publisher = MarketDataPublisher(self.symbols)
+        demux = shared_demultiplexer(get_session_pool("DEMO"))
+        self._publisher_listener = demux.subscribe_callback(
+            self.publisher.topics(), self.publisher.on_message
+        )
+        self._publisher_demux = demux
+        for symbol in self.symbols:
+            demux.subscriptions.acquire("getTickPrices", symbol)
+            demux.subscriptions.acquire("getCandles", symbol)
+
+    def stop_publisher(self) -> None:
+        if self.publisher is None:
+            return
+        demux = self._publisher_demux
+        demux.unsubscribe(self._publisher_listener)
+        for symbol in self.symbols:
+            demux.subscriptions.release("getTickPrices", symbol)
+            demux.subscriptions.release("getCandles", symbol)
+        self.publisher.close()
+        self.publisher = None
+
     def run_pool(self, risk_data, session_data):
         """
         Starts thread pools for all defined symbols.
@@ -106,6 +140,10 @@ class TradingPool:
 
         self.risk_data = risk_data
         self.session_data = session_data
+        # the sockets of the first positions are connected ahead
+        get_session_pool("DEMO").warm_up()
+        if self.publish:
+            self.start_publisher()
 
         # Starts thread pools
         slots = []
@@ -119,6 +157,7 @@ class TradingPool:
 
         for slot in slots:
             slot.join()
+        self.stop_publisher()
 
 
 class TradingSlot:
@@ -232,11 +271,7 @@ class Trader:
 
         # block holding the conclusion of the position until the data is
         # calculated by the purchasing model
-        while True:
-            if self.buy_model.signal == 20:
-                sleep(1)
-            else:
-                break
+        self.buy_model.signal_ready.wait()
 
         position_thread.start()
         buy_model_thread.join()
@@ -254,9 +289,13 @@ class Position:
             position (default: 0.01).
         close_signal (object, optional): The close signal for
             the position (default: DefaultCloseSignal()).
+        pool (SessionPool, optional): The session pool providing the
+            command scheduler for trading (default: process-wide DEMO pool).
 
     Attributes:
-        client: The client object for trading.
+        pool: The session pool providing the command scheduler.
+        client: The command scheduler of the pool, sending the orders
+            of the position ahead of queries and history downloads.
         order: atribut for order data
         cmd (int): The command for the position.
         symbol (str): The symbol associated with the position.
@@ -271,8 +310,10 @@ class Position:
         symbol: str,
         volume: float = 0.01,
         close_signal=DefaultCloseSignal(),
+        pool: Optional[SessionPool] = None,
     ):
-        self.client = XTBClient("DEMO")
+        self.pool = pool if pool is not None else get_session_pool("DEMO")
+        self.client: Optional[CommandScheduler] = None
         self.order: dict[str, Any] = {}
         self.cmd = cmd
         self.symbol = symbol
@@ -287,25 +328,38 @@ class Position:
         """
         Executes the position and logs the result.
         """
-        self.client.open_session()
+        self.client = self.pool.scheduler()
+        self.trade(self.client)
 
+    def trade(self, client: CommandScheduler):
+        """
+        Opens the position, waits for the close signal and saves the
+        closed transaction.
+        """
         if self.cmd == 0:
             self.order = buy_transaction(
-                client=self.client, symbol=self.symbol, volume=self.volume
+                client=client, symbol=self.symbol, volume=self.volume
             )
         if self.cmd == 1:
             self.order = sell_transaction(
-                client=self.client, symbol=self.symbol, volume=self.volume
+                client=client, symbol=self.symbol, volume=self.volume
             )
         # Combination of sl_start parameter
         # (percentage value of position rate)
         self.close_signal.set_params(
-            client=self.client, position_data=self.order, sl_start=0.5
+            client=client,
+            position_data=self.order,
+            sl_start=0.5,
+            demux=shared_demultiplexer(self.pool),
         )
-        self.close_signal.run()
+        try:
+            self.close_signal.run()
+        finally:
+            price_data = getattr(self.close_signal, "price_data", None)
+            if price_data is not None:
+                price_data.detach()
         profit = self.close_signal.closedata["profit"]
         self.transaction_db.add(self.close_signal.closedata)
         self.logging.info(
             f'{self.order.get("order_no", 0)} CLOSED WITH PROFIT: {profit}'
         )
-        self.client.close_session()
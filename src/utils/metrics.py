@@ -0,0 +1,273 @@
+"""
+The module includes the instrumentation of the API clients: latency
+histograms per command, transferred bytes, decode times and retries.
+"""
+
+import json
+from threading import Lock
+from typing import Any, Optional
+
+
+class LatencyHistogram:
+    """
+    Histogram of latencies with buckets of constant relative width, in the
+    manner of HDR histograms. Values are kept in microseconds, every power
+    of two is split into the same number of linear sub-buckets, so the
+    relative error of a percentile is below 1 / sub_buckets while
+    recording costs a few integer operations.
+
+    Args:
+        highest (float, optional): The highest trackable value in seconds,
+            larger values are clamped. Defaults to 3600.
+        sub_bucket_bits (int, optional): log2 of the number of linear
+            sub-buckets per power of two. Defaults to 7 (< 1% error).
+
+    Attributes:
+        count (int): The number of recorded values.
+        total (float): The sum of the recorded values in seconds.
+        min (float): The smallest recorded value in seconds.
+        max (float): The largest recorded value in seconds.
+    """
+
+    def __init__(
+        self, highest: float = 3600.0, sub_bucket_bits: int = 7
+    ) -> None:
+        self.highest = int(highest * 1e6)
+        self.sub_bucket_bits = sub_bucket_bits
+        self._half = 1 << (sub_bucket_bits - 1)
+        self.counts = [0] * (self._index(self.highest) + 1)
+        self.count: int = 0
+        self.total: float = 0.0
+        self.min: float = 0.0
+        self.max: float = 0.0
+
+    def _index(self, value: int) -> int:
+        magnitude = max(value.bit_length() - self.sub_bucket_bits, 0)
+        return magnitude * self._half + (value >> magnitude)
+
+    def _value(self, index: int) -> float:
+        """
+        Returns the middle of a bucket in seconds.
+        """
+        magnitude = max(index // self._half - 1, 0)
+        lowest = (index - magnitude * self._half) << magnitude
+        return (lowest + ((1 << magnitude) - 1) / 2) / 1e6
+
+    def record(self, seconds: float) -> None:
+        """
+        Records a latency in seconds.
+        """
+        value = min(max(int(seconds * 1e6), 0), self.highest)
+        self.counts[self._index(value)] += 1
+        if self.count == 0 or seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.count += 1
+        self.total += seconds
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        """
+        Adds the values recorded by a histogram of the same layout.
+        """
+        if len(other.counts) != len(self.counts):
+            raise ValueError("Histograms of different layouts")
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        if other.count:
+            self.min = (
+                other.min if not self.count else min(self.min, other.min)
+            )
+            self.max = max(self.max, other.max)
+        self.count += other.count
+        self.total += other.total
+
+    def percentile(self, percent: float) -> float:
+        """
+        Returns the value below which the given percent of the recorded
+        values fall, in seconds.
+        """
+        if not self.count:
+            return 0.0
+        rank = max(int(percent / 100 * self.count + 0.5), 1)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(max(self._value(index), self.min), self.max)
+        return self.max
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self) -> dict[str, float]:
+        """
+        Returns the count, the mean, the extremes and the usual
+        percentiles in seconds.
+        """
+        return {
+            "count": self.count,
+            "mean": self.mean(),
+            "min": self.min,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "p99.9": self.percentile(99.9),
+            "max": self.max,
+        }
+
+
+class ClientMetrics:
+    """
+    Metrics of the traffic of the API clients, shared by all clients of
+    the process unless a client is given its own. Per command it keeps
+    the latency histogram (from sending to the received response), the
+    decode time histogram, the numbers of calls, error responses and
+    retries and the bytes sent and received. Per stream command it keeps
+    the number of messages, the bytes received, the decode times and, for
+    streams read by a reactor, the tick-to-callback dispatch latency.
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self.commands: dict[str, dict[str, Any]] = {}
+        self.streams: dict[str, dict[str, Any]] = {}
+
+    @staticmethod
+    def _command_entry() -> dict[str, Any]:
+        return {
+            "latency": LatencyHistogram(),
+            "decode": LatencyHistogram(),
+            "calls": 0,
+            "errors": 0,
+            "retries": 0,
+            "bytes_out": 0,
+            "bytes_in": 0,
+        }
+
+    def record_command(
+        self,
+        command: str,
+        latency: float,
+        decode: float,
+        bytes_out: int,
+        bytes_in: int,
+        error: bool = False,
+    ) -> None:
+        """
+        Records a command and its response.
+
+        Args:
+            command (str): The name of the command.
+            latency (float): The seconds from sending to the response.
+            decode (float): The seconds spent decoding the response.
+            bytes_out (int): The size of the command.
+            bytes_in (int): The size of the response.
+            error (bool, optional): Whether the command failed.
+        """
+        with self._lock:
+            entry = self.commands.get(command)
+            if entry is None:
+                entry = self.commands[command] = self._command_entry()
+            entry["latency"].record(latency)
+            entry["decode"].record(decode)
+            entry["calls"] += 1
+            entry["bytes_out"] += bytes_out
+            entry["bytes_in"] += bytes_in
+            if error:
+                entry["errors"] += 1
+
+    def record_retry(self, command: str) -> None:
+        """
+        Counts a command sent again after a failed or incomplete attempt.
+        """
+        with self._lock:
+            entry = self.commands.get(command)
+            if entry is None:
+                entry = self.commands[command] = self._command_entry()
+            entry["retries"] += 1
+
+    def record_stream(
+        self,
+        command: str,
+        decode: float,
+        bytes_in: int,
+        dispatch: Optional[float] = None,
+    ) -> None:
+        """
+        Records a message received on a stream connection.
+
+        Args:
+            command (str): The command of the message, e.g. tickPrices.
+            decode (float): The seconds spent decoding the message.
+            bytes_in (int): The size of the message.
+            dispatch (float, optional): The seconds from the arrival of
+                the bytes to the call of the consumer callback, known for
+                streams read by a reactor.
+        """
+        with self._lock:
+            entry = self.streams.get(command)
+            if entry is None:
+                entry = self.streams[command] = {
+                    "decode": LatencyHistogram(),
+                    "dispatch": LatencyHistogram(),
+                    "messages": 0,
+                    "bytes_in": 0,
+                }
+            entry["decode"].record(decode)
+            if dispatch is not None:
+                entry["dispatch"].record(dispatch)
+            entry["messages"] += 1
+            entry["bytes_in"] += bytes_in
+
+    def snapshot(self) -> dict[str, Any]:
+        """
+        Returns the metrics with the histograms summarized.
+        """
+        with self._lock:
+            return {
+                "commands": {
+                    command: {
+                        key: (
+                            value.summary()
+                            if isinstance(value, LatencyHistogram)
+                            else value
+                        )
+                        for key, value in entry.items()
+                    }
+                    for command, entry in self.commands.items()
+                },
+                "streams": {
+                    command: {
+                        key: (
+                            value.summary()
+                            if isinstance(value, LatencyHistogram)
+                            else value
+                        )
+                        for key, value in entry.items()
+                    }
+                    for command, entry in self.streams.items()
+                },
+            }
+
+    def dump(self, path: Optional[str] = None) -> str:
+        """
+        Returns the snapshot as JSON and writes it to a file if given.
+
+        Args:
+            path (str, optional): The file to write the JSON to.
+        """
+        data = json.dumps(self.snapshot(), indent=2, sort_keys=True)
+        if path is not None:
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(data)
+        return data
+
+    def reset(self) -> None:
+        with self._lock:
+            self.commands = {}
+            self.streams = {}
+
+
+client_metrics = ClientMetrics()
@@ -0,0 +1,149 @@
+"""
+Function tests in the async_commands module.
+"""
+
+import asyncio
+from time import perf_counter
+from unittest.mock import AsyncMock, MagicMock
+import pytest
+import numpy as np
+from api.async_commands import (
+    get_trades,
+    get_margin,
+    buy_transaction,
+    close_position,
+    get_historical_candles,
+    get_server_time,
+)
+
+
+@pytest.fixture
+def trade_record():
+    return {
+        "close_price": 1.3256,
+        "close_time": 1272380937000,
+        "cmd": 0,
+        "open_price": 1.4,
+        "open_time": 1272380927000,
+        "order": 7497776,
+        "order2": 1234567,
+        "position": 1234567,
+        "profit": -2196.44,
+        "symbol": "EURUSD",
+        "volume": 0.10,
+    }
+
+
+def make_client(*responses):
+    client = MagicMock()
+    client.send_n_return = AsyncMock(side_effect=list(responses))
+    return client
+
+
+class Test_async_get_trades:
+    def test_get_trades_polls_until_order_is_reported(self, trade_record):
+        client = make_client(
+            {"status": True, "returnData": []},
+            {"status": True, "returnData": [trade_record]},
+        )
+        trade = asyncio.run(
+            get_trades(client=client, order_no=1234567, interval=0)
+        )
+        assert trade["position"] == 1234567
+        assert client.send_n_return.await_count == 2
+
+
+class Test_async_get_margin:
+    def test_get_margin_returns_float(self):
+        client = make_client({"status": True, "returnData": {"margin": 4}})
+        margin = asyncio.run(get_margin(client, "EURUSD", 0.1))
+        assert margin == 4.0
+
+
+class Test_async_buy_transaction:
+    def test_buy_transaction_returns_position(self, trade_record):
+        client = make_client(
+            {"status": True, "returnData": {"order": 1234567}},
+            {"status": True, "returnData": {"margin": 4}},
+            {"status": True, "returnData": [trade_record]},
+        )
+        position = asyncio.run(buy_transaction(client, "EURUSD", 0.1))
+        assert position["order_no"] == 1234567
+        assert position["margin"] == 4.0
+        assert position["transactions_data"]["symbol"] == "EURUSD"
+        sent = client.send_n_return.await_args_list[0][0][0]
+        assert sent["arguments"]["tradeTransInfo"]["cmd"] == 0
+
+    def test_buy_transaction_returns_empty_dict_on_failure(self):
+        client = make_client(
+            {"status": False, "returnData": {}},
+            {"status": True, "returnData": {"margin": 4}},
+        )
+        assert asyncio.run(buy_transaction(client, "EURUSD", 0.1)) == {}
+
+
+class Test_async_close_position:
+    def test_close_position_returns_closed_trade(self, trade_record):
+        client = make_client(
+            {"status": True, "returnData": {"order": 1}},
+            {"status": True, "returnData": {"time": 1272380940000}},
+            {"status": True, "returnData": [trade_record]},
+        )
+        closed = asyncio.run(
+            close_position(client, "EURUSD", 1234567, 0.1, 0, interval=0)
+        )
+        assert closed["profit"] == -2196.44
+        assert closed["order"] == 1234567
+
+    def test_close_position_waits_between_rejected_closes(self, trade_record):
+        client = make_client(
+            {"status": False, "returnData": {}},
+            {"status": False, "returnData": {}},
+            {"status": True, "returnData": {"order": 1}},
+            {"status": True, "returnData": {"time": 1272380940000}},
+            {"status": True, "returnData": [trade_record]},
+        )
+        start = perf_counter()
+        closed = asyncio.run(
+            close_position(client, "EURUSD", 1234567, 0.1, 0, interval=0.05)
+        )
+
+        assert closed["position"] == 1234567
+        # two retries of the close and one history query
+        assert perf_counter() - start >= 0.15
+        assert client.send_n_return.await_count == 5
+
+
+class Test_async_get_historical_candles:
+    def test_get_historical_candles_returns_array(self):
+        client = make_client(
+            {"status": True, "returnData": {"time": 1389362640000}},
+            {
+                "status": True,
+                "returnData": {
+                    "digits": 4,
+                    "rateInfos": [
+                        {
+                            "ctm": 1389362640000,
+                            "ctmString": "Jan 10, 2014 3:04:00 PM",
+                            "open": 4000.0,
+                            "close": 1.0,
+                            "high": 6.0,
+                            "low": 0.0,
+                            "vol": 0.0,
+                        }
+                    ],
+                },
+            },
+        )
+        candles = asyncio.run(get_historical_candles(client, "EURUSD", 1))
+        assert np.array_equal(
+            candles,
+            np.array([[1389362640000, 0.4, 0.4001, 0.4006, 0.4, 0.0]]),
+        )
+
+
+class Test_async_get_server_time:
+    def test_get_server_time_returns_int(self):
+        client = make_client({"status": True, "returnData": {"time": 5}})
+        assert asyncio.run(get_server_time(client)) == 5
@@ -0,0 +1,102 @@
+"""
+Check the ring buffers of the stream data.
+"""
+
+import numpy as np
+import pytest
+from data.buffers import TICK_DTYPE, TICK_FIELDS, RingBuffer, TickStore
+
+
+class Test_RingBuffer:
+    """
+    Tests of the appends, the windows and the queries of the ring buffer.
+    """
+
+    @pytest.fixture
+    def buffer(self):
+        return RingBuffer(TICK_DTYPE, capacity=8)
+
+    @staticmethod
+    def tick(i, symbol="EURUSD"):
+        data = {field: float(i) for field in TICK_FIELDS}
+        data.update({"symbol": symbol, "timestamp": 1000 + i * 10})
+        return data
+
+    def test_last_is_in_order_after_wrapping(self, buffer):
+        for i in range(20):
+            buffer.append_fields(self.tick(i))
+
+        assert len(buffer) == 8
+        assert buffer.count == 20
+        assert list(buffer.last()["ask"]) == list(range(12, 20))
+        assert list(buffer.last(3)["ask"]) == [17, 18, 19]
+        assert buffer.latest()["timestamp"] == 1190
+
+    def test_windows_are_views_without_copies(self, buffer):
+        for i in range(11):
+            buffer.append_fields(self.tick(i))
+
+        window = buffer.last(4)
+
+        assert window.base is buffer.last().base
+        assert not window.flags.owndata
+        assert window.flags.c_contiguous
+
+    def test_since_returns_ticks_from_timestamp(self, buffer):
+        for i in range(12):
+            buffer.append_fields(self.tick(i))
+
+        assert list(buffer.since(1095)["ask"]) == [10, 11]
+        assert list(buffer.since(1110)["ask"]) == [11]
+        assert len(buffer.since(0)) == 8
+        assert len(buffer.since(2000)) == 0
+
+    def test_values_are_rows_of_fields(self, buffer):
+        buffer.append_fields(self.tick(3))
+
+        rows = buffer.values(1)
+
+        assert rows.shape == (1, len(TICK_FIELDS))
+        assert rows[0, TICK_FIELDS.index("timestamp")] == 1030
+        assert buffer.values(5).shape == (1, len(TICK_FIELDS))
+
+    def test_empty_buffer(self, buffer):
+        assert buffer.latest() is None
+        assert len(buffer.last(5)) == 0
+        assert buffer.values(1).shape == (0, len(TICK_FIELDS))
+
+    def test_message_is_read_without_modification(self, buffer):
+        data = self.tick(1)
+        copied = dict(data)
+
+        buffer.append_fields(data)
+
+        assert data == copied
+
+    def test_missing_field_raises(self, buffer):
+        data = self.tick(1)
+        del data["bid"]
+
+        with pytest.raises(KeyError):
+            buffer.append_fields(data)
+
+    def test_clear_and_invalid_arguments(self, buffer):
+        buffer.append_fields(self.tick(1))
+        buffer.clear()
+
+        assert len(buffer) == 0
+        with pytest.raises(ValueError):
+            RingBuffer(TICK_DTYPE, capacity=0)
+        with pytest.raises(ValueError):
+            RingBuffer(np.dtype([("ctm", np.float64)]))
+
+    def test_tick_store_keeps_buffer_per_symbol(self):
+        store = TickStore(capacity=4)
+        for i in range(6):
+            store.append(self.tick(i, "EURUSD"))
+        store.append(self.tick(9, "USDJPY"))
+
+        assert store.symbols() == ["EURUSD", "USDJPY"]
+        assert list(store["EURUSD"].last()["ask"]) == [2, 3, 4, 5]
+        assert len(store["USDJPY"]) == 1
+        assert "GBPUSD" not in store
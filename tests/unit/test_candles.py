@@ -0,0 +1,217 @@
+"""
+Check the aggregation of candles into higher timeframes.
+"""
+
+import numpy as np
+import pytest
+from data.candles import CANDLE_FIELDS, MINUTE, BarBuilder, CandleAggregator
+
+# 10:00 UTC, the start of an interval of every timeframe up to 1 hour
+START = 1700042400000
+
+
+def candle(minute, close=None):
+    close = 1.0 + minute if close is None else close
+    return (START + minute * MINUTE, close - 0.5, close, close + 1, 0.5, 1.0)
+
+
+class Test_CandleAggregator:
+    """
+    Tests of the clock alignment, the events and the history of the
+    candle aggregator.
+    """
+
+    @pytest.fixture
+    def aggregator(self):
+        return CandleAggregator((5, 15, 60), capacity=16)
+
+    def test_bars_are_aligned_on_the_clock(self, aggregator):
+        for minute in range(2, 17):
+            aggregator.add(candle(minute))
+
+        bars = aggregator.bars(5)
+        assert list(bars["ctm"]) == [
+            START + minute * MINUTE for minute in (0, 5, 10)
+        ]
+        assert list(bars["vol"]) == [3.0, 5.0, 5.0]
+        assert bars[0]["open"] == 2.5
+        assert bars[0]["close"] == 5.0
+        assert bars[0]["high"] == 6.0
+        assert aggregator.last_closed(15)["vol"] == 13.0
+        assert aggregator.forming(5)[0] == START + 15 * MINUTE
+        assert aggregator.forming(60)[5] == 15.0
+
+    def test_listeners_get_closed_bars(self, aggregator):
+        events = []
+        aggregator.add_listener(
+            lambda timeframe, bar: events.append((timeframe, bar["ctm"]))
+        )
+
+        for minute in range(15):
+            aggregator.add(candle(minute))
+
+        assert events[-2:] == [(5, START + 10 * MINUTE), (15, START)]
+        assert [event for event in events if event[0] == 1] == [
+            (1, START + minute * MINUTE) for minute in range(15)
+        ]
+        assert aggregator.metrics["closed"] == len(events) == 19
+
+    def test_missed_minutes_close_bar_on_next_interval(self, aggregator):
+        aggregator.add(candle(0))
+        closed = aggregator.add(candle(12))
+
+        assert [(timeframe, bar["ctm"]) for timeframe, bar in closed] == [
+            (1, START + 12 * MINUTE),
+            (5, START),
+        ]
+        assert aggregator.forming(5)[0] == START + 10 * MINUTE
+
+    def test_duplicate_and_late_candles_are_ignored(self, aggregator):
+        aggregator.add(candle(3))
+        aggregator.add(candle(3))
+        aggregator.add(candle(1))
+
+        assert aggregator.metrics["ignored"] == 2
+        assert aggregator.forming(5)[5] == 1.0
+
+    def test_update_reads_message_by_key(self, aggregator):
+        data = dict(zip(CANDLE_FIELDS, candle(4)))
+        data.update({"symbol": "EURUSD", "ctmString": "", "quoteId": 2})
+        copied = dict(data)
+
+        aggregator.update(data)
+
+        assert data == copied
+        assert aggregator.values(5).shape == (1, len(CANDLE_FIELDS))
+        assert aggregator.values(1)[0, 2] == data["close"]
+
+    def test_load_merges_history_before_streamed_candles(self, aggregator):
+        events = []
+        aggregator.add_listener(lambda *event: events.append(event))
+        aggregator.add(candle(6, close=100.0))
+
+        added = aggregator.load(np.array([candle(m) for m in range(7)]))
+
+        assert added == 6
+        assert len(events) == 1
+        assert list(aggregator.bars(1)["ctm"])[-1] == START + 6 * MINUTE
+        assert aggregator.last_closed(1)["close"] == 100.0
+        assert aggregator.last_closed(5)["vol"] == 5.0
+        assert aggregator.forming(5)[2] == 100.0
+        assert aggregator.metrics["loaded"] == 6
+        assert aggregator.metrics["candles"] == 1
+
+    def test_gaps_of_the_input_are_reported(self, aggregator):
+        gaps = []
+        aggregator.add_gap_listener(lambda *gap: gaps.append(gap))
+        for minute in (0, 1, 4, 5):
+            aggregator.add(candle(minute))
+
+        assert gaps == [(START + 2 * MINUTE, START + 4 * MINUTE)]
+        assert aggregator.metrics["gaps"] == 1
+
+        aggregator.load([candle(2), candle(3), candle(7), candle(9)])
+        assert len(gaps) == 1
+        assert aggregator.metrics["gaps"] == 1
+        assert list(aggregator.bars(1)["ctm"]) == [
+            START + minute * MINUTE for minute in (0, 1, 2, 3, 4, 5, 7, 9)
+        ]
+
+    def test_history_is_bounded(self, aggregator):
+        for minute in range(40):
+            aggregator.add(candle(minute))
+
+        assert len(aggregator.bars(1)) == 16
+        assert aggregator.bars(1)[0]["ctm"] == START + 24 * MINUTE
+
+    def test_offset_shifts_day_boundaries(self):
+        # days from 23:00 UTC, the midnight of CET
+        aggregator = CandleAggregator((1440,), offset=-60 * MINUTE)
+        aggregator.add(candle(-11 * 60 - 1))
+        aggregator.add(candle(-11 * 60 + 1))
+
+        assert aggregator.last_closed(1440)["ctm"] == START - 35 * 60 * MINUTE
+        assert aggregator.forming(1440)[0] == START - 11 * 60 * MINUTE
+
+    def test_timeframes_must_be_multiples_of_base(self):
+        with pytest.raises(ValueError):
+            CandleAggregator((5, 7), base=5)
+
+
+class Test_BarBuilder:
+    """
+    Tests of the time, tick and volume bars built from ticks.
+    """
+
+    @staticmethod
+    def feed(builder, ticks):
+        return [builder.add(*tick) for tick in ticks]
+
+    def test_time_bars_close_on_later_interval(self):
+        builder = BarBuilder("time", 5)
+        closed = self.feed(
+            builder,
+            [
+                (START + 1000, 1.0, 2.0),
+                (START + 3000, 3.0, 1.0),
+                (START + 4999, 0.5, 1.0),
+                (START + 12000, 2.0, 1.0),
+            ],
+        )
+
+        assert closed[:3] == [None, None, None]
+        assert tuple(closed[3]) == (START, 1.0, 0.5, 3.0, 0.5, 4.0)
+        assert builder.forming()[0] == START + 10000
+        assert builder.values().shape == (1, len(CANDLE_FIELDS))
+
+    def test_late_tick_of_time_bar_is_ignored(self):
+        builder = BarBuilder("time", 1)
+        self.feed(builder, [(START + 2500, 1.0), (START + 1500, 9.0)])
+
+        assert builder.metrics["ignored"] == 1
+        assert builder.forming()[3] == 1.0
+
+    def test_tick_bars_hold_size_ticks(self):
+        builder = BarBuilder("ticks", 3)
+        self.feed(builder, [(START + i, float(i)) for i in range(7)])
+
+        bars = builder.bars()
+        assert list(bars["ctm"]) == [START, START + 3]
+        assert list(bars["close"]) == [2.0, 5.0]
+        assert builder.forming()[1] == 6.0
+
+    def test_volume_bars_close_at_size(self):
+        builder = BarBuilder("volume", 10)
+        self.feed(
+            builder,
+            [
+                (START + i, 1.0 + i, volume)
+                for i, volume in enumerate([4, 5, 2, 9])
+            ],
+        )
+
+        assert list(builder.bars()["vol"]) == [11.0]
+        assert builder.forming()[5] == 9.0
+
+    def test_update_reads_tick_message_by_key(self):
+        builder = BarBuilder("ticks", 1)
+        listened = []
+        builder.add_listener(lambda size, bar: listened.append(bar["close"]))
+        data = {"timestamp": START, "bid": 1.5, "bidVolume": 3, "ask": 1.6}
+
+        builder.update(data)
+
+        assert listened == [1.5]
+        assert builder.last_closed()["vol"] == 3.0
+
+    def test_memory_is_capped(self):
+        builder = BarBuilder("ticks", 1, capacity=4)
+        self.feed(builder, [(START + i, 1.0) for i in range(100)])
+
+        assert len(builder.bars()) == 4
+        assert builder.metrics["bars"] == 100
+
+    @pytest.mark.parametrize("kind, size", [("range", 1), ("time", 0)])
+    def test_invalid_bars(self, kind, size):
+        with pytest.raises(ValueError):
+            BarBuilder(kind, size)
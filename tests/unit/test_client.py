@@ -2,14 +2,34 @@
 Check the XTBClient of XTB API is valid.
 """
 
+import asyncio
 import json
+import socket
 import ssl
-from time import monotonic_ns
+import threading
+from concurrent.futures import Future
+from time import monotonic, monotonic_ns, sleep
 from typing import Any
+from unittest.mock import AsyncMock, MagicMock, patch
 import pytest
 import numpy as np
 from settings import XTBUserDEMO
-from api.client import XTBClient, session_simulator, stream_session_simulator
+from api.client import (
+    XTBClient,
+    AsyncXTBClient,
+    ConnectionFactory,
+    MessageFramer,
+    MultiplexedChannel,
+    SessionPool,
+    CommandScheduler,
+    TokenBucket,
+    KeepAliveManager,
+    ReconnectEngine,
+    Reactor,
+    session_simulator,
+    stream_session_simulator,
+)
+from api.streamtools import StreamDemultiplexer
 
 
 class Test_XTBClient:
@@ -132,6 +152,487 @@ class Test_XTBClient:
         )  # statuses should be different
 
 
+class Test_MessageFramer:
+    """
+    Tests of the incremental decoder of frames sent by the API.
+    """
+
+    @pytest.fixture
+    def tick_msgs(self):
+        return [
+            {"command": "tickPrices", "data": {"symbol": "EURUSD", "ask": i}}
+            for i in range(3)
+        ]
+
+    @pytest.fixture
+    def payload(self, tick_msgs):
+        return b"".join(
+            json.dumps(msg).encode("utf-8") + b"\n\n" for msg in tick_msgs
+        )
+
+    @staticmethod
+    def received(payload):
+        """
+        Returns a recv_into substitute writing payload to the buffer
+        """
+
+        def recv_into(buffer, nbytes=0):
+            buffer[: len(payload)] = payload
+            return len(payload)
+
+        return recv_into
+
+    def test_framer_returns_all_messages_from_one_chunk(
+        self, tick_msgs, payload
+    ):
+        """
+        Several messages delivered in one segment are all returned
+        """
+        framer = MessageFramer()
+        framer.feed(payload)
+        assert list(framer.messages()) == tick_msgs
+        assert len(framer) == 0
+
+    def test_framer_joins_message_split_between_chunks(
+        self, tick_msgs, payload
+    ):
+        """
+        Messages are returned only when they are complete, also when the
+        terminator itself is split between chunks
+        """
+        framer = MessageFramer()
+        received = []
+        for i in range(len(payload)):
+            framer.feed(payload[i:][:1])
+            received.extend(framer.messages())
+        assert received == tick_msgs
+
+    def test_framer_keeps_leftover_for_next_read(self, tick_msgs, payload):
+        """
+        Bytes after the first complete frame are not dropped
+        """
+        framer = MessageFramer()
+        framer.feed(payload[:-5])
+        assert json.loads(framer.next_frame()) == tick_msgs[0]
+        assert json.loads(framer.next_frame()) == tick_msgs[1]
+        assert framer.next_frame() is None
+        framer.feed(payload[-5:])
+        assert json.loads(framer.next_frame()) == tick_msgs[2]
+
+    def test_framer_receives_into_reused_buffer(self, tick_msgs, payload):
+        """
+        Frames are read with recv_into and only complete frames are
+        allocated
+        """
+        ours, theirs = socket.socketpair()
+        framer = MessageFramer()
+        received = []
+        with ours, theirs:
+            for rounds in range(1, 51):
+                theirs.sendall(payload[:100])
+                framer.recv_into(ours)
+                received.extend(framer.messages())
+                theirs.sendall(payload[100:])
+                while len(received) < rounds * len(tick_msgs):
+                    framer.recv_into(ours)
+                    received.extend(framer.messages())
+        assert received == tick_msgs * 50
+        assert framer.stats()["allocations"] == len(received)
+
+    def test_framer_compacts_and_grows_small_buffer(
+        self, tick_msgs, payload
+    ):
+        """
+        A frame larger than the buffer grows it, unread bytes are moved
+        to its front
+        """
+        framer = MessageFramer(chunk_size=8, capacity=64)
+        received = []
+        for i in range(0, len(payload), 7):
+            framer.feed(payload[i:][:7])
+            received.extend(framer.messages())
+        assert received == tick_msgs
+        assert framer.metrics["grows"] > 0
+        assert framer.metrics["compactions"] > 0
+
+    def test_stream_read_returns_messages_from_one_recv(
+        self, tick_msgs, payload
+    ):
+        """
+        The client reads the socket once for messages received together
+        """
+        client = XTBClient("DEMO")
+        client.socket_stream_connection = MagicMock()
+        client.socket_stream_connection.recv_into.side_effect = (
+            self.received(payload)
+        )
+        assert [client.stream_read() for _ in tick_msgs] == tick_msgs
+        assert client.socket_stream_connection.recv_into.call_count == 1
+
+    def test_send_n_return_raises_when_connection_is_closed(self):
+        """
+        An empty read means the server closed the connection
+        """
+        client = XTBClient("DEMO")
+        client.socket_connection = MagicMock()
+        client.socket_connection.send.side_effect = lambda data: len(data)
+        client.socket_connection.recv_into.return_value = 0
+        with pytest.raises(ConnectionError):
+            client.send_n_return({"command": "getVersion"})
+
+
+class Test_AsyncXTBClient:
+    """
+    Tests of the asyncio client with the streams of the connection
+    replaced by in-memory ones.
+    """
+
+    @staticmethod
+    def make_streams(*responses):
+        reader = asyncio.StreamReader()
+        for response in responses:
+            reader.feed_data(json.dumps(response).encode("utf-8") + b"\n\n")
+        writer = MagicMock()
+        writer.drain = AsyncMock()
+        writer.wait_closed = AsyncMock()
+        return reader, writer
+
+    def test_async_client_default_attributes(self):
+        client = AsyncXTBClient("DEMO")
+        assert client.user.__class__ is XTBUserDEMO
+        assert client.login_status is False
+        assert client.connection is False
+        assert client.connection_stream is False
+        assert isinstance(client.ssl_context, ssl.SSLContext)
+
+    def test_async_client_open_session_logs_in(self):
+        """
+        Session opening connects both ports and sets the stream session id
+        """
+        login_msg = {"status": True, "streamSessionId": "abc"}
+
+        async def scenario():
+            client = AsyncXTBClient("DEMO")
+            main = self.make_streams(login_msg)
+            stream = self.make_streams()
+            with patch(
+                "asyncio.open_connection",
+                AsyncMock(side_effect=[main, stream]),
+            ):
+                await client.open_session()
+            return client, main[1]
+
+        client, writer = asyncio.run(scenario())
+        assert client.connection is True
+        assert client.connection_stream is True
+        assert client.login_status is True
+        assert client.stream_sesion_id == "abc"
+        assert json.loads(writer.write.call_args[0][0])["command"] == "login"
+
+    def test_async_client_iterates_stream_messages(self):
+        """
+        The client is an async iterator over the stream messages
+        """
+        msgs = [{"command": "tickPrices", "data": {"ask": i}} for i in range(3)]
+
+        async def scenario():
+            client = AsyncXTBClient("DEMO")
+            client.stream_reader, client.stream_writer = self.make_streams(
+                *msgs
+            )
+            client.connection_stream = True
+            received = []
+            async for message in client:
+                received.append(message)
+                if len(received) == len(msgs):
+                    break
+            return received
+
+        assert asyncio.run(scenario()) == msgs
+
+    def test_async_send_n_return_serializes_concurrent_requests(self):
+        """
+        Concurrent callers receive the responses in request order
+        """
+
+        async def scenario():
+            client = AsyncXTBClient("DEMO")
+            client.reader, client.writer = self.make_streams(
+                {"status": True, "returnData": 1},
+                {"status": True, "returnData": 2},
+            )
+            return await asyncio.gather(
+                client.send_n_return({"command": "getVersion"}),
+                client.send_n_return({"command": "getServerTime"}),
+            )
+
+        first, second = asyncio.run(scenario())
+        assert first["returnData"] == 1
+        assert second["returnData"] == 2
+
+
+class Test_SessionPool:
+    """
+    Tests of the pool of logged-in sessions with mocked clients.
+    """
+
+    @staticmethod
+    def client_factory(mode):
+        client = MagicMock()
+        client.connection = False
+        client.login_status = False
+        client.connection_stream = False
+
+        def connect():
+            client.connection = True
+
+        def login():
+            client.login_status = True
+            client.stream_sesion_id = f"stream-{id(client)}"
+
+        client.connect.side_effect = connect
+        client.login.side_effect = login
+        return client
+
+    @pytest.fixture
+    def pool(self):
+        return SessionPool(
+            mode="DEMO", max_size=2, client_factory=self.client_factory
+        )
+
+    def test_pool_leases_logged_in_client(self, pool):
+        with pool.lease() as client:
+            assert client.login_status is True
+            assert pool.stats()["leased"] == 1
+        assert pool.stats()["idle"] == 1
+
+    def test_pool_reuses_released_session_without_login(self, pool):
+        with pool.lease() as first:
+            pass
+        with pool.lease() as second:
+            pass
+        assert first is second
+        assert pool.stats()["logins"] == 1
+        assert pool.stats()["reused"] == 1
+
+    def test_pool_respects_max_size(self, pool):
+        first = pool.acquire()
+        second = pool.acquire()
+        with pytest.raises(TimeoutError):
+            pool.acquire(timeout=0.01)
+        pool.release(first)
+        assert pool.acquire(timeout=0.01) is first
+        pool.release(second)
+        assert pool.stats()["size"] == 2
+
+    def test_pool_replaces_session_failing_health_check(self, pool):
+        pool.health_check_interval = 0
+        client = pool.acquire()
+        pool.release(client)
+        client.send_n_return.side_effect = ConnectionError
+        replacement = pool.acquire()
+        assert replacement is not client
+        assert pool.stats()["failed_health_checks"] == 1
+        assert pool.stats()["discarded"] == 1
+
+    def test_pool_discards_client_after_connection_error(self, pool):
+        with pytest.raises(ConnectionError):
+            with pool.lease():
+                raise ConnectionError
+        assert pool.stats()["size"] == 0
+
+    def test_attach_stream_uses_stream_session_of_pool(self, pool):
+        stream_client = self.client_factory("DEMO")
+        pool.attach_stream(stream_client)
+        stream_client.connect_stream.assert_called_once()
+        stream_client.login.assert_not_called()
+        assert stream_client.stream_sesion_id == pool.stream_session_id()
+        assert pool.stats()["logins"] == 1
+
+
+class Test_MultiplexedChannel:
+    """
+    Tests of the customTag routing on a shared main connection. The server
+    side of a socket pair plays the API.
+    """
+
+    @pytest.fixture
+    def connection(self):
+        client_sock, server_sock = socket.socketpair()
+        client = XTBClient("DEMO")
+        client.socket_connection = client_sock
+        client.connection = True
+        yield client, server_sock
+        client_sock.close()
+        server_sock.close()
+
+    @staticmethod
+    def read_requests(server_sock, count):
+        decoder = json.JSONDecoder()
+        received, requests = "", []
+        while len(requests) < count:
+            received += server_sock.recv(4096).decode()
+            while received:
+                try:
+                    request, size = decoder.raw_decode(received)
+                except ValueError:
+                    break
+                requests.append(request)
+                received = received[size:]
+        return requests
+
+    @staticmethod
+    def respond(server_sock, request, data):
+        response = {
+            "status": True,
+            "returnData": data,
+            "customTag": request["customTag"],
+        }
+        server_sock.sendall(json.dumps(response).encode("utf-8") + b"\n\n")
+
+    def test_channel_routes_responses_out_of_order(self, connection):
+        client, server_sock = connection
+        with MultiplexedChannel(client) as channel:
+            version = channel.submit({"command": "getVersion"})
+            time = channel.submit({"command": "getServerTime"})
+            first, second = self.read_requests(server_sock, 2)
+            assert first["customTag"] != second["customTag"]
+            self.respond(server_sock, second, "time")
+            self.respond(server_sock, first, "version")
+            assert version.result(timeout=5)["returnData"] == "version"
+            assert time.result(timeout=5)["returnData"] == "time"
+            assert channel.in_flight() == 0
+
+    def test_channel_does_not_modify_packet(self, connection):
+        client, server_sock = connection
+        packet = {"command": "getVersion"}
+        with MultiplexedChannel(client) as channel:
+            future = channel.submit(packet)
+            self.respond(server_sock, *self.read_requests(server_sock, 1), 1)
+            future.result(timeout=5)
+        assert packet == {"command": "getVersion"}
+
+    def test_stopped_channel_leaves_responses_to_the_client(self, connection):
+        client, server_sock = connection
+        channel = MultiplexedChannel(client).start()
+        reader = channel._reader
+        channel.stop()
+
+        assert not reader.is_alive()
+        server_sock.sendall(b'{"status": true, "returnData": 1}\n\n')
+        response, _, _ = client.receive(client.socket_connection, client.framer)
+        assert response == {"status": True, "returnData": 1}
+
+    def test_channel_fails_pending_commands_when_connection_closes(
+        self, connection
+    ):
+        client, server_sock = connection
+        with MultiplexedChannel(client) as channel:
+            future = channel.submit({"command": "getVersion"})
+            server_sock.close()
+            with pytest.raises(ConnectionError):
+                future.result(timeout=5)
+
+
+class Test_CommandScheduler:
+    """
+    Tests of the priority lanes and the rate limit of the commands sent
+    through one connection.
+    """
+
+    @pytest.fixture
+    def close_packet(self):
+        return {
+            "command": "tradeTransaction",
+            "arguments": {"tradeTransInfo": {"type": 2}},
+        }
+
+    @pytest.fixture
+    def open_packet(self):
+        return {
+            "command": "tradeTransaction",
+            "arguments": {"tradeTransInfo": {"type": 0}},
+        }
+
+    @pytest.fixture
+    def target(self):
+        target = MagicMock(spec=["send_n_return"])
+        target.send_n_return.side_effect = lambda packet: {
+            "status": True,
+            "returnData": packet["command"],
+        }
+        return target
+
+    def test_lane_of_commands(self, close_packet, open_packet):
+        assert CommandScheduler.lane_of(close_packet) == "close"
+        assert CommandScheduler.lane_of(open_packet) == "open"
+        assert CommandScheduler.lane_of({"command": "getTrades"}) == "query"
+        assert (
+            CommandScheduler.lane_of({"command": "getChartLastRequest"})
+            == "history"
+        )
+
+    def test_scheduler_sends_closes_before_opens_queries_and_history(
+        self, target, close_packet, open_packet
+    ):
+        scheduler = CommandScheduler(target, TokenBucket(rate=1000))
+        scheduler.running = True
+        futures = [
+            scheduler.submit({"command": "getChartLastRequest"}),
+            scheduler.submit({"command": "getTrades"}),
+            scheduler.submit(open_packet),
+            scheduler.submit(close_packet),
+        ]
+        assert scheduler.stats()["history"]["depth"] == 1
+        scheduler.running = False
+        scheduler.start()
+        for future in futures:
+            future.result(timeout=5)
+        scheduler.stop()
+        sent = [
+            CommandScheduler.lane_of(call[0][0])
+            for call in target.send_n_return.call_args_list
+        ]
+        assert sent == ["close", "open", "query", "history"]
+
+    def test_scheduler_respects_rate_limit(self, target):
+        scheduler = CommandScheduler(target, TokenBucket(rate=20)).start()
+        start = monotonic()
+        for _ in range(3):
+            scheduler.send_n_return({"command": "getServerTime"}, timeout=5)
+        scheduler.stop()
+        # the first command uses the stored token, two wait 50 ms each
+        assert monotonic() - start >= 0.09
+
+    def test_scheduler_reports_wait_time(self, target):
+        scheduler = CommandScheduler(target, TokenBucket(rate=1000)).start()
+        scheduler.send_n_return({"command": "getServerTime"}, timeout=5)
+        scheduler.stop()
+        stats = scheduler.stats()["query"]
+        assert stats["dispatched"] == 1
+        assert stats["depth"] == 0
+        assert stats["mean_wait_time"] >= 0
+
+    def test_scheduler_pipelines_through_channel(self):
+        channel = MagicMock(spec=["submit", "running"])
+        response: Future = Future()
+        response.set_result({"status": True})
+        channel.submit.return_value = response
+        scheduler = CommandScheduler(channel, TokenBucket(rate=1000)).start()
+        assert scheduler.send_n_return({"command": "ping"}, timeout=5) == {
+            "status": True
+        }
+        scheduler.stop()
+
+    def test_stopped_scheduler_fails_queued_commands(self, target):
+        scheduler = CommandScheduler(target)
+        scheduler.running = True
+        future = scheduler.submit({"command": "ping"})
+        scheduler.stop()
+        with pytest.raises(ConnectionError):
+            future.result(timeout=1)
+
+
 @pytest.mark.skip(reason="Features to be rebuilt")
 class Test_Decorators:
     # A class of validation tests for decorators to test streaming processes
@@ -233,3 +734,546 @@ class Test_Decorators:
         assert time_of_runing_code >= time_run
         # stream execution time should be longer than
         # declared in the decorator
+
+
+class Test_KeepAliveManager:
+    """
+    Tests of the pings of the main connections and of the watch of the
+    stream connections.
+    """
+
+    @pytest.fixture
+    def manager(self):
+        manager = KeepAliveManager(
+            interval=0.02, timeout=0.05, max_missed=2, stream_timeout=0.1
+        )
+        yield manager.start()
+        manager.stop()
+
+    @staticmethod
+    def wait_for(condition, timeout=2.0):
+        deadline = monotonic() + timeout
+        while not condition():
+            assert monotonic() < deadline
+            sleep(0.005)
+
+    def test_pings_client_and_measures_round_trip(self, manager):
+        client = MagicMock(spec=["send_n_return"])
+        client.send_n_return.return_value = {"status": True}
+        manager.register(client, "main")
+
+        self.wait_for(lambda: manager.stats()["main"]["pongs"] >= 3)
+
+        stats = manager.stats()["main"]
+        client.send_n_return.assert_called_with({"command": "ping"})
+        assert stats["stale"] is False
+        assert 0 < stats["mean_rtt"] <= stats["max_rtt"]
+
+    def test_pings_channel_through_submit(self, manager):
+        channel = MagicMock(spec=["submit"])
+
+        def submit(packet):
+            future = Future()
+            future.set_result({"status": True})
+            return future
+
+        channel.submit.side_effect = submit
+        manager.register(channel, "channel")
+
+        self.wait_for(lambda: manager.stats()["channel"]["pongs"] >= 1)
+
+    def test_missing_pongs_mark_connection_as_stale(self, manager):
+        channel = MagicMock(spec=["submit"])
+        channel.submit.side_effect = lambda packet: Future()
+        manager.register(channel)
+
+        self.wait_for(lambda: manager.is_stale(channel))
+
+        name = f"MagicMock-{id(channel):x}"
+        assert manager.stats()[name]["missed"] >= 2
+
+    def test_pong_after_stale_recovers_connection(self, manager):
+        answering = []
+        channel = MagicMock(spec=["submit"])
+        channel.submit.side_effect = lambda packet: (
+            _done({"status": True}) if answering else Future()
+        )
+        manager.register(channel)
+
+        self.wait_for(lambda: manager.is_stale(channel))
+        answering.append(True)
+        self.wait_for(lambda: not manager.is_stale(channel))
+
+    def test_silent_stream_is_stale(self, manager):
+        client = MagicMock()
+        client.stream_sesion_id = "abc"
+        client.last_stream_message = monotonic()
+        manager.register_stream(client, "stream")
+
+        client.stream_send.assert_called_once_with(
+            {"command": "getKeepAlive", "streamSessionId": "abc"}
+        )
+        assert manager.is_stale(client) is False
+        self.wait_for(lambda: manager.is_stale(client))
+        client.last_stream_message = monotonic()
+        self.wait_for(lambda: not manager.is_stale(client))
+
+    def test_unregistered_connection_is_not_pinged(self, manager):
+        client = MagicMock(spec=["send_n_return"])
+        manager.register(client)
+        manager.unregister(client)
+        sleep(0.05)
+
+        client.send_n_return.assert_not_called()
+        assert manager.is_stale(client) is False
+
+    def test_pool_recovers_stale_scheduler_session(self):
+        keep_alive = MagicMock()
+        keep_alive.is_stale.return_value = False
+        pool = SessionPool(
+            max_size=2,
+            client_factory=Test_SessionPool.client_factory,
+            keep_alive=keep_alive,
+        )
+        with patch("api.client.MultiplexedChannel") as channel_class:
+            first, second = MagicMock(), MagicMock()
+            first.running, second.running = True, True
+            second.submit.return_value = _done({"status": True})
+            channel_class.return_value.start.side_effect = [first, second]
+            scheduler = pool.scheduler()
+            on_stale = keep_alive.register.call_args.kwargs["on_stale"]
+
+            first.stop.side_effect = lambda: setattr(first, "running", False)
+            on_stale()
+            response = scheduler.send_n_return({"command": "ping"}, timeout=5)
+        pool.close()
+
+        assert response == {"status": True}
+        assert scheduler.target is second
+        assert pool.stats()["stale_replaced"] == 1
+        assert pool.reconnect_engine.metrics["recoveries"] == 1
+        keep_alive.unregister.assert_any_call(scheduler)
+
+
+def _done(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+class Test_Reconnect:
+    """
+    Tests of the recovery of lost connections with the local stand-in of
+    the API.
+    """
+
+    @pytest.fixture
+    def client(self, xtb_standin):
+        if xtb_standin is None:
+            pytest.skip("Needs the local stand-in of the API")
+        client = XTBClient("DEMO")
+        client.reconnect_engine.base_delay = 0.01
+        client.open_session()
+        yield client
+        client.disconnect_stream()
+        client.disconnect()
+
+    def test_engine_delays_grow_with_jitter(self):
+        engine = ReconnectEngine(
+            base_delay=1.0, max_delay=8.0, factor=2.0, jitter=0.5
+        )
+
+        delays = [engine.delay(attempt) for attempt in range(6)]
+
+        for attempt, delay in enumerate(delays):
+            full = min(8.0, 2.0**attempt)
+            assert full / 2 <= delay <= full
+
+    def test_engine_retries_until_recovered(self):
+        engine = ReconnectEngine(base_delay=0.001, max_attempts=5)
+        attempts = iter([OSError("down"), ConnectionError("down"), None])
+
+        def recover():
+            error = next(attempts)
+            if error is not None:
+                raise error
+            return "up"
+
+        assert engine.run(recover) == "up"
+        stats = engine.stats()
+        assert stats["attempts"] == 3
+        assert stats["failed_attempts"] == 2
+        assert stats["recoveries"] == 1
+        assert stats["mean_time_to_recover"] == stats["time_to_recover"] > 0
+
+    def test_engine_gives_up_with_connection_error(self):
+        engine = ReconnectEngine(base_delay=0.001, max_attempts=3)
+
+        with pytest.raises(ConnectionError):
+            engine.run(MagicMock(side_effect=OSError("down")))
+        assert engine.metrics["given_up"] == 1
+
+    def test_connect_raises_instead_of_exiting(self):
+        client = XTBClient("DEMO")
+        client.user.main_port = 1
+
+        with pytest.raises(ConnectionError):
+            client.connect()
+        assert client.connection is False
+
+    def test_stream_send_tracks_subscriptions(self):
+        client = XTBClient("DEMO")
+        client.socket_stream_connection = MagicMock()
+        client.stream_send({"command": "getTickPrices", "symbol": "EURUSD"})
+        client.stream_send({"command": "getBalance"})
+        client.stream_send({"command": "stopTickPrices", "symbol": "EURUSD"})
+
+        assert list(client.subscriptions) == [("getBalance", None)]
+
+    def test_reconnect_restores_session_and_subscriptions(
+        self, xtb_standin, client
+    ):
+        client.stream_send(
+            {
+                "command": "getTickPrices",
+                "streamSessionId": client.stream_sesion_id,
+                "symbol": "EURUSD",
+            }
+        )
+        client.stream_read()
+        xtb_standin.drop_connections()
+        with pytest.raises((ConnectionError, OSError)):
+            while True:
+                client.stream_read()
+
+        time_to_recover = client.reconnect()
+
+        assert client.login_status is True
+        assert client.stream_read()["command"] == "tickPrices"
+        assert client.send_n_return({"command": "ping"})["status"] is True
+        assert 0 < time_to_recover < 5
+        assert client.reconnect_engine.metrics["recoveries"] == 1
+
+    def test_reconnect_retries_failed_login(self, client):
+        send_n_return = client.send_n_return
+        failures = iter([ConnectionError("Dropped during login")])
+
+        def send_dropping_login(packet):
+            if packet["command"] == "login":
+                error = next(failures, None)
+                if error is not None:
+                    raise error
+            return send_n_return(packet)
+
+        client.send_n_return = send_dropping_login
+        client.reconnect()
+
+        assert client.login_status is True
+        assert client.reconnect_engine.metrics["failed_attempts"] == 1
+        assert client.reconnect_engine.metrics["recoveries"] == 1
+
+    def test_demultiplexer_recovers_stream_for_subscribers(
+        self, xtb_standin, client
+    ):
+        demux = StreamDemultiplexer(
+            client, recover=client.reconnect_stream
+        ).start()
+        subscriber = demux.subscribe([("tickPrices", "EURUSD")])
+        client.stream_send(
+            {
+                "command": "getTickPrices",
+                "streamSessionId": client.stream_sesion_id,
+                "symbol": "EURUSD",
+            }
+        )
+        subscriber.stream_read(timeout=5)
+
+        xtb_standin.drop_connections()
+        deadline = monotonic() + 5
+        while demux.metrics["reconnects"] == 0:
+            assert monotonic() < deadline
+            sleep(0.01)
+        message = subscriber.stream_read(timeout=5)
+        demux.stop()
+
+        assert message["command"] == "tickPrices"
+
+
+class Test_Reactor:
+    """
+    Tests of the single-threaded reactor owning the client sockets.
+    """
+
+    @pytest.fixture
+    def reactor(self):
+        reactor = Reactor(select_timeout=0.1).start()
+        yield reactor
+        reactor.stop()
+
+    @pytest.fixture
+    def pair(self):
+        ours, theirs = socket.socketpair()
+        yield ours, theirs
+        ours.close()
+        theirs.close()
+
+    @pytest.fixture
+    def client(self, xtb_standin):
+        if xtb_standin is None:
+            pytest.skip("Needs the local stand-in of the API")
+        client = XTBClient("DEMO")
+        client.reconnect_engine.base_delay = 0.01
+        client.open_session()
+        yield client
+        client.disconnect_stream()
+        client.disconnect()
+
+    @staticmethod
+    def wait_for(condition, timeout=5.0):
+        deadline = monotonic() + timeout
+        while not condition():
+            assert monotonic() < deadline
+            sleep(0.005)
+
+    def test_dispatches_frames_split_across_reads(self, reactor, pair):
+        ours, theirs = pair
+        frames = []
+        reactor.add(
+            ours, MessageFramer(), lambda frame, _: frames.append(frame)
+        )
+
+        theirs.sendall(b'{"a": 1}\n\n{"b"')
+        self.wait_for(lambda: len(frames) == 1)
+        theirs.sendall(b": 2}\n")
+        theirs.sendall(b"\n")
+        self.wait_for(lambda: len(frames) == 2)
+
+        assert frames == [b'{"a": 1}', b'{"b": 2}']
+        stats = reactor.stats()["connections"]
+        [connection] = stats.values()
+        assert connection["frames"] == 2
+        assert connection["latency"]["count"] == 2
+
+    def test_sends_from_other_threads_are_written(self, reactor, pair):
+        ours, theirs = pair
+        reactor.add(ours, MessageFramer(), lambda frame, _: None)
+
+        senders = [
+            threading.Thread(target=reactor.send, args=(ours, b"x" * 1000))
+            for _ in range(4)
+        ]
+        for sender in senders:
+            sender.start()
+        for sender in senders:
+            sender.join()
+        received = b""
+        while len(received) < 4000:
+            received += theirs.recv(4096)
+
+        assert received == b"x" * 4000
+
+    def test_lost_connection_is_released_and_reported(self, reactor, pair):
+        ours, theirs = pair
+        errors = []
+        reactor.add(
+            ours, MessageFramer(), lambda frame, _: None, errors.append
+        )
+
+        theirs.close()
+        self.wait_for(lambda: errors)
+
+        assert isinstance(errors[0], ConnectionError)
+        assert reactor.owns(ours) is False
+        assert reactor.metrics["lost"] == 1
+
+    def test_removed_connection_is_blocking_again(self, reactor, pair):
+        ours, theirs = pair
+        reactor.add(ours, MessageFramer(), lambda frame, _: None)
+
+        reactor.remove(ours)
+
+        assert reactor.owns(ours) is False
+        assert ours.gettimeout() is None
+        with pytest.raises(ConnectionError):
+            reactor.send(ours, b"{}")
+
+    def test_failing_callback_does_not_stop_reactor(self, reactor, pair):
+        ours, theirs = pair
+        frames = []
+
+        def on_frame(frame, arrival):
+            frames.append(frame)
+            raise ValueError("consumer bug")
+
+        reactor.add(ours, MessageFramer(), on_frame)
+        theirs.sendall(b"{}\n\n{}\n\n")
+        self.wait_for(lambda: len(frames) == 2)
+
+        assert reactor.metrics["callback_errors"] == 2
+        assert reactor.running is True
+
+    def test_one_thread_serves_stream_and_commands(self, reactor, client):
+        dispatch = client.metrics
+        client.metrics = type(dispatch)()
+        demux = StreamDemultiplexer(client).attach(reactor)
+        symbols = ["EURUSD", "USDJPY", "GBPUSD", "EURPLN", "DE30"]
+        counts = {symbol: 0 for symbol in symbols}
+
+        def count(message):
+            counts[message["data"]["symbol"]] += 1
+
+        # threads of earlier tests may end meanwhile, so only the threads
+        # started here are counted
+        before = set(threading.enumerate())
+        for symbol in symbols:
+            demux.subscribe_callback([("tickPrices", symbol)], count)
+            client.stream_send(
+                {
+                    "command": "getTickPrices",
+                    "streamSessionId": client.stream_sesion_id,
+                    "symbol": symbol,
+                }
+            )
+        with MultiplexedChannel(client, reactor=reactor) as channel:
+            version = channel.send_n_return(
+                {"command": "getVersion"}, timeout=5
+            )
+            self.wait_for(lambda: min(counts.values()) >= 3)
+        demux.stop()
+
+        assert version["status"] is True
+        assert set(threading.enumerate()) - before == set()
+        latency = client.metrics.snapshot()["streams"]["tickPrices"]
+        assert latency["dispatch"]["count"] == latency["messages"] > 0
+        assert client.socket_connection.gettimeout() is None
+
+    def test_attached_demultiplexer_recovers_stream(
+        self, xtb_standin, reactor, client
+    ):
+        demux = StreamDemultiplexer(
+            client, recover=client.reconnect_stream
+        ).attach(reactor)
+        ticks = []
+        demux.subscribe_callback([("tickPrices", "EURUSD")], ticks.append)
+        client.stream_send(
+            {
+                "command": "getTickPrices",
+                "streamSessionId": client.stream_sesion_id,
+                "symbol": "EURUSD",
+            }
+        )
+        self.wait_for(lambda: ticks)
+
+        xtb_standin.drop_connections()
+        self.wait_for(lambda: demux.metrics["reconnects"] == 1)
+        received = len(ticks)
+        self.wait_for(lambda: len(ticks) > received)
+        demux.stop()
+
+        assert reactor.owns(client.socket_stream_connection) is False
+
+
+class Test_ConnectionFactory:
+    """
+    Tests of the shared TLS context, the session resumption and the
+    warm-up pool of the client sockets.
+    """
+
+    @pytest.fixture
+    def factory(self, xtb_standin):
+        if xtb_standin is None or not xtb_standin.tls:
+            pytest.skip("Needs the local stand-in of the API with TLS")
+        factory = ConnectionFactory()
+        yield factory
+        factory.clear()
+
+    @staticmethod
+    def client(factory):
+        client = XTBClient("DEMO")
+        client.connector = factory
+        client.socket_connection = client.new_socket(client.user.tls)
+        client.socket_stream_connection = client.new_socket(client.user.tls)
+        return client
+
+    def test_unset_host_is_rejected(self):
+        factory = ConnectionFactory()
+        sock = factory.new_socket(tls=False)
+
+        with pytest.raises(ValueError, match="5124"):
+            factory.connect(sock, (None, 5124))
+        with pytest.raises(ValueError):
+            factory.warm_up((None, 5124))
+        factory.save_session(sock, (None, 5124))
+        assert factory.sessions == {}
+        assert factory.metrics["warm_opened"] == 0
+        sock.close()
+
+    def test_sockets_share_context_and_options(self, factory):
+        sock = factory.new_socket(tls=True)
+
+        assert type(sock) is ssl.SSLSocket
+        assert sock.context is factory.context
+        assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+        assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) >= (
+            factory.receive_buffer
+        )
+        sock.close()
+
+    def test_next_client_resumes_tls_session(self, factory):
+        first = self.client(factory)
+        first.open_session()
+        # the session ticket of the stream arrives with the first message
+        first.stream_send(
+            {
+                "command": "getTickPrices",
+                "streamSessionId": first.stream_sesion_id,
+                "symbol": "EURUSD",
+            }
+        )
+        first.stream_read()
+        first.close_session()
+        second = self.client(factory)
+        second.connect()
+        second.connect_stream()
+
+        assert second.socket_connection.session_reused is True
+        assert second.socket_stream_connection.session_reused is True
+        assert set(factory.sessions) == {
+            (second.user.host, second.user.main_port),
+            (second.user.host, second.user.streaming_port),
+        }
+        stats = factory.stats()
+        assert stats["resumed_handshakes"] == 2
+        assert stats["mean_resumed_handshake_time"] > 0
+        second.disconnect_stream()
+        second.disconnect()
+
+    def test_client_takes_warm_socket_and_pool_refills(
+        self, factory, xtb_standin
+    ):
+        address = (xtb_standin.host, xtb_standin.main_port)
+        assert factory.warm_up(address, count=1) == 1
+        warm = factory._warm[(*address, True)][0][0]
+        client = self.client(factory)
+        client.login_status = False
+
+        client.connect()
+        client.login()
+
+        assert client.socket_connection is warm
+        assert client.login_status is True
+        deadline = monotonic() + 5
+        while factory.stats()["warm"] < 1 and monotonic() < deadline:
+            sleep(0.01)
+        assert factory.stats()["warm"] == 1
+        assert factory.metrics["warm_hits"] == 1
+        client.disconnect()
+
+    def test_expired_warm_socket_is_discarded(self, factory, xtb_standin):
+        factory.max_idle = 0.0
+        address = (xtb_standin.host, xtb_standin.main_port)
+        factory.warm_up(address, count=1, refill=False)
+
+        assert factory.take(address) is None
+        assert factory.metrics["warm_discarded"] == 1
+        assert factory.metrics["warm_misses"] == 1
@@ -12,7 +12,9 @@ from api.commands import (
     sell_transaction,
     close_position,
     get_historical_candles,
+    get_candles_range,
     get_server_time,
+    candles_to_array,
 )
 
 
@@ -628,10 +630,10 @@ class Test_get_historical_candles:
             [
                 [
                     1.39221136e12,
-                    1.00000000e00,
-                    7.00000000e00,
-                    1.00000000e00,
-                    4.18490000e04,
+                    4.1848,
+                    4.1849,
+                    4.1854,
+                    4.1848,
                     0.00000000e00,
                 ]
             ]
@@ -643,18 +645,18 @@ class Test_get_historical_candles:
             [
                 [
                     1.39221136e12,
-                    1.00000000e00,
-                    7.00000000e00,
-                    1.00000000e00,
-                    4.18490000e04,
+                    4.1848,
+                    4.1849,
+                    4.1854,
+                    4.1848,
                     0.00000000e00,
                 ],
                 [
                     1.39221135e12,
-                    1.00000000e00,
-                    7.00000000e00,
-                    1.00000000e00,
-                    4.18490000e04,
+                    4.1848,
+                    4.1849,
+                    4.1854,
+                    4.1848,
                     0.00000000e00,
                 ],
             ]
@@ -740,6 +742,96 @@ class Test_get_historical_candles:
             )
             assert np.array_equal(historical_data, expected_array_extended)
 
+    def test_candles_to_array_reads_records_by_key(
+        self, first_candle_history_response, expected_array
+    ):
+        """
+        Test if the columns do not depend on the key order of the records
+        and the records are not modified.
+        """
+        record = dict(reversed(list(first_candle_history_response.items())))
+        copied = dict(record)
+
+        candles = candles_to_array([record], digits=4)
+
+        assert np.array_equal(candles, expected_array)
+        assert record == copied
+        assert candles_to_array([]).shape == (0, 6)
+
+    def test_get_candles_range_requests_the_interval(
+        self, first_candle_history_response, expected_array
+    ):
+        """
+        Test if the function requests the candles between start and end
+        once and returns them as an array.
+        """
+        client = MagicMock()
+        client.send_n_return.return_value = {
+            "status": True,
+            "returnData": {
+                "digits": 4,
+                "rateInfos": [first_candle_history_response],
+            },
+        }
+
+        candles = get_candles_range(
+            client, "EURUSD", 1392211320000.0, 1392211440000.0
+        )
+
+        assert np.array_equal(candles, expected_array)
+        client.send_n_return.assert_called_once_with(
+            {
+                "command": "getChartRangeRequest",
+                "arguments": {
+                    "info": {
+                        "end": 1392211440000,
+                        "period": 1,
+                        "start": 1392211320000,
+                        "symbol": "EURUSD",
+                        "ticks": 0,
+                    }
+                },
+            }
+        )
+
+    def test_candles_to_array_scales_prices_by_digits(self):
+        """
+        Test if the open price and the shifts of close, high and low are
+        converted from units of 10**-digits to prices.
+        """
+        record = {
+            "ctm": 1392211320000,
+            "open": 1234567.0,
+            "close": -25.0,
+            "high": 10.0,
+            "low": -40.0,
+            "vol": 3.0,
+        }
+
+        candles = candles_to_array([record], digits=5)
+
+        assert np.allclose(
+            candles,
+            [[1392211320000, 12.34567, 12.34542, 12.34577, 12.34527, 3.0]],
+        )
+        assert np.array_equal(
+            candles_to_array([record])[0, 1:5],
+            [1234567.0, 1234542.0, 1234577.0, 1234527.0],
+        )
+
+    def test_get_candles_range_raises_on_failed_command(self):
+        """
+        Test if a failed command is not taken for an empty range.
+        """
+        client = MagicMock()
+        client.send_n_return.return_value = {
+            "status": False,
+            "errorCode": "BE005",
+        }
+
+        with pytest.raises(KeyError):
+            get_candles_range(client, "EURUSD", 0, 60000)
+
 
 class Test_get_server_time:
     """
@@ -0,0 +1,83 @@
+"""
+Check the depth book built from the quotes of all levels.
+"""
+
+import numpy as np
+import pytest
+from data.depth import DepthBook
+
+
+def level(n, bid, bid_volume, ask, ask_volume, timestamp=1000):
+    return {
+        "level": n,
+        "bid": bid,
+        "bidVolume": bid_volume,
+        "ask": ask,
+        "askVolume": ask_volume,
+        "timestamp": timestamp + n,
+        "symbol": "EURUSD",
+        "spreadTable": 0.5,
+    }
+
+
+class Test_DepthBook:
+    """
+    Tests of the updates and the accessors of the depth book.
+    """
+
+    @pytest.fixture
+    def book(self):
+        book = DepthBook(levels=3)
+        book.update(level(0, 1.0000, 100, 1.0002, 50))
+        book.update(level(1, 0.9999, 200, 1.0003, 50))
+        book.update(level(2, 0.9998, 300, 1.0004, 100))
+        return book
+
+    def test_levels_are_updated_in_place(self, book):
+        book.update(level(1, 0.9990, 10, 1.0010, 20))
+
+        assert book.depth == 3
+        assert book.book[1]["bid"] == 0.9990
+        assert list(book.cumulative("bid")) == [100, 110, 410]
+        assert book.metrics["updates"] == 4
+
+    def test_best_prices_and_imbalance(self, book):
+        assert book.best() == (1.0, 1.0002)
+        assert list(book.cumulative("ask")) == [50, 100, 200]
+        assert book.imbalance(1) == pytest.approx(50 / 150)
+        assert book.imbalance() == pytest.approx(400 / 800)
+
+    def test_price_for_walks_the_levels(self, book):
+        assert book.price_for(50) == pytest.approx(1.0002)
+        assert book.price_for(100) == pytest.approx((1.0002 + 1.0003) / 2)
+        assert book.price_for(250, "sell") == pytest.approx(
+            (100 * 1.0 + 150 * 0.9999) / 250
+        )
+        assert book.price_for(1000) is None
+
+    def test_levels_above_kept_are_ignored(self, book):
+        data = level(5, 0.9, 1, 1.1, 1)
+        copied = dict(data)
+
+        assert book.update(data) is False
+        assert book.metrics["ignored"] == 1
+        assert data == copied
+
+    def test_snapshot_is_a_copy(self, book):
+        snapshot = book.snapshot()
+        book.update(level(0, 1.1, 1, 1.2, 1))
+
+        assert snapshot.bid == 1.0
+        assert list(snapshot.bid_volume) == [100, 300, 600]
+        assert snapshot.timestamp == 1002
+        assert snapshot.imbalance == pytest.approx(0.5)
+
+    def test_empty_book(self):
+        book = DepthBook(levels=2)
+
+        assert np.isnan(book.best()[0])
+        assert book.imbalance() == 0.0
+        assert book.price_for(1) is None
+        assert len(book.snapshot().ask_volume) == 0
+        with pytest.raises(ValueError):
+            DepthBook(levels=0)
@@ -0,0 +1,137 @@
+"""
+Check the instrumentation of the API clients.
+"""
+
+import json
+import random
+import pytest
+from api.client import XTBClient, MultiplexedChannel
+from utils.metrics import LatencyHistogram, ClientMetrics
+
+
+class Test_LatencyHistogram:
+    """
+    Tests of the percentiles of the log-linear latency histogram.
+    """
+
+    @pytest.fixture
+    def values(self):
+        generator = random.Random(7)
+        return [generator.lognormvariate(-6, 1.5) for _ in range(20000)]
+
+    def test_percentiles_are_within_relative_error(self, values):
+        histogram = LatencyHistogram()
+        for value in values:
+            histogram.record(value)
+        ordered = sorted(values)
+
+        for percent in (50, 90, 99, 99.9):
+            exact = ordered[int(percent / 100 * len(ordered)) - 1]
+            assert histogram.percentile(percent) == pytest.approx(
+                exact, rel=0.02, abs=2e-6
+            )
+        assert histogram.count == len(values)
+        assert histogram.max == max(values)
+        assert histogram.mean() == pytest.approx(sum(values) / len(values))
+
+    def test_values_above_highest_are_clamped(self):
+        histogram = LatencyHistogram(highest=1.0)
+        histogram.record(5.0)
+
+        assert histogram.percentile(100) == 5.0
+        assert sum(histogram.counts) == 1
+
+    def test_merge_adds_counts(self, values):
+        first, second, whole = (LatencyHistogram() for _ in range(3))
+        for index, value in enumerate(values):
+            (first if index % 2 else second).record(value)
+            whole.record(value)
+
+        first.merge(second)
+
+        assert first.counts == whole.counts
+        assert first.summary() == pytest.approx(whole.summary())
+
+    def test_empty_histogram_summary(self):
+        assert LatencyHistogram().summary()["p99"] == 0.0
+
+
+class Test_ClientMetrics:
+    """
+    Tests of the per command metrics and of their instrumentation in the
+    clients.
+    """
+
+    @pytest.fixture
+    def metrics(self):
+        return ClientMetrics()
+
+    @pytest.fixture
+    def client(self, metrics):
+        client = XTBClient("DEMO")
+        client.metrics = metrics
+        client.open_session()
+        yield client
+        client.disconnect_stream()
+        client.disconnect()
+
+    def test_records_and_dumps_commands(self, metrics, tmp_path):
+        metrics.record_command("getTrades", 0.02, 0.001, 60, 400)
+        metrics.record_command("getTrades", 0.04, 0.002, 60, 500, error=True)
+        metrics.record_retry("getTrades")
+        metrics.record_stream("tickPrices", 0.00001, 250)
+
+        dumped = json.loads(metrics.dump(str(tmp_path / "metrics.json")))
+
+        trades = dumped["commands"]["getTrades"]
+        assert trades["calls"] == 2
+        assert trades["errors"] == 1
+        assert trades["retries"] == 1
+        assert trades["bytes_in"] == 900
+        assert trades["latency"]["max"] == 0.04
+        assert dumped["streams"]["tickPrices"]["messages"] == 1
+        assert json.loads((tmp_path / "metrics.json").read_text()) == dumped
+
+    def test_send_n_return_is_instrumented(self, metrics, client):
+        client.send_n_return({"command": "getVersion"})
+        client.send_n_return({"command": "getNoSuchCommand"})
+
+        commands = metrics.snapshot()["commands"]
+        assert commands["login"]["calls"] == 1
+        assert commands["getVersion"]["latency"]["count"] == 1
+        assert commands["getVersion"]["bytes_out"] == len(
+            b'{"command": "getVersion"}'
+        )
+        assert commands["getVersion"]["bytes_in"] > 0
+        assert commands["getNoSuchCommand"]["errors"] == 1
+
+    def test_stream_read_is_instrumented(self, metrics, client):
+        client.stream_send(
+            {
+                "command": "getTickPrices",
+                "streamSessionId": client.stream_sesion_id,
+                "symbol": "EURUSD",
+            }
+        )
+        for _ in range(3):
+            client.stream_read()
+
+        ticks = metrics.snapshot()["streams"]["tickPrices"]
+        assert ticks["messages"] == 3
+        assert ticks["decode"]["count"] == 3
+
+    def test_multiplexed_commands_are_instrumented(self, metrics, client):
+        with MultiplexedChannel(client) as channel:
+            channel.send_n_return({"command": "getServerTime"}, timeout=5)
+            # the reader of the channel ends with the connection
+            client.disconnect()
+
+        server_time = metrics.snapshot()["commands"]["getServerTime"]
+        assert server_time["calls"] == 1
+        assert server_time["latency"]["p50"] > 0
+
+    def test_instrumentation_can_be_disabled(self, metrics, client):
+        client.metrics = None
+        client.send_n_return({"command": "getVersion"})
+
+        assert "getVersion" not in metrics.snapshot()["commands"]
@@ -0,0 +1,67 @@
+"""
+Check the parsing of the API messages into records.
+"""
+
+import numpy as np
+import pytest
+from data.buffers import TICK_DTYPE, TICK_FIELDS
+from data.records import BALANCE_DTYPE, BALANCE_FIELDS, RecordParser
+
+
+class Test_RecordParser:
+    """
+    Tests of the key-addressed parsing of message data.
+    """
+
+    @pytest.fixture
+    def parser(self):
+        return RecordParser(TICK_DTYPE, "tickPrices")
+
+    @pytest.fixture
+    def tick(self):
+        data = {field: float(i) for i, field in enumerate(TICK_FIELDS)}
+        data["symbol"] = "EURUSD"
+        return data
+
+    def test_columns_do_not_depend_on_key_order(self, parser, tick):
+        reversed_tick = dict(reversed(list(tick.items())))
+
+        assert parser.values(reversed_tick) == parser.values(tick)
+        assert list(parser.array(reversed_tick)) == list(
+            range(len(TICK_FIELDS))
+        )
+
+    def test_record_is_read_without_modification(self, parser, tick):
+        copied = dict(tick)
+
+        record = parser.record(tick)
+
+        assert tick == copied
+        assert record.dtype == TICK_DTYPE
+        assert record["timestamp"] == tick["timestamp"]
+
+    def test_missing_field_is_named(self, parser, tick):
+        del tick["bid"]
+
+        with pytest.raises(KeyError, match="tickPrices without the field"):
+            parser.values(tick)
+        assert parser.missing(tick) == ["bid"]
+
+    def test_records_of_many_messages(self):
+        parser = RecordParser(BALANCE_DTYPE, "balance")
+        rows = [
+            {field: float(i) for field in BALANCE_FIELDS} for i in range(3)
+        ]
+
+        records = parser.records(rows)
+
+        assert records.shape == (3,)
+        assert list(records["equity"]) == [0.0, 1.0, 2.0]
+        assert parser.records([]).shape == (0,)
+
+    def test_single_field_and_invalid_dtype(self):
+        parser = RecordParser(np.dtype([("profit", np.float64)]))
+
+        assert parser.values({"profit": 2.5, "order": 1}) == (2.5,)
+        with pytest.raises(ValueError):
+            RecordParser(np.float64)
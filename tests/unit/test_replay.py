@@ -0,0 +1,138 @@
+"""
+Check the capture of API frames and their replay.
+"""
+
+from time import monotonic
+import pytest
+from api.client import XTBClient
+from api.replay import (
+    CaptureWriter,
+    ReplayClient,
+    read_capture,
+    capture_size,
+    COMMAND_SENT,
+    COMMAND_RECEIVED,
+    STREAM_RECEIVED,
+)
+from api.streamtools import StreamDemultiplexer
+
+
+class Test_Capture:
+    """
+    Unit tests of the capture file and of ReplayClient.
+    """
+
+    @pytest.fixture
+    def capture(self, tmp_path):
+        path = str(tmp_path / "session.cap")
+        with CaptureWriter(path) as writer:
+            writer.write(COMMAND_SENT, b'{"command": "login"}', 10.0)
+            writer.write(
+                COMMAND_RECEIVED,
+                b'{"status": true, "streamSessionId": "abc"}',
+                10.02,
+            )
+            for i in range(5):
+                writer.write(
+                    STREAM_RECEIVED,
+                    b'{"command": "tickPrices", "data": {"symbol": "EURUSD", '
+                    b'"ask": %d}}' % i,
+                    11.0 + i * 0.1,
+                )
+        return path
+
+    def test_frames_are_read_in_written_order(self, capture):
+        frames = list(read_capture(capture))
+
+        assert [frame.channel for frame in frames] == [0, 1, 3, 3, 3, 3, 3]
+        assert frames[1].timestamp == 10.02
+        assert frames[2].payload.startswith(b'{"command": "tickPrices"')
+
+    def test_capture_is_appended(self, capture):
+        with CaptureWriter(capture) as writer:
+            writer.write(STREAM_RECEIVED, b"{}", 12.0)
+
+        assert capture_size(capture)["stream_received"] == 6
+
+    def test_truncated_record_ends_reading(self, capture):
+        with open(capture, "ab") as file:
+            file.write(b"\x03\x00\x00")
+
+        assert len(list(read_capture(capture))) == 7
+
+    def test_other_file_is_rejected(self, tmp_path):
+        path = tmp_path / "other"
+        path.write_bytes(b"not a capture")
+
+        with pytest.raises(ValueError):
+            list(read_capture(str(path)))
+
+    def test_replay_returns_recorded_login(self, capture):
+        client = ReplayClient(capture, speed=None)
+        client.open_session()
+
+        assert client.stream_sesion_id == "abc"
+        assert client.send_n_return({"command": "login"})["status"] is True
+        with pytest.raises(ConnectionError):
+            client.send_n_return({"command": "getVersion"})
+
+    def test_replay_at_maximum_speed_ends_with_connection_error(
+        self, capture
+    ):
+        client = ReplayClient(capture, speed=None)
+        client.connect_stream()
+
+        messages = [client.stream_read()["data"]["ask"] for _ in range(5)]
+
+        assert messages == [0, 1, 2, 3, 4]
+        with pytest.raises(ConnectionError):
+            client.stream_read()
+        assert client.connection_stream is False
+
+    def test_replay_keeps_recorded_gaps_divided_by_speed(self, capture):
+        client = ReplayClient(capture, speed=4.0)
+        client.connect_stream()
+
+        start = monotonic()
+        for _ in range(5):
+            client.stream_read()
+
+        # 0.4 s of recorded stream played four times faster
+        assert 0.09 <= monotonic() - start < 0.3
+
+    def test_replay_feeds_stream_demultiplexer(self, capture):
+        client = ReplayClient(capture, speed=None)
+        client.connect_stream()
+        demux = StreamDemultiplexer(client)
+        subscriber = demux.subscribe([("tickPrices", "EURUSD")])
+
+        demux.running = True
+        demux.run()
+
+        asks = [subscriber.stream_read()["data"]["ask"] for _ in range(5)]
+
+        assert asks == [0, 1, 2, 3, 4]
+        assert demux.stats()["delivered"] == 5
+
+    def test_client_captures_session_with_stand_in(self, tmp_path):
+        path = str(tmp_path / "live.cap")
+        client = XTBClient("DEMO")
+        client.start_capture(path)
+        client.open_session()
+        client.stream_send(
+            {
+                "command": "getTickPrices",
+                "streamSessionId": client.stream_sesion_id,
+                "symbol": "EURUSD",
+            }
+        )
+        live = [client.stream_read() for _ in range(3)]
+        client.stop_capture()
+        client.close_session()
+
+        replay = ReplayClient(path, speed=None)
+        replay.open_session()
+
+        assert capture_size(path)["stream_sent"] == 1
+        assert replay.stream_sesion_id == client.stream_sesion_id
+        assert [replay.stream_read() for _ in range(3)] == live
@@ -0,0 +1,157 @@
+"""
+Check the market data bus in shared memory.
+"""
+
+import multiprocessing
+from multiprocessing.shared_memory import SharedMemory
+from uuid import uuid4
+import pytest
+from data.buffers import TICK_FIELDS
+from data.candles import CANDLE_FIELDS
+from data.shared import (
+    MarketDataPublisher,
+    MarketDataReader,
+    segment_name,
+)
+
+
+def quote(value, symbol="EURUSD"):
+    data = {field: float(value) for field in TICK_FIELDS}
+    data.update({"symbol": symbol, "level": 0})
+    return data
+
+
+def candle(minute, symbol="EURUSD"):
+    data = {field: float(minute) for field in CANDLE_FIELDS}
+    data.update({"ctm": 60000.0 * minute, "symbol": symbol, "quoteId": 2})
+    return data
+
+
+def read_consistent_quotes(prefix, count, connection):
+    """
+    Reads quotes in a child process until the last one, counting the
+    snapshots whose fields differ.
+    """
+    reader = MarketDataReader("EURUSD", prefix, timeout=5)
+    torn = reads = 0
+    last = -1.0
+    while last < count - 1:
+        sequence, tick = reader.quote()
+        if tick is None:
+            continue
+        values = set(tick.tolist())
+        torn += len(values) != 1
+        last = tick["bid"]
+        reads += 1
+    _, candles = reader.candles()
+    reader.close()
+    connection.send((torn, reads, list(candles["close"])))
+
+
+class Test_MarketDataBus:
+    """
+    Tests of the publisher and the read-only readers of the shared
+    market data.
+    """
+
+    @pytest.fixture
+    def prefix(self):
+        return f"test_{uuid4().hex[:8]}"
+
+    @pytest.fixture
+    def publisher(self, prefix):
+        publisher = MarketDataPublisher(
+            ["EURUSD", "US500.cash"], capacity=4, prefix=prefix
+        )
+        yield publisher
+        publisher.close()
+
+    def test_reader_gets_latest_quote_and_candles(self, publisher, prefix):
+        reader = MarketDataReader("EURUSD", prefix)
+        assert reader.quote() == (0, None)
+
+        publisher.on_message({"command": "tickPrices", "data": quote(1)})
+        publisher.on_message({"command": "tickPrices", "data": quote(2)})
+        for minute in range(6):
+            publisher.on_message({"command": "candle", "data": candle(minute)})
+
+        sequence, tick = reader.quote()
+        _, candles = reader.candles(3)
+        assert sequence == reader.sequence == 8
+        assert tick["ask"] == 2.0
+        assert list(candles["close"]) == [3.0, 4.0, 5.0]
+        assert len(reader.candles()[1]) == reader.capacity == 4
+        reader.close()
+
+    def test_messages_are_routed_by_symbol(self, publisher, prefix):
+        message = {"command": "tickPrices", "data": quote(3, "US500.cash")}
+        copied = {"command": "tickPrices", "data": dict(message["data"])}
+
+        publisher.on_message(message)
+        publisher.on_message({"command": "tickPrices", "data": quote(1, "X")})
+
+        reader = MarketDataReader("US500.cash", prefix)
+        assert reader.quote()[1]["bid"] == 3.0
+        assert message == copied
+        assert publisher.metrics == {"ticks": 1, "candles": 0, "unknown": 1}
+        reader.close()
+
+    def test_reader_views_are_read_only(self, publisher, prefix):
+        reader = MarketDataReader("EURUSD", prefix)
+
+        with pytest.raises(ValueError):
+            reader._view.quote["bid"] = 1.0
+        with pytest.raises(ValueError):
+            reader._view.candles.flags.writeable = True
+        reader.close()
+
+    def test_read_during_write_times_out(self, publisher, prefix):
+        reader = MarketDataReader("EURUSD", prefix, timeout=0.01)
+        # a write that never ends leaves the sequence odd
+        publisher._segments["EURUSD"].header[1] += 1
+
+        with pytest.raises(TimeoutError):
+            reader.quote()
+        reader.close()
+
+    def test_missing_and_stale_segments(self, prefix):
+        with pytest.raises(FileNotFoundError):
+            MarketDataReader("EURUSD", prefix)
+
+        # left by a publisher that did not close
+        stale = SharedMemory(
+            segment_name(prefix, "EURUSD"), create=True, size=64
+        )
+        stale.close()
+        publisher = MarketDataPublisher(["EURUSD"], capacity=8, prefix=prefix)
+        reader = MarketDataReader("EURUSD", prefix)
+        assert reader.capacity == 8
+        reader.close()
+        publisher.close()
+
+    @pytest.mark.skipif(
+        "fork" not in multiprocessing.get_all_start_methods(),
+        reason="needs the fork start method",
+    )
+    def test_process_reads_snapshots_without_tearing(self, publisher, prefix):
+        count = 20000
+        for minute in range(3):
+            publisher.on_message({"command": "candle", "data": candle(minute)})
+        context = multiprocessing.get_context("fork")
+        ours, theirs = context.Pipe()
+        child = context.Process(
+            target=read_consistent_quotes, args=(prefix, count, theirs)
+        )
+        child.start()
+
+        for i in range(count):
+            publisher.write_quote("EURUSD", (float(i),) * len(TICK_FIELDS))
+        assert ours.poll(30)
+        torn, reads, closes = ours.recv()
+        child.join(10)
+
+        assert torn == 0
+        assert reads > 0
+        assert closes == [0.0, 1.0, 2.0]
+        assert child.exitcode == 0
+        assert publisher.metrics["ticks"] == count
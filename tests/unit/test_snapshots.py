@@ -0,0 +1,47 @@
+"""
+Check the immutable snapshots of the market data.
+"""
+
+import numpy as np
+import pytest
+from data.buffers import TICK_DTYPE
+from data.snapshots import SnapshotStore, frozen
+
+
+class Test_SnapshotStore:
+    """
+    Tests of the publication of the snapshots of symbols.
+    """
+
+    def test_update_replaces_snapshot_without_changing_it(self):
+        store = SnapshotStore()
+        assert store.get("EURUSD").quote is None
+
+        quote = frozen(np.ones(1, TICK_DTYPE))[0]
+        first = store.update("EURUSD", quote=quote)
+        candles = frozen(np.arange(12.0).reshape(2, 6))
+        second = store.update("EURUSD", candles={1: candles})
+
+        assert first.candles == {}
+        assert second.quote is quote
+        assert store.get("EURUSD") is second
+        assert (second.sequence, store.symbols()) == (2, ["EURUSD"])
+        assert store.get("USDJPY").sequence == 0
+
+    def test_snapshot_fields_are_read_only(self):
+        store = SnapshotStore()
+        values = np.zeros((3, 6))
+        snapshot = store.update(
+            "EURUSD",
+            quote=frozen(np.zeros(1, TICK_DTYPE))[0],
+            candles={5: frozen(values)},
+        )
+        values[:] = 1.0
+
+        assert not snapshot.candles[5].any()
+        with pytest.raises(ValueError):
+            snapshot.quote["bid"] = 1.0
+        with pytest.raises(ValueError):
+            snapshot.candles[5][0, 0] = 1.0
+        with pytest.raises(TypeError):
+            snapshot.candles[15] = values
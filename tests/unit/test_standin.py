@@ -0,0 +1,127 @@
+"""
+Check the local stand-in of the XTB API serves the clients.
+"""
+
+import pytest
+from api.client import XTBClient
+from api.commands import buy_transaction, close_position, get_server_time
+from api.standin import RequestReader, XTBStandInServer
+
+
+class Test_XTBStandInServer:
+    """
+    Unit tests of the stand-in server, run over plain TCP and over TLS.
+    """
+
+    @pytest.fixture(params=[False, True], ids=["tcp", "tls"])
+    def server(self, request):
+        with XTBStandInServer(
+            tls=request.param, tick_rate=100.0, profit_interval=0.05
+        ) as server:
+            with server.patch_environ("REAL"):
+                yield server
+
+    @pytest.fixture
+    def client(self, server):
+        client = XTBClient("REAL")
+        client.open_session()
+        yield client
+        client.close_session()
+
+    def test_request_reader_splits_unterminated_commands(self):
+        reader = RequestReader()
+
+        first = reader.feed(b'{"command": "ping"}{"command": "getV')
+        second = reader.feed(b'ersion"}')
+
+        assert first == [{"command": "ping"}]
+        assert second == [{"command": "getVersion"}]
+
+    def test_client_logs_in_with_stand_in_credentials(self, server, client):
+        assert client.login_status is True
+        assert client.stream_sesion_id == server.stream_session_id
+        assert client.send_n_return({"command": "getVersion"})["status"]
+
+    def test_wrong_password_is_rejected(self, server):
+        response = server.respond(
+            {
+                "command": "login",
+                "arguments": {"userId": server.login, "password": "wrong"},
+            },
+            logged=False,
+        )
+
+        assert response == (
+            server.error("BE005", "userPasswordCheck: Invalid login"),
+            False,
+        )
+
+    def test_commands_require_login(self, server):
+        response, logged = server.respond(
+            {"command": "getServerTime"}, logged=False
+        )
+
+        assert response["status"] is False
+        assert logged is False
+
+    def test_custom_tag_is_echoed(self, client):
+        response = client.send_n_return(
+            {"command": "getServerTime", "customTag": "abc"}
+        )
+
+        assert response["customTag"] == "abc"
+        assert get_server_time(client) > 0
+
+    def test_tick_prices_are_streamed(self, client):
+        client.stream_send(
+            {
+                "command": "getTickPrices",
+                "streamSessionId": client.stream_sesion_id,
+                "symbol": "EURUSD",
+            }
+        )
+        messages = [client.stream_read() for _ in range(3)]
+
+        assert [msg["command"] for msg in messages] == ["tickPrices"] * 3
+        assert messages[0]["data"]["symbol"] == "EURUSD"
+        assert messages[0]["data"]["ask"] > messages[0]["data"]["bid"]
+
+    def test_trade_is_opened_streamed_and_closed(self, server, client):
+        opened = buy_transaction(client, "EURUSD", 0.1)
+        order_no = opened["order_no"]
+        client.stream_send(
+            {
+                "command": "getProfits",
+                "streamSessionId": client.stream_sesion_id,
+            }
+        )
+        profit = client.stream_read()
+
+        closed = close_position(
+            client, "EURUSD", order_no, 0.1, opened["transactions_data"]["cmd"]
+        )
+
+        assert profit["command"] == "profit"
+        assert profit["data"]["order2"] == order_no
+        assert closed["position"] == order_no
+        assert server.positions == {}
+        assert len(server.history) == 1
+
+    def test_chart_request_returns_minute_candles(self, server):
+        chart = server.chart("EURUSD", 1, 0, 10 * 60000)
+
+        assert [info["ctm"] for info in chart["rateInfos"]] == [
+            i * 60000 for i in range(10)
+        ]
+
+    def test_chart_prices_are_scaled_by_digits(self, server):
+        chart = server.chart("EURUSD", 1, 0, 10 * 60000)
+        first = chart["rateInfos"][0]
+
+        assert first["open"] / 10 ** chart["digits"] == pytest.approx(
+            server.price("EURUSD")
+        )
+        for info in chart["rateInfos"]:
+            for field in ("open", "close", "high", "low"):
+                assert info[field] == int(info[field])
+            assert info["high"] >= max(info["close"], 0)
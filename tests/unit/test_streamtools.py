@@ -2,11 +2,26 @@
 Check the XTBClient of XTB API is valid.
 """
 
-from unittest.mock import Mock, MagicMock, patch
+from threading import Event, Thread
+from time import perf_counter
+from unittest.mock import Mock, MagicMock
 import pytest
 import numpy as np
 from api.client import XTBClient, stream_session_simulator
-from api.streamtools import WalletStream, PositionObservator, DataStream
+from api.streamtools import (
+    WalletStream,
+    PositionObservator,
+    DataStream,
+    StreamDemultiplexer,
+    StreamSubscriber,
+    EventBus,
+    TickEvent,
+    CandleEvent,
+    SubscriptionManager,
+    DeliveryPolicy,
+)
+from data.buffers import TICK_FIELDS
+from data.candles import CANDLE_FIELDS
 
 
 class Test_WalletStream:
@@ -130,6 +145,22 @@ class Test_WalletStream:
         wallet_stream.read_stream()
         assert np.array_equal(wallet_stream.balance, balance_array)
 
+    def test_walletstream_reads_balance_by_key(
+        self, mock_xtb_client, balance_msg, balance_array
+    ):
+        """
+        Checking whether the balance does not depend on the key order of
+        the message, which is not modified
+        """
+        data = dict(reversed(list(balance_msg["data"].items())))
+        message = {"command": "balance", "data": data}
+        wallet_stream = WalletStream()
+        wallet_stream.client = mock_xtb_client
+        wallet_stream.client.stream_read.return_value = message
+        wallet_stream.read_stream()
+        assert np.array_equal(wallet_stream.balance, balance_array)
+        assert list(data) == list(reversed(list(balance_msg["data"])))
+
     def test_walletstream_is_not_writing_message_to_balance(
         self, mock_xtb_client
     ):
@@ -276,54 +307,58 @@ class Test_PositionObservator:
         return np.array(
             [
                 [
-                    4.1849,
                     1378369375000,
-                    4.1854,
                     4.1848,
+                    4.1849,
+                    4.1854,
                     4.1848,
-                    2,
                     0.0,
                 ]
             ]
         )
 
+    @pytest.fixture
+    def minute_candles(self, candle_msg):
+        """
+        Creating fixture of 1-minute candle msgs from 10:15, the start of
+        a 15-minute interval, rising by 0.001 per minute
+        """
+
+        def candles(minutes, first=0):
+            messages = []
+            for minute in range(first, first + minutes):
+                message = {
+                    "command": "candle",
+                    "data": dict(candle_msg["data"]),
+                }
+                message["data"].update(
+                    {
+                        "ctm": 1378368900000 + minute * 60000,
+                        "open": 4.0 + minute * 0.001,
+                        "close": 4.001 + minute * 0.001,
+                        "high": 4.002 + minute * 0.001,
+                        "low": 3.999 + minute * 0.001,
+                        "vol": 1.0,
+                    }
+                )
+                messages.append(message)
+            return messages
+
+        return candles
+
     @pytest.fixture
     def candle_array_5_minutes(self):
         """
         Creating fixture of calculated candle 5M
         """
-        return np.array(
-            [
-                [
-                    4.1849,
-                    1378369375000,
-                    4.1854,
-                    4.1848,
-                    4.1848,
-                    10,
-                    0.0,
-                ]
-            ]
-        )
+        return np.array([[1378368900000, 4.0, 4.005, 4.006, 3.999, 5.0]])
 
     @pytest.fixture
     def candle_array_15_minutes(self):
         """
         Creating fixture of calculated candle 15M
         """
-        return np.array(
-            [
-                [
-                    4.1849,
-                    1378369375000,
-                    4.1854,
-                    4.1848,
-                    4.1848,
-                    30,
-                    0.0,
-                ]
-            ]
-        )
+        return np.array([[1378368900000, 4.0, 4.015, 4.016, 3.999, 15.0]])
 
     @pytest.fixture
     def profit_msg(self, event_order_no):
@@ -358,8 +393,7 @@ class Test_PositionObservator:
             "minute_1",
             "minute_5",
             "minute_15",
-            "minute_1_5box",
-            "minute_5_15box",
+            "candles",
         ],
     )
     def test_PositionObservator_have_right_client_attribut(
@@ -403,11 +437,9 @@ class Test_PositionObservator:
         "atribut, expected",
         [
             ("curent_price", np.empty(shape=[0, 11])),
-            ("minute_1", np.empty(shape=[0, 7])),
-            ("minute_5", np.empty(shape=[0, 7])),
-            ("minute_15", np.empty(shape=[0, 7])),
-            ("minute_1_5box", np.empty(shape=[0, 7])),
-            ("minute_5_15box", np.empty(shape=[0, 7])),
+            ("minute_1", np.empty(shape=[0, 6])),
+            ("minute_5", np.empty(shape=[0, 6])),
+            ("minute_15", np.empty(shape=[0, 6])),
         ],
     )
     def test_PositionObservator_have_values_of_matrix_attributs_after_init(
@@ -498,131 +530,108 @@ class Test_PositionObservator:
         """
         mock_position_obs.client.stream_read.return_value = price_msg
         mock_position_obs.read_stream()
-        expected_minute_1 = np.empty(shape=[0, 7])
+        expected_minute_1 = np.empty(shape=[0, 6])
         assert np.array_equal(mock_position_obs.minute_1, expected_minute_1)
 
+    def feed(self, observator, messages):
+        """
+        Reads the messages from the stream one by one and aggregates them
+        """
+        observator.client.stream_read.side_effect = iter(messages)
+        for _ in messages:
+            observator.stream()
+
     @pytest.mark.parametrize(
-        "M1_candles_no, expected_minute_1_5box_shape", [(1, 1), (2, 2), (3, 3)]
+        "M1_candles_no, expected_minute_5_shape", [(4, 0), (5, 1), (9, 1)]
     )
-    def test_make_more_candles_agregate_1M_candles_to_minute_1_5box(
+    def test_make_more_candles_five_1M_candles_make_minute_5_candle(
         self,
         mock_position_obs,
-        candle_msg,
+        minute_candles,
         M1_candles_no,
-        expected_minute_1_5box_shape,
+        expected_minute_5_shape,
     ):
         """
-        Test to see if 1 minute candles aggregate to contener minute_1_5box
+        Test to see if a 5 minute candle will form with the 1 minute
+        candle of the last minute of its interval
         """
-        mock_position_obs.client.stream_read.return_value = candle_msg
-        for i in range(M1_candles_no):
-            mock_position_obs.read_stream()
-        assert (
-            np.shape(mock_position_obs.minute_1_5box)[0]
-            == expected_minute_1_5box_shape
+        self.feed(mock_position_obs, minute_candles(M1_candles_no))
+        assert np.shape(mock_position_obs.minute_5)[0] == (
+            expected_minute_5_shape
         )
 
-    def test_make_more_candles_five_1M_candles_make_minute_5_candle(
-        self, mock_position_obs, candle_msg
+    def test_make_more_candles_calc_right_5_min_candle(
+        self, mock_position_obs, minute_candles, candle_array_5_minutes
     ):
         """
-        Test to see if a 5 minute candle will form after sending
-        five 1 minute candles
+        Correctness of calculation of 5 miute candle from 1 minute candles
         """
-        mock_position_obs.client.stream_read.return_value = candle_msg
-        for i in range(5):
-            mock_position_obs.read_stream()
-            mock_position_obs.make_more_candles()
-        assert np.shape(mock_position_obs.minute_5)[0] == 1
+        self.feed(mock_position_obs, minute_candles(5))
+        assert np.allclose(mock_position_obs.minute_5, candle_array_5_minutes)
 
-    def test_make_more_candles_after_five_1M_candles_minute_1_5box_is_empty(
+    def test_make_more_candles_repeated_1M_candle_is_aggregated_once(
         self, mock_position_obs, candle_msg
     ):
         """
-        Test whether the contender for 1-minute candles will be cleared
-        after calculating 5-minute candles
+        Test to see if the same 1 minute candle sent again does not make
+        a 5 minute candle
         """
-        mock_position_obs.client.stream_read.return_value = candle_msg
-        for i in range(5):
-            mock_position_obs.read_stream()
-            mock_position_obs.make_more_candles()
-        assert np.shape(mock_position_obs.minute_1_5box)[0] == 0
+        self.feed(mock_position_obs, [candle_msg] * 5)
+        assert np.shape(mock_position_obs.minute_5)[0] == 0
+        assert mock_position_obs.candles.metrics["ignored"] == 4
 
-    def test_make_more_candles_calc_right_5_min_candle(
-        self, mock_position_obs, candle_msg, candle_array_5_minutes
+    def test_make_more_candles_position_opened_mid_interval(
+        self, mock_position_obs, minute_candles
     ):
         """
-        Correctness of calculation of 5 miute candle from 1 minute candles
+        Test to see if the first 5 minute candle of a position opened in
+        the middle of an interval closes on the clock boundary
         """
-        mock_position_obs.client.stream_read.return_value = candle_msg
-        for i in range(5):
-            mock_position_obs.read_stream()
-            mock_position_obs.make_more_candles()
-        assert np.array_equal(
-            mock_position_obs.minute_5, candle_array_5_minutes
+        self.feed(mock_position_obs, minute_candles(2, first=3))
+        assert mock_position_obs.minute_5[0, 0] == 1378368900000
+        assert mock_position_obs.minute_5[0, 5] == 2.0
+
+    def test_make_more_candles_missed_last_minute_closes_on_next_interval(
+        self, mock_position_obs, minute_candles
+    ):
+        """
+        Test to see if a 5 minute candle missing its last minute closes
+        with the first candle of the next interval
+        """
+        self.feed(mock_position_obs, minute_candles(4))
+        self.feed(mock_position_obs, minute_candles(1, first=6))
+        assert mock_position_obs.minute_5[0, 5] == 4.0
+        assert mock_position_obs.candles.forming(5)[0] == (
+            1378368900000 + 5 * 60000
         )
 
     @pytest.mark.parametrize(
-        "M1_candles_no, expected_minute_5_15box_shape",
-        [(4, 0), (9, 1), (14, 2)],
+        "M1_candles_no, expected_minute_15_shape", [(14, 0), (15, 1)]
     )
-    def test_make_more_candles_agregate_5M_candles_to_minute_5_15box(
+    def test_make_more_candles_after_fifteen_1M_make_minute_15_candle(
         self,
         mock_position_obs,
-        candle_msg,
+        minute_candles,
         M1_candles_no,
-        expected_minute_5_15box_shape,
+        expected_minute_15_shape,
     ):
         """
-        Test to see if 5-minute candles are saved in the 5-minute candle
-        container for the 15-minute candle arrangement
+        Test to see if fifteen 1-minute candles create a 15-minute candle
         """
-        mock_position_obs.client.stream_read.return_value = candle_msg
-        for i in range(M1_candles_no):
-            mock_position_obs.read_stream()
-            mock_position_obs.make_more_candles()
-        assert (
-            np.shape(mock_position_obs.minute_5_15box)[0]
-            == expected_minute_5_15box_shape
+        self.feed(mock_position_obs, minute_candles(M1_candles_no))
+        assert np.shape(mock_position_obs.minute_15)[0] == (
+            expected_minute_15_shape
         )
 
-    def test_make_more_candles_after_three_5M_candles_delete_minute_5_15box(
-        self, mock_position_obs, candle_msg
-    ):
-        """
-        Test to see if three 5-minute nets clear the 5-minute
-        candle contender
-        """
-        mock_position_obs.client.stream_read.return_value = candle_msg
-        for i in range(15):
-            mock_position_obs.read_stream()
-            mock_position_obs.make_more_candles()
-        assert np.shape(mock_position_obs.minute_5_15box)[0] == 0
-
-    def test_make_more_candles_after_three_5M_make_minute_15_candle(
-        self, mock_position_obs, candle_msg
-    ):
-        """
-        Test to see if three 5-minute nets create a 15-minute candle
-        """
-        mock_position_obs.client.stream_read.return_value = candle_msg
-        for i in range(15):
-            mock_position_obs.read_stream()
-            mock_position_obs.make_more_candles()
-        assert np.shape(mock_position_obs.minute_15)[0] == 1
-
     def test_make_more_candles_agregate_minute_15_candle_right(
-        self, mock_position_obs, candle_msg, candle_array_15_minutes
+        self, mock_position_obs, minute_candles, candle_array_15_minutes
     ):
         """
         Checking the correctness of the calculation of the 15-minute
-        candle on the basis of 5-minute candles
+        candle on the basis of 1-minute candles
         """
-        mock_position_obs.client.stream_read.return_value = candle_msg
-        for i in range(15):
-            mock_position_obs.read_stream()
-            mock_position_obs.make_more_candles()
-        assert np.array_equal(
+        self.feed(mock_position_obs, minute_candles(15))
+        assert np.allclose(
             mock_position_obs.minute_15, candle_array_15_minutes
         )
 
@@ -748,10 +757,10 @@ class Test_DataStream:
         return np.array(
             [
                 [
-                    4.1849,
                     1378369375000,
-                    4.1854,
                     4.1848,
+                    4.1849,
+                    4.1854,
                     4.1848,
                     0.0,
                 ]
@@ -818,105 +827,638 @@ class Test_DataStream:
             mock_data_stream.__getattribute__(atribut), expected
         )
 
-    def test_read_stream_messages_write_candle_msg_to_candle_msg_atrib(
-        self, mock_data_stream, candle_msg_test
-    ):
-        """
-        Test to check if candle api message is stored in candle_msg attribute
-        """
-        mock_data_stream.is_connected = Mock(side_effect=iter([True, False]))
-        mock_data_stream.client.stream_read = Mock(
-            side_effect=iter([candle_msg_test])
-        )
-        mock_data_stream.read_stream_messages()
-        assert mock_data_stream.candle_msg == candle_msg_test
-
-    def test_read_stream_messages_overwrite_candle_msg_in_candle_msg_atrib(
+    def test_on_message_overwrites_candle_msg_atrib(
         self, mock_data_stream, candle_msg_test, candle_msg_test2
     ):
         """
         Test to see if candle api messages are overwritten in
         candle_msg attribute
         """
-        mock_data_stream.is_connected = Mock(
-            side_effect=iter([True, True, False])
-        )
-        mock_data_stream.client.stream_read = Mock(
-            side_effect=iter([candle_msg_test, candle_msg_test2])
-        )
-        mock_data_stream.read_stream_messages()
+        mock_data_stream.on_message(candle_msg_test)
+        assert mock_data_stream.candle_msg == candle_msg_test
+        mock_data_stream.on_message(candle_msg_test2)
         assert mock_data_stream.candle_msg == candle_msg_test2
 
-    def test_read_stream_messages_write_tickPrices_msg_to_tick_msg_atrib(
-        self, mock_data_stream, price_msg
-    ):
-        """
-        Is the message from the api about the price written to
-        the tick_msg attribute
-        """
-        mock_data_stream.is_connected = Mock(side_effect=iter([True, False]))
-        mock_data_stream.client.stream_read = Mock(
-            side_effect=iter([price_msg])
-        )
-        mock_data_stream.read_stream_messages()
-        assert mock_data_stream.tick_msg == price_msg
-
-    def test_read_stream_messages_overwrite_tickPrices_msg_in_tick_msg_atrib(
+    def test_on_message_overwrites_tick_msg_atrib(
         self, mock_data_stream, price_msg, price_msg2
     ):
         """
         Test to see if tick price api messages are overwritten in
         tick_msg attribute
         """
-        mock_data_stream.is_connected = Mock(
-            side_effect=iter([True, True, False])
-        )
-        mock_data_stream.client.stream_read = Mock(
-            side_effect=iter([price_msg, price_msg2])
-        )
-        mock_data_stream.read_stream_messages()
+        mock_data_stream.on_message(price_msg)
+        assert mock_data_stream.tick_msg == price_msg
+        mock_data_stream.on_message(price_msg2)
         assert mock_data_stream.tick_msg == price_msg2
 
-    def test_read_prices_convert_tick_msg_to_symbols_price(
+    def test_on_message_convert_tick_msg_to_symbols_price(
         self, mock_data_stream, price_msg, price_array
     ):
         """
         Test if the price message is correctly converted to the
         symbols_price class attribute
         """
-        mock_data_stream.is_connected = Mock(
-            side_effect=iter([True, True, False])
-        )
-        with patch.object(mock_data_stream, "tick_msg", new=price_msg):
-            mock_data_stream.read_prices()
+        mock_data_stream.on_message(price_msg)
         assert np.array_equal(mock_data_stream.symbols_price, price_array)
 
-    def test_read_prices_not_convert_candle_msg_to_symbols_price(
+    def test_on_message_not_convert_candle_msg_to_symbols_price(
         self, mock_data_stream, candle_msg_test
     ):
         """
         Test if the candle message is not converted to the
         symbols_price class attribute
         """
-        mock_data_stream.is_connected = Mock(
-            side_effect=iter([True, True, False])
-        )
-        with patch.object(mock_data_stream, "candle_msg", new=candle_msg_test):
-            mock_data_stream.read_prices()
+        mock_data_stream.on_message(candle_msg_test)
         assert np.array_equal(
             mock_data_stream.symbols_price, np.empty(shape=[0, 11])
         )
 
-    def test_read_last_1M_convert_candle_msg_to_symbols_last_1M(
+    def test_on_message_convert_candle_msg_to_symbols_last_1M(
         self, mock_data_stream, candle_msg_test, candle_array
     ):
         """
         Test if the candle message is  converted to the
         symbols_last_1M class attribute
         """
-        mock_data_stream.is_connected = Mock(
-            side_effect=iter([True, True, False])
-        )
-        with patch.object(mock_data_stream, "candle_msg", new=candle_msg_test):
-            mock_data_stream.read_last_1M()
+        mock_data_stream.on_message(candle_msg_test)
         assert np.array_equal(mock_data_stream.symbols_last_1M, candle_array)
+
+    def test_on_message_publishes_tick_and_candle_events(
+        self, mock_data_stream, price_msg, candle_msg_test
+    ):
+        """
+        Test if the converted messages are published to the consumers
+        """
+        mock_data_stream.on_message(price_msg)
+        mock_data_stream.on_message(candle_msg_test)
+
+        sequence, event = mock_data_stream.wait_tick(timeout=0)
+        assert sequence == 1
+        assert isinstance(event, TickEvent)
+        assert event.tick["ask"] == price_msg["data"]["ask"]
+        sequence, event = mock_data_stream.wait_candle(1, timeout=0)
+        assert isinstance(event, CandleEvent)
+        assert event.bar["ctm"] == candle_msg_test["data"]["ctm"]
+        assert mock_data_stream.wait_candle(5, timeout=0) == (0, None)
+
+
+class Test_StreamDemultiplexer:
+    """
+    Tests of the dispatching of one shared stream to many consumers
+    """
+
+    @pytest.fixture
+    def demux(self):
+        client = MagicMock()
+        client.connection_stream = True
+        return StreamDemultiplexer(client)
+
+    @staticmethod
+    def tick(symbol):
+        return {"command": "tickPrices", "data": {"symbol": symbol, "ask": 1}}
+
+    def test_dispatch_routes_by_command_and_symbol(self, demux):
+        eurusd = demux.subscribe([("tickPrices", "EURUSD")])
+        usdjpy = demux.subscribe([("tickPrices", "USDJPY")])
+        demux.dispatch(self.tick("EURUSD"))
+        assert eurusd.stream_read(timeout=1) == self.tick("EURUSD")
+        assert usdjpy.queue.empty()
+
+    def test_dispatch_delivers_all_keys_to_command_subscriber(self, demux):
+        everything = demux.subscribe([("tickPrices", None)])
+        eurusd = demux.subscribe([("tickPrices", "EURUSD")])
+        assert demux.dispatch(self.tick("EURUSD")) == 2
+        assert demux.dispatch(self.tick("USDJPY")) == 1
+        assert everything.queue.qsize() == 2
+        assert eurusd.queue.qsize() == 1
+
+    def test_dispatch_routes_profit_by_order(self, demux):
+        position = demux.subscribe([("profit", 100000)])
+        demux.dispatch(
+            {"command": "profit", "data": {"order2": 100000, "profit": 1.0}}
+        )
+        demux.dispatch(
+            {"command": "profit", "data": {"order2": 200000, "profit": 2.0}}
+        )
+        assert position.queue.qsize() == 1
+        assert demux.stats()["unrouted"] == 1
+
+    def test_unsubscribed_consumer_gets_no_messages(self, demux):
+        subscriber = demux.subscribe([("tickPrices", "EURUSD")])
+        demux.unsubscribe(subscriber)
+        demux.dispatch(self.tick("EURUSD"))
+        assert subscriber.queue.empty()
+        assert demux.stats()["topics"] == 0
+
+    def test_full_subscriber_drops_oldest_message(self):
+        subscriber = StreamSubscriber([("tickPrices", "EURUSD")], maxsize=2)
+        for i in range(3):
+            subscriber.put(i)
+        assert subscriber.dropped == 1
+        assert subscriber.stream_read(timeout=1) == 1
+
+    def test_conflated_subscriber_keeps_latest_tick_per_level(self, demux):
+        subscriber = demux.subscribe(
+            [("tickPrices", "EURUSD"), ("candle", "EURUSD")],
+            policy=DeliveryPolicy("conflated"),
+        )
+        ticks = [self.tick("EURUSD") for _ in range(4)]
+        for i, tick in enumerate(ticks):
+            tick["data"].update({"ask": i, "level": int(i == 2)})
+        candle = {"command": "candle", "data": {"symbol": "EURUSD"}}
+        for message in ticks + [candle, candle]:
+            demux.dispatch(message)
+
+        read = [subscriber.stream_read(timeout=1) for _ in range(4)]
+        assert read == [ticks[3], ticks[2], candle, candle]
+        assert subscriber.queue.empty()
+        assert demux.stats()["conflated"] == subscriber.conflated == 2
+        demux.dispatch(ticks[0])
+        assert subscriber.stream_read(timeout=1) is ticks[0]
+
+    def test_throttled_subscriber_delivers_latest_once_per_interval(self):
+        subscriber = StreamSubscriber(
+            [("tickPrices", "EURUSD")],
+            policy=DeliveryPolicy("throttled", interval=50),
+        )
+        ticks = [self.tick("EURUSD") for _ in range(3)]
+        subscriber.put(ticks[0])
+        assert subscriber.stream_read(timeout=1) is ticks[0]
+        start = perf_counter()
+        subscriber.put(ticks[1])
+        Thread(target=subscriber.put, args=(ticks[2],)).start()
+
+        assert subscriber.stream_read(timeout=1) is ticks[2]
+        assert perf_counter() - start >= 0.04
+        assert subscriber.conflated == 1
+        assert DeliveryPolicy("throttled", 50).arguments() == {
+            "minArrivalTime": 50
+        }
+
+    def test_full_conflated_subscriber_drops_oldest_symbol(self):
+        subscriber = StreamSubscriber(
+            [("tickPrices", None)],
+            maxsize=1,
+            policy=DeliveryPolicy("conflated"),
+        )
+        eurusd, usdjpy = self.tick("EURUSD"), self.tick("USDJPY")
+        subscriber.put(eurusd)
+        subscriber.put(usdjpy)
+        assert subscriber.stream_read(timeout=1) is usdjpy
+        subscriber.put(eurusd)
+
+        assert subscriber.stream_read(timeout=1) is eurusd
+        assert subscriber.dropped == 1
+        with pytest.raises(ValueError):
+            StreamSubscriber([], policy=DeliveryPolicy("sampled"))
+
+    def test_run_closes_subscribers_when_stream_ends(self, demux):
+        subscriber = demux.subscribe([("tickPrices", "EURUSD")])
+        demux.client.stream_messages.return_value = iter(
+            [self.tick("EURUSD")]
+        )
+        demux.running = True
+        demux.run()
+        assert subscriber.stream_read(timeout=1) == self.tick("EURUSD")
+        with pytest.raises(ConnectionError):
+            subscriber.stream_read(timeout=1)
+
+    def test_position_observator_reads_from_shared_stream(self, demux):
+        observator = PositionObservator(
+            client=MagicMock(), symbol="EURUSD", order_no=100000, demux=demux
+        )
+        demux.dispatch(
+            {"command": "profit", "data": {"order2": 100000, "profit": 7.5}}
+        )
+        observator.read_stream()
+        assert observator.profit == 7.5
+        assert observator.client is demux.client
+        observator.detach()
+        assert demux.stats()["topics"] == 0
+
+    def test_shared_message_is_not_modified_by_data_stream(self, demux):
+        data_stream = DataStream("EURUSD")
+        data_stream.client = demux.client
+        message = self.tick("EURUSD")
+        message["data"].update(
+            {
+                "askVolume": 1,
+                "bid": 1,
+                "bidVolume": 1,
+                "high": 1,
+                "level": 0,
+                "low": 1,
+                "quoteId": 0,
+                "spreadRaw": 0,
+                "spreadTable": 0,
+                "timestamp": 1,
+            }
+        )
+        data_stream.on_message(message)
+        assert message["data"]["symbol"] == "EURUSD"
+        assert np.shape(data_stream.symbols_price) == (1, 11)
+
+    def test_callback_subscriber_is_called_on_dispatch(self, demux):
+        ticks = []
+        listener = demux.subscribe_callback(
+            [("tickPrices", "EURUSD")], ticks.append
+        )
+        failing = demux.subscribe_callback(
+            [("tickPrices", None)], Mock(side_effect=KeyError("data"))
+        )
+        demux.client.stream_messages.return_value = iter(
+            [self.tick("EURUSD"), self.tick("USDJPY")]
+        )
+        demux.running = True
+        demux.run()
+
+        assert ticks == [self.tick("EURUSD")]
+        assert failing.errors == 2
+        assert listener.wait(timeout=1) is True
+
+    def test_data_stream_converts_messages_on_dispatch(self, demux):
+        data_stream = DataStream("EURUSD")
+        demux.subscribe_callback(
+            [("tickPrices", "EURUSD"), ("candle", "EURUSD")],
+            data_stream.on_message,
+        )
+        tick = self.tick("EURUSD")
+        tick["data"].update(
+            {
+                "askVolume": 1,
+                "bid": 1,
+                "bidVolume": 1,
+                "high": 1,
+                "level": 0,
+                "low": 1,
+                "quoteId": 0,
+                "spreadRaw": 0,
+                "spreadTable": 0,
+                "timestamp": 1,
+            }
+        )
+        candle = {
+            "command": "candle",
+            "data": {
+                "close": 1.0,
+                "ctm": 1,
+                "ctmString": "",
+                "high": 1.0,
+                "low": 1.0,
+                "open": 1.0,
+                "quoteId": 2,
+                "symbol": "EURUSD",
+                "vol": 1.0,
+            },
+        }
+        demux.dispatch(tick)
+        demux.dispatch(candle)
+
+        assert data_stream.tick_msg is tick
+        assert np.shape(data_stream.symbols_price) == (1, 11)
+        assert np.shape(data_stream.symbols_last_1M) == (1, 6)
+
+    def test_data_stream_keeps_tick_history(self, demux):
+        data_stream = DataStream("EURUSD", tick_capacity=3)
+        demux.subscribe_callback(
+            [("tickPrices", "EURUSD")], data_stream.on_message
+        )
+        for i in range(5):
+            tick = self.tick("EURUSD")
+            tick["data"].update(
+                {
+                    "ask": 1.0 + i,
+                    "askVolume": 1,
+                    "bid": 1,
+                    "bidVolume": 1,
+                    "high": 1,
+                    "level": 0,
+                    "low": 1,
+                    "quoteId": 0,
+                    "spreadRaw": 0,
+                    "spreadTable": 0,
+                    "timestamp": 100 + i,
+                }
+            )
+            demux.dispatch(tick)
+
+        assert list(data_stream.ticks.last()["ask"]) == [3.0, 4.0, 5.0]
+        assert list(data_stream.ticks.since(104)["ask"]) == [5.0]
+        assert data_stream.symbols_price[0, 0] == 5.0
+
+    def test_data_stream_builds_bars_from_ticks(self, demux):
+        data_stream = DataStream(
+            "EURUSD", bar_specs=[("time", 1), ("ticks", 2)]
+        )
+        demux.subscribe_callback(
+            [("tickPrices", "EURUSD")], data_stream.on_message
+        )
+        for timestamp in (1000, 1500, 2100):
+            tick = self.tick("EURUSD")
+            tick["data"].update(
+                {field: 1.0 for field in TICK_FIELDS}
+                | {"timestamp": timestamp, "level": 0}
+            )
+            demux.dispatch(tick)
+
+        assert data_stream.bars[("time", 1)].values(1)[0, 0] == 1000
+        assert data_stream.bars[("ticks", 2)].values().shape == (1, 6)
+
+    def test_data_stream_subscribes_only_with_a_stream_client(self):
+        data_stream = DataStream("EURUSD")
+        with pytest.raises(ConnectionError, match="stream client"):
+            data_stream.subscribe()
+        assert data_stream.subscriptions is None
+
+    def test_data_stream_keeps_deeper_levels_in_depth_book(self, demux):
+        data_stream = DataStream("EURUSD", levels=3)
+        data_stream.client = demux.client
+        data_stream.subscribe()
+        demux.subscribe_callback(
+            [("tickPrices", "EURUSD")], data_stream.on_message
+        )
+        for level in (0, 1, 2):
+            tick = self.tick("EURUSD")
+            tick["data"].update(
+                {field: 1.0 + level for field in TICK_FIELDS}
+                | {"level": level, "timestamp": 1000}
+            )
+            demux.dispatch(tick)
+
+        request = demux.client.stream_send.call_args_list[0].args[0]
+        assert request["maxLevel"] == 2
+        assert len(data_stream.ticks) == 1
+        assert data_stream.symbols_price[0, 0] == 1.0
+        assert data_stream.depth.depth == 3
+        assert data_stream.depth.best() == (1.0, 1.0)
+
+    def test_readers_never_see_half_updated_snapshots(self):
+        """
+        Readers on other threads check that every quote and candle they
+        hold has the fields of one update and never changes, while the
+        stream thread writes ticks into a small ring buffer.
+        """
+        data_stream = DataStream(
+            "EURUSD", pool=MagicMock(), tick_capacity=4, backfill=False
+        )
+        count, done, errors, reads = 20000, Event(), [], []
+        # every field of a tick but its level is the number of the tick
+        others = [n for n, f in enumerate(TICK_FIELDS) if f != "level"]
+
+        def write():
+            for i in range(count):
+                tick = self.tick("EURUSD")
+                tick["data"].update(
+                    {field: float(i) for field in TICK_FIELDS} | {"level": 0}
+                )
+                data_stream.on_message(tick)
+                if i % 10 == 9:
+                    minute = float(i // 10)
+                    data = {field: minute for field in CANDLE_FIELDS}
+                    data.update({"ctm": 60000 * minute, "symbol": "EURUSD"})
+                    data_stream.on_message({"command": "candle", "data": data})
+            done.set()
+
+        def read():
+            held, sequence, n = [], 0, 0
+            while not done.is_set():
+                snapshot = data_stream.snapshot()
+                row = data_stream.symbols_price
+                candles = snapshot.candles.get(1)
+                if snapshot.sequence < sequence:
+                    errors.append("sequence went back")
+                sequence = snapshot.sequence
+                if snapshot.quote is not None:
+                    values = snapshot.quote.tolist()
+                    held.append((snapshot.quote, values))
+                    if len({values[n] for n in others}) != 1:
+                        errors.append(f"torn quote {values}")
+                if len(row) and len(set(row[0, others])) != 1:
+                    errors.append(f"torn row {row}")
+                if candles is not None and len(candles):
+                    if not (candles[:, 0] == 60000 * candles[:, 5]).all():
+                        errors.append("torn candles")
+                n += 1
+            for quote, values in held[-100:]:
+                if quote.tolist() != values:
+                    errors.append("quote changed after it was read")
+            reads.append(n)
+
+        readers = [Thread(target=read) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        write()
+        for reader in readers:
+            reader.join(10)
+
+        assert errors == []
+        assert min(reads) > 0
+        assert data_stream.snapshot().quote["bid"] == count - 1
+        assert len(data_stream.snapshot().candles[1]) == 60
+
+    def test_data_stream_backfills_gaps_of_candle_stream(self):
+        pool = MagicMock()
+        data_stream = DataStream("EURUSD", pool=pool, timeframes=(5,))
+
+        def candle(minute, close=1.0):
+            return {
+                "ctm": 60000 * minute,
+                "open": 1.0,
+                "close": close,
+                "high": 1.0,
+                "low": 1.0,
+                "vol": 1.0,
+            }
+
+        # getChartRangeRequest gives the open in units of 10**-digits and
+        # the close, high and low as shifts from it
+        shifts = {"open": 10000.0, "close": 10000.0, "high": 0.0, "low": 0.0}
+        pool.scheduler.return_value.send_n_return.return_value = {
+            "status": True,
+            "returnData": {
+                "digits": 4,
+                "rateInfos": [{**candle(m), **shifts} for m in (1, 2, 3)],
+            },
+        }
+        for minute in (0, 4):
+            data_stream.on_message(
+                {"command": "candle", "data": candle(minute)}
+            )
+        sequence = data_stream.events.latest(("candle", 1))[0]
+        sequence, event = data_stream.wait_candle(1, sequence, timeout=5)
+
+        request = pool.scheduler.return_value.send_n_return.call_args.args[0]
+        assert request["arguments"]["info"]["start"] == 60000
+        assert request["arguments"]["info"]["end"] == 240000
+        assert event.bar["ctm"] == 240000
+        assert list(data_stream.candles.bars(1)["ctm"]) == [
+            60000 * m for m in range(5)
+        ]
+        assert list(data_stream.candles.bars(1)["close"]) == [1, 2, 2, 2, 1]
+        assert data_stream.candles.last_closed(5)["vol"] == 5.0
+        assert data_stream.gaps == {
+            "found": 1,
+            "minutes": 3,
+            "filled": 1,
+            "empty": 0,
+            "failed": 0,
+            "candles": 3,
+        }
+
+
+class Test_EventBus:
+    """
+    Tests of the publication of the latest events to blocked consumers
+    """
+
+    @staticmethod
+    def event(received=0.0):
+        return TickEvent("EURUSD", None, received or perf_counter())
+
+    def test_wait_returns_latest_event_after_sequence(self):
+        bus = EventBus()
+        first, second = self.event(), self.event()
+        bus.publish("tick", first)
+        bus.publish("tick", second)
+
+        assert bus.wait("tick", 0, timeout=0) == (2, second)
+        assert bus.wait("tick", 2, timeout=0) == (2, None)
+        assert bus.latest("candle") == (0, None)
+        bus.publish("tick", first)
+        bus.publish("tick", second)
+        assert bus.wait("tick", 2, timeout=0) == (4, second)
+        assert bus.skipped == 1
+
+    def test_blocked_consumer_wakes_on_publish(self):
+        bus = EventBus()
+        received = []
+        consumer = Thread(
+            target=lambda: received.append(bus.wait("tick", 0, timeout=5))
+        )
+        consumer.start()
+        event = self.event()
+        bus.publish("tick", event)
+        consumer.join(5)
+
+        assert received == [(1, event)]
+        assert bus.latency.count == 1
+        assert bus.latency.max < 5
+
+    def test_close_wakes_consumers(self):
+        bus = EventBus()
+        received = []
+        consumer = Thread(target=lambda: received.append(bus.wait("tick", 0)))
+        consumer.start()
+        bus.close()
+        consumer.join(5)
+
+        assert received == [(0, None)]
+        assert bus.closed
+
+
+class Test_SubscriptionManager:
+    """
+    Tests of the reference counted stream subscriptions
+    """
+
+    @pytest.fixture
+    def client(self):
+        client = MagicMock()
+        client.stream_sesion_id = "abc"
+        return client
+
+    def sent(self, client):
+        return [call.args[0] for call in client.stream_send.call_args_list]
+
+    def test_commands_are_sent_on_first_and_last_consumer(self, client):
+        manager = SubscriptionManager(client)
+
+        assert manager.acquire("getTickPrices", "EURUSD") == 1
+        assert manager.acquire("getTickPrices", "EURUSD") == 2
+        assert manager.acquire("getProfits") == 1
+        assert manager.active() == {
+            ("getTickPrices", "EURUSD"): 2,
+            ("getProfits", None): 1,
+        }
+        assert manager.release("getTickPrices", "EURUSD") == 1
+        assert manager.release("getTickPrices", "EURUSD") == 0
+        assert manager.release("getTickPrices", "EURUSD") == 0
+
+        assert self.sent(client) == [
+            {
+                "command": "getTickPrices",
+                "streamSessionId": "abc",
+                "symbol": "EURUSD",
+            },
+            {"command": "getProfits", "streamSessionId": "abc"},
+            {"command": "stopTickPrices", "symbol": "EURUSD"},
+        ]
+        assert manager.active() == {("getProfits", None): 1}
+        assert manager.metrics == {"subscribed": 2, "stopped": 1, "lost": 0}
+
+    def test_added_arguments_are_sent_again(self, client):
+        manager = SubscriptionManager(client)
+        manager.acquire("getTickPrices", "EURUSD")
+        manager.acquire("getTickPrices", "EURUSD", maxLevel=2)
+        manager.acquire("getTickPrices", "EURUSD")
+
+        assert [message.get("maxLevel") for message in self.sent(client)] == [
+            None,
+            2,
+        ]
+        with pytest.raises(ValueError):
+            manager.acquire("getChartRangeRequest", "EURUSD")
+
+    def test_shortest_arrival_time_serves_all_consumers(self, client):
+        manager = SubscriptionManager(client)
+        observator = PositionObservator(
+            client,
+            "EURUSD",
+            1,
+            policy=DeliveryPolicy("throttled", interval=1000),
+        )
+        observator.subscriptions = manager
+        observator.subscribe()
+        # a consumer without minArrivalTime gets the 200 ms of the server
+        manager.acquire("getTickPrices", "EURUSD")
+        manager.acquire("getTickPrices", "EURUSD", minArrivalTime=500)
+
+        ticks = [
+            message
+            for message in self.sent(client)
+            if message["command"] == "getTickPrices"
+        ]
+        assert [message["minArrivalTime"] for message in ticks] == [1000, 200]
+
+    def test_stop_lost_with_connection_is_counted(self, client):
+        manager = SubscriptionManager(client)
+        manager.acquire("getCandles", "EURUSD")
+        client.stream_send.side_effect = OSError("closed")
+
+        assert manager.release("getCandles", "EURUSD") == 0
+        assert manager.count("getCandles", "EURUSD") == 0
+        assert manager.metrics["lost"] == 1
+
+    def test_observators_share_and_release_subscriptions(self, client):
+        demux = StreamDemultiplexer(client)
+        first, second = (
+            PositionObservator(client, "EURUSD", order_no, demux=demux)
+            for order_no in (1, 2)
+        )
+        first.subscribe()
+        second.subscribe()
+        first.detach()
+
+        assert demux.stats()["subscriptions"] == 3
+        assert demux.subscriptions.count("getProfits") == 1
+        second.detach()
+
+        assert demux.stats()["subscriptions"] == 0
+        assert [message["command"] for message in self.sent(client)] == [
+            "getCandles",
+            "getTickPrices",
+            "getProfits",
+            "stopProfits",
+            "stopTickPrices",
+            "stopCandles",
+        ]
@@ -0,0 +1,60 @@
+"""
+Check the models based on trend.
+"""
+
+from unittest.mock import MagicMock, patch
+import numpy as np
+import pytest
+from api.streamtools import DataStream
+from models.trends import MovingAVG
+
+
+class Test_MovingAVG:
+    """
+    Tests of the moving averages of the candles of a data stream.
+    """
+
+    def test_period_must_be_a_timeframe_of_the_data_stream(self):
+        pool = MagicMock()
+        data_stream = DataStream("EURUSD", pool=pool, timeframes=(5,))
+        model = MovingAVG("EURUSD", period=15, pool=pool)
+
+        with pytest.raises(ValueError, match="15"):
+            model.run(data_stream)
+        with pytest.raises(ValueError, match="15"):
+            model.market_observe(data_stream)
+        pool.scheduler.assert_not_called()
+        MovingAVG("EURUSD", period=5, pool=pool).check_period(data_stream)
+
+    def test_history_of_the_period_gives_a_signal(self):
+        """
+        The loaded history holds 60 closed candles of the period also
+        when its last minute is still forming
+        """
+
+        def history(client, symbol, shift, period):
+            # aligned to the period, without the forming minute
+            start = 1_700_000_100_000 - 1_700_000_100_000 % 300_000
+            return np.array(
+                [
+                    (start + i * 60_000, 1.0, 1.0 + i, 1.0 + i, 1.0, 1.0)
+                    for i in range(shift - 1)
+                ]
+            )
+
+        pool = MagicMock()
+        data_stream = DataStream("EURUSD", pool=pool, timeframes=(5,))
+        model = MovingAVG("EURUSD", period=5, pool=pool)
+        with patch("models.trends.get_historical_candles", history):
+            model.run(data_stream)
+
+        assert model.signal_ready.wait(5)
+        assert model.signal == 0
+        assert len(model.base_data) == 60
+
+    def test_short_history_gives_no_signal(self):
+        model = MovingAVG("EURUSD", period=5, pool=MagicMock())
+        model.update_signal(np.ones((59, 6)))
+
+        assert model.signal == 20
+        assert not model.signal_ready.is_set()